@@ -1,7 +1,10 @@
 import asyncio
 import os
 import platform
+import re
 import sys
+import sqlite3
+import threading
 import traceback
 import warnings
 from contextlib import asynccontextmanager
@@ -10,8 +13,9 @@ from datetime import datetime
 # 忽略jieba库中的无效转义序列警告
 warnings.filterwarnings("ignore", category=SyntaxWarning, message="invalid escape sequence")
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
 
@@ -48,8 +52,13 @@ from routers import (
     video_details,
     dynamic
 )
+from scripts.dynamic_crawler import DynamicCrawler
+from scripts.favorites_sync import FavoritesSync
+from scripts.metrics import MetricsMiddleware, install_http_hooks, registry as metrics_registry
+from scripts.slow_query_log import SlowQueryLog
 from scripts.scheduler_db_enhanced import EnhancedSchedulerDB
 from scripts.scheduler_manager import SchedulerManager
+from scripts.startup_manager import StartupManager
 from scripts.utils import load_config, get_output_path
 
 
@@ -57,18 +66,29 @@ from scripts.utils import load_config, get_output_path
 def setup_logging():
     """设置Loguru日志系统"""
     # 使用统一的日志初始化函数
-    from scripts.utils import setup_logger
+    from scripts.utils import log_enabled, setup_logger
 
     # 初始化日志系统
     log_info = setup_logger()
 
     # 重定向 print 输出到日志
     class PrintToLogger:
+        """把 print 输出按行转发到 loguru
+
+        按行缓冲（每个线程独立），只对完整的行做一次过滤和一次日志调用；
+        调用方模块的 INFO 级别被关闭时（见 config.yaml 的 logging.modules），
+        在进入 loguru 之前就直接丢弃。实际写文件由 scripts.utils 中的日志写入线程完成。
+        """
+
+        # uvicorn 等自带格式的输出，只写入控制台
+        _passthrough_pattern = re.compile(
+            r"INFO:|ERROR:|WARNING:|\[32m|\[0m|Application|Started|Waiting|HTTP|uvicorn|DEBUG"
+        )
+
         def __init__(self, stdout):
             self.stdout = stdout
-            self._line_buffer = []
+            self._local = threading.local()  # 每个线程的未完成行与重入标记
             self._is_shutting_down = False  # 标记系统是否正在关闭
-            self._logging_in_progress = False  # 防止日志重入
             self._is_docker = os.environ.get('DOCKER_ENV') == 'true'  # 检测是否在Docker环境
             self._resource_warning_pattern = "系统资源不足"  # 用于识别资源警告的模式
             self._low_memory_detected = False  # 标记是否检测到内存不足
@@ -76,101 +96,74 @@ def setup_logging():
         def write(self, buf):
             # 如果系统正在关闭或在Docker环境中，直接写入原始stdout而不经过logger
             if self._is_shutting_down or self._is_docker:
-                self.stdout.write(buf)
-                return
+                return self.stdout.write(buf)
+
+            local = self._local
+            # 防止日志重入 - 如果已经在记录日志中，直接写入原始stdout
+            if getattr(local, 'busy', False):
+                return self.stdout.write(buf)
 
             # 检查是否包含资源警告信息
             if self._resource_warning_pattern in buf:
                 # 如果已经检测到内存不足，跳过重复的警告
-                if self._low_memory_detected:
-                    return
-                # 标记已检测到内存不足
-                self._low_memory_detected = True
-                # 直接写入原始stdout，避免通过logger触发循环
-                self.stdout.write(buf)
-                return
+                if not self._low_memory_detected:
+                    # 标记已检测到内存不足，直接写入原始stdout，避免通过logger触发循环
+                    self._low_memory_detected = True
+                    self.stdout.write(buf)
+                return len(buf)
 
             # 跳过uvicorn日志
-            if any(skip in buf for skip in [
-                'INFO:', 'ERROR:', 'WARNING:', '[32m', '[0m',
-                'Application', 'Started', 'Waiting', 'HTTP',
-                'uvicorn', 'DEBUG'
-            ]):
-                # 只写入到控制台
-                self.stdout.write(buf)
-                return
+            if self._passthrough_pattern.search(buf):
+                return self.stdout.write(buf)
 
             # 检测是否是关闭信息
             if "应用关闭" in buf or "Shutting down" in buf:
                 self._is_shutting_down = True
 
-            # 防止日志重入 - 如果已经在记录日志中，直接写入原始stdout
-            if self._logging_in_progress:
-                self.stdout.write(buf)
-                return
+            pending = getattr(local, 'pending', '')
+            if '\n' not in buf:
+                local.pending = pending + buf
+                return len(buf)
 
-            # 收集完整的行
-            for c in buf:
-                if c == '\n':
-                    line = ''.join(self._line_buffer).rstrip()
+            # 收集完整的行，最后一段留到下次
+            lines = (pending + buf).split('\n')
+            local.pending = lines.pop()
+
+            # 调用方模块没有开启INFO级别时直接丢弃
+            module = sys._getframe(1).f_globals.get('__name__', '')
+            if not log_enabled("INFO", module):
+                return len(buf)
+
+            local.busy = True
+            try:
+                for line in lines:
+                    line = line.rstrip()
                     if line:  # 只记录非空行
-                        try:
-                            # 设置日志记录锁
-                            self._logging_in_progress = True
-                            # 使用loguru记录，但保持控制台干净
-                            if not self._is_shutting_down:
-                                try:
-                                    logger.opt(depth=1).log("INFO", line)
-                                except Exception as e:
-                                    # 记录失败，写入原始stdout
-                                    self.stdout.write(f"日志记录失败: {e}\n")
-                                    self.stdout.write(f"{line}\n")
-                            else:
-                                # 关闭阶段直接写入控制台
-                                self.stdout.write(f"{line}\n")
-                        except Exception as e:
-                            # 如果记录失败，写入原始stdout
-                            self.stdout.write(f"日志异常: {e}\n")
-                            self.stdout.write(f"{line}\n")
-                        finally:
-                            # 释放日志记录锁
-                            self._logging_in_progress = False
-                    self._line_buffer = []
-                else:
-                    self._line_buffer.append(c)
+                        logger.opt(depth=1).info(line)
+            except Exception as e:
+                # 记录失败，写入原始stdout
+                self.stdout.write(f"日志记录失败: {e}\n")
+                self.stdout.write('\n'.join(lines) + '\n')
+            finally:
+                local.busy = False
+            return len(buf)
 
         def flush(self):
-            if self._line_buffer:
-                line = ''.join(self._line_buffer).rstrip()
-                if line:
-                    # 检查是否包含资源警告信息
-                    if self._resource_warning_pattern in line:
-                        if not self._low_memory_detected:
-                            self._low_memory_detected = True
-                            self.stdout.write(f"{line}\n")
-                        self._line_buffer = []
-                        self.stdout.flush()
-                        return
-
-                    # 防止日志重入
-                    if self._logging_in_progress:
+            local = self._local
+            line = getattr(local, 'pending', '').rstrip()
+            local.pending = ''
+            if line:
+                if getattr(local, 'busy', False) or self._is_shutting_down:
+                    self.stdout.write(f"{line}\n")
+                else:
+                    local.busy = True
+                    try:
+                        logger.opt(depth=1).info(line)
+                    except Exception:
                         self.stdout.write(f"{line}\n")
-                    else:
-                        try:
-                            self._logging_in_progress = True
-                            if not self._is_shutting_down:
-                                try:
-                                    logger.opt(depth=1).log("INFO", line)
-                                except Exception:
-                                    self.stdout.write(f"{line}\n")
-                            else:
-                                self.stdout.write(f"{line}\n")
-                        except Exception:
-                            self.stdout.write(f"{line}\n")
-                        finally:
-                            self._logging_in_progress = False
-                    self._line_buffer = []
-                self.stdout.flush()
+                    finally:
+                        local.busy = False
+            self.stdout.flush()
 
         def isatty(self):
             return self.stdout.isatty()
@@ -269,16 +262,20 @@ scheduler_manager = None
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
-    global scheduler_manager
-
     logger.info("正在启动应用...")
 
-    try:
-        # 初始化增强版数据库
+    startup = StartupManager.get_instance()
+    scheduler_task = None
+
+    async def init_scheduler():
+        """初始化调度器（首次运行时会从 scheduler_config.yaml 导入任务）"""
+        global scheduler_manager
+        nonlocal scheduler_task
+
+        # 调度器数据库连接不能跨线程使用，因此在事件循环线程中初始化
         EnhancedSchedulerDB.get_instance()
         logger.info("已初始化增强版调度器数据库")
 
-        # 初始化调度器
         scheduler_manager = SchedulerManager.get_instance(app)
 
         # 显示调度器配置
@@ -294,27 +291,101 @@ async def lifespan(app: FastAPI):
         # 创建异步任务运行调度器
         scheduler_task = asyncio.create_task(scheduler_manager.run_scheduler())
 
-        # 加载配置并决定是否执行数据完整性校验
+    def run_integrity_check(progress):
+        """启动时数据完整性校验"""
+        from scripts.check_data_integrity import check_data_integrity
+        result = check_data_integrity(progress=progress)
+        if result["success"]:
+            if result["difference"] == 0:
+                logger.success("数据完整性校验通过，数据库和JSON文件记录数一致")
+            else:
+                logger.warning(f"数据完整性校验发现差异: {result['difference']} 条记录")
+                logger.info(f"详细报告已保存到 {result['report_file']}")
+        else:
+            raise RuntimeError("数据完整性校验失败")
+        return {"difference": result["difference"]}
+
+    def build_history_time_columns():
+        """补齐年份表的本地时间生成列和组合索引（首次升级或修改时区后需要建立索引）"""
+        from scripts.history_time_columns import ensure_time_columns
+        conn = sqlite3.connect(get_output_path(current_config['db_file']))
+        try:
+            return {"years": ensure_time_columns(conn)}
+        finally:
+            conn.close()
+
+    def seal_closed_years():
+        """把已经结束的年份封存为只读数据库文件（history_partitions.auto_seal）"""
+        from scripts.history_partitions import auto_seal_years
+        return {"sealed": auto_seal_years()}
+
+    def load_history_suggest():
+        """同步并载入历史记录输入提示（统计结果已持久化，通常只需读取提示库）"""
+        from scripts.history_suggest import HistorySuggestIndex
+        index = HistorySuggestIndex.get_instance()
+        summary = index.refresh()
+        index.load()
+        return {"rebuilt": summary["rebuilt"], "incremental": summary["incremental"],
+                "entries": index.get_stats()["entries"]}
+
+    def reconcile_image_index(progress):
+        """核对图片下载记录与磁盘文件"""
+        from scripts.image_downloader import DownloadStatusDB
+        result = DownloadStatusDB().reconcile_missing_files(progress=progress)
+        if result['fixed']:
+            logger.warning(f"图片索引核对: {result['fixed']} 条下载记录对应的文件已缺失，已重置为未下载")
+        return result
+
+    try:
         current_config = load_config()
-        check_on_startup = current_config.get('server', {}).get('data_integrity', {}).get('check_on_startup', True)
+        server_config = current_config.get('server', {})
+        startup_jobs = server_config.get('startup_jobs', {}) or {}
+
+        # 调度器优先初始化，其余维护任务按优先级在后台依次执行
+        startup.register_job('scheduler', init_scheduler, priority=0,
+                             description='初始化计划任务调度器', subsystem='scheduler')
+
+        if current_config.get('history_partitions', {}).get('auto_seal', False):
+            startup.register_job('history_partitions', seal_closed_years, priority=9,
+                                 description='封存已结束年份的历史记录', subsystem='history_indexes')
+
+        startup.register_job('history_time_columns', build_history_time_columns, priority=10,
+                             description='建立历史记录本地时间列和组合索引', subsystem='history_indexes')
+
+        startup.register_job('history_suggest', load_history_suggest, priority=20,
+                             description='载入历史记录输入提示', subsystem='history_indexes')
+
+        check_on_startup = server_config.get('data_integrity', {}).get('check_on_startup', True)
         if check_on_startup:
-            logger.info("正在执行启动时数据完整性校验...")
-            try:
-                from scripts.check_data_integrity import check_data_integrity
-                result = check_data_integrity()
-                if result["success"]:
-                    if result["difference"] == 0:
-                        logger.success("数据完整性校验通过，数据库和JSON文件记录数一致")
-                    else:
-                        logger.warning(f"数据完整性校验发现差异: {result['difference']} 条记录")
-                        logger.info(f"详细报告已保存到 {result['report_file']}")
-                else:
-                    logger.error("数据完整性校验失败")
-            except Exception as e:
-                logger.error(f"执行数据完整性校验时出错: {str(e)}")
+            startup.register_job('data_integrity', run_integrity_check, priority=50,
+                                 description='校验数据库与JSON文件记录数', subsystem='data_integrity')
         else:
             logger.info("已跳过启动时数据完整性校验")
 
+        # 需要遍历整个图片目录，默认关闭，需要时在配置中开启
+        if startup_jobs.get('image_index_reconcile', False):
+            startup.register_job('image_index', reconcile_image_index, priority=80,
+                                 description='核对图片下载记录与磁盘文件', subsystem='image_index')
+
+        # 按配置启动动态后台抓取服务
+        dynamic_crawler = DynamicCrawler.get_instance()
+        if dynamic_crawler.enabled_on_startup:
+            await dynamic_crawler.start()
+            startup.set_ready('dynamic_crawler')
+        else:
+            startup.set_skipped('dynamic_crawler', '未开启自动抓取')
+
+        # 按配置启动收藏夹本地镜像的周期同步
+        favorites_sync = FavoritesSync.get_instance()
+        if current_config.get('favorites_sync', {}).get('enabled', False):
+            favorites_sync.start_periodic()
+            startup.set_ready('favorites_sync')
+        else:
+            startup.set_skipped('favorites_sync', '未开启周期同步')
+
+        startup.start()
+        startup.mark_serving()
+
         logger.success("=== 应用启动完成 ===")
         logger.info(f"启动时间: {datetime.now().isoformat()}")
 
@@ -328,16 +399,25 @@ async def lifespan(app: FastAPI):
         if hasattr(sys.stdout, 'mark_shutdown'):
             sys.stdout.mark_shutdown()
 
+        await startup.stop()
+
+        if dynamic_crawler.is_running:
+            logger.info("正在停止动态后台抓取服务...")
+            await dynamic_crawler.stop()
+
+        await favorites_sync.stop_periodic()
+
         if scheduler_manager:
             logger.info("正在停止调度器...")
             scheduler_manager.stop_scheduler()
             # 取消调度器任务
-            scheduler_task.cancel()
-            try:
-                logger.info("等待调度器任务完成...")
-                await scheduler_task
-            except asyncio.CancelledError:
-                logger.info("调度器任务已取消")
+            if scheduler_task:
+                scheduler_task.cancel()
+                try:
+                    logger.info("等待调度器任务完成...")
+                    await scheduler_task
+                except asyncio.CancelledError:
+                    logger.info("调度器任务已取消")
 
         # 恢复原始的 stdout
         if hasattr(sys.stdout, 'stdout'):
@@ -395,10 +475,38 @@ async def health_check():
     """健康检查端点"""
     return {
         "status": "running",
+        "ready": StartupManager.get_instance().get_status()["ready"],
         "timestamp": datetime.now().isoformat(),
         "scheduler_status": "running" if scheduler_manager and scheduler_manager.is_running else "stopped"
     }
 
+
+@app.get("/startup/status", summary="启动进度与各子系统就绪状态")
+async def startup_status():
+    """返回启动后台任务的进度和各子系统的就绪标记"""
+    return StartupManager.get_instance().get_status()
+
+
+@app.get("/metrics", summary="Prometheus 指标", response_class=PlainTextResponse)
+async def metrics():
+    """接口耗时、SQLite 语句耗时、外部请求耗时和状态码、后台队列长度、计划任务耗时（Prometheus 文本格式）"""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/metrics/slow-queries", summary="慢查询日志")
+async def slow_queries(
+    limit: int = Query(50, ge=1, le=500, description="返回的语句数量"),
+    sort: str = Query("total", description="排序方式：total 累计耗时，max 单次最长耗时，count 次数")
+):
+    """超过 slow_query_log.threshold_ms 的 SQLite 语句，附执行计划、大表全表扫描和索引建议"""
+    return {"status": "success", "data": SlowQueryLog.get_instance().report(limit=limit, sort=sort)}
+
+
+@app.post("/metrics/slow-queries/reset", summary="清空慢查询日志")
+async def reset_slow_queries():
+    SlowQueryLog.get_instance().reset()
+    return {"status": "success", "message": "慢查询日志已清空"}
+
 # 添加 CORS 中间件
 app.add_middleware(
     CORSMiddleware,
@@ -408,6 +516,11 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有头部
 )
 
+# 统计各接口耗时和外部请求耗时（metrics.enabled）
+if metrics_registry.enabled:
+    app.add_middleware(MetricsMiddleware)
+    install_http_hooks()
+
 # 注册路由
 app.include_router(login.router, prefix="/login", tags=["用户登录"])
 app.include_router(analysis.router, prefix="/analysis", tags=["数据分析"])
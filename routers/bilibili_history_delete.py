@@ -9,7 +9,7 @@ import requests
 from fastapi import APIRouter, Query
 from pydantic import BaseModel, Field
 
-from scripts.utils import load_config
+from scripts.utils import get_config
 
 router = APIRouter()
 
@@ -25,7 +25,7 @@ class BatchDeleteRequest(BaseModel):
 def get_headers():
     """获取请求头"""
     # 动态读取配置文件，获取最新的SESSDATA
-    current_config = load_config()
+    current_config = get_config()
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
         'Referer': 'https://www.bilibili.com/',
@@ -67,7 +67,7 @@ async def delete_single_history(
         # 如果需要同步删除B站服务器上的记录
         if sync_to_bilibili:
             # 获取配置
-            current_config = load_config()
+            current_config = get_config()
             bili_jct = current_config.get("bili_jct", "")
 
             if not bili_jct:
@@ -126,7 +126,7 @@ async def batch_delete_history(request: BatchDeleteRequest):
     """
     try:
         # 获取配置
-        current_config = load_config()
+        current_config = get_config()
         bili_jct = current_config.get("bili_jct", "")
 
         if not bili_jct:
@@ -4,6 +4,7 @@ from typing import Optional
 
 from fastapi import APIRouter, HTTPException, Query
 
+from scripts.history_partitions import connect_history, history_table_names, history_years
 from scripts.utils import load_config, get_output_path
 
 router = APIRouter()
@@ -12,28 +13,13 @@ config = load_config()
 def get_db():
     """获取数据库连接"""
     db_path = get_output_path(config['db_file'])
-    return sqlite3.connect(db_path)
+    return connect_history(db_path)
 
 def get_available_years():
     """获取数据库中所有可用的年份"""
     conn = get_db()
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name LIKE 'bilibili_history_%'
-            ORDER BY name DESC
-        """)
-        
-        years = []
-        for (table_name,) in cursor.fetchall():
-            try:
-                year = int(table_name.split('_')[-1])
-                years.append(year)
-            except (ValueError, IndexError):
-                continue
-                
-        return sorted(years, reverse=True)
+        return sorted(history_years(conn), reverse=True)
     except sqlite3.Error as e:
         print(f"获取年份列表时发生错误: {e}")
         return []
@@ -158,12 +144,7 @@ async def get_daily_count(
         
         # 检查年份表是否存在
         table_name = f"bilibili_history_{year}"
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name=?
-        """, (table_name,))
-        
-        if not cursor.fetchone():
+        if table_name not in history_table_names(conn):
             return {
                 "status": "error",
                 "message": f"未找到 {year} 年的历史记录数据"
@@ -11,10 +11,11 @@ from typing import Optional, List
 
 import aiohttp
 import requests
-import yaml
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel, Field
 
+from scripts.utils import ConfigService, get_config_path, load_config
+
 # 创建API路由
 router = APIRouter()
 
@@ -82,20 +83,15 @@ class ApiKeyStatusResponse(BaseModel):
     is_valid: bool = Field(..., description="API密钥是否有效")
     message: str = Field(..., description="状态描述信息")
 
-# 加载YAML配置文件
-def load_config():
-    """加载配置文件"""
-    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "config.yaml")
+# 获取配置（由 scripts.utils 的配置服务统一解析与缓存）
+def _load_deepseek_config():
     try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
-        return config
+        return load_config()
     except Exception as e:
         print(f"加载配置文件出错: {e}")
         return {}
 
-# 获取配置
-config = load_config()
+config = _load_deepseek_config()
 deepseek_config = config.get('deepseek', {})
 
 # 设置API密钥（优先使用环境变量，其次使用配置文件）
@@ -104,6 +100,18 @@ API_BASE = deepseek_config.get('api_base', 'https://api.deepseek.com/v1')
 DEFAULT_MODEL = deepseek_config.get('default_model', 'deepseek-chat')
 SSL_VERIFY = deepseek_config.get('ssl_verify', False)  # 默认关闭SSL验证
 
+def _on_deepseek_config_change(old, new):
+    """配置文件中 deepseek 段变化时刷新模块级设置"""
+    global config, deepseek_config, API_KEY, API_BASE, DEFAULT_MODEL, SSL_VERIFY
+    config = load_config()
+    deepseek_config = config.get('deepseek', {})
+    API_KEY = os.environ.get("DEEPSEEK_API_KEY", deepseek_config.get('api_key', ''))
+    API_BASE = deepseek_config.get('api_base', 'https://api.deepseek.com/v1')
+    DEFAULT_MODEL = deepseek_config.get('default_model', 'deepseek-chat')
+    SSL_VERIFY = deepseek_config.get('ssl_verify', False)
+
+ConfigService.get_instance().on_change(_on_deepseek_config_change, keys=['deepseek'])
+
 # 辅助函数，用于记录API调用日志
 async def log_api_call(model: str, prompt_tokens: int, completion_tokens: int):
     """记录API调用日志，可以扩展为保存到数据库或发送到监控系统"""
@@ -621,7 +629,7 @@ async def set_api_key(request: ApiKeyRequest):
         
         # 保存到配置文件
         # 获取配置文件路径
-        config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "config.yaml")
+        config_path = get_config_path('config.yaml')
         
         try:
             # 读取配置文件
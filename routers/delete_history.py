@@ -6,6 +6,7 @@ from typing import List
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from scripts.history_partitions import is_sealed
 from scripts.utils import load_config, get_output_path
 
 router = APIRouter()
@@ -52,12 +53,13 @@ async def batch_delete_history(items: List[DeleteHistoryItem]):
         # 获取当前所有年份的表
         cursor.execute("""
             SELECT name FROM sqlite_master
-            WHERE type='table' AND name LIKE 'bilibili_history_%'
+            WHERE type IN ('table', 'view') AND name LIKE 'bilibili_history_%'
         """)
         tables = [table[0] for table in cursor.fetchall()]
 
         total_deleted = 0
         deleted_details = []
+        sealed_skipped = []  # 已封存年份是只读的，需要先解封
         min_timestamp = float('inf')  # 记录最早的删除时间
 
         # 确保删除记录表存在
@@ -80,14 +82,20 @@ async def batch_delete_history(items: List[DeleteHistoryItem]):
             table_name = f"bilibili_history_{year}"
 
             if table_name in tables:
+                # 先统计要删除的记录数：紧凑存储（v2）年份的年份表是视图，
+                # 经 INSTEAD OF 触发器删除时 rowcount 始终为 0
+                cursor.execute(f"SELECT COUNT(*) FROM {table_name} WHERE bvid = ? AND view_at = ?",
+                               (item.bvid, item.view_at))
+                matched = cursor.fetchone()[0]
+
                 # 在对应年份的表中删除指定的记录
                 query = f"""
                     DELETE FROM {table_name}
                     WHERE bvid = ? AND view_at = ?
                 """
                 cursor.execute(query, (item.bvid, item.view_at))
-                if cursor.rowcount > 0:
-                    total_deleted += cursor.rowcount
+                if matched > 0:
+                    total_deleted += matched
                     deleted_details.append({
                         "bvid": item.bvid,
                         "view_at": item.view_at,
@@ -109,6 +117,8 @@ async def batch_delete_history(items: List[DeleteHistoryItem]):
                             SET delete_time = ?
                             WHERE bvid = ? AND view_at = ?
                         """, (current_time, item.bvid, item.view_at))
+            elif is_sealed(year):
+                sealed_skipped.append({"bvid": item.bvid, "view_at": item.view_at, "year": year})
 
         conn.commit()
 
@@ -118,10 +128,12 @@ async def batch_delete_history(items: List[DeleteHistoryItem]):
 
         return {
             "status": "success",
-            "message": f"成功删除 {total_deleted} 条历史记录",
+            "message": f"成功删除 {total_deleted} 条历史记录"
+                       + (f"，{len(sealed_skipped)} 条位于已封存的年份，未删除" if sealed_skipped else ""),
             "data": {
                 "deleted_count": total_deleted,
-                "deleted_records": deleted_details
+                "deleted_records": deleted_details,
+                "sealed_skipped": sealed_skipped
             }
         }
 
@@ -6,14 +6,17 @@ import sys
 from datetime import datetime
 from typing import Optional, List, Dict, Any, Tuple
 
-import requests
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel, Field
 import httpx
 import json
 
+from scripts.history_partitions import connect_history, history_table_names
+from scripts.response_cache import ResponseCache
+from scripts.space_videos import SpaceApiError, SpaceVideoLister
 from scripts.utils import load_config
+from scripts.wbi_sign import fetch_wbi_keys
 from scripts.yutto_runner import run_yutto
 
 # 尝试导入 history 模块，用于处理图像 URL
@@ -312,6 +315,8 @@ class DownloadRequest(BaseDownloadParams):
 class UserSpaceDownloadRequest(BaseDownloadParams):
     """用户空间视频下载请求"""
     user_id: str = Field(..., description="用户 UID，例如：100969474")
+    only_new: Optional[bool] = Field(False, description="是否只下载上次获取列表之后的新投稿")
+    full_refresh: Optional[bool] = Field(False, description="是否重新列举全部投稿而不是增量刷新")
 
 class FavoriteDownloadRequest(BaseDownloadParams):
     """收藏夹下载请求"""
@@ -651,7 +656,7 @@ async def list_downloaded_videos(search_term: Optional[str] = None, limit: int =
         try:
             import sqlite3
             db_path = os.path.join('output', 'bilibili_history.db')
-            conn = sqlite3.connect(db_path)
+            conn = connect_history(db_path)
             conn.row_factory = sqlite3.Row  # 将结果转换为字典形式
             db_available = True
         except Exception as e:
@@ -963,9 +968,7 @@ async def list_downloaded_videos(search_term: Optional[str] = None, limit: int =
                             cursor = conn.cursor()
                             # 查询所有历史记录表
                             years = [table_name.split('_')[-1]
-                                    for (table_name,) in cursor.execute(
-                                        "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'bilibili_history_%'"
-                                    ).fetchall()
+                                    for table_name in history_table_names(conn)
                                     if table_name.split('_')[-1].isdigit()]
 
                             # 构建 UNION ALL 查询所有年份表
@@ -1504,6 +1507,9 @@ async def download_user_videos(request: UserSpaceDownloadRequest):
     """
     下载指定用户的全部投稿视频
 
+    投稿列表由 SpaceVideoLister 并发获取并缓存，得到的视频逐个交给 yutto 下载，
+    不再由 yutto 逐页列举用户空间。
+
     Args:
         request: 包含用户 ID 和可选 SESSDATA 的请求对象
     """
@@ -1511,29 +1517,52 @@ async def download_user_videos(request: UserSpaceDownloadRequest):
         # 检查下载目录和临时目录
         download_dir, tmp_dir = check_download_directories()
 
-        # 构建用户空间 URL
-        user_space_url = f"https://space.bilibili.com/{request.user_id}/video"
-
-        # 构建基本命令
-        command = [
-            user_space_url,
-            '--batch',  # 批量下载
-            '--dir', download_dir,
-            '--tmp-dir', tmp_dir,
-            '--subpath-template', f'{{username}}的全部投稿视频/{{title}}_{{download_date@%Y%m%d_%H%M%S}}/{{title}}',
-            '--with-metadata'  # 添加元数据文件保存
-        ]
+        try:
+            mid = int(request.user_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"无效的用户 UID：{request.user_id}")
 
-        # 添加下载参数
-        command = add_download_params_to_command(command, request)
-        
-        print(f"执行下载命令：yutto {' '.join(command)}")
-        
         async def event_stream():
-            async for chunk in run_yutto(command):
-                yield chunk
+            yield f"data: 正在获取用户 {mid} 的投稿列表\n\n"
+            try:
+                listing = await SpaceVideoLister.get_instance().list_videos(
+                    mid, refresh=True, full=request.full_refresh, sessdata=request.sessdata
+                )
+            except Exception as e:
+                yield f"data: ERROR: 获取投稿列表失败：{str(e)}\n\n"
+                yield "event: close\ndata: close\n\n"
+                return
+
+            if request.only_new:
+                new_bvids = set(listing['new_bvids'])
+                videos = [v for v in listing['videos'] if v['bvid'] in new_bvids]
+            else:
+                videos = listing['videos']
+            total = len(videos)
+            yield (f"data: 投稿列表获取完成（{listing['source']}，耗时 {listing['duration']} 秒），"
+                   f"共 {listing['total']} 个，新增 {len(listing['new_bvids'])} 个，本次下载 {total} 个\n\n")
+
+            for index, video in enumerate(videos, 1):
+                yield f"data: 正在下载第 {index}/{total} 个视频: {video['title'] or video['bvid']}\n\n"
+                command = [
+                    f"https://www.bilibili.com/video/{video['bvid']}",
+                    '--batch',  # 下载全部分P
+                    '--dir', download_dir,
+                    '--tmp-dir', tmp_dir,
+                    '--subpath-template', f'{{username}}的全部投稿视频/{{title}}_{{download_date@%Y%m%d_%H%M%S}}/{{title}}',
+                    '--with-metadata'  # 添加元数据文件保存
+                ]
+                command = add_download_params_to_command(command, request)
+                print(f"执行下载命令：yutto {' '.join(command)}")
+                try:
+                    async for chunk in run_yutto(command):
+                        yield chunk
+                except Exception as e:
+                    yield f"data: ERROR: 下载视频 {video['bvid']} 时出错：{str(e)}\n\n"
+
+            yield f"data: 用户投稿视频下载完成，共 {total} 个视频\n\n"
             yield "event: close\ndata: close\n\n"
-            
+
         return StreamingResponse(event_stream(), media_type="text/event-stream")
 
     except HTTPException:
@@ -1700,10 +1729,137 @@ class VideoDetailResponse(BaseModel):
     message: str
     data: Optional[dict] = None
 
+# 这些错误码表示视频本身不可访问，重试也不会改变结果，不需要回退到本地数据
+_VIDEO_INFO_FINAL_CODES = {-404, -403, 62002, 62004, 62012}
+
+# 本地视频库中以这些前缀命名的列对应API返回中的嵌套对象，如 stat_view -> stat.view
+_NESTED_COLUMN_PREFIXES = ('owner', 'stat', 'rights', 'dimension')
+
+
+class _VideoInfoUnavailable(Exception):
+    """上游暂时不可用（网络错误、风控等），携带原始响应以便没有本地数据时原样返回"""
+
+    def __init__(self, response: VideoDetailResponse):
+        super().__init__(response.message)
+        self.response = response
+
+
+def _nest_columns(row: Dict[str, Any], drop: Tuple[str, ...] = ()) -> Dict[str, Any]:
+    """把扁平的数据库行转换为与API返回一致的嵌套结构"""
+    data: Dict[str, Any] = {}
+    for column, value in row.items():
+        if column in drop:
+            continue
+        prefix, _, rest = column.partition('_')
+        if prefix in _NESTED_COLUMN_PREFIXES and rest:
+            data.setdefault(prefix, {})[rest] = value
+        else:
+            data[column] = value
+    return data
+
+
+def _load_local_video_info(aid: Optional[int] = None, bvid: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """从本地视频库读取视频信息
+
+    依次查找 video_library.db 的 video_details 与 bilibili_video_details.db 的 video_base_info，
+    返回结构尽量与 /x/web-interface/view 的 data 字段保持一致。
+    """
+    import sqlite3
+    from scripts.utils import get_database_path, get_output_path
+
+    where, param = ("bvid = ?", bvid) if bvid else ("aid = ?", aid)
+    sources = (
+        (get_output_path("video_library.db"), "video_details", "video_bvid"),
+        (get_database_path("bilibili_video_details.db"), "video_base_info", "bvid"),
+    )
+    for db_path, table, page_column in sources:
+        if not os.path.exists(db_path):
+            continue
+        conn = None
+        try:
+            conn = sqlite3.connect(db_path)
+            conn.row_factory = sqlite3.Row
+            row = conn.execute(f"SELECT * FROM {table} WHERE {where} LIMIT 1", (param,)).fetchone()
+            if not row:
+                continue
+            data = _nest_columns(dict(row), drop=('id',))
+            pages = conn.execute(
+                f"SELECT * FROM video_pages WHERE {page_column} = ? ORDER BY page",
+                (data.get('bvid'),)
+            ).fetchall()
+            data['pages'] = [_nest_columns(dict(page), drop=('id', page_column)) for page in pages]
+            data['from_local'] = True
+            return data
+        except sqlite3.Error as e:
+            print(f"读取本地视频信息失败 ({table}): {e}")
+        finally:
+            if conn:
+                conn.close()
+    return None
+
+
 @router.get("/video_info", summary="获取 B 站视频详细信息")
-async def get_video_info(aid: Optional[int] = None, bvid: Optional[str] = None, sessdata: Optional[str] = None, headers: Optional[dict] = None, use_sessdata: bool = True):
+async def get_video_info(aid: Optional[int] = None, bvid: Optional[str] = None, sessdata: Optional[str] = None, headers: Optional[dict] = None, use_sessdata: bool = True, force_refresh: bool = False):
     """
-    获取B站视频详细信息
+    获取B站视频详细信息（带缓存）
+
+    同一视频的重复请求在TTL内直接返回缓存，并发请求只会向B站发出一次；
+    B站暂时不可用时回退到本地视频库中保存的数据。
+
+    Args:
+        aid: 视频aid
+        bvid: 视频bvid
+        sessdata: B站会话ID
+        headers: 自定义请求头（提供时不使用缓存）
+        use_sessdata: 是否使用SESSDATA认证，默认为True
+        force_refresh: 是否跳过缓存直接请求B站
+    """
+    if not aid and not bvid:
+        return VideoDetailResponse(
+            status="error",
+            message="至少需要提供aid或bvid参数",
+            data=None
+        )
+
+    if headers or not ResponseCache.enabled():
+        return await _fetch_video_info_upstream(aid, bvid, sessdata, headers, use_sessdata)
+
+    async def loader() -> VideoDetailResponse:
+        result = await _fetch_video_info_upstream(aid, bvid, sessdata, None, use_sessdata)
+        if result.status != "success":
+            code = result.data.get('code') if isinstance(result.data, dict) else None
+            if code not in _VIDEO_INFO_FINAL_CODES:
+                raise _VideoInfoUnavailable(result)
+        return result
+
+    def fallback() -> Optional[VideoDetailResponse]:
+        local = _load_local_video_info(aid, bvid)
+        if local is None:
+            return None
+        return VideoDetailResponse(
+            status="success",
+            message="B站接口暂时不可用，返回本地视频库数据",
+            data=local
+        )
+
+    ttl = float(ResponseCache.setting('video_info_ttl', 600))
+    key = (bvid or f"av{aid}", bool(sessdata and use_sessdata))
+    try:
+        result, _ = await ResponseCache.get_instance().get_or_load(
+            'video_info', key, loader,
+            ttl=lambda r: ttl if r.status == "success" else 0,
+            stale_ttl=float(ResponseCache.setting('video_info_stale_ttl', 3600)),
+            force_refresh=force_refresh,
+            fallback=fallback,
+        )
+        return result
+    except _VideoInfoUnavailable as e:
+        return e.response
+
+
+async def _fetch_video_info_upstream(aid: Optional[int] = None, bvid: Optional[str] = None, sessdata: Optional[str] = None, headers: Optional[dict] = None, use_sessdata: bool = True):
+    """
+    直接请求B站获取视频详细信息
 
     Args:
         aid: 视频aid
@@ -1866,19 +2022,8 @@ async def get_user_videos(
         用户投稿视频列表
     """
     try:
-        # 设置请求头
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Accept': 'application/json',
-            'Referer': f'https://space.bilibili.com/{mid}/video',
-            'Origin': 'https://space.bilibili.com'
-        }
-
-        # 仅在需要使用SESSDATA且提供了SESSDATA时，加入到请求头中
-        if sessdata and use_sessdata:
-            headers['Cookie'] = f'SESSDATA={sessdata}'
-        elif config.get('SESSDATA') and use_sessdata:
-            headers['Cookie'] = f'SESSDATA={config["SESSDATA"]}'
+        lister = SpaceVideoLister.get_instance()
+        headers = lister.build_headers(mid, sessdata, use_sessdata)
 
         # 构建请求参数
         params = {
@@ -1891,29 +2036,10 @@ async def get_user_videos(
             'platform': 'web'
         }
 
-        # 使用 WBI 签名
-        from scripts.wbi_sign import get_wbi_sign
-        signed_params = get_wbi_sign(params)
-
-        # 发送请求获取用户视频列表
-        response = requests.get(
-            'https://api.bilibili.com/x/space/wbi/arc/search',
-            params=signed_params,
-            headers=headers,
-            timeout=10
-        )
-
-        # 显式设置响应编码
-        response.encoding = 'utf-8'
-
-        # 打印响应状态和内容预览，便于调试
-        print(f"请求 URL: {response.url}")
-        print(f"响应状态码：{response.status_code}")
-        content_preview = response.text[:100] if len(response.text) > 100 else response.text
-        print(f"响应内容预览：{content_preview}")
-
-        # 解析响应
-        response_json = response.json()
+        # 使用 WBI 签名（密钥有缓存，签名在本地计算）
+        keys = await asyncio.to_thread(fetch_wbi_keys)
+        async with httpx.AsyncClient(timeout=10) as client:
+            response_json = await lister.request_page(client, headers, keys, params)
 
         # 处理可能的错误
         if response_json.get('code') != 0:
@@ -1942,6 +2068,35 @@ async def get_user_videos(
             data={"error_trace": error_trace}
         )
 
+@router.get("/user_videos/all", summary="获取用户全部投稿视频")
+async def get_all_user_videos(
+    mid: int,
+    refresh: bool = True,
+    full: bool = False,
+    sessdata: Optional[str] = None,
+    use_sessdata: bool = True
+):
+    """
+    获取用户的全部投稿视频（本地缓存 + 增量刷新）
+
+    Args:
+        mid: 目标用户 mid
+        refresh: 是否向B站确认新投稿，为 False 且缓存未过期时直接返回缓存
+        full: 是否重新列举全部投稿（并发请求所有页面，可清理已删除的视频）
+        sessdata: 可选，用户的 SESSDATA
+        use_sessdata: 是否使用SESSDATA认证，默认为True
+    """
+    try:
+        result = await SpaceVideoLister.get_instance().list_videos(
+            mid, refresh=refresh, full=full, sessdata=sessdata, use_sessdata=use_sessdata
+        )
+        return UserVideosResponse(status="success", message="获取用户全部投稿视频成功", data=result)
+    except SpaceApiError as e:
+        return UserVideosResponse(status="error", message=f"获取用户投稿视频列表失败：{str(e)}", data=e.payload)
+    except Exception as e:
+        print(f"获取用户全部投稿视频时出错：{str(e)}")
+        return UserVideosResponse(status="error", message=f"获取用户全部投稿视频时出错：{str(e)}")
+
 # 合集视频信息响应模型
 class SeasonVideoInfo(BaseModel):
     title: str
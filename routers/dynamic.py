@@ -2,23 +2,27 @@ import os
 import shutil
 import asyncio
 from typing import Optional, Dict, Any, List
-from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import StreamingResponse
 from loguru import logger
+from pydantic import BaseModel
 import aiohttp
 import aiofiles
 
-from scripts.utils import load_config, setup_logger, get_output_path
+from scripts.utils import get_config, setup_logger, get_output_path
 from scripts.dynamic_db import (
     get_connection,
-    save_normalized_dynamic_item,
+    save_normalized_dynamic_page,
+    existing_dynamic_ids,
+    get_item_id_str,
+    update_media_locals,
     list_hosts_with_stats,
     list_dynamics_for_host,
-    dynamic_core_exists,
     purge_host,
 )
-from scripts.dynamic_media import collect_image_urls, download_images, predict_image_path, collect_live_media_urls, download_live_media, collect_emoji_urls, download_emojis
+from scripts.dynamic_media import download_images, download_item_media
 from scripts.wbi_sign import get_wbi_sign
+from scripts.dynamic_crawler import DynamicCrawler
 
 # 确保日志系统已初始化
 setup_logger()
@@ -206,9 +210,47 @@ async def list_db_space(
             pass
 
 
+class WatchHostsRequest(BaseModel):
+    host_mids: List[int]
+
+
+@router.get("/crawler/status", summary="后台多UP抓取服务状态")
+async def crawler_status():
+    crawler = DynamicCrawler.get_instance()
+    return {"status": "success", "data": {**crawler.get_status(), "hosts": await crawler.list_hosts()}}
+
+
+@router.post("/crawler/start", summary="启动后台多UP抓取服务")
+async def crawler_start():
+    started = await DynamicCrawler.get_instance().start()
+    return {"status": "success", "message": "后台抓取服务已启动" if started else "后台抓取服务已在运行"}
+
+
+@router.post("/crawler/stop", summary="停止后台多UP抓取服务")
+async def crawler_stop():
+    stopped = await DynamicCrawler.get_instance().stop()
+    return {"status": "success", "message": "后台抓取服务已停止" if stopped else "后台抓取服务未在运行"}
+
+
+@router.post("/crawler/watch", summary="添加UP到后台抓取关注列表")
+async def crawler_watch(request: WatchHostsRequest):
+    crawler = DynamicCrawler.get_instance()
+    for host_mid in request.host_mids:
+        await crawler.add_host(host_mid)
+    return {"status": "success", "message": f"已添加 {len(request.host_mids)} 个UP", "data": await crawler.list_hosts()}
+
+
+@router.delete("/crawler/watch/{host_mid}", summary="从后台抓取关注列表移除UP")
+async def crawler_unwatch(host_mid: int):
+    removed = await DynamicCrawler.get_instance().remove_host(host_mid)
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"UP {host_mid} 不在关注列表中")
+    return {"status": "success", "message": f"已移除UP {host_mid}"}
+
+
 def get_headers() -> Dict[str, str]:
     """获取请求头（包含完整的浏览器模拟 Headers 以避免 412 风控）"""
-    config = load_config()
+    config = get_config()
     sessdata = config.get("SESSDATA", "")
 
     headers = {
@@ -408,9 +450,10 @@ async def auto_fetch_all(
 
             # 若从头开始，并且出现连续10条都已存在，则停止
             if start_from_head and conn is not None:
+                known_ids = existing_dynamic_ids(conn, host_mid, [get_item_id_str(item) for item in items])
                 for item in items:
-                    id_str = item.get("id_str") or item.get("basic", {}).get("id_str") or str(item.get("id"))
-                    if id_str and dynamic_core_exists(conn, host_mid, str(id_str)):
+                    id_str = get_item_id_str(item)
+                    if id_str and id_str in known_ids:
                         consecutive_duplicates += 1
                         if consecutive_duplicates >= 10:
                             next_offset = None  # 触发终止
@@ -425,8 +468,6 @@ async def auto_fetch_all(
 
             # 保存页面数据（去掉item.json保存，只有包含多媒体文件时才创建文件夹）
             if save_to_db and items:
-                base_output_dir = os.path.dirname(get_output_path("__base__"))
-                
                 # 头像保存：仅保存一次到 output/dynamic/{host_mid}/face.(ext)
                 try:
                     # 尝试从items提取用户头像
@@ -478,114 +519,23 @@ async def auto_fetch_all(
                 except Exception as e:
                     logger.warning(f"保存头像失败（忽略）：{e}")
                 
-                for item in items:
-                    try:
-                        id_str = (
-                            item.get("id_str")
-                            or item.get("basic", {}).get("id_str")
-                            or str(item.get("id"))
-                        )
+                # 整页批量写入规范化表（单事务），随后逐条下载媒体并回写本地路径
+                try:
+                    save_normalized_dynamic_page(conn, host_mid, items)
+                except Exception as norm_err:
+                    logger.warning(f"规范化保存失败（忽略）: {norm_err}")
+
+                if save_media:
+                    for item in items:
+                        id_str = get_item_id_str(item)
                         if not id_str:
                             continue
-
-                        # 检查是否有多媒体文件需要下载
-                        has_media = False
-                        predicted_locals = []
-                        live_predicted_locals = []
-                        if save_media:
-                            # 处理普通图片
-                            image_urls = collect_image_urls(item)
-                            if image_urls:
-                                has_media = True
-                                # 只有当包含多媒体文件时才创建文件夹
-                                item_dir = os.path.dirname(
-                                    get_output_path("dynamic", str(host_mid), str(id_str), "media")
-                                )
-                                os.makedirs(item_dir, exist_ok=True)
-                                
-                                # 预测本地路径
-                                for u in image_urls:
-                                    predicted_locals.append(os.path.relpath(predict_image_path(u, item_dir), base_output_dir))
-                                
-                                results = await download_images(image_urls, item_dir)
-                                media_records = []
-                                for media_url, local_path, ok in results:
-                                    if ok:
-                                        rel_path = os.path.relpath(local_path, base_output_dir)
-                                        media_records.append((media_url, rel_path, "image"))
-                            
-                            # 处理实况媒体（live图片+视频）
-                            live_media_pairs = collect_live_media_urls(item)
-                            if live_media_pairs:
-                                has_media = True
-                                # 创建文件夹（如果还未创建）
-                                if not image_urls:
-                                    item_dir = os.path.dirname(
-                                        get_output_path("dynamic", str(host_mid), str(id_str), "media")
-                                    )
-                                    os.makedirs(item_dir, exist_ok=True)
-                                
-                                live_results = await download_live_media(live_media_pairs, item_dir)
-                                for image_url, video_url, image_path, video_path, ok in live_results:
-                                    if ok:
-                                        # 将实况媒体路径分别记录
-                                        image_rel = os.path.relpath(image_path, base_output_dir)
-                                        video_rel = os.path.relpath(video_path, base_output_dir)
-                                        live_predicted_locals.extend([image_rel, video_rel])
-                            
-                            # 处理表情
-                            emoji_pairs = collect_emoji_urls(item)
-                            if emoji_pairs:
-                                has_media = True
-                                # 创建文件夹（如果还未创建）
-                                if not image_urls and not live_media_pairs:
-                                    item_dir = os.path.dirname(
-                                        get_output_path("dynamic", str(host_mid), str(id_str), "media")
-                                    )
-                                    os.makedirs(item_dir, exist_ok=True)
-                                
-                                emoji_results = await download_emojis(emoji_pairs, item_dir)
-                                for emoji_url, emoji_path, ok in emoji_results:
-                                    if ok:
-                                        # 将表情路径记录到普通媒体中
-                                        emoji_rel = os.path.relpath(emoji_path, base_output_dir)
-                                        predicted_locals.append(emoji_rel)
-
-                        # 规范化保存到数据库
-                        logger.info(f"normalize.core.call begin host_mid={host_mid} id_str={id_str}")
                         try:
-                            save_normalized_dynamic_item(conn, host_mid, item)
-                            logger.info(f"normalize.core.call done host_mid={host_mid} id_str={id_str}")
-                            # 回写本地路径逗号串（只有当有多媒体文件时）
+                            predicted_locals, live_predicted_locals = await download_item_media(host_mid, id_str, item)
                             if predicted_locals or live_predicted_locals:
-                                cursor = conn.cursor()
-                                cursor.execute(
-                                    """
-                                    UPDATE dynamic_core SET
-                                        media_locals = CASE
-                                            WHEN media_locals IS NULL OR media_locals = '' THEN ?
-                                            ELSE media_locals
-                                        END,
-                                        live_media_locals = CASE
-                                            WHEN live_media_locals IS NULL OR live_media_locals = '' THEN ?
-                                            ELSE live_media_locals
-                                        END,
-                                        live_media_count = ?
-                                    WHERE host_mid = ? AND id_str = ?
-                                    """,
-                                    (
-                                        ",".join(predicted_locals) if predicted_locals else "",
-                                        ",".join(live_predicted_locals) if live_predicted_locals else "",
-                                        len(live_predicted_locals),
-                                        str(host_mid),
-                                        str(id_str),
-                                    ),
-                                )
-                                conn.commit()
-                        except Exception as norm_err:
-                            logger.warning(f"规范化保存失败（忽略）: {norm_err}")
-                    except Exception as perr:
-                        logger.warning(f"保存页面数据失败: {perr}")
+                                update_media_locals(conn, host_mid, id_str, predicted_locals, live_predicted_locals)
+                        except Exception as perr:
+                            logger.warning(f"保存页面数据失败: {perr}")
 
             # 更新 meta
             meta["last_fetch_time"] = int(time.time())
@@ -709,8 +659,6 @@ async def get_space_dynamic(
 
             items: List[Dict[str, Any]] = all_items
 
-            base_output_dir = os.path.dirname(get_output_path("__base__"))
-
             # 头像保存：仅保存一次到 output/dynamic/{host_mid}/face.(ext)
             try:
                 # 尝试从items提取用户头像
@@ -791,116 +739,23 @@ async def get_space_dynamic(
             except Exception as e:
                 logger.warning(f"写入 host_mid 元数据失败（忽略）：{e}")
 
-            for item in items:
-                try:
-                    id_str = (
-                        item.get("id_str")
-                        or item.get("basic", {}).get("id_str")
-                        or str(item.get("id"))
-                    )
+            # 整页批量写入规范化表（单事务），随后逐条下载媒体并回写本地路径
+            try:
+                save_normalized_dynamic_page(conn, host_mid, items)
+            except Exception as norm_err:
+                logger.warning(f"规范化保存失败（忽略）: {norm_err}")
+
+            if save_media:
+                for item in items:
+                    id_str = get_item_id_str(item)
                     if not id_str:
-                        # 跳过无法定位ID的记录
                         continue
-
-                    # 检查是否有多媒体文件需要下载
-                    has_media = False
-                    predicted_locals = []
-                    live_predicted_locals = []
-                    if save_media:
-                        # 处理普通图片
-                        image_urls = collect_image_urls(item)
-                        if image_urls:
-                            has_media = True
-                            # 只有当包含多媒体文件时才创建文件夹
-                            item_dir = os.path.dirname(
-                                get_output_path("dynamic", str(host_mid), str(id_str), "media")
-                            )
-                            os.makedirs(item_dir, exist_ok=True)
-                            
-                            # 预测本地路径
-                            for u in image_urls:
-                                predicted_locals.append(os.path.relpath(predict_image_path(u, item_dir), base_output_dir))
-                            
-                            # 下载多媒体文件
-                            results = await download_images(image_urls, item_dir)
-                            media_records = []
-                            for media_url, local_path, ok in results:
-                                if ok:
-                                    rel_path = os.path.relpath(local_path, base_output_dir)
-                                    media_records.append((media_url, rel_path, "image"))
-                        
-                        # 处理实况媒体（live图片+视频）
-                        live_media_pairs = collect_live_media_urls(item)
-                        if live_media_pairs:
-                            has_media = True
-                            # 创建文件夹（如果还未创建）
-                            if not image_urls:
-                                item_dir = os.path.dirname(
-                                    get_output_path("dynamic", str(host_mid), str(id_str), "media")
-                                )
-                                os.makedirs(item_dir, exist_ok=True)
-                            
-                            live_results = await download_live_media(live_media_pairs, item_dir)
-                            for image_url, video_url, image_path, video_path, ok in live_results:
-                                if ok:
-                                    # 将实况媒体路径分别记录
-                                    image_rel = os.path.relpath(image_path, base_output_dir)
-                                    video_rel = os.path.relpath(video_path, base_output_dir)
-                                    live_predicted_locals.extend([image_rel, video_rel])
-                        
-                        # 处理表情
-                        emoji_pairs = collect_emoji_urls(item)
-                        if emoji_pairs:
-                            has_media = True
-                            # 创建文件夹（如果还未创建）
-                            if not image_urls and not live_media_pairs:
-                                item_dir = os.path.dirname(
-                                    get_output_path("dynamic", str(host_mid), str(id_str), "media")
-                                )
-                                os.makedirs(item_dir, exist_ok=True)
-                            
-                            emoji_results = await download_emojis(emoji_pairs, item_dir)
-                            for emoji_url, emoji_path, ok in emoji_results:
-                                if ok:
-                                    # 将表情路径记录到普通媒体中
-                                    emoji_rel = os.path.relpath(emoji_path, base_output_dir)
-                                    predicted_locals.append(emoji_rel)
-
-                    # 规范化保存到数据库
-                    logger.info(f"normalize.core.call begin host_mid={host_mid} id_str={id_str}")
                     try:
-                        save_normalized_dynamic_item(conn, host_mid, item)
-                        logger.info(f"normalize.core.call done host_mid={host_mid} id_str={id_str}")
-                        # 回写本地路径逗号串（只有当有多媒体文件时）
+                        predicted_locals, live_predicted_locals = await download_item_media(host_mid, id_str, item)
                         if predicted_locals or live_predicted_locals:
-                            cursor = conn.cursor()
-                            cursor.execute(
-                                """
-                                UPDATE dynamic_core SET
-                                    media_locals = CASE
-                                        WHEN media_locals IS NULL OR media_locals = '' THEN ?
-                                        ELSE media_locals
-                                    END,
-                                    live_media_locals = CASE
-                                        WHEN live_media_locals IS NULL OR live_media_locals = '' THEN ?
-                                        ELSE live_media_locals
-                                    END,
-                                    live_media_count = ?
-                                WHERE host_mid = ? AND id_str = ?
-                                """,
-                                (
-                                    ",".join(predicted_locals) if predicted_locals else "",
-                                    ",".join(live_predicted_locals) if live_predicted_locals else "",
-                                    len(live_predicted_locals),
-                                    str(host_mid),
-                                    str(id_str),
-                                ),
-                            )
-                            conn.commit()
-                    except Exception as norm_err:
-                        logger.warning(f"规范化保存失败（忽略）: {norm_err}")
-                except Exception as perr:
-                    logger.error(f"保存动态项失败 id_str={item.get('id_str')}: {perr}")
+                            update_media_locals(conn, host_mid, id_str, predicted_locals, live_predicted_locals)
+                    except Exception as perr:
+                        logger.error(f"保存动态项失败 id_str={id_str}: {perr}")
 
             try:
                 conn.close()
@@ -981,70 +836,10 @@ async def get_dynamic_detail(
                     except Exception:
                         host_mid_int = 0
 
-                    # 检查是否有多媒体文件需要下载
-                    base_output_dir = os.path.dirname(get_output_path("__base__"))
-                    has_media = False
-                    predicted_locals = []
-                    live_predicted_locals = []
-                    if save_media:
-                        # 处理普通图片
-                        image_urls = collect_image_urls(item)
-                        if image_urls:
-                            has_media = True
-                            # 只有当包含多媒体文件时才创建文件夹
-                            item_dir = os.path.dirname(
-                                get_output_path("dynamic", str(host_mid_int), str(id_str), "media")
-                            )
-                            os.makedirs(item_dir, exist_ok=True)
-                            
-                            # 预测本地路径
-                            for u in image_urls:
-                                predicted_locals.append(os.path.relpath(predict_image_path(u, item_dir), base_output_dir))
-                            
-                            # 下载多媒体文件
-                            results = await download_images(image_urls, item_dir)
-                            media_records = []
-                            for media_url, local_path, ok in results:
-                                if ok:
-                                    rel_path = os.path.relpath(local_path, base_output_dir)
-                                    media_records.append((media_url, rel_path, "image"))
-                        
-                        # 处理实况媒体（live图片+视频）
-                        live_media_pairs = collect_live_media_urls(item)
-                        if live_media_pairs:
-                            has_media = True
-                            # 创建文件夹（如果还未创建）
-                            if not image_urls:
-                                item_dir = os.path.dirname(
-                                    get_output_path("dynamic", str(host_mid_int), str(id_str), "media")
-                                )
-                                os.makedirs(item_dir, exist_ok=True)
-                            
-                            live_results = await download_live_media(live_media_pairs, item_dir)
-                            for image_url, video_url, image_path, video_path, ok in live_results:
-                                if ok:
-                                    # 将实况媒体路径分别记录
-                                    image_rel = os.path.relpath(image_path, base_output_dir)
-                                    video_rel = os.path.relpath(video_path, base_output_dir)
-                                    live_predicted_locals.extend([image_rel, video_rel])
-                        
-                        # 处理表情
-                        emoji_pairs = collect_emoji_urls(item)
-                        if emoji_pairs:
-                            has_media = True
-                            # 创建文件夹（如果还未创建）
-                            if not image_urls and not live_media_pairs:
-                                item_dir = os.path.dirname(
-                                    get_output_path("dynamic", str(host_mid_int), str(id_str), "media")
-                                )
-                                os.makedirs(item_dir, exist_ok=True)
-                            
-                            emoji_results = await download_emojis(emoji_pairs, item_dir)
-                            for emoji_url, emoji_path, ok in emoji_results:
-                                if ok:
-                                    # 将表情路径记录到普通媒体中
-                                    emoji_rel = os.path.relpath(emoji_path, base_output_dir)
-                                    predicted_locals.append(emoji_rel)
+                    # 下载图片/实况/表情，得到回写的本地路径
+                    predicted_locals, live_predicted_locals = (
+                        await download_item_media(host_mid_int, id_str, item) if save_media else ([], [])
+                    )
 
                     # 保存头像一次（若存在）
                     try:
@@ -1087,34 +882,11 @@ async def get_dynamic_detail(
                     except Exception as e:
                         logger.warning(f"保存头像失败（忽略）：{e}")
 
-                    # 规范化保存 + 回写预测路径（逗号分隔）
+                    # 规范化保存 + 回写本地路径（逗号分隔）
                     try:
-                        save_normalized_dynamic_item(conn, host_mid_int, item)
+                        save_normalized_dynamic_page(conn, host_mid_int, [item])
                         if predicted_locals or live_predicted_locals:
-                            cursor = conn.cursor()
-                            cursor.execute(
-                                """
-                                UPDATE dynamic_core SET
-                                    media_locals = CASE
-                                        WHEN media_locals IS NULL OR media_locals = '' THEN ?
-                                        ELSE media_locals
-                                    END,
-                                    live_media_locals = CASE
-                                        WHEN live_media_locals IS NULL OR live_media_locals = '' THEN ?
-                                        ELSE live_media_locals
-                                    END,
-                                    live_media_count = ?
-                                WHERE host_mid = ? AND id_str = ?
-                                """,
-                                (
-                                    ",".join(predicted_locals) if predicted_locals else "",
-                                    ",".join(live_predicted_locals) if live_predicted_locals else "",
-                                    len(live_predicted_locals),
-                                    str(host_mid_int),
-                                    str(id_str),
-                                ),
-                            )
-                            conn.commit()
+                            update_media_locals(conn, host_mid_int, id_str, predicted_locals, live_predicted_locals)
                     except Exception as norm_err:
                         logger.warning(f"规范化保存失败（忽略）: {norm_err}")
                 except Exception as perr:
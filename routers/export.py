@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import FileResponse
-from scripts.export_to_excel import export_bilibili_history
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from scripts.db_snapshot import DatabaseSnapshotManager, MEDIA_TYPES, zstd_available
+from scripts.export_to_excel import (
+    EXPORT_FORMATS, build_export_filename, export_bilibili_history, stream_history_csv
+)
 from scripts.utils import get_output_path, load_config
 from typing import Dict, Any
+from urllib.parse import quote
+import asyncio
 import os
 from datetime import datetime
 
@@ -13,13 +18,14 @@ config = load_config()
     "/export_history",
     summary="导出Bilibili历史记录到Excel",
     response_model=Dict[str, Any],
-    description="将历史记录数据导出为Excel文件，支持按年份、月份或日期范围导出数据"
+    description="将历史记录数据导出为Excel、CSV或Parquet文件，支持按年份、月份或日期范围导出数据"
 )
 def export_history(
     year: int = Query(None, description="要导出的年份，不指定则使用当前年份"),
     month: int = Query(None, description="要导出的月份（1-12），如果指定则只导出该月数据", ge=1, le=12),
     start_date: str = Query(None, description="开始日期，格式为'YYYY-MM-DD'，如果指定则从该日期开始导出"),
-    end_date: str = Query(None, description="结束日期，格式为'YYYY-MM-DD'，如果指定则导出到该日期为止")
+    end_date: str = Query(None, description="结束日期，格式为'YYYY-MM-DD'，如果指定则导出到该日期为止"),
+    format: str = Query("xlsx", description="导出格式：xlsx / csv / parquet（parquet 需要安装 pyarrow）")
 ):
     """
     导出Bilibili历史记录到Excel文件。
@@ -29,10 +35,27 @@ def export_history(
         month: 要导出的月份（1-12），如果指定则只导出该月数据
         start_date: 开始日期，格式为'YYYY-MM-DD'，如果指定则从该日期开始导出
         end_date: 结束日期，格式为'YYYY-MM-DD'，如果指定则导出到该日期为止
+        format: 导出格式
 
     Returns:
         Dict[str, Any]: 包含状态和消息的响应
     """
+    _validate_export_params(start_date, end_date, format)
+
+    result = export_bilibili_history(year, month, start_date, end_date, format)
+
+    if result["status"] == "success":
+        # 返回文件名信息，便于前端下载
+        filename = os.path.basename(result["message"].split("数据已成功导出到 ")[-1])
+        return {"status": "success", "message": result["message"], "filename": filename}
+    else:
+        raise HTTPException(status_code=500, detail=result["message"])
+
+
+def _validate_export_params(start_date: str, end_date: str, format: str) -> None:
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支持的导出格式: {format}")
+
     # 验证日期格式
     if start_date:
         try:
@@ -46,14 +69,41 @@ def export_history(
         except ValueError:
             raise HTTPException(status_code=400, detail="结束日期格式错误，应为'YYYY-MM-DD'")
 
-    result = export_bilibili_history(year, month, start_date, end_date)
 
-    if result["status"] == "success":
-        # 返回文件名信息，便于前端下载
-        filename = os.path.basename(result["message"].split("数据已成功导出到 ")[-1])
-        return {"status": "success", "message": result["message"], "filename": filename}
-    else:
+@router.get(
+    "/stream",
+    summary="流式下载历史记录",
+    description="直接下载导出结果。CSV 边查询边发送；xlsx 和 parquet 先分块写入文件再发送，内存占用与数据量无关"
+)
+async def stream_history(
+    year: int = Query(None, description="要导出的年份，不指定则使用当前年份"),
+    month: int = Query(None, description="要导出的月份（1-12），如果指定则只导出该月数据", ge=1, le=12),
+    start_date: str = Query(None, description="开始日期，格式为'YYYY-MM-DD'，如果指定则从该日期开始导出"),
+    end_date: str = Query(None, description="结束日期，格式为'YYYY-MM-DD'，如果指定则导出到该日期为止"),
+    format: str = Query("csv", description="导出格式：csv / xlsx / parquet（parquet 需要安装 pyarrow）")
+):
+    _validate_export_params(start_date, end_date, format)
+
+    filename = build_export_filename(year, month, start_date, end_date, format)
+    headers = {"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+    media_type = EXPORT_FORMATS[format][1]
+
+    if format == "csv":
+        return StreamingResponse(
+            stream_history_csv(year, month, start_date, end_date),
+            media_type=media_type,
+            headers=headers
+        )
+
+    # xlsx / parquet 需要写完整个文件才能发送（文件格式要求），写入过程本身是分块的
+    result = await asyncio.to_thread(export_bilibili_history, year, month, start_date, end_date, format)
+    if result["status"] != "success":
         raise HTTPException(status_code=500, detail=result["message"])
+    return FileResponse(
+        path=get_output_path(filename),
+        filename=filename,
+        media_type=media_type
+    )
 
 @router.get(
     "/download_excel/{filename}",
@@ -94,16 +144,40 @@ def download_excel(filename: str):
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail=f"未找到文件 {filename}")
 
+    media_type = next(
+        (media for ext, media in EXPORT_FORMATS.values() if filename.endswith(ext)),
+        "application/octet-stream"
+    )
     return FileResponse(
         path=file_path,
         filename=filename,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        media_type=media_type
     )
 
+def _snapshot_response(request: Request, snapshot) -> Response:
+    """返回快照文件，支持 ETag 缓存校验和 Range 断点续传"""
+    if request.headers.get("if-none-match") == snapshot.etag:
+        return Response(status_code=304, headers={"ETag": snapshot.etag})
+    # 传入固定 ETag，数据未变化时重新生成的快照 ETag 不变，If-Range 续传依然有效
+    return FileResponse(
+        path=snapshot.path,
+        filename=snapshot.filename,
+        media_type=MEDIA_TYPES[snapshot.compression],
+        headers={"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    )
+
+
+def _get_snapshot(scope: str, compression: str):
+    try:
+        return DatabaseSnapshotManager.get_instance().get(scope, compression)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get(
     "/download_db",
     summary="下载SQLite数据库",
-    description="下载完整的SQLite数据库文件，包含所有年份的历史记录数据",
+    description="下载完整的SQLite数据库文件，包含所有年份的历史记录数据。文件为在线备份生成的一致快照，支持断点续传",
     response_class=FileResponse,
     responses={
         200: {
@@ -124,20 +198,97 @@ def download_excel(filename: str):
         }
     }
 )
-def download_db():
+async def download_db(request: Request):
     """
     下载完整的SQLite数据库文件。
 
+    数据库不会被直接发送，而是先通过 SQLite 在线备份生成快照（数据未变化时复用已有快照），
+    避免导入过程中下载到不完整的文件。
+
     Returns:
         FileResponse: 数据库文件响应
     """
-    db_path = get_output_path(config['db_file'])
+    manager = DatabaseSnapshotManager.get_instance()
+    if not os.path.exists(manager.source_path()):
+        raise HTTPException(status_code=404, detail="数据库文件不存在")
 
-    if not os.path.exists(db_path):
+    snapshot = await manager.ensure("full", "none")
+    if snapshot.state != "ready":
+        raise HTTPException(status_code=500, detail=f"生成数据库快照失败: {snapshot.error}")
+    return _snapshot_response(request, snapshot)
+
+
+@router.get("/snapshots", summary="列出数据库快照")
+def list_snapshots():
+    """列出可生成快照的年份和已有快照"""
+    manager = DatabaseSnapshotManager.get_instance()
+    try:
+        years = manager.list_years()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    for scope in ["full"] + [str(year) for year in years]:
+        for compression in MEDIA_TYPES:
+            manager.get(scope, compression)
+    return {
+        "status": "success",
+        "years": years,
+        "compressions": [c for c in MEDIA_TYPES if c != "zstd" or zstd_available()],
+        "snapshots": [s for s in manager.list_snapshots() if s["state"] != "missing"]
+    }
+
+
+@router.post("/snapshots", summary="生成数据库快照")
+async def create_snapshot(
+    scope: str = Query("full", description="快照范围：full 为完整数据库，年份（如 2024）为单年快照"),
+    compression: str = Query("none", description="压缩方式：none / gzip / zstd"),
+    force: bool = Query(False, description="数据未变化时也重新生成")
+):
+    """在后台生成快照，完成后通过下载接口获取；数据未变化时直接复用已有快照"""
+    manager = DatabaseSnapshotManager.get_instance()
+    if not os.path.exists(manager.source_path()):
         raise HTTPException(status_code=404, detail="数据库文件不存在")
+    try:
+        snapshot = manager.start(scope, compression, force)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "message": "快照生成任务已启动", "snapshot": snapshot.to_dict()}
 
-    return FileResponse(
-        path=db_path,
-        filename="bilibili_history.db",
-        media_type="application/x-sqlite3"
+
+@router.get("/snapshots/{scope}", summary="查询数据库快照状态")
+def get_snapshot_status(
+    scope: str,
+    compression: str = Query("none", description="压缩方式：none / gzip / zstd")
+):
+    snapshot = _get_snapshot(scope, compression)
+    return {"status": "success", "snapshot": snapshot.to_dict()}
+
+
+@router.get("/snapshots/{scope}/download", summary="下载数据库快照")
+async def download_snapshot(
+    request: Request,
+    scope: str,
+    compression: str = Query("none", description="压缩方式：none / gzip / zstd")
+):
+    """下载已生成的快照，支持 If-None-Match 和 Range 请求
+
+    已有快照时先按当前数据重新计算指纹，数据变化后重新生成再返回（与 /download_db 相同）；
+    快照尚未生成时会启动生成任务并返回 202，稍后重试即可。
+    """
+    snapshot = _get_snapshot(scope, compression)
+    if snapshot.fingerprint and os.path.exists(snapshot.path):
+        try:
+            snapshot = await DatabaseSnapshotManager.get_instance().ensure(scope, compression)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if snapshot.state != "ready":
+            raise HTTPException(status_code=500, detail=f"生成数据库快照失败: {snapshot.error}")
+        return _snapshot_response(request, snapshot)
+    if snapshot.state != "running":
+        try:
+            DatabaseSnapshotManager.get_instance().start(scope, compression)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(
+        status_code=202,
+        content={"status": "pending", "message": "快照正在生成，请稍后重试", "snapshot": snapshot.to_dict()}
     )
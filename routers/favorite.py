@@ -8,7 +8,9 @@ import requests
 from fastapi import APIRouter, Query
 from pydantic import BaseModel, Field
 
-from scripts.utils import load_config
+from scripts.metrics import sqlite_factory
+from scripts.favorites_sync import FavoritesSync, save_folder_row, save_content_rows, lookup_favorite_folders
+from scripts.utils import load_config, get_config
 
 router = APIRouter()
 config = load_config()
@@ -93,7 +95,9 @@ CREATE_INDEXES = [
     "CREATE INDEX IF NOT EXISTS idx_favorites_folder_mtime ON favorites_folder (mtime);",
     "CREATE INDEX IF NOT EXISTS idx_favorites_content_media_id ON favorites_content (media_id);",
     "CREATE INDEX IF NOT EXISTS idx_favorites_content_upper_mid ON favorites_content (upper_mid);",
-    "CREATE INDEX IF NOT EXISTS idx_favorites_content_fav_time ON favorites_content (fav_time);"
+    "CREATE INDEX IF NOT EXISTS idx_favorites_content_fav_time ON favorites_content (fav_time);",
+    # lookup_favorite_folders 按 (content_id, type) 批量查询视频所在的收藏夹
+    "CREATE INDEX IF NOT EXISTS idx_favorites_content_content_id_type ON favorites_content (content_id, type);"
 ]
 
 # 数据模型
@@ -139,7 +143,7 @@ def get_headers(sessdata=None):
     """获取请求头"""
     # 如果未提供SESSDATA，尝试从配置中获取
     if sessdata is None:
-        current_config = load_config()
+        current_config = get_config()
         sessdata = current_config.get("SESSDATA", "")
     
     headers = {
@@ -153,7 +157,7 @@ def get_headers(sessdata=None):
         cookies.append(f"SESSDATA={sessdata}")
     
     # 如果配置中有bili_jct，也添加到Cookie中
-    current_config = load_config()
+    current_config = get_config()
     bili_jct = current_config.get("bili_jct", "")
     if bili_jct:
         cookies.append(f"bili_jct={bili_jct}")
@@ -200,7 +204,7 @@ def get_db_connection():
     # 确保数据库目录存在
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, factory=sqlite_factory())
     conn.row_factory = sqlite3.Row
     
     # 创建表和索引
@@ -272,44 +276,7 @@ async def get_created_folders(
             
             # 遍历所有收藏夹
             for folder in folders_data.get('list', []):
-                # 保存创建者信息
-                upper = folder.get('upper', {})
-                if upper and 'mid' in upper:
-                    cursor.execute("""
-                    INSERT OR REPLACE INTO favorites_creator 
-                    (mid, name, face, followed, vip_type, vip_status, fetch_time) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        upper.get('mid'),
-                        upper.get('name', ''),
-                        upper.get('face', ''),
-                        1 if upper.get('followed') else 0,
-                        upper.get('vip_type', 0),
-                        upper.get('vip_statue', 0),  # API返回的字段名可能有误
-                        timestamp
-                    ))
-                
-                # 保存收藏夹信息
-                cursor.execute("""
-                INSERT OR REPLACE INTO favorites_folder 
-                (media_id, fid, mid, title, cover, attr, intro, ctime, mtime, state, media_count, fav_state, like_state, fetch_time) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    folder.get('id'),
-                    folder.get('fid'),
-                    folder.get('mid'),
-                    folder.get('title', ''),
-                    folder.get('cover', ''),
-                    folder.get('attr'),
-                    folder.get('intro', ''),
-                    folder.get('ctime'),
-                    folder.get('mtime'),
-                    folder.get('state'),
-                    folder.get('media_count', 0),
-                    folder.get('fav_state', 0),
-                    folder.get('like_state', 0),
-                    timestamp
-                ))
+                save_folder_row(cursor, folder, timestamp)
             
             conn.commit()
         except Exception as e:
@@ -610,100 +577,10 @@ async def get_folder_resource_list(
             # 保存收藏夹元数据
             info = result_data.get('info', {})
             if info and 'id' in info:
-                # 保存创建者信息
-                upper = info.get('upper', {})
-                if upper and 'mid' in upper:
-                    cursor.execute("""
-                    INSERT OR REPLACE INTO favorites_creator 
-                    (mid, name, face, followed, vip_type, vip_status, fetch_time) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        upper.get('mid'),
-                        upper.get('name', ''),
-                        upper.get('face', ''),
-                        1 if upper.get('followed') else 0,
-                        upper.get('vip_type', 0),
-                        upper.get('vip_statue', 0),  # API返回的字段名可能有误
-                        timestamp
-                    ))
-                
-                # 保存收藏夹信息
-                cursor.execute("""
-                INSERT OR REPLACE INTO favorites_folder 
-                (media_id, fid, mid, title, cover, attr, intro, ctime, mtime, state, media_count, fav_state, like_state, fetch_time) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    info.get('id'),
-                    info.get('fid'),
-                    info.get('mid'),
-                    info.get('title', ''),
-                    info.get('cover', ''),
-                    info.get('attr'),
-                    info.get('intro', ''),
-                    info.get('ctime'),
-                    info.get('mtime'),
-                    info.get('state'),
-                    info.get('media_count', 0),
-                    info.get('fav_state', 0),
-                    info.get('like_state', 0),
-                    timestamp
-                ))
+                save_folder_row(cursor, info, timestamp)
             
             # 保存收藏夹内容
-            for resource in result_data.get('medias', []):
-                # 保存UP主信息
-                upper = resource.get('upper', {})
-                if upper and 'mid' in upper:
-                    cursor.execute("""
-                    INSERT OR REPLACE INTO favorites_creator 
-                    (mid, name, face, followed, vip_type, vip_status, fetch_time) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        upper.get('mid'),
-                        upper.get('name', ''),
-                        upper.get('face', ''),
-                        0,  # API不返回是否关注
-                        0,  # API不返回会员类型
-                        0,  # API不返回会员状态
-                        timestamp
-                    ))
-                
-                # 保存资源信息
-                cursor.execute("""
-                INSERT OR REPLACE INTO favorites_content 
-                (media_id, content_id, type, title, cover, bvid, intro, page, duration, upper_mid, attr, ctime, pubtime, fav_time, link, fetch_time,
-                creator_name, creator_face, bv_id, collect, play, danmaku, vt, play_switch, reply, view_text_1, first_cid, media_list_link) 
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    media_id,
-                    resource.get('id'),
-                    resource.get('type'),
-                    resource.get('title', ''),
-                    resource.get('cover', ''),
-                    resource.get('bvid', ''),
-                    resource.get('intro', ''),
-                    resource.get('page', 0),
-                    resource.get('duration', 0),
-                    upper.get('mid') if upper else 0,
-                    resource.get('attr', 0),
-                    resource.get('ctime', 0),
-                    resource.get('pubtime', 0),
-                    resource.get('fav_time', 0),
-                    resource.get('link', ''),
-                    timestamp,
-                    upper.get('name', '') if upper else '',
-                    upper.get('face', '') if upper else '',
-                    resource.get('bv_id', ''),
-                    resource.get('cnt_info', {}).get('collect', 0),
-                    resource.get('cnt_info', {}).get('play', 0),
-                    resource.get('cnt_info', {}).get('danmaku', 0),
-                    resource.get('cnt_info', {}).get('vt', 0),
-                    resource.get('cnt_info', {}).get('play_switch', 0),
-                    resource.get('cnt_info', {}).get('reply', 0),
-                    resource.get('cnt_info', {}).get('view_text_1', ''),
-                    resource.get('ugc', {}).get('first_cid', 0) if resource.get('ugc') else 0,
-                    resource.get('media_list_link', '')
-                ))
+            save_content_rows(cursor, media_id, result_data.get('medias') or [], timestamp)
             
             conn.commit()
         except Exception as e:
@@ -894,7 +771,7 @@ async def favorite_resource(
         headers = get_headers(sessdata)
         
         # 从配置或Cookie中获取bili_jct (CSRF Token)
-        current_config = load_config()
+        current_config = get_config()
         bili_jct = current_config.get("bili_jct", "")
         
         if not bili_jct:
@@ -1015,7 +892,7 @@ async def batch_favorite_resource(
         headers = get_headers(sessdata)
         
         # 从配置或Cookie中获取bili_jct (CSRF Token)
-        current_config = load_config()
+        current_config = get_config()
         bili_jct = current_config.get("bili_jct", "")
         
         if not bili_jct:
@@ -1077,6 +954,22 @@ async def batch_favorite_resource(
             "message": f"批量收藏操作失败: {str(e)}"
         }
 
+@router.post("/sync", summary="同步收藏夹到本地镜像")
+async def sync_favorites(
+    full: bool = Query(False, description="是否全量同步，默认增量（遇到已同步的收藏即停止）")
+):
+    """
+    拉取当前登录用户创建的全部收藏夹，增量写入本地数据库
+    """
+    return await FavoritesSync.get_instance().sync_all(full=full)
+
+@router.get("/sync/status", summary="获取收藏夹同步状态")
+async def get_sync_status():
+    return {
+        "status": "success",
+        "data": FavoritesSync.get_instance().get_status()
+    }
+
 class CheckFavoritesRequest(BaseModel):
     oids: List[int] = Field(..., description="视频的av号列表")
     sessdata: Optional[str] = Field(None, description="用户的SESSDATA")
@@ -1087,7 +980,7 @@ async def check_favorites_batch(request: CheckFavoritesRequest):
     批量检查多个视频是否已被收藏
     
     - oids: 视频的av号列表
-    - sessdata: 用户的SESSDATA，不提供则从配置文件读取
+    - sessdata: 保留参数，结果来自本地收藏夹镜像，不再请求B站接口
     
     响应格式:
     ```json
@@ -1110,7 +1003,6 @@ async def check_favorites_batch(request: CheckFavoritesRequest):
     try:
         # 获取请求参数
         oids = request.oids
-        sessdata = request.sessdata
         
         if not oids:
             return {
@@ -1118,48 +1010,22 @@ async def check_favorites_batch(request: CheckFavoritesRequest):
                 "message": "请提供至少一个视频av号"
             }
         
-        # 查询B站API获取用户的收藏夹列表
-        user_info = await get_current_user_info(sessdata)
-        if not user_info:
-            return {
-                "status": "error",
-                "message": "无法获取用户信息，请确保已登录"
-            }
-        
-        # 获取本地数据库中的相关收藏信息
+        # 只查询本地镜像（由收藏夹同步服务维护），一次 IN 查询得到全部结果
         conn = get_db_connection()
-        cursor = conn.cursor()
+        try:
+            folders_by_oid = lookup_favorite_folders(conn, oids)
+        finally:
+            conn.close()
         
         results = []
-        # 遍历每个视频av号
         for oid in oids:
-            # 查询本地数据库中是否收藏了该视频
-            cursor.execute("""
-            SELECT fc.media_id, ff.title 
-            FROM favorites_content fc
-            JOIN favorites_folder ff ON fc.media_id = ff.media_id
-            WHERE fc.content_id = ? AND fc.type = 2
-            """, (oid,))
-            
-            rows = cursor.fetchall()
-            is_favorited = len(rows) > 0
-            favorite_folders = []
-            
-            if is_favorited:
-                for row in rows:
-                    favorite_folders.append({
-                        "media_id": row[0],
-                        "title": row[1]
-                    })
-            
+            favorite_folders = folders_by_oid.get(oid, [])
             results.append({
                 "oid": oid,
-                "is_favorited": is_favorited,
+                "is_favorited": len(favorite_folders) > 0,
                 "favorite_folders": favorite_folders
             })
         
-        conn.close()
-        
         return {
             "status": "success",
             "data": {
@@ -4,10 +4,11 @@ from fastapi import APIRouter, Query, HTTPException
 from loguru import logger
 from pydantic import BaseModel, Field
 
-from scripts.bilibili_history import fetch_history, find_latest_local_history, fetch_and_compare_history, save_history, \
+from scripts.bilibili_history import fetch_history, find_latest_local_history, fetch_and_compare_history, \
     load_cookie, get_invalid_videos_from_db
+from scripts.history_sync_state import HistorySyncCheckpoint
 from scripts.import_sqlite import import_all_history_files
-from scripts.utils import load_config, setup_logger
+from scripts.utils import load_config, get_config, setup_logger
 
 # 确保日志系统已初始化
 setup_logger()
@@ -31,7 +32,7 @@ class ResponseModel(BaseModel):
 def get_headers():
     """获取请求头"""
     # 动态读取配置文件，获取最新的SESSDATA
-    current_config = load_config()
+    current_config = get_config()
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
         'Cookie': f'SESSDATA={current_config["SESSDATA"]}'
@@ -60,9 +61,9 @@ async def get_bili_history(output_dir: Optional[str] = "history_by_date", skip_e
 async def get_bili_history_realtime(sync_deleted: bool = False, process_video_details: bool = False):
     """实时获取B站历史记录"""
     try:
-        # 获取最新的本地历史记录时间戳
+        # 没有本地历史记录也没有同步检查点时，需要先进行一次完整获取
         latest_history = find_latest_local_history()
-        if not latest_history:
+        if not latest_history and HistorySyncCheckpoint.stored_high_water_mark() is None:
             return {"status": "error", "message": "未找到本地历史记录"}
 
         # 获取cookie
@@ -70,30 +71,33 @@ async def get_bili_history_realtime(sync_deleted: bool = False, process_video_de
         if not cookie:
             return {"status": "error", "message": "未找到有效的cookie"}
 
-        # 获取新的历史记录 - 使用await，因为fetch_and_compare_history现在是异步函数
-        new_records = await fetch_and_compare_history(cookie, latest_history, True, process_video_details)  # 传递process_video_details参数
+        # 获取新的历史记录，每页获取后已直接保存到本地文件
+        sync_summary = await fetch_and_compare_history(cookie, latest_history, True, process_video_details)
 
         # 保存新历史记录的结果信息
         history_result = {"new_records_count": 0, "inserted_count": 0}
         video_details_result = {"processed": False}
 
-        if new_records:
-            # 保存新记录
-            save_result = save_history(new_records)
-            logger.info("成功保存新记录到本地文件")
-            history_result["new_records_count"] = len(new_records)
+        if sync_summary["new_count"] > 0:
+            logger.info("成功保存新记录")
+            history_result["new_records_count"] = sync_summary["new_count"]
 
-            # 更新SQLite数据库
-            logger.info("=== 开始更新SQLite数据库 ===")
-            logger.info(f"同步已删除记录: {sync_deleted}")
-            db_result = import_all_history_files(sync_deleted=sync_deleted)
-
-            if db_result["status"] == "success":
-                history_result["inserted_count"] = db_result['inserted_count']
+            if sync_summary["direct_sqlite"]:
+                # 每页已在同步时直接写入数据库
+                history_result["inserted_count"] = sync_summary["inserted_count"]
                 history_result["status"] = "success"
             else:
-                history_result["status"] = "error"
-                history_result["message"] = db_result["message"]
+                # 更新SQLite数据库
+                logger.info("=== 开始更新SQLite数据库 ===")
+                logger.info(f"同步已删除记录: {sync_deleted}")
+                db_result = import_all_history_files(sync_deleted=sync_deleted)
+
+                if db_result["status"] == "success":
+                    history_result["inserted_count"] = db_result['inserted_count']
+                    history_result["status"] = "success"
+                else:
+                    history_result["status"] = "error"
+                    history_result["message"] = db_result["message"]
         else:
             history_result["status"] = "success"
             history_result["message"] = "没有新记录"
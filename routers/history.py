@@ -1,6 +1,8 @@
+import asyncio
 import json
 import os
 import hashlib
+import stat
 try:
     import pysqlite3 as sqlite3
 except ImportError:
@@ -11,7 +13,14 @@ from typing import Optional
 from fastapi import APIRouter, Query, HTTPException
 from pydantic import BaseModel
 
-from scripts.utils import get_output_path, load_config
+from loguru import logger
+
+from scripts.history_index import locate, locate_cid, set_remark, sync_history_index
+from scripts.history_fanout import HistoryQueryExecutor
+from scripts.history_suggest import KINDS as SUGGEST_KINDS, HistorySuggestIndex
+from scripts.history_partitions import (connect_history, history_table_names, is_sealed, list_partitions,
+                                        seal_year, sealed_stats, sealed_years, unseal_year)
+from scripts.utils import get_output_path, load_config, log_enabled
 from scripts.image_downloader import ImageDownloader
 
 router = APIRouter()
@@ -26,8 +35,8 @@ def get_db():
     db_exists = os.path.exists(db_path)
 
     try:
-        # 连接数据库
-        conn = sqlite3.connect(db_path)
+        # 连接数据库（附加已封存的年份）
+        conn = connect_history(db_path)
         cursor = conn.cursor()
 
         # 设置数据库兼容性参数
@@ -38,7 +47,14 @@ def get_db():
             ('user_version', 317)  # 使用固定的用户版本号
         ]
 
+        # journal_mode 和 user_version 保存在数据库文件中，只在与当前值不同时修改：
+        # 每次请求都重写文件头会让依赖数据库变化的缓存（计数缓存、查找表同步）全部失效
+        persistent = {'journal_mode', 'user_version'}
         for pragma, value in pragmas:
+            if pragma in persistent:
+                current = cursor.execute(f'PRAGMA {pragma}').fetchone()
+                if current and str(current[0]).upper() == str(value).upper():
+                    continue
             cursor.execute(f'PRAGMA {pragma}={value}')
         conn.commit()
 
@@ -68,16 +84,8 @@ def get_available_years():
             print("无法连接到数据库")
             return [datetime.now().year]  # 返回当前年份作为默认值
 
-        cursor = conn.cursor()
-
-        # 查询所有历史记录表
-        cursor.execute("""
-            SELECT name FROM sqlite_master
-            WHERE type='table' AND name LIKE 'bilibili_history_%'
-            ORDER BY name DESC
-        """)
-
-        tables = cursor.fetchall()
+        # 查询所有历史记录表（包括已封存的年份）
+        tables = [(name,) for name in reversed(history_table_names(conn))]
         print(f"找到的表: {tables}")
 
         years = []
@@ -223,22 +231,15 @@ async def get_history_page(
     business: Optional[str] = Query(None, description="业务类型，如archive(普通视频)、pgc(番剧)、live(直播)、article-list(文集)、article(文章)")
 ):
     """分页查询历史记录，支持跨年份查询"""
-    print("\n=== 接收到的请求参数 ===")
-    print(f"页码(page): {page}")
-    print(f"每页记录数(size): {size}")
-    print(f"排序顺序(sort_order): {'升序' if sort_order == 1 else '降序'}")
-    print(f"子分区名称(tag_name): {tag_name if tag_name else '无'}")
-    print(f"主分区名称(main_category): {main_category if main_category else '无'}")
-    print(f"日期范围(date_range): {date_range if date_range else '无'}")
-    print(f"是否使用本地图片(use_local_images): {use_local_images}")
-    print(f"是否使用SESSDATA(use_sessdata): {use_sessdata}")
-    print(f"业务类型(business): {business if business else '全部'}")
-    print("=====================\n")
+    debug = log_enabled("DEBUG")
+    if debug:
+        logger.debug(
+            f"分页查询参数: page={page}, size={size}, sort_order={'升序' if sort_order == 1 else '降序'}, "
+            f"tag_name={tag_name or '无'}, main_category={main_category or '无'}, date_range={date_range or '无'}, "
+            f"use_local_images={use_local_images}, use_sessdata={use_sessdata}, business={business or '全部'}"
+        )
 
     try:
-        conn = get_db()
-        cursor = conn.cursor()
-
         # 获取可用年份列表
         available_years = get_available_years()
         if not available_years:
@@ -247,10 +248,6 @@ async def get_history_page(
                 "message": "未找到任何历史记录数据"
             }
 
-        # 构建UNION ALL查询
-        queries = []
-        params = []
-
         # 处理日期范围
         start_timestamp = None
         end_timestamp = None
@@ -262,66 +259,55 @@ async def get_history_page(
             except ValueError:
                 return {"status": "error", "message": "日期格式无效，应为yyyyMMdd-yyyyMMdd"}
 
-        # 为每个年份构建查询
-        for year in available_years:
-            table_name = f"bilibili_history_{year}"
-            query = f"SELECT * FROM {table_name} WHERE 1=1"
-
-            # 添加日期范围条件
-            if start_timestamp is not None and end_timestamp is not None:
-                query += " AND view_at >= ? AND view_at < ?"
-                params.extend([start_timestamp, end_timestamp])
-
-            # 添加分类筛选
-            if main_category:
-                query += " AND main_category = ?"
-                params.append(main_category)
-            elif tag_name:
-                query += " AND tag_name = ?"
-                params.append(tag_name)
-
-            # 添加业务类型筛选
-            if business:
-                query += " AND business = ?"
-                params.append(business)
-
-            queries.append(query)
-
-        # 组合所有查询
-        base_query = " UNION ALL ".join(queries)
-
-        # 获取总记录数
-        count_query = f"SELECT COUNT(*) FROM ({base_query})"
-        cursor.execute(count_query, params)
-        total = cursor.fetchone()[0]
-
-        # 添加排序和分页
-        final_query = f"""
-            SELECT * FROM ({base_query})
-            ORDER BY view_at {('ASC' if sort_order == 1 else 'DESC')}
-            LIMIT ? OFFSET ?
-        """
-        params.extend([size, (page - 1) * size])
-
-        print("=== SQL查询构建 ===")
-        print(f"最终SQL: {final_query}")
-        print(f"参数: {params}")
-        print("==================\n")
+        # 每个年份使用相同的筛选条件
+        conditions = []
+        params = []
 
-        # 执行查询
-        cursor.execute(final_query, params)
-        columns = [description[0] for description in cursor.description]
+        # 添加日期范围条件
+        if start_timestamp is not None and end_timestamp is not None:
+            conditions.append("view_at >= ? AND view_at < ?")
+            params.extend([start_timestamp, end_timestamp])
+
+        # 添加分类筛选
+        if main_category:
+            conditions.append("main_category = ?")
+            params.append(main_category)
+        elif tag_name:
+            conditions.append("tag_name = ?")
+            params.append(tag_name)
+
+        # 添加业务类型筛选
+        if business:
+            conditions.append("business = ?")
+            params.append(business)
+
+        where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        years = available_years
+        if start_timestamp is not None and end_timestamp is not None:
+            # 日期范围之外的年份不需要查询
+            years = [year for year in available_years
+                     if datetime(year, 1, 1).timestamp() - 86400 < end_timestamp
+                     and datetime(year + 1, 1, 1).timestamp() + 86400 > start_timestamp]
+
+        if debug:
+            logger.debug(f"筛选条件: {where_clause} 参数: {params} 年份: {years}")
+
+        # 各年份并发计数和查询，按观看时间合并出当前页
+        executor = HistoryQueryExecutor.get_instance()
+        total, (columns, rows) = await asyncio.gather(
+            asyncio.to_thread(executor.count, years, where_clause, params),
+            asyncio.to_thread(executor.fetch_page, years, where_clause, params,
+                              sort_order != 1, size, (page - 1) * size)
+        )
         records = []
 
-        for row in cursor.fetchall():
+        for row in rows:
             record = dict(zip(columns, row))
             record = _process_record(record, use_local_images, use_sessdata)
             records.append(record)
 
-        print("=== 响应结果 ===")
-        print(f"返回记录数: {len(records)}")
-        print(f"第一条记录: {records[0] if records else '无记录'}")
-        print("================\n")
+        if debug:
+            logger.debug(f"返回记录数: {len(records)}, 第一条记录: {records[0] if records else '无记录'}")
 
         return {
             "status": "success",
@@ -338,9 +324,6 @@ async def get_history_page(
         error_msg = f"数据库错误: {str(e)}"
         print(f"=== 错误 ===\n{error_msg}\n===========")
         return {"status": "error", "message": error_msg}
-    finally:
-        if conn:
-            conn.close()
 
 def process_search_keyword(keyword: str) -> str:
     """处理搜索关键词，返回处理后的关键词
@@ -365,11 +348,14 @@ def create_fts_table(conn, table_name: str):
     try:
         # 检查原表是否存在
         cursor.execute(f"""
-            SELECT name FROM sqlite_master
-            WHERE type='table' AND name='bilibili_history_{table_name}'
+            SELECT type FROM sqlite_master
+            WHERE type IN ('table', 'view') AND name='bilibili_history_{table_name}'
         """)
-        if not cursor.fetchone():
+        source = cursor.fetchone()
+        if not source:
             return False
+        # 紧凑存储的年份是视图，只能使用 INSTEAD OF 触发器
+        timing = "INSTEAD OF" if source[0] == 'view' else "AFTER"
 
         # 创建FTS5虚拟表
         fts_table = f"bilibili_history_{table_name}_fts"
@@ -388,7 +374,7 @@ def create_fts_table(conn, table_name: str):
 
         # 创建触发器以保持FTS表同步
         cursor.execute(f"""
-            CREATE TRIGGER IF NOT EXISTS history_{table_name}_ai AFTER INSERT ON bilibili_history_{table_name} BEGIN
+            CREATE TRIGGER IF NOT EXISTS history_{table_name}_ai {timing} INSERT ON bilibili_history_{table_name} BEGIN
                 INSERT INTO {fts_table}(
                     rowid, title, author_name, tag_name, main_category, remark, title_pinyin
                 )
@@ -400,14 +386,14 @@ def create_fts_table(conn, table_name: str):
         """)
 
         cursor.execute(f"""
-            CREATE TRIGGER IF NOT EXISTS history_{table_name}_ad AFTER DELETE ON bilibili_history_{table_name} BEGIN
+            CREATE TRIGGER IF NOT EXISTS history_{table_name}_ad {timing} DELETE ON bilibili_history_{table_name} BEGIN
                 INSERT INTO {fts_table}({fts_table}, rowid, title, author_name, tag_name, main_category, remark)
                 VALUES('delete', old.id, old.title, old.author_name, old.tag_name, old.main_category, old.remark);
             END;
         """)
 
         cursor.execute(f"""
-            CREATE TRIGGER IF NOT EXISTS history_{table_name}_au AFTER UPDATE ON bilibili_history_{table_name} BEGIN
+            CREATE TRIGGER IF NOT EXISTS history_{table_name}_au {timing} UPDATE ON bilibili_history_{table_name} BEGIN
                 INSERT INTO {fts_table}({fts_table}, rowid, title, author_name, tag_name, main_category, remark)
                 VALUES('delete', old.id, old.title, old.author_name, old.tag_name, old.main_category, old.remark);
                 INSERT INTO {fts_table}(rowid, title, author_name, tag_name, main_category, remark)
@@ -450,10 +436,8 @@ def build_field_search_conditions(field: str, search: str, exact_match: bool) ->
     # 使用 OR 连接所有条件
     condition = "(" + " OR ".join(conditions) + ")"
 
-    print(f"\n=== 字段条件构建 [{field}] ===")
-    print(f"条件: {condition}")
-    print(f"参数: {params}")
-    print("===================")
+    if log_enabled("DEBUG"):
+        logger.debug(f"字段条件构建 [{field}]: {condition} 参数: {params}")
     return condition, params
 
 @router.get("/search", summary="搜索历史记录")
@@ -467,18 +451,14 @@ async def search_history(
     use_local_images: bool = Query(False, description="是否使用本地图片")
 ):
     """高级搜索历史记录，按观看时间排序，使用模糊匹配"""
+    debug = log_enabled("DEBUG")
     try:
-        print("\n=== 搜索开始 ===")
-        print(f"关键词: {search}")
-        print(f"类型: {search_type}")
-        print(f"匹配方式: 模糊匹配")
-        print(f"排序顺序: {'升序' if sortOrder == 1 else '降序'}")
-        print(f"是否使用SESSDATA: {use_sessdata}")
-        print(f"是否使用本地图片: {use_local_images}")
-        print("==============\n")
-
-        conn = get_db()
-        cursor = conn.cursor()
+        if debug:
+            logger.debug(
+                f"搜索开始: 关键词={search}, 类型={search_type}, 匹配方式=模糊匹配, "
+                f"排序顺序={'升序' if sortOrder == 1 else '降序'}, use_sessdata={use_sessdata}, "
+                f"use_local_images={use_local_images}"
+            )
 
         # 获取可用年份列表
         available_years = get_available_years()
@@ -488,10 +468,6 @@ async def search_history(
                 "message": "未找到任何历史记录数据"
             }
 
-        # 构建每个年份的子查询
-        sub_queries = []
-        base_params = []
-
         # 处理搜索关键词
         field_map = {
             "title": "title",
@@ -504,20 +480,17 @@ async def search_history(
         search_params = []
         if search:
             search = process_search_keyword(search)
-            print(f"\n处理后的搜索关键词: {search}\n")
-
-            print("\n=== 开始构建查询条件 ===")
+            if debug:
+                logger.debug(f"处理后的搜索关键词: {search}")
 
             # 构建WHERE子句（强制使用模糊匹配）
             exact_match = False
             if search_type == "all":
                 field_conditions = []
                 for field_name, field in field_map.items():
-                    print(f"\n处理字段: {field_name}")
                     condition, params = build_field_search_conditions(field, search, exact_match)
                     field_conditions.append(condition)
                     search_params.extend(params)
-                    print(f"当前参数数量: {len(search_params)}")
 
                 if field_conditions:
                     where_clause = f"WHERE ({' OR '.join(field_conditions)})"
@@ -528,55 +501,19 @@ async def search_history(
                     where_clause = f"WHERE {condition}"
                     search_params.extend(params)
 
-        # 构建基础查询
-        for year in available_years:
-            table_name = f"bilibili_history_{year}"
-            sub_query = f"SELECT * FROM {table_name} {where_clause}"
-            sub_queries.append(sub_query)
-            # 为每个子查询添加一组参数
-            base_params.extend(search_params)
-
-        base_query = f"{' UNION ALL '.join(sub_queries)}"
-
-        print("\n=== 基础查询 ===")
-        print(f"SQL: {base_query}")
-        print(f"参数: {base_params}")
-        print(f"参数数量: {len(base_params)}")
-        print("================\n")
-
-        # 获取总记录数
-        count_query = f"SELECT COUNT(*) FROM ({base_query})"
-        print("\n=== 计数查询 ===")
-        print(f"SQL: {count_query}")
-        print(f"参数: {base_params}")
-        print("================\n")
-
-        cursor.execute(count_query, base_params)
-        total = cursor.fetchone()[0]
+        if debug:
+            logger.debug(f"搜索条件: {where_clause} 参数: {search_params}")
 
-        # 构建最终查询，按观看时间排序和分页
-        params = base_params.copy()
-        query = f"""
-            SELECT * FROM ({base_query})
-            ORDER BY view_at {('ASC' if sortOrder == 1 else 'DESC')}
-        """
-
-        # 添加分页
-        query += " LIMIT ? OFFSET ?"
-        params.extend([size, (page - 1) * size])
-
-        print("\n=== 最终查询 ===")
-        print(f"SQL: {query}")
-        print(f"参数: {params}")
-        print(f"参数数量: {len(params)}")
-        print("================\n")
-
-        # 执行查询
-        cursor.execute(query, params)
-        columns = [description[0] for description in cursor.description]
+        # 各年份并发计数和搜索，按观看时间合并出当前页
+        executor = HistoryQueryExecutor.get_instance()
+        total, (columns, rows) = await asyncio.gather(
+            asyncio.to_thread(executor.count, available_years, where_clause, search_params),
+            asyncio.to_thread(executor.fetch_page, available_years, where_clause, search_params,
+                              sortOrder != 1, size, (page - 1) * size)
+        )
         records = []
 
-        for row in cursor.fetchall():
+        for row in rows:
             record = dict(zip(columns, row))
             record = _process_record(record, use_local_images, use_sessdata)
             records.append(record)
@@ -602,9 +539,39 @@ async def search_history(
         error_msg = f"数据库错误: {str(e)}"
         print(f"\n=== 数据库错误 ===\n{error_msg}\n=================\n")
         return {"status": "error", "message": error_msg}
-    finally:
-        if conn:
-            conn.close()
+
+@router.get("/suggest", summary="标题、UP主和标签的输入提示")
+async def suggest_history(
+    q: str = Query(..., description="输入的前缀，支持拼音首字母，如 ys 匹配 原神"),
+    limit: int = Query(10, ge=1, le=50, description="返回条数"),
+    type: Optional[str] = Query(None, description="只提示某一类：title、author 或 tag，不传则全部")
+):
+    """输入提示
+
+    在内存中的前缀索引上查询，不访问历史记录库；结果按观看次数排序，
+    match 为 prefix 表示原文前缀匹配，pinyin 表示拼音首字母匹配。
+    """
+    if type is not None and type not in SUGGEST_KINDS:
+        raise HTTPException(status_code=400, detail=f"type 只能是 {'、'.join(SUGGEST_KINDS)}")
+    index = HistorySuggestIndex.get_instance()
+    if not index.loaded:
+        # 首次查询时从提示库载入，之后只访问内存
+        await asyncio.to_thread(index.load)
+    return {
+        "status": "success",
+        "data": {
+            "query": q,
+            "suggestions": index.suggest(q, limit, type)
+        }
+    }
+
+@router.post("/suggest/refresh", summary="更新输入提示")
+async def refresh_suggest(rebuild: bool = Query(False, description="是否重新统计全部年份")):
+    """把历史记录库的变化同步到输入提示（导入历史记录后会自动执行）"""
+    index = HistorySuggestIndex.get_instance()
+    summary = await asyncio.to_thread(index.refresh, rebuild)
+    await asyncio.to_thread(index.load)
+    return {"status": "success", "data": {"refresh": summary, "stats": index.get_stats()}}
 
 @router.get("/remarks", summary="获取所有备注")
 async def get_all_remarks(
@@ -626,49 +593,39 @@ async def get_all_remarks(
         conn = get_db()
         cursor = conn.cursor()
 
-        # 获取所有年份的表
-        years = get_available_years()
-        if not years:
-            return {
-                "status": "error",
-                "message": "未找到任何历史记录数据"
-            }
-
-        # 构建UNION ALL查询，只查询有备注的记录
-        queries = []
-        for year in years:
-            table_name = f"bilibili_history_{year}"
-            queries.append(f"""
-                SELECT *
-                FROM {table_name}
-                WHERE remark != ''
-            """)
-
-        # 组合所有查询，添加排序和分页
-        base_query = " UNION ALL ".join(queries)
-        count_query = f"SELECT COUNT(*) FROM ({base_query})"
-
-        # 添加排序和分页（按备注时间排序）
-        final_query = f"""
-            SELECT * FROM ({base_query})
-            ORDER BY remark_time {('ASC' if sort_order == 1 else 'DESC')}
-            LIMIT ? OFFSET ?
-        """
-
-        # 获取总记录数
-        cursor.execute(count_query)
+        # 备注表只包含有备注的记录，按备注时间排序分页只需走索引
+        sync_history_index(conn)
+        cursor.execute("SELECT COUNT(*) FROM history_remarks")
         total = cursor.fetchone()[0]
+        cursor.execute(f"""
+            SELECT year, id FROM history_remarks
+            ORDER BY remark_time {('ASC' if sort_order == 1 else 'DESC')}, id
+            LIMIT ? OFFSET ?
+        """, [size, (page - 1) * size])
+        page_ids = cursor.fetchall()
+
+        # 按年份批量读取完整记录，再按分页顺序排列
+        ids_by_year = {}
+        for year, record_id in page_ids:
+            ids_by_year.setdefault(year, []).append(record_id)
+        rows_by_id = {}
+        columns = []
+        for year, ids in ids_by_year.items():
+            cursor.execute(
+                f"SELECT * FROM bilibili_history_{year} WHERE id IN ({','.join('?' * len(ids))})", ids
+            )
+            columns = [description[0] for description in cursor.description]
+            for row in cursor.fetchall():
+                rows_by_id[(year, row[0])] = dict(zip(columns, row))
 
-        # 执行分页查询
-        cursor.execute(final_query, [size, (page - 1) * size])
-
-        # 获取列名
-        columns = [description[0] for description in cursor.description]
         records = []
 
         # 构建记录
-        for row in cursor.fetchall():
-            record = dict(zip(columns, row))
+        for year, record_id in page_ids:
+            record = rows_by_id.get((year, record_id))
+            if record is None:
+                continue
+
             # 解析JSON字符串
             if 'covers' in record and record['covers']:
                 try:
@@ -715,22 +672,40 @@ async def update_video_remark(request: UpdateRemarkRequest):
         conn = get_db()
         cursor = conn.cursor()
 
-        # 从时间戳获取年份
-        year = datetime.fromtimestamp(request.view_at).year
+        # 通过全局查找表定位记录所在的年份表，找不到时按观看时间推算年份
+        sync_history_index(conn)
+        location = locate(conn, request.bvid, request.view_at)
+        year = location[0] if location else datetime.fromtimestamp(request.view_at).year
         table_name = f"bilibili_history_{year}"
 
         # 检查表是否存在
         cursor.execute("""
             SELECT name FROM sqlite_master
-            WHERE type='table' AND name=?
+            WHERE type IN ('table', 'view') AND name=?
         """, (table_name,))
 
         if not cursor.fetchone():
+            if is_sealed(year):
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"{year} 年的历史记录已封存为只读，请先解封"
+                )
             raise HTTPException(
                 status_code=404,
                 detail=f"未找到 {year} 年的历史记录数据"
             )
 
+        # 先查出要更新的记录：紧凑存储（v2）年份的年份表是视图，
+        # 经 INSTEAD OF 触发器写入时 rowcount 始终为 0，不能据此判断是否找到记录
+        cursor.execute(f"SELECT id FROM {table_name} WHERE bvid = ? AND view_at = ?",
+                       (request.bvid, request.view_at))
+        record_ids = [row[0] for row in cursor.fetchall()]
+        if not record_ids:
+            raise HTTPException(
+                status_code=404,
+                detail="未找到指定的视频记录"
+            )
+
         # 更新备注和备注时间
         current_time = int(datetime.now().timestamp())
         query = f"""
@@ -739,13 +714,13 @@ async def update_video_remark(request: UpdateRemarkRequest):
             WHERE bvid = ? AND view_at = ?
         """
         cursor.execute(query, (request.remark, current_time, request.bvid, request.view_at))
-        conn.commit()
 
-        if cursor.rowcount == 0:
-            raise HTTPException(
-                status_code=404,
-                detail="未找到指定的视频记录"
-            )
+        # 同步备注表
+        for record_id in record_ids:
+            set_remark(conn, year, record_id, request.bvid, request.view_at, request.remark, current_time)
+        conn.commit()
+        # 备注表已同步，记下写入后的变化标识，之后的读请求不必再检查年份表
+        sync_history_index(conn)
 
         return {
             "status": "success",
@@ -791,6 +766,18 @@ async def reset_database():
                     detail=f"删除数据库文件失败: {str(e)}"
                 )
 
+        # 删除封存的年份，重新导入时写回主库
+        sealed_files = list(sealed_years().values())
+        for path in sealed_files:
+            try:
+                os.chmod(path, stat.S_IWRITE | stat.S_IREAD)
+                os.remove(path)
+            except Exception as e:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"删除封存文件失败: {str(e)}"
+                )
+
         # 删除last_import.json文件
         if os.path.exists(last_import_path):
             try:
@@ -808,7 +795,7 @@ async def reset_database():
                 "deleted_files": [
                     os.path.basename(db_path),
                     os.path.basename(last_import_path)
-                ]
+                ] + [os.path.basename(path) for path in sealed_files]
             }
         }
 
@@ -818,6 +805,37 @@ async def reset_database():
             detail=f"重置数据库失败: {str(e)}"
         )
 
+@router.get("/partitions", summary="获取各年份的存储位置")
+async def get_partitions():
+    """列出各年份在主库（可写）还是封存文件（只读）中，以及封存时预先计算的统计"""
+    partitions = await asyncio.to_thread(list_partitions)
+    for item in partitions:
+        if item['sealed']:
+            item['stats'] = sealed_stats(item['year'])
+    return {"status": "success", "data": partitions}
+
+@router.post("/partitions/{year}/seal", summary="封存已结束的年份")
+async def seal_partition(year: int):
+    """把已经结束的年份封存为只读数据库文件，主库中删除该年份"""
+    try:
+        result = await asyncio.to_thread(seal_year, year)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (ValueError, sqlite3.IntegrityError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "message": f"{year} 年历史记录已封存", "data": result}
+
+@router.post("/partitions/{year}/unseal", summary="解封年份")
+async def unseal_partition(year: int):
+    """把封存的年份复制回主库，恢复修改备注和删除记录"""
+    try:
+        result = await asyncio.to_thread(unseal_year, year)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (ValueError, sqlite3.IntegrityError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "message": f"{year} 年历史记录已解封", "data": result}
+
 @router.get("/sqlite-version", summary="获取SQLite版本")
 async def get_sqlite_version():
     """获取 SQLite 版本信息"""
@@ -926,51 +944,40 @@ async def get_video_remarks(request: BatchRemarksRequest):
         conn = get_db()
         cursor = conn.cursor()
 
-        # 按年份分组记录
-        records_by_year = {}
-        for record in request.items:
-            year = datetime.fromtimestamp(record['view_at']).year
-            if year not in records_by_year:
-                records_by_year[year] = []
-            records_by_year[year].append((record['bvid'], record['view_at']))
+        # 所有 (bvid, view_at) 写入临时表，通过全局查找表一次连接查出各年份表中的记录
+        sync_history_index(conn)
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS remark_keys (bvid TEXT, view_at INTEGER)")
+        cursor.execute("DELETE FROM remark_keys")
+        cursor.executemany(
+            "INSERT INTO remark_keys (bvid, view_at) VALUES (?, ?)",
+            [(record['bvid'], record['view_at']) for record in request.items]
+        )
+        cursor.execute("""
+            SELECT DISTINCT l.year FROM remark_keys k
+            JOIN history_lookup l ON l.bvid = k.bvid AND l.view_at = k.view_at
+        """)
+        years = [row[0] for row in cursor.fetchall()]
 
         # 存储所有查询结果
         results = {}
 
-        # 处理每个年份的数据
-        for year, year_records in records_by_year.items():
-            table_name = f"bilibili_history_{year}"
-
-            # 检查表是否存在
-            cursor.execute("""
-                SELECT name FROM sqlite_master
-                WHERE type='table' AND name=?
-            """, (table_name,))
-
-            if not cursor.fetchone():
-                print(f"未找到 {year} 年的历史记录数据")
-                continue
-
-            # 为每个(bvid, view_at)对执行单独的查询
-            for bvid, view_at in year_records:
-                query = f"""
-                    SELECT bvid, view_at, title, remark, remark_time
-                    FROM {table_name}
-                    WHERE bvid = ? AND view_at = ?
-                """
-
-                cursor.execute(query, (bvid, view_at))
-                row = cursor.fetchone()
-
-                if row:
-                    bvid, view_at, title, remark, remark_time = row
-                    results[f"{bvid}_{view_at}"] = {
-                        "bvid": bvid,
-                        "view_at": view_at,
-                        "title": title,
-                        "remark": remark,
-                        "remark_time": remark_time
-                    }
+        if years:
+            query = " UNION ALL ".join(f"""
+                SELECT h.bvid, h.view_at, h.title, h.remark, h.remark_time
+                FROM remark_keys k
+                JOIN history_lookup l ON l.bvid = k.bvid AND l.view_at = k.view_at AND l.year = {year}
+                JOIN bilibili_history_{year} h ON h.id = l.id
+            """ for year in years)
+            cursor.execute(query)
+            for bvid, view_at, title, remark, remark_time in cursor.fetchall():
+                results[f"{bvid}_{view_at}"] = {
+                    "bvid": bvid,
+                    "view_at": view_at,
+                    "title": title,
+                    "remark": remark,
+                    "remark_time": remark_time
+                }
+        cursor.execute("DELETE FROM remark_keys")
 
         return {
             "status": "success",
@@ -1008,38 +1015,27 @@ async def get_video_by_cid(
         conn = get_db()
         cursor = conn.cursor()
 
-        # 获取所有年份表
-        years = get_available_years()
-        if not years:
-            print(f"【调试】未找到任何历史记录数据表")
+        # 通过全局查找表的 cid 索引定位记录，再按主键读取
+        sync_history_index(conn)
+        location = locate_cid(conn, cid)
+        if not location:
+            print(f"【调试】未找到CID为{cid}的视频记录")
             return {
                 "status": "error",
-                "message": "未找到任何历史记录数据"
+                "message": f"未找到CID为{cid}的视频记录"
             }
 
-        print(f"【调试】找到以下年份表: {years}")
-
-        # 构建UNION ALL查询
-        queries = []
-        for year in years:
-            table_name = f"bilibili_history_{year}"
-            # 选择与视频相关的所有字段
-            queries.append(f"""
-                SELECT
-                    id, title, long_title, cover, covers, uri, oid, epid, bvid, page,
-                    cid, part, business, dt, videos, author_name, author_face, author_mid,
-                    view_at, progress, badge, show_title, duration, current, total,
-                    new_desc, is_finish, is_fav, kid, tag_name, live_status, main_category
-                FROM {table_name}
-                WHERE cid = {cid}
-            """)
-
-        # 组合所有查询，LIMIT放在最后，不使用括号
-        union_query = f"{' UNION ALL '.join(queries)} LIMIT 1"
-        print(f"【调试】CID查询SQL: {union_query}")
-
-        # 执行查询
-        cursor.execute(union_query)
+        year, record_id = location
+        print(f"【调试】CID={cid} 位于 {year} 年表，记录ID={record_id}")
+        cursor.execute(f"""
+            SELECT
+                id, title, long_title, cover, covers, uri, oid, epid, bvid, page,
+                cid, part, business, dt, videos, author_name, author_face, author_mid,
+                view_at, progress, badge, show_title, duration, current, total,
+                new_desc, is_finish, is_fav, kid, tag_name, live_status, main_category
+            FROM bilibili_history_{year}
+            WHERE id = ?
+        """, (record_id,))
         columns = [description[0] for description in cursor.description]
 
         record = cursor.fetchone()
@@ -1,8 +1,8 @@
-import sqlite3
 from typing import Optional
 
 from fastapi import APIRouter, Query, HTTPException
 
+from scripts.history_partitions import connect_history
 from scripts.utils import load_config, get_output_path
 
 router = APIRouter()
@@ -11,7 +11,7 @@ config = load_config()
 def get_db():
     """获取数据库连接"""
     db_path = get_output_path(config['db_file'])
-    return sqlite3.connect(db_path)
+    return connect_history(db_path)
 
 def validate_year_and_get_table(year: Optional[int]) -> tuple:
     """验证年份并获取对应的表名"""
@@ -7,6 +7,7 @@ from loguru import logger
 
 from scripts.scheduler_db_enhanced import EnhancedSchedulerDB
 from scripts.scheduler_manager import SchedulerManager
+from scripts.startup_manager import StartupManager
 from scripts.utils import get_config_path as utils_get_config_path, setup_logger
 
 # 确保日志系统已初始化
@@ -14,12 +15,19 @@ setup_logger()
 
 router = APIRouter()
 
+def _ensure_scheduler_ready():
+    """调度器在启动后台任务中初始化，完成前返回503"""
+    if not StartupManager.get_instance().is_ready('scheduler'):
+        raise HTTPException(status_code=503, detail="调度器正在初始化，请稍后重试")
+
 # 获取调度器实例
 def get_scheduler():
+    _ensure_scheduler_ready()
     return SchedulerManager.get_instance()
 
 # 获取调度器数据库实例
 def get_scheduler_db():
+    _ensure_scheduler_ready()
     return EnhancedSchedulerDB.get_instance()
 
 def get_config_path():
@@ -1,4 +1,3 @@
-import sqlite3
 from collections import Counter
 from collections import defaultdict
 from datetime import datetime
@@ -9,6 +8,9 @@ import numpy as np
 from fastapi import APIRouter, HTTPException, Query
 from snownlp import SnowNLP
 
+from scripts.history_partitions import connect_history
+from scripts.history_time_columns import ensure_time_columns
+from scripts.title_pattern_model import TitlePatternModelStore
 from scripts.utils import load_config, get_output_path
 from .title_pattern_discovery import discover_interaction_patterns
 
@@ -18,7 +20,10 @@ config = load_config()
 def get_db():
     """获取数据库连接"""
     db_path = get_output_path(config['db_file'])
-    return sqlite3.connect(db_path)
+    conn = connect_history(db_path)
+    # 查询使用本地时间生成列，旧数据库首次访问时补齐（只修改表结构，索引由启动任务建立）
+    ensure_time_columns(conn, build_indexes=False)
+    return conn
 
 def analyze_keywords(titles_data: List[tuple]) -> List[Tuple[str, int]]:
     """
@@ -144,7 +149,7 @@ def analyze_title_length(cursor, table_name: str) -> dict:
         SELECT title, duration, progress
         FROM {table_name}
         WHERE duration > 0 AND title IS NOT NULL
-        AND strftime('%Y', datetime(view_at, 'unixepoch')) = ?
+        AND substr(view_date, 1, 4) = ?
     """, (table_name.split('_')[-1],))
     
     length_stats = defaultdict(lambda: {'count': 0, 'completion_rates': []})
@@ -185,7 +190,7 @@ def analyze_title_sentiment(cursor, table_name: str) -> dict:
         SELECT title, duration, progress
         FROM {table_name}
         WHERE duration > 0 AND title IS NOT NULL
-        AND strftime('%Y', datetime(view_at, 'unixepoch')) = ?
+        AND substr(view_date, 1, 4) = ?
     """, (table_name.split('_')[-1],))
     
     sentiment_stats = {
@@ -238,7 +243,7 @@ def analyze_title_trends(cursor, table_name: str) -> dict:
         SELECT title, duration, progress, view_at
         FROM {table_name}
         WHERE duration > 0 AND title IS NOT NULL
-        AND strftime('%Y', datetime(view_at, 'unixepoch')) = ?
+        AND substr(view_date, 1, 4) = ?
         ORDER BY view_at ASC
     """, (table_name.split('_')[-1],))
     
@@ -299,7 +304,7 @@ def analyze_title_interaction(cursor, table_name: str) -> dict:
         SELECT title, duration, progress, tag_name, view_at
         FROM {table_name}
         WHERE duration > 0 AND title IS NOT NULL
-        AND strftime('%Y', datetime(view_at, 'unixepoch')) = ?
+        AND substr(view_date, 1, 4) = ?
     """, (table_name.split('_')[-1],))
     
     titles_data = cursor.fetchall()
@@ -699,3 +704,49 @@ async def get_interaction_analysis(
     finally:
         if conn:
             conn.close()
+
+@router.get("/pattern-discovery", summary="获取标题模式聚类分析")
+async def get_title_pattern_discovery(
+    year: Optional[int] = Query(None, description="要分析的年份，不传则使用当前年份"),
+    refit: bool = Query(False, description="是否在后台重新拟合模型，返回结果仍来自当前模型")
+):
+    """获取标题模式聚类分析
+
+    结果来自持久化的 TF-IDF + MiniBatchKMeans 模型：新增标题增量更新模型，
+    完整拟合在后台进程中进行。某年首次请求时需要等待首次拟合完成。
+
+    Args:
+        year: 要分析的年份，不传则使用当前年份
+        refit: 是否在后台重新拟合模型
+
+    Returns:
+        dict: 包含各标题模式的关键词、情感倾向、覆盖率和区分度
+    """
+    table_name, target_year, available_years = validate_year_and_get_table(year)
+    if table_name is None:
+        return available_years  # 这里是错误响应
+
+    try:
+        store = TitlePatternModelStore.get_instance()
+        if refit:
+            store.schedule_fit(target_year)
+        meta, refitting = await store.patterns(target_year)
+        return {
+            "status": "success",
+            "data": {
+                "patterns": meta["patterns"],
+                "model": {
+                    "fit_rows": meta["fit_rows"],
+                    "row_count": meta["row_count"],
+                    "incremental_rows": meta["incremental_rows"],
+                    "n_clusters": meta["n_clusters"],
+                    "fitted_at": meta["fitted_at"],
+                    "updated_at": meta["updated_at"],
+                    "refitting": refitting or refit
+                },
+                "year": target_year,
+                "available_years": available_years
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -2,7 +2,7 @@ import json
 import os
 import sqlite3
 from collections import Counter, defaultdict
-from typing import List, Dict, Tuple, Set, Optional
+from typing import List, Dict, Tuple, Optional
 
 import jieba
 import numpy as np
@@ -10,6 +10,8 @@ from sklearn.cluster import KMeans
 from sklearn.feature_extraction.text import TfidfVectorizer
 from snownlp import SnowNLP
 
+from scripts.title_pattern_model import get_stop_words
+
 
 class PatternCache:
     """模式缓存管理器"""
@@ -153,16 +155,6 @@ class PatternCache:
 # 创建全局缓存管理器实例
 pattern_cache = PatternCache()
 
-def get_stop_words() -> Set[str]:
-    """获取停用词列表"""
-    return {
-        '的', '了', '是', '在', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', 
-        '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这', '那', '啊', '呢', '吧',
-        '吗', '啦', '呀', '哦', '哈', '嘿', '哎', '哟', '唉', '嗯', '嘛', '哼', '哇', '咦', '诶', '喂',
-        '么', '什么', '这个', '那个', '这样', '那样', '怎么', '为什么', '如何', '哪里', '谁', '什么时候',
-        '多少', '几', '怎样', '为何', '哪个', '哪些', '几个', '多久', '多长时间', '什么样'
-    }
-
 def collect_title_data(cursor: sqlite3.Cursor, table_name: str) -> List[Tuple[str, float, float, str, int]]:
     """
     从数据库收集标题数据
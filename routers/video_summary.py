@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import sqlite3
@@ -9,7 +10,8 @@ import yaml
 from fastapi import APIRouter, HTTPException, Body, BackgroundTasks
 from pydantic import BaseModel, Field
 
-from scripts.utils import get_output_path, load_config
+from scripts.response_cache import ResponseCache
+from scripts.utils import get_config, get_output_path, load_config
 from scripts.wbi_sign import get_wbi_sign
 # 导入DeepSeek API相关模块
 from routers.deepseek import chat_completion, ChatMessage, ChatRequest
@@ -226,6 +228,8 @@ def save_video_summary_to_db(
             )
             
         conn.commit()
+        # 数据库内容已变化，丢弃内存中的旧结果
+        ResponseCache.get_instance().invalidate('video_summary', (bvid, cid))
         return True
     except sqlite3.Error as e:
         print(f"保存到数据库时发生错误: {e}")
@@ -250,8 +254,8 @@ async def fetch_video_summary_from_api(bvid: str, cid: int, up_mid: int) -> Dict
         # 构建请求URL
         url = "https://api.bilibili.com/x/web-interface/view/conclusion/get"
         
-        # 从配置中读取SESSDATA
-        sessdata = config.get('SESSDATA', '')
+        # 从配置中读取SESSDATA（配置修改后无需重启）
+        sessdata = get_config().get('SESSDATA', '')
         
         # 添加必要的HTTP头信息
         headers = {
@@ -299,6 +303,113 @@ async def fetch_video_summary_from_api(bvid: str, cid: int, up_mid: int) -> Dict
             detail=f"获取视频摘要时发生错误: {str(e)}"
         )
 
+def _summary_ttl(result: Dict[str, Any]) -> float:
+    """摘要结果的有效期：有摘要的结果基本不会变化，无摘要的结果需要定期重新检查"""
+    if result.get('has_summary'):
+        return float(ResponseCache.setting('video_summary_ttl', 30 * 86400))
+    return float(ResponseCache.setting('video_summary_empty_ttl', 86400))
+
+
+async def _refresh_video_summary(bvid: str, cid: int, up_mid: int) -> Dict[str, Any]:
+    """从B站获取摘要，保存到数据库和文件，并返回接口响应"""
+    api_result = await fetch_video_summary_from_api(bvid, cid, up_mid)
+
+    # 解析API结果
+    result_type = api_result.get('model_result', {}).get('result_type', 0)
+    summary = api_result.get('model_result', {}).get('summary', '')
+    outline_data = api_result.get('model_result', {}).get('outline', None)
+    stid = api_result.get('stid', '')
+
+    # 获取状态消息
+    status_message = get_status_message(result_type)
+
+    # 判断是否有有效摘要 (result_type为1或2表示有摘要)
+    has_summary = result_type > 0
+
+    # 根据配置决定是否保存到数据库
+    # 如果CACHE_EMPTY_SUMMARY为True，则保存所有结果
+    # 如果CACHE_EMPTY_SUMMARY为False，则只保存有摘要的结果
+    should_save = has_summary or CACHE_EMPTY_SUMMARY
+
+    if should_save:
+        # 保存到数据库
+        save_success = save_video_summary_to_db(
+            bvid=bvid,
+            cid=cid,
+            up_mid=up_mid,
+            stid=stid,
+            summary=summary,
+            outline=outline_data,
+            result_type=result_type
+        )
+        if not save_success:
+            print(f"警告: 保存视频摘要到数据库失败: {bvid}, {cid}")
+    else:
+        print(f"跳过保存无摘要数据到数据库: {bvid}, {cid}, result_type={result_type}")
+
+    # 保存B站获取的摘要到./output/BSummary/{cid}目录
+    # 不管是否有摘要内容，都保存，因为判断太耗时间
+    try:
+        # 创建保存目录
+        save_dir = os.path.join("output", "BSummary", str(cid))
+        os.makedirs(save_dir, exist_ok=True)
+
+        # 构建完整的响应数据
+        response_data = {
+            "bvid": bvid,
+            "cid": cid,
+            "up_mid": up_mid,
+            "stid": stid,
+            "summary": summary,
+            "outline": outline_data,
+            "result_type": result_type,
+            "status_message": status_message,
+            "has_summary": has_summary,
+            "fetch_time": int(time.time()),
+            "update_time": int(time.time()),
+            "from_cache": False,
+            "api_response": api_result  # 保存原始API响应
+        }
+
+        # 保存完整响应数据
+        response_path = os.path.join(save_dir, f"{cid}_response.json")
+        with open(response_path, 'w', encoding='utf-8') as f:
+            json.dump(response_data, f, ensure_ascii=False, indent=2)
+
+        # 如果有摘要，单独保存摘要内容到文本文件，方便查看
+        if has_summary:
+            summary_path = os.path.join(save_dir, f"{cid}_summary.txt")
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                f.write(summary)
+
+            # 如果有提纲，单独保存提纲
+            if outline_data:
+                outline_path = os.path.join(save_dir, f"{cid}_outline.json")
+                with open(outline_path, 'w', encoding='utf-8') as f:
+                    json.dump(outline_data, f, ensure_ascii=False, indent=2)
+
+        print(f"已保存B站摘要到: {save_dir}")
+    except Exception as e:
+        # 保存到文件失败不影响API返回
+        print(f"警告: 保存B站摘要到文件失败: {str(e)}")
+
+    # 返回结果
+    return {
+        "bvid": bvid,
+        "cid": cid,
+        "up_mid": up_mid,
+        "stid": stid,
+        "summary": summary,
+        "outline": outline_data,
+        "result_type": result_type,
+        "status_message": status_message,
+        "has_summary": has_summary,
+        "fetch_time": int(time.time()),
+        "update_time": int(time.time()),
+        "from_cache": False
+    }
+
+
 @router.get("/get_summary", summary="获取视频摘要", response_model=VideoSummaryResponse)
 async def get_video_summary(bvid: str, cid: int, up_mid: int, force_refresh: Optional[bool] = False):
     """
@@ -308,116 +419,57 @@ async def get_video_summary(bvid: str, cid: int, up_mid: int, force_refresh: Opt
     - **cid**: 视频的CID
     - **up_mid**: UP主的MID
     - **force_refresh**: 是否强制刷新（不使用缓存）
+
+    结果依次从内存缓存、video_summary 表和B站接口获取。数据库中的结果超过有效期时
+    先返回旧结果并在后台刷新；B站请求失败时回退到数据库中的旧结果。
     """
     # 处理force_refresh参数，确保是正确的布尔值
     if isinstance(force_refresh, str):
         force_refresh = force_refresh.lower() == 'true'
-    
+
+    cache = ResponseCache.get_instance()
+    key = (bvid, cid)
+
+    async def refresh() -> Dict[str, Any]:
+        return await _refresh_video_summary(bvid, cid, up_mid)
+
+    stale = False
+
+    async def load() -> Dict[str, Any]:
+        nonlocal stale
+        db_result = await asyncio.to_thread(get_video_summary_from_db, bvid, cid)
+        if not db_result:
+            return await refresh()
+        age = time.time() - (db_result.get('update_time') or db_result.get('fetch_time') or 0)
+        stale = age >= _summary_ttl(db_result)
+        return db_result
+
+    def load_ttl(result: Dict[str, Any]) -> float:
+        # 过期的数据库结果不按正常有效期缓存，后台刷新完成后由新结果替换
+        return 0 if stale else _summary_ttl(result)
+
     try:
-        # 首先尝试从数据库获取
-        if not force_refresh:
-            db_result = get_video_summary_from_db(bvid, cid)
-            if db_result:
-                return db_result
-        
-        # 从API获取
-        api_result = await fetch_video_summary_from_api(bvid, cid, up_mid)
-        
-        # 解析API结果
-        result_type = api_result.get('model_result', {}).get('result_type', 0)
-        summary = api_result.get('model_result', {}).get('summary', '')
-        outline_data = api_result.get('model_result', {}).get('outline', None)
-        stid = api_result.get('stid', '')
-        
-        # 获取状态消息
-        status_message = get_status_message(result_type)
-        
-        # 判断是否有有效摘要 (result_type为1或2表示有摘要)
-        has_summary = result_type > 0
-        
-        # 根据配置决定是否保存到数据库
-        # 如果CACHE_EMPTY_SUMMARY为True，则保存所有结果
-        # 如果CACHE_EMPTY_SUMMARY为False，则只保存有摘要的结果
-        should_save = has_summary or CACHE_EMPTY_SUMMARY
-        
-        if should_save:
-            # 保存到数据库
-            save_success = save_video_summary_to_db(
-                bvid=bvid,
-                cid=cid,
-                up_mid=up_mid,
-                stid=stid,
-                summary=summary,
-                outline=outline_data,
-                result_type=result_type
-            )
-            if not save_success:
-                print(f"警告: 保存视频摘要到数据库失败: {bvid}, {cid}")
+        if not ResponseCache.enabled():
+            result = await (refresh() if force_refresh else load())
+        elif force_refresh:
+            result, _ = await cache.get_or_load('video_summary', key, refresh, _summary_ttl, force_refresh=True)
         else:
-            print(f"跳过保存无摘要数据到数据库: {bvid}, {cid}, result_type={result_type}")
-        
-        # 保存B站获取的摘要到./output/BSummary/{cid}目录
-        # 不管是否有摘要内容，都保存，因为判断太耗时间
-        try:
-            # 创建保存目录
-            save_dir = os.path.join("output", "BSummary", str(cid))
-            os.makedirs(save_dir, exist_ok=True)
-            
-            # 构建完整的响应数据
-            response_data = {
-                "bvid": bvid,
-                "cid": cid,
-                "up_mid": up_mid,
-                "stid": stid,
-                "summary": summary,
-                "outline": outline_data,
-                "result_type": result_type,
-                "status_message": status_message,
-                "has_summary": has_summary,
-                "fetch_time": int(time.time()),
-                "update_time": int(time.time()),
-                "from_cache": False,
-                "api_response": api_result  # 保存原始API响应
-            }
-            
-            # 保存完整响应数据
-            response_path = os.path.join(save_dir, f"{cid}_response.json")
-            with open(response_path, 'w', encoding='utf-8') as f:
-                json.dump(response_data, f, ensure_ascii=False, indent=2)
-            
-            # 如果有摘要，单独保存摘要内容到文本文件，方便查看
-            if has_summary:
-                summary_path = os.path.join(save_dir, f"{cid}_summary.txt")
-                with open(summary_path, 'w', encoding='utf-8') as f:
-                    f.write(summary)
-                    
-                # 如果有提纲，单独保存提纲
-                if outline_data:
-                    outline_path = os.path.join(save_dir, f"{cid}_outline.json")
-                    with open(outline_path, 'w', encoding='utf-8') as f:
-                        json.dump(outline_data, f, ensure_ascii=False, indent=2)
-                        
-            print(f"已保存B站摘要到: {save_dir}")
-        except Exception as e:
-            # 保存到文件失败不影响API返回
-            print(f"警告: 保存B站摘要到文件失败: {str(e)}")
-        
-        # 返回结果
-        return {
-            "bvid": bvid,
-            "cid": cid,
-            "up_mid": up_mid,
-            "stid": stid,
-            "summary": summary,
-            "outline": outline_data,
-            "result_type": result_type,
-            "status_message": status_message,
-            "has_summary": has_summary,
-            "fetch_time": int(time.time()),
-            "update_time": int(time.time()),
-            "from_cache": False
-        }
-    
+            result, _ = await cache.get_or_load('video_summary', key, load, load_ttl)
+        if stale:
+            # 数据库结果已过期：先返回旧结果，后台刷新（须在 get_or_load 返回后调度，否则键仍在进行中）
+            cache.schedule_refresh('video_summary', key, refresh, _summary_ttl)
+        return result
+    except HTTPException as e:
+        # B站请求失败时回退到数据库中已有的结果
+        db_result = await asyncio.to_thread(get_video_summary_from_db, bvid, cid)
+        if db_result:
+            print(f"获取视频摘要失败，返回数据库中的旧结果: {bvid}, {cid}: {e.detail}")
+            return db_result
+        print(f"获取视频摘要出错: {e.detail}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"获取视频摘要失败: {e.detail}"
+        )
     except Exception as e:
         # 捕获所有可能的异常，确保API有良好的错误处理
         print(f"获取视频摘要出错: {str(e)}")
@@ -1,10 +1,15 @@
+import asyncio
 import sqlite3
 from datetime import datetime
 from typing import Optional
 
 from fastapi import APIRouter, Query, HTTPException
 
+from scripts.history_partitions import connect_history, history_years
+from scripts.history_time_columns import ensure_time_columns, utc_offset_seconds
 from scripts.utils import load_config, get_output_path
+from scripts.viewing_cube import ViewingCube
+from scripts.viewing_engine import ViewingAnalyticsEngine
 
 router = APIRouter()
 config = load_config()
@@ -12,7 +17,10 @@ config = load_config()
 def get_db():
     """获取数据库连接"""
     db_path = get_output_path(config['db_file'])
-    return sqlite3.connect(db_path)
+    conn = connect_history(db_path)
+    # 查询使用本地时间生成列，旧数据库首次访问时补齐（只修改表结构，索引由启动任务建立）
+    ensure_time_columns(conn, build_indexes=False)
+    return conn
 
 def generate_continuity_insights(continuity_data: dict) -> dict:
     """生成连续性相关的洞察"""
@@ -35,28 +43,19 @@ def generate_continuity_insights(continuity_data: dict) -> dict:
     
     return insights
 
-def analyze_viewing_continuity(cursor, table_name: str) -> dict:
+def analyze_viewing_continuity(dates: list) -> dict:
     """分析观看习惯的连续性
-    
+
     Args:
-        cursor: 数据库游标
-        table_name: 表名
-    
+        dates: 按顺序排列的观看日期列表（YYYY-MM-DD）
+
     Returns:
         dict: 连续性分析结果
     """
-    # 获取所有观看日期
-    cursor.execute(f"""
-        SELECT DISTINCT date(datetime(view_at + 28800, 'unixepoch')) as view_date
-        FROM {table_name}
-        ORDER BY view_date
-    """)
-    dates = [row[0] for row in cursor.fetchall()]
-    
     # 计算连续观看天数
     max_streak = current_streak = 1
     longest_streak_start = longest_streak_end = current_streak_start = dates[0] if dates else None
-    
+
     for i in range(1, len(dates)):
         date1 = datetime.strptime(dates[i-1], '%Y-%m-%d')
         date2 = datetime.strptime(dates[i], '%Y-%m-%d')
@@ -69,7 +68,7 @@ def analyze_viewing_continuity(cursor, table_name: str) -> dict:
         else:
             current_streak = 1
             current_streak_start = dates[i]
-    
+
     return {
         'max_streak': max_streak,
         'longest_streak_period': {
@@ -80,222 +79,24 @@ def analyze_viewing_continuity(cursor, table_name: str) -> dict:
         'current_streak_start': current_streak_start
     }
 
-def analyze_time_investment(cursor, table_name: str) -> dict:
-    """分析时间投入强度
-    
-    Args:
-        cursor: 数据库游标
-        table_name: 表名
-    
-    Returns:
-        dict: 时间投入分析结果
+async def load_year_metrics(year: int) -> dict:
+    """获取某年的全部观看统计指标
+
+    所有 /viewing 统计接口共用 ViewingAnalyticsEngine 的计算结果，
+    同一年的数据只扫描一次，数据未变化时直接复用。
     """
-    cursor.execute(f"""
-        SELECT 
-            date(datetime(view_at + 28800, 'unixepoch')) as view_date,
-            COUNT(*) as video_count,
-            SUM(CASE WHEN progress = -1 THEN duration ELSE progress END) as total_duration
-        FROM {table_name}
-        GROUP BY view_date
-        ORDER BY total_duration DESC
-        LIMIT 1
-    """)
-    max_duration_day = cursor.fetchone()
-    
-    cursor.execute(f"""
-        SELECT 
-            AVG(daily_duration) as avg_duration
-        FROM (
-            SELECT 
-                date(datetime(view_at + 28800, 'unixepoch')) as view_date,
-                SUM(CASE WHEN progress = -1 THEN duration ELSE progress END) as daily_duration
-            FROM {table_name}
-            GROUP BY view_date
-        )
-    """)
-    avg_daily_duration = cursor.fetchone()[0]
-    
-    return {
-        'max_duration_day': {
-            'date': max_duration_day[0],
-            'video_count': max_duration_day[1],
-            'total_duration': max_duration_day[2]
-        },
-        'avg_daily_duration': avg_daily_duration
-    }
+    return await asyncio.to_thread(ViewingAnalyticsEngine.get_instance().get_metrics, year)
 
-def analyze_completion_rates(cursor, table_name: str) -> dict:
+def analyze_completion_rates(metrics: dict) -> dict:
     """分析视频完成率"""
-    # 获取表结构
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = {col[1]: idx for idx, col in enumerate(cursor.fetchall())}
-    
-    # 确保必要的列存在
-    required_columns = ['duration', 'progress', 'author_name', 'author_mid', 'tag_name']
-    for col in required_columns:
-        if col not in columns:
-            raise ValueError(f"Required column '{col}' not found in table {table_name}")
-    
-    cursor.execute(f"SELECT * FROM {table_name}")
-    histories = cursor.fetchall()
-    
-    # 基础统计
-    total_videos = len(histories)
-    total_completion = 0
-    fully_watched = 0
-    not_started = 0
-    
-    # UP主统计
-    author_stats = {}
-    # 分区统计
-    tag_stats = {}
-    # 时长分布统计
-    duration_stats = {
-        "短视频(≤5分钟)": {"video_count": 0, "total_completion": 0, "fully_watched": 0, "average_completion_rate": 0},
-        "中等视频(5-20分钟)": {"video_count": 0, "total_completion": 0, "fully_watched": 0, "average_completion_rate": 0},
-        "长视频(>20分钟)": {"video_count": 0, "total_completion": 0, "fully_watched": 0, "average_completion_rate": 0}
-    }
-    # 完成率分布
-    completion_distribution = {
-        "0-10%": 0,
-        "10-30%": 0,
-        "30-50%": 0,
-        "50-70%": 0,
-        "70-90%": 0,
-        "90-100%": 0
-    }
-    
-    for history in histories:
-        # 获取并转换数据类型
-        try:
-            duration = float(history[columns['duration']]) if history[columns['duration']] else 0
-            progress = float(history[columns['progress']]) if history[columns['progress']] else 0
-            author_name = history[columns['author_name']]
-            author_mid = history[columns['author_mid']]
-            tag_name = history[columns['tag_name']]
-        except (ValueError, TypeError) as e:
-            print(f"Warning: Failed to process record: {history}")
-            continue
-        
-        # 计算完成率
-        # 当progress为-1时表示已完全观看，计算为100%
-        if progress == -1:
-            completion_rate = 100
-        else:
-            completion_rate = (progress / duration * 100) if duration > 0 else 0
-        
-        total_completion += completion_rate
-        
-        # 统计完整观看和未开始观看
-        if completion_rate >= 90:  # 90%以上视为完整观看
-            fully_watched += 1
-        elif completion_rate == 0:
-            not_started += 1
-        
-        # 更新完成率分布
-        if completion_rate <= 10:
-            completion_distribution["0-10%"] += 1
-        elif completion_rate <= 30:
-            completion_distribution["10-30%"] += 1
-        elif completion_rate <= 50:
-            completion_distribution["30-50%"] += 1
-        elif completion_rate <= 70:
-            completion_distribution["50-70%"] += 1
-        elif completion_rate <= 90:
-            completion_distribution["70-90%"] += 1
-        else:
-            completion_distribution["90-100%"] += 1
-        
-        # UP主统计
-        if author_name and author_mid:
-            if author_name not in author_stats:
-                author_stats[author_name] = {
-                    "author_mid": author_mid,
-                    "video_count": 0,
-                    "total_completion": 0,
-                    "fully_watched": 0
-                }
-            stats = author_stats[author_name]
-            stats["video_count"] += 1
-            stats["total_completion"] += completion_rate
-            if completion_rate >= 90:
-                stats["fully_watched"] += 1
-        
-        # 分区统计
-        if tag_name:
-            if tag_name not in tag_stats:
-                tag_stats[tag_name] = {
-                    "video_count": 0,
-                    "total_completion": 0,
-                    "fully_watched": 0
-                }
-            stats = tag_stats[tag_name]
-            stats["video_count"] += 1
-            stats["total_completion"] += completion_rate
-            if completion_rate >= 90:
-                stats["fully_watched"] += 1
-        
-        # 时长分布统计
-        if duration <= 300:  # 5分钟
-            category = "短视频(≤5分钟)"
-        elif duration <= 1200:  # 20分钟
-            category = "中等视频(5-20分钟)"
-        else:
-            category = "长视频(>20分钟)"
-        
-        stats = duration_stats[category]
-        stats["video_count"] += 1
-        stats["total_completion"] += completion_rate
-        if completion_rate >= 90:
-            stats["fully_watched"] += 1
-    
-    # 计算总体统计
-    overall_stats = {
-        "total_videos": total_videos,
-        "average_completion_rate": round(total_completion / total_videos, 2) if total_videos > 0 else 0,
-        "fully_watched_count": fully_watched,
-        "not_started_count": not_started,
-        "fully_watched_rate": round(fully_watched / total_videos * 100, 2) if total_videos > 0 else 0,
-        "not_started_rate": round(not_started / total_videos * 100, 2) if total_videos > 0 else 0
-    }
-    
-    # 计算各类视频的平均完成率和完整观看率
-    for category, stats in duration_stats.items():
-        if stats["video_count"] > 0:
-            stats["average_completion_rate"] = round(stats["total_completion"] / stats["video_count"], 2)
-            stats["fully_watched_rate"] = round(stats["fully_watched"] / stats["video_count"] * 100, 2)
-        else:
-            stats["average_completion_rate"] = 0
-            stats["fully_watched_rate"] = 0
-    
-    # 计算UP主平均完成率和完整观看率，并按观看数量筛选和排序
-    filtered_authors = {}
-    for name, stats in author_stats.items():
-        if stats["video_count"] >= 5:  # 只保留观看数量>=5的UP主
-            stats["average_completion_rate"] = round(stats["total_completion"] / stats["video_count"], 2)
-            stats["fully_watched_rate"] = round(stats["fully_watched"] / stats["video_count"] * 100, 2)
-            filtered_authors[name] = stats
-
-    most_watched_authors = {}
-    highest_completion_authors = {}
-    
-    # 计算分区平均完成率和完整观看率，并按观看数量筛选和排序
-    filtered_tags = {}
-    for tag, stats in tag_stats.items():
-        if stats["video_count"] >= 5:  # 只保留视频数量>=5的分区
-            stats["average_completion_rate"] = round(stats["total_completion"] / stats["video_count"], 2)
-            stats["fully_watched_rate"] = round(stats["fully_watched"] / stats["video_count"] * 100, 2)
-            filtered_tags[tag] = stats
-
-    top_tags = {}
-    
+    completion = metrics["completion"]
     return {
-        "overall_stats": overall_stats,
-        "duration_based_stats": duration_stats,
-        "completion_distribution": completion_distribution,
-        "tag_completion_rates": top_tags,
-        "most_watched_authors": most_watched_authors,
-        "highest_completion_authors": highest_completion_authors
+        "overall_stats": dict(completion["overall_stats"]),
+        "duration_based_stats": {k: dict(v) for k, v in completion["duration_based_stats"].items()},
+        "completion_distribution": dict(completion["completion_distribution"]),
+        "tag_completion_rates": {},
+        "most_watched_authors": {},
+        "highest_completion_authors": {}
     }
 
 def generate_completion_insights(completion_data: dict) -> dict:
@@ -362,108 +163,14 @@ def generate_completion_insights(completion_data: dict) -> dict:
     
     return insights
 
-def analyze_video_watch_counts(cursor, table_name: str) -> dict:
+def analyze_video_watch_counts(metrics: dict) -> dict:
     """分析视频观看次数"""
-    # 获取表结构
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = {col[1]: idx for idx, col in enumerate(cursor.fetchall())}
-    
-    # 确保必要的列存在
-    required_columns = ['title', 'bvid', 'duration', 'tag_name', 'author_name']
-    for col in required_columns:
-        if col not in columns:
-            raise ValueError(f"Required column '{col}' not found in table {table_name}")
-    
-    # 获取视频观看次数统计
-    cursor.execute(f"""
-        SELECT 
-            title,
-            bvid,
-            duration,
-            tag_name,
-            author_name,
-            COUNT(*) as watch_count,
-            MIN(view_at) as first_view,
-            MAX(view_at) as last_view
-        FROM {table_name}
-        WHERE bvid IS NOT NULL AND bvid != ''
-        GROUP BY bvid
-        HAVING COUNT(*) > 1
-        ORDER BY watch_count DESC
-    """)
-    
-    results = cursor.fetchall()
-    
-    # 处理统计结果
-    most_watched_videos = []
-    total_rewatched = 0
-    total_videos = len(results)
-    duration_distribution = {
-        "短视频(≤5分钟)": 0,
-        "中等视频(5-20分钟)": 0,
-        "长视频(>20分钟)": 0
-    }
-    tag_distribution = {}
-    
-    for row in results:
-        title = row[0]
-        bvid = row[1]
-        duration = float(row[2]) if row[2] else 0
-        tag_name = row[3]
-        author_name = row[4]
-        watch_count = row[5]
-        first_view = row[6]
-        last_view = row[7]
-        
-        # 统计重复观看的视频时长分布
-        if duration <= 300:
-            duration_distribution["短视频(≤5分钟)"] += 1
-        elif duration <= 1200:
-            duration_distribution["中等视频(5-20分钟)"] += 1
-        else:
-            duration_distribution["长视频(>20分钟)"] += 1
-
-        
-        # 记录观看次数最多的视频
-        if len(most_watched_videos) < 10:
-            most_watched_videos.append({
-                "title": title,
-                "bvid": bvid,
-                "duration": duration,
-                "tag_name": tag_name,
-                "author_name": author_name,
-                "watch_count": watch_count,
-                "first_view": first_view,
-                "last_view": last_view,
-                "avg_interval": (last_view - first_view) / (watch_count - 1) if watch_count > 1 else 0
-            })
-        
-        total_rewatched += watch_count - 1
-    
-    # 获取总视频数
-    cursor.execute(f"SELECT COUNT(DISTINCT bvid) FROM {table_name}")
-    total_unique_videos = cursor.fetchone()[0]
-    
-    # 计算重复观看率
-    rewatch_rate = round(total_videos / total_unique_videos * 100, 2)
-    
-    # 获取分区排名
-    tag_ranking = sorted(
-        tag_distribution.items(),
-        key=lambda x: x[1],
-        reverse=True
-    )[:10]
-    
+    watch_counts = metrics["watch_counts"]
     return {
-        "rewatch_stats": {
-            "total_rewatched_videos": total_videos,
-            "total_unique_videos": total_unique_videos,
-            "rewatch_rate": rewatch_rate,
-            "total_rewatch_count": total_rewatched
-        },
-        "most_watched_videos": most_watched_videos,
-        "duration_distribution": duration_distribution,
-        "tag_distribution": dict(tag_ranking)
+        "rewatch_stats": dict(watch_counts["rewatch_stats"]),
+        "most_watched_videos": [dict(v) for v in watch_counts["most_watched_videos"]],
+        "duration_distribution": dict(watch_counts["duration_distribution"]),
+        "tag_distribution": dict(watch_counts["tag_distribution"])
     }
 
 def generate_watch_count_insights(watch_count_data: dict) -> dict:
@@ -592,22 +299,7 @@ def get_available_years():
     """获取数据库中所有可用的年份"""
     conn = get_db()
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT name FROM sqlite_master
-            WHERE type='table' AND name LIKE 'bilibili_history_%'
-            ORDER BY name DESC
-        """)
-
-        years = []
-        for (table_name,) in cursor.fetchall():
-            try:
-                year = int(table_name.split('_')[-1])
-                years.append(year)
-            except (ValueError, IndexError):
-                continue
-
-        return sorted(years, reverse=True)
+        return sorted(history_years(conn), reverse=True)
     except sqlite3.Error as e:
         print(f"获取年份列表时发生错误: {e}")
         return []
@@ -666,10 +358,7 @@ async def get_monthly_stats(
     if table_name is None:
         return available_years  # 这里是错误响应
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-
         # 如果启用缓存，尝试从缓存获取
         if use_cache:
             from .title_pattern_discovery import pattern_cache
@@ -679,27 +368,12 @@ async def get_monthly_stats(
                 return cached_response
 
         print(f"开始分析 {target_year} 年的月度观看统计数据")
+        metrics = await load_year_metrics(target_year)
 
-        # 月度观看统计
-        cursor.execute(f"""
-            SELECT
-                strftime('%Y-%m', datetime(view_at + 28800, 'unixepoch')) as month,
-                COUNT(*) as view_count
-            FROM {table_name}
-            GROUP BY month
-            ORDER BY month
-        """)
-        monthly_stats = {row[0]: row[1] for row in cursor.fetchall()}
-
-        # 计算总视频数和活跃天数
-        cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
-        total_videos = cursor.fetchone()[0]
-
-        cursor.execute(f"""
-            SELECT COUNT(DISTINCT strftime('%Y-%m-%d', datetime(view_at + 28800, 'unixepoch')))
-            FROM {table_name}
-        """)
-        active_days = cursor.fetchone()[0]
+        # 月度观看统计、总视频数和活跃天数
+        monthly_stats = dict(metrics["monthly_stats"])
+        total_videos = metrics["total_videos"]
+        active_days = metrics["active_days"]
 
         # 计算平均每日观看数
         avg_daily_videos = round(total_videos / active_days, 1) if active_days > 0 else 0
@@ -753,9 +427,6 @@ async def get_monthly_stats(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @router.get("/weekly-stats", summary="获取周度观看统计分析")
 async def get_weekly_stats(
@@ -776,10 +447,7 @@ async def get_weekly_stats(
     if table_name is None:
         return available_years  # 这里是错误响应
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-
         # 如果启用缓存，尝试从缓存获取
         if use_cache:
             from .title_pattern_discovery import pattern_cache
@@ -789,47 +457,14 @@ async def get_weekly_stats(
                 return cached_response
 
         print(f"开始分析 {target_year} 年的周度观看统计数据")
+        metrics = await load_year_metrics(target_year)
+
+        # 活跃天数（用于洞察生成）
+        active_days = metrics["active_days"]
 
-        # 计算活跃天数（用于洞察生成）
-        cursor.execute(f"""
-            SELECT COUNT(DISTINCT strftime('%Y-%m-%d', datetime(view_at + 28800, 'unixepoch'))) as active_days
-            FROM {table_name}
-        """)
-        active_days = cursor.fetchone()[0] or 0
-
-        # 每周观看分布（0=周日，1-6=周一至周六）
-        weekday_mapping = {'0': '周日', '1': '周一', '2': '周二', '3': '周三',
-                          '4': '周四', '5': '周五', '6': '周六'}
-        # 初始化所有星期的默认值为0
-        weekly_stats = {day: 0 for day in weekday_mapping.values()}
-        cursor.execute(f"""
-            SELECT
-                strftime('%w', datetime(view_at + 28800, 'unixepoch')) as weekday,
-                COUNT(*) as view_count
-            FROM {table_name}
-            GROUP BY weekday
-            ORDER BY weekday
-        """)
-        # 更新有数据的星期的值
-        for row in cursor.fetchall():
-            weekly_stats[weekday_mapping[row[0]]] = row[1]
-
-        # 季节性观看模式分析
-        cursor.execute(f"""
-            SELECT
-                CASE
-                    WHEN CAST(strftime('%m', datetime(view_at + 28800, 'unixepoch')) AS INTEGER) IN (1,2,3) THEN '春季'
-                    WHEN CAST(strftime('%m', datetime(view_at + 28800, 'unixepoch')) AS INTEGER) IN (4,5,6) THEN '夏季'
-                    WHEN CAST(strftime('%m', datetime(view_at + 28800, 'unixepoch')) AS INTEGER) IN (7,8,9) THEN '秋季'
-                    WHEN CAST(strftime('%m', datetime(view_at + 28800, 'unixepoch')) AS INTEGER) IN (10,11,12) THEN '冬季'
-                END as season,
-                COUNT(*) as view_count,
-                AVG(CASE WHEN progress = -1 THEN duration ELSE progress END) as avg_duration
-            FROM {table_name}
-            WHERE CAST(strftime('%m', datetime(view_at + 28800, 'unixepoch')) AS INTEGER) BETWEEN 1 AND 12
-            GROUP BY season
-        """)
-        seasonal_patterns = {row[0]: {'view_count': row[1], 'avg_duration': row[2]} for row in cursor.fetchall()}
+        # 每周观看分布（周日至周六）和季节性观看模式
+        weekly_stats = dict(metrics["weekly_stats"])
+        seasonal_patterns = {k: dict(v) for k, v in metrics["seasonal_patterns"].items()}
 
         # 生成周度统计洞察
         weekly_insights = {}
@@ -871,9 +506,6 @@ async def get_weekly_stats(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @router.get("/time-slots", summary="获取时段观看分析")
 async def get_time_slots(
@@ -894,10 +526,7 @@ async def get_time_slots(
     if table_name is None:
         return available_years  # 这里是错误响应
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-
         # 如果启用缓存，尝试从缓存获取
         if use_cache:
             from .title_pattern_discovery import pattern_cache
@@ -907,51 +536,24 @@ async def get_time_slots(
                 return cached_response
 
         print(f"开始分析 {target_year} 年的时段观看数据")
+        metrics = await load_year_metrics(target_year)
 
         # 每日时段分布（按小时统计）
-        cursor.execute(f"""
-            SELECT
-                strftime('%H', datetime(view_at + 28800, 'unixepoch')) as hour,
-                COUNT(*) as view_count
-            FROM {table_name}
-            GROUP BY hour
-            ORDER BY hour
-        """)
-        daily_time_slots = {f"{int(row[0])}时": row[1] for row in cursor.fetchall()}
+        hourly_counts = metrics["hourly_counts"]
+        daily_time_slots = {f"{hour}时": count for hour, count in hourly_counts.items()}
 
         # 最活跃时段TOP5
-        cursor.execute(f"""
-            SELECT
-                strftime('%H', datetime(view_at + 28800, 'unixepoch')) as hour,
-                COUNT(*) as view_count
-            FROM {table_name}
-            GROUP BY hour
-            ORDER BY view_count DESC
-            LIMIT 5
-        """)
         peak_hours = [{
-            "hour": f"{int(row[0])}时",
-            "view_count": row[1]
-        } for row in cursor.fetchall()]
-
-        # 时间投入分析 - 使用已有的函数
-        time_investment = analyze_time_investment(cursor, table_name)
-
-        # 单日最大观看记录
-        cursor.execute(f"""
-            SELECT
-                date(datetime(view_at + 28800, 'unixepoch')) as view_date,
-                COUNT(*) as video_count
-            FROM {table_name}
-            GROUP BY view_date
-            ORDER BY video_count DESC
-            LIMIT 1
-        """)
-        max_daily_record = cursor.fetchone()
-        max_daily_record = {
-            'date': max_daily_record[0],
-            'video_count': max_daily_record[1]
+            "hour": f"{hour}时",
+            "view_count": count
+        } for hour, count in sorted(hourly_counts.items(), key=lambda x: x[1], reverse=True)[:5]]
+
+        # 时间投入分析和单日最大观看记录
+        time_investment = {
+            "max_duration_day": dict(metrics["time_investment"]["max_duration_day"]),
+            "avg_daily_duration": metrics["time_investment"]["avg_daily_duration"]
         }
+        max_daily_record = dict(metrics["max_daily_record"]) if metrics["max_daily_record"] else None
 
         # 生成时段分析洞察
         time_slot_insights = {}
@@ -1007,9 +609,6 @@ async def get_time_slots(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @router.get("/continuity", summary="获取观看连续性分析")
 async def get_viewing_continuity(
@@ -1030,10 +629,7 @@ async def get_viewing_continuity(
     if table_name is None:
         return available_years  # 这里是错误响应
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-
         # 如果启用缓存，尝试从缓存获取
         if use_cache:
             from .title_pattern_discovery import pattern_cache
@@ -1043,9 +639,10 @@ async def get_viewing_continuity(
                 return cached_response
 
         print(f"开始分析 {target_year} 年的观看连续性数据")
+        metrics = await load_year_metrics(target_year)
 
         # 分析观看连续性
-        viewing_continuity = analyze_viewing_continuity(cursor, table_name)
+        viewing_continuity = analyze_viewing_continuity(metrics["view_dates"])
 
         # 生成连续性洞察
         continuity_insights = generate_continuity_insights(viewing_continuity)
@@ -1070,9 +667,6 @@ async def get_viewing_continuity(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 def analyze_viewing_details(cursor, table_name: str) -> dict:
     """分析更详细的观看行为，包括设备、总观看时长等
@@ -1084,6 +678,9 @@ def analyze_viewing_details(cursor, table_name: str) -> dict:
     Returns:
         dict: 详细观看行为分析结果
     """
+    # 生成列 view_date/view_hour 已按配置的时区计算，分钟和时间字符串使用同一偏移
+    offset = utc_offset_seconds()
+
     # 1. 计算总观看时长（根据progress字段）
     cursor.execute(f"""
         SELECT SUM(CASE WHEN progress = -1 THEN duration ELSE progress END) as total_watch_seconds
@@ -1095,8 +692,8 @@ def analyze_viewing_details(cursor, table_name: str) -> dict:
     
     # 2. 计算观看B站的总天数
     cursor.execute(f"""
-        SELECT COUNT(DISTINCT strftime('%Y-%m-%d', datetime(view_at + 28800, 'unixepoch'))) as total_days
-        FROM {table_name}
+        SELECT COUNT(*) as total_days
+        FROM (SELECT view_date FROM {table_name} GROUP BY view_date)
     """)
     total_days = cursor.fetchone()[0] or 0
     
@@ -1150,26 +747,20 @@ def analyze_viewing_details(cursor, table_name: str) -> dict:
             view_at,
             author_name,
             title,
-            strftime('%H', datetime(view_at + 28800, 'unixepoch')) as hour,
-            strftime('%M', datetime(view_at + 28800, 'unixepoch')) as minute,
+            printf('%02d', view_hour) as hour,
+            strftime('%M', view_at + {offset}, 'unixepoch') as minute,
             -- 将凌晨时间(00:00-05:00)的日期调整为前一天
             CASE 
-                WHEN strftime('%H', datetime(view_at + 28800, 'unixepoch')) < '05' THEN 
-                    date(datetime(view_at + 28800 - 86400, 'unixepoch'))
-                ELSE 
-                    date(datetime(view_at + 28800, 'unixepoch'))
+                WHEN view_hour < 5 THEN date(view_date, '-1 day')
+                ELSE view_date
             END as adjusted_date,
             -- 计算小时+分钟的浮点数时间
             CASE 
-                WHEN strftime('%H', datetime(view_at + 28800, 'unixepoch')) < '05' THEN 
-                    CAST(strftime('%H', datetime(view_at + 28800, 'unixepoch')) AS REAL) + 24 
-                ELSE 
-                    CAST(strftime('%H', datetime(view_at + 28800, 'unixepoch')) AS REAL)
-            END + CAST(strftime('%M', datetime(view_at + 28800, 'unixepoch')) AS REAL)/100.0 as hour_with_minute
+                WHEN view_hour < 5 THEN view_hour + 24.0
+                ELSE view_hour
+            END + CAST(strftime('%M', view_at + {offset}, 'unixepoch') AS REAL)/100.0 as hour_with_minute
         FROM {table_name}
-        WHERE 
-            strftime('%H', datetime(view_at + 28800, 'unixepoch')) >= '23' OR 
-            strftime('%H', datetime(view_at + 28800, 'unixepoch')) < '05'
+        WHERE view_hour >= 23 OR view_hour < 5
     """)
     
     # 第二步：创建临时表存储每天最晚的观看时间
@@ -1183,10 +774,10 @@ def analyze_viewing_details(cursor, table_name: str) -> dict:
     """)
     
     # 第三步：查询每天最晚的观看记录
-    cursor.execute("""
+    cursor.execute(f"""
         SELECT 
             t.adjusted_date as date,
-            strftime('%H:%M', datetime(t.view_at + 28800, 'unixepoch')) as time,
+            strftime('%H:%M', t.view_at + {offset}, 'unixepoch') as time,
             t.author_name,
             t.title,
             t.hour,
@@ -1220,12 +811,12 @@ def analyze_viewing_details(cursor, table_name: str) -> dict:
     cursor.execute(f"""
         SELECT 
             CASE 
-                WHEN strftime('%H', datetime(view_at + 28800, 'unixepoch')) BETWEEN '05' AND '11' THEN '上午'
-                WHEN strftime('%H', datetime(view_at + 28800, 'unixepoch')) BETWEEN '12' AND '17' THEN '下午'
-                WHEN strftime('%H', datetime(view_at + 28800, 'unixepoch')) BETWEEN '18' AND '22' THEN '晚上'
+                WHEN view_hour BETWEEN 5 AND 11 THEN '上午'
+                WHEN view_hour BETWEEN 12 AND 17 THEN '下午'
+                WHEN view_hour BETWEEN 18 AND 22 THEN '晚上'
                 ELSE '深夜'
             END as time_slot,
-            COUNT(DISTINCT strftime('%Y-%m-%d', datetime(view_at + 28800, 'unixepoch'))) as active_days
+            COUNT(DISTINCT view_date) as active_days
         FROM {table_name}
         GROUP BY time_slot
     """)
@@ -1387,10 +978,7 @@ async def get_viewing_watch_counts(
     if table_name is None:
         return available_years  # 这里是错误响应
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-
         # 如果启用缓存，尝试从缓存获取
         if use_cache:
             from .title_pattern_discovery import pattern_cache
@@ -1400,9 +988,10 @@ async def get_viewing_watch_counts(
                 return cached_response
 
         print(f"开始分析 {target_year} 年的重复观看数据")
+        metrics = await load_year_metrics(target_year)
 
         # 获取重复观看分析数据
-        watch_count_data = analyze_video_watch_counts(cursor, table_name)
+        watch_count_data = analyze_video_watch_counts(metrics)
 
         # 生成重复观看洞察
         watch_count_insights = generate_watch_count_insights(watch_count_data)
@@ -1427,9 +1016,6 @@ async def get_viewing_watch_counts(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 @router.get("/completion-rates", summary="获取视频完成率分析")
 async def get_viewing_completion_rates(
@@ -1450,10 +1036,7 @@ async def get_viewing_completion_rates(
     if table_name is None:
         return available_years  # 这里是错误响应
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-
         # 如果启用缓存，尝试从缓存获取
         if use_cache:
             from .title_pattern_discovery import pattern_cache
@@ -1463,9 +1046,10 @@ async def get_viewing_completion_rates(
                 return cached_response
 
         print(f"开始分析 {target_year} 年的视频完成率数据")
+        metrics = await load_year_metrics(target_year)
 
         # 获取视频完成率分析数据
-        completion_data = analyze_completion_rates(cursor, table_name)
+        completion_data = analyze_completion_rates(metrics)
 
         # 生成完成率洞察
         completion_insights = generate_completion_insights(completion_data)
@@ -1490,66 +1074,11 @@ async def get_viewing_completion_rates(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
-def analyze_author_completion_rates(cursor, table_name: str) -> dict:
+def analyze_author_completion_rates(metrics: dict) -> dict:
     """专门分析UP主完成率数据，使用智能综合评分算法"""
-    # 获取表结构
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = {col[1]: idx for idx, col in enumerate(cursor.fetchall())}
-
-    # 确保必要的列存在
-    required_columns = ['duration', 'progress', 'author_name', 'author_mid']
-    for col in required_columns:
-        if col not in columns:
-            raise ValueError(f"Required column '{col}' not found in table {table_name}")
-
-    # 获取所有历史记录
-    cursor.execute(f"SELECT * FROM {table_name}")
-    histories = cursor.fetchall()
-
-    author_stats = {}
-
-    for history in histories:
-        # 获取并转换数据类型
-        try:
-            duration = float(history[columns['duration']]) if history[columns['duration']] else 0
-            progress = float(history[columns['progress']]) if history[columns['progress']] else 0
-            author_name = history[columns['author_name']]
-            author_mid = history[columns['author_mid']]
-        except (ValueError, TypeError):
-            continue
-
-        # 计算完成率
-        if progress == -1:
-            completion_rate = 100
-        else:
-            completion_rate = (progress / duration * 100) if duration > 0 else 0
-
-        # UP主统计
-        if author_name and author_mid:
-            if author_name not in author_stats:
-                author_stats[author_name] = {
-                    "author_mid": author_mid,
-                    "video_count": 0,
-                    "total_completion": 0,
-                    "fully_watched": 0
-                }
-            stats = author_stats[author_name]
-            stats["video_count"] += 1
-            stats["total_completion"] += completion_rate
-            if completion_rate >= 90:
-                stats["fully_watched"] += 1
-
-    # 计算UP主平均完成率和完整观看率，并按观看数量筛选
-    filtered_authors = {}
-    for name, stats in author_stats.items():
-        if stats["video_count"] >= 5:  # 只保留观看数量>=5的UP主
-            stats["average_completion_rate"] = round(stats["total_completion"] / stats["video_count"], 2)
-            stats["fully_watched_rate"] = round(stats["fully_watched"] / stats["video_count"] * 100, 2)
-            filtered_authors[name] = stats
+    # 引擎中只保留了观看数量>=5的UP主
+    filtered_authors = {name: dict(stats) for name, stats in metrics["authors"].items()}
 
     # 使用新的智能评分算法
     scored_authors = calculate_comprehensive_author_scores(filtered_authors)
@@ -1717,10 +1246,7 @@ async def get_viewing_author_completion(
     if table_name is None:
         return available_years  # 这里是错误响应
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-
         # 如果启用缓存，尝试从缓存获取
         if use_cache:
             from .title_pattern_discovery import pattern_cache
@@ -1730,9 +1256,10 @@ async def get_viewing_author_completion(
                 return cached_response
 
         print(f"开始分析 {target_year} 年的UP主完成率数据")
+        metrics = await load_year_metrics(target_year)
 
         # 获取UP主完成率分析数据
-        author_data = analyze_author_completion_rates(cursor, table_name)
+        author_data = analyze_author_completion_rates(metrics)
 
         # 生成UP主完成率洞察
         author_insights = generate_author_completion_insights(author_data)
@@ -1757,79 +1284,19 @@ async def get_viewing_author_completion(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
-def analyze_tag_analysis(cursor, table_name: str) -> dict:
+def analyze_tag_analysis(metrics: dict) -> dict:
     """专门分析标签数据，包括分布和完成率"""
-    # 获取表结构
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = {col[1]: idx for idx, col in enumerate(cursor.fetchall())}
-
-    # 确保必要的列存在
-    required_columns = ['duration', 'progress', 'tag_name']
-    for col in required_columns:
-        if col not in columns:
-            raise ValueError(f"Required column '{col}' not found in table {table_name}")
-
-    # 获取所有历史记录
-    cursor.execute(f"SELECT * FROM {table_name}")
-    histories = cursor.fetchall()
-
-    tag_stats = {}
-    tag_distribution = {}
-
-    for history in histories:
-        # 获取并转换数据类型
-        try:
-            duration = float(history[columns['duration']]) if history[columns['duration']] else 0
-            progress = float(history[columns['progress']]) if history[columns['progress']] else 0
-            tag_name = history[columns['tag_name']]
-        except (ValueError, TypeError):
-            continue
-
-        # 计算完成率
-        if progress == -1:
-            completion_rate = 100
-        else:
-            completion_rate = (progress / duration * 100) if duration > 0 else 0
-
-        # 标签分布统计
-        if tag_name:
-            tag_distribution[tag_name] = tag_distribution.get(tag_name, 0) + 1
-
-            # 标签完成率统计
-            if tag_name not in tag_stats:
-                tag_stats[tag_name] = {
-                    "video_count": 0,
-                    "total_completion": 0,
-                    "fully_watched": 0
-                }
-            stats = tag_stats[tag_name]
-            stats["video_count"] += 1
-            stats["total_completion"] += completion_rate
-            if completion_rate >= 90:
-                stats["fully_watched"] += 1
-
-    # 计算标签平均完成率和完整观看率，并按观看数量筛选
-    filtered_tags = {}
-    for tag, stats in tag_stats.items():
-        if stats["video_count"] >= 5:  # 只保留视频数量>=5的标签
-            stats["average_completion_rate"] = round(stats["total_completion"] / stats["video_count"], 2)
-            stats["fully_watched_rate"] = round(stats["fully_watched"] / stats["video_count"] * 100, 2)
-            filtered_tags[tag] = stats
-
-    # 获取完成率最高的标签
+    # 获取完成率最高的标签（引擎中只保留了视频数量>=5的标签）
     top_completion_tags = dict(sorted(
-        filtered_tags.items(),
+        ((tag, dict(stats)) for tag, stats in metrics["tags"].items()),
         key=lambda x: x[1]["average_completion_rate"],
         reverse=True
     )[:10])
 
     # 获取观看最多的标签
     top_watched_tags = dict(sorted(
-        tag_distribution.items(),
+        metrics["tag_counts"].items(),
         key=lambda x: x[1],
         reverse=True
     )[:10])
@@ -1889,10 +1356,7 @@ async def get_viewing_tag_analysis(
     if table_name is None:
         return available_years  # 这里是错误响应
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-
         # 如果启用缓存，尝试从缓存获取
         if use_cache:
             from .title_pattern_discovery import pattern_cache
@@ -1902,9 +1366,10 @@ async def get_viewing_tag_analysis(
                 return cached_response
 
         print(f"开始分析 {target_year} 年的标签数据")
+        metrics = await load_year_metrics(target_year)
 
         # 获取标签分析数据
-        tag_data = analyze_tag_analysis(cursor, table_name)
+        tag_data = analyze_tag_analysis(metrics)
 
         # 生成标签分析洞察
         tag_insights = generate_tag_analysis_insights(tag_data)
@@ -1930,115 +1395,14 @@ async def get_viewing_tag_analysis(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
-def analyze_duration_analysis(cursor, table_name: str) -> dict:
-    """专门分析视频时长数据"""
-    # 获取表结构
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = {col[1]: idx for idx, col in enumerate(cursor.fetchall())}
-
-    # 确保必要的列存在
-    required_columns = ['duration', 'view_at']
-    for col in required_columns:
-        if col not in columns:
-            raise ValueError(f"Required column '{col}' not found in table {table_name}")
-
-    # 获取所有历史记录
-    cursor.execute(f"SELECT * FROM {table_name}")
-    histories = cursor.fetchall()
-
-    print(f"Debug: 总共获取到 {len(histories)} 条历史记录")
-    if len(histories) > 0:
-        print(f"Debug: 第一条记录示例: {histories[0]}")
-        print(f"Debug: 列映射: {columns}")
-
-    # 时段分类
-    time_periods = {
-        '凌晨': {'start': 0, 'end': 6},
-        '上午': {'start': 6, 'end': 12},
-        '下午': {'start': 12, 'end': 18},
-        '晚上': {'start': 18, 'end': 24}
+def analyze_duration_analysis(metrics: dict) -> dict:
+    """专门分析视频时长数据（按观看时段和视频时长分类）"""
+    return {
+        period: {duration_type: dict(stats) for duration_type, stats in types.items()}
+        for period, types in metrics["duration_correlation"].items()
     }
 
-    # 初始化时长相关性数据
-    duration_correlation = {}
-    for period in time_periods.keys():
-        duration_correlation[period] = {
-            '短视频': {'video_count': 0, 'total_duration': 0, 'avg_duration': 0},
-            '中等视频': {'video_count': 0, 'total_duration': 0, 'avg_duration': 0},
-            '长视频': {'video_count': 0, 'total_duration': 0, 'avg_duration': 0}
-        }
-
-    processed_count = 0
-    valid_count = 0
-
-    for history in histories:
-        processed_count += 1
-        try:
-            duration = float(history[columns['duration']]) if history[columns['duration']] else 0
-            view_at = history[columns['view_at']]
-
-            if not view_at or duration <= 0:
-                if processed_count <= 5:  # 只打印前5条的调试信息
-                    print(f"Debug: 跳过记录 {processed_count}: view_at={view_at}, duration={duration}")
-                continue
-
-            # 解析观看时间 - view_at 是 Unix 时间戳
-            from datetime import datetime
-            try:
-                # view_at 是 Unix 时间戳，需要转换为 datetime 对象
-                view_time = datetime.fromtimestamp(int(view_at))
-                hour = view_time.hour
-            except (ValueError, TypeError, OSError):
-                continue
-
-            # 确定时段
-            period = None
-            for p, time_range in time_periods.items():
-                if time_range['start'] <= hour < time_range['end']:
-                    period = p
-                    break
-
-            if not period:
-                continue
-
-            # 确定时长类型
-            if duration < 300:  # 5分钟以下
-                duration_type = '短视频'
-            elif duration < 1200:  # 20分钟以下
-                duration_type = '中等视频'
-            else:
-                duration_type = '长视频'
-
-            # 更新统计
-            stats = duration_correlation[period][duration_type]
-            stats['video_count'] += 1
-            stats['total_duration'] += duration
-            valid_count += 1
-
-            if valid_count <= 5:  # 只打印前5条有效记录的调试信息
-                print(f"Debug: 有效记录 {valid_count}: period={period}, duration_type={duration_type}, duration={duration}")
-
-        except (ValueError, TypeError):
-            if processed_count <= 5:
-                print(f"Debug: 数据转换失败，记录 {processed_count}")
-            continue
-
-    # 计算平均时长
-    for period in duration_correlation:
-        for duration_type in duration_correlation[period]:
-            stats = duration_correlation[period][duration_type]
-            if stats['video_count'] > 0:
-                stats['avg_duration'] = stats['total_duration'] / stats['video_count']
-
-    print(f"Debug: 处理完成 - 总记录数: {processed_count}, 有效记录数: {valid_count}")
-    print(f"Debug: 最终统计结果: {duration_correlation}")
-
-    return duration_correlation
-
 def generate_duration_analysis_insights(duration_data: dict) -> dict:
     """生成视频时长分析相关的洞察"""
     insights = {}
@@ -2100,10 +1464,7 @@ async def get_viewing_duration_analysis(
     if table_name is None:
         return available_years  # 这里是错误响应
 
-    conn = get_db()
     try:
-        cursor = conn.cursor()
-
         # 如果启用缓存，尝试从缓存获取
         if use_cache:
             from .title_pattern_discovery import pattern_cache
@@ -2113,9 +1474,10 @@ async def get_viewing_duration_analysis(
                 return cached_response
 
         print(f"开始分析 {target_year} 年的视频时长数据")
+        metrics = await load_year_metrics(target_year)
 
         # 获取视频时长分析数据
-        duration_data = analyze_duration_analysis(cursor, table_name)
+        duration_data = analyze_duration_analysis(metrics)
 
         # 生成时长分析洞察
         duration_insights = generate_duration_analysis_insights(duration_data)
@@ -2140,6 +1502,56 @@ async def get_viewing_duration_analysis(
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
+
+
+def parse_year_ranges(ranges: str) -> list:
+    """解析年份范围参数，如 "2021-2022,2023,2024" -> [(2021, 2022), (2023, 2023), (2024, 2024)]"""
+    result = []
+    for part in ranges.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = (int(x) for x in part.split('-', 1))
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"无效的年份范围: {part}")
+        if start > end:
+            start, end = end, start
+        result.append((start, end))
+    if not result:
+        raise HTTPException(status_code=400, detail="至少需要一个年份范围")
+    return result
+
+@router.get("/habit-compare", summary="多年份观看习惯对比")
+async def compare_viewing_habits(
+    ranges: Optional[str] = Query(None, description="要对比的年份范围，逗号分隔，如 2021-2022,2023,2024；不传则逐年对比全部年份"),
+    main_category: Optional[str] = Query(None, description="只统计该主分区"),
+    tag_name: Optional[str] = Query(None, description="只统计该分区标签"),
+    top: int = Query(10, ge=1, le=50, description="每个范围返回的热门分区数量"),
+    rebuild: bool = Query(False, description="是否重建观看习惯立方体")
+):
+    """多年份观看习惯对比
+
+    数据来自按（年份, 星期, 小时, 分区）预先聚合的观看习惯立方体，导入历史记录时增量更新，
+    对比任意多个年份范围都只是内存中的分组求和。第一个范围作为基准，其余范围额外返回
+    小时分布和星期分布相对基准的占比变化。
+
+    Returns:
+        dict: 每个年份范围的星期×小时矩阵、小时/星期分布、高峰时段和热门分区
+    """
+    cube = ViewingCube.get_instance()
+    try:
+        refresh = await asyncio.to_thread(cube.refresh, rebuild)
+        year_ranges = parse_year_ranges(ranges) if ranges else [(y, y) for y in cube.years()]
+        if not year_ranges:
+            return {"status": "error", "message": "未找到任何历史记录数据"}
+        data = cube.compare(year_ranges, main_category, tag_name, top)
+        data["refresh"] = refresh
+        return {"status": "success", "data": data}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -4,6 +4,8 @@ from collections import defaultdict
 from datetime import datetime
 import sqlite3
 
+from scripts.history_partitions import connect_history, history_table_names, history_years
+from scripts.history_time_columns import ensure_time_columns
 from scripts.utils import load_config, get_output_path
 
 config = load_config()
@@ -11,7 +13,10 @@ config = load_config()
 def get_db():
     """获取数据库连接"""
     db_path = get_output_path(config['db_file'])
-    return sqlite3.connect(db_path)
+    conn = connect_history(db_path)
+    # 查询使用本地时间生成列，旧数据库首次访问时补齐（只修改表结构，索引由启动任务建立）
+    ensure_time_columns(conn, build_indexes=False)
+    return conn
 
 def get_current_year():
     """获取当前年份"""
@@ -28,7 +33,7 @@ def load_history_from_db():
         # 检查表是否存在
         cursor.execute(f"""
             SELECT name FROM sqlite_master 
-            WHERE type='table' AND name=?
+            WHERE type IN ('table', 'view') AND name=?
         """, (table_name,))
         
         if not cursor.fetchone():
@@ -158,11 +163,7 @@ def get_daily_counts(year=None):
         
         if not table_name:
             # 获取所有年份的表
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name LIKE 'bilibili_history_%'
-            """)
-            tables = cursor.fetchall()
+            tables = [(name,) for name in history_table_names(conn)]
             if not tables:
                 return {"error": "未找到任何历史记录数据"}
             
@@ -172,7 +173,7 @@ def get_daily_counts(year=None):
                 # 按日期统计观看数量
                 cursor.execute(f"""
                     SELECT 
-                        strftime('%Y-%m-%d', datetime(view_at, 'unixepoch')) as date,
+                        view_date as date,
                         COUNT(*) as count
                     FROM {table}
                     GROUP BY date
@@ -189,7 +190,7 @@ def get_daily_counts(year=None):
             # 查询指定年份的数据
             cursor.execute(f"""
                 SELECT 
-                    strftime('%Y-%m-%d', datetime(view_at, 'unixepoch')) as date,
+                    view_date as date,
                     COUNT(*) as count
                 FROM {table_name}
                 GROUP BY date
@@ -236,11 +237,7 @@ def get_monthly_counts(year=None):
         
         if not table_name:
             # 获取所有年份的表
-            cursor.execute("""
-                SELECT name FROM sqlite_master 
-                WHERE type='table' AND name LIKE 'bilibili_history_%'
-            """)
-            tables = cursor.fetchall()
+            tables = [(name,) for name in history_table_names(conn)]
             if not tables:
                 return {"error": "未找到任何历史记录数据"}
             
@@ -249,7 +246,7 @@ def get_monthly_counts(year=None):
             for (table,) in tables:
                 cursor.execute(f"""
                     SELECT 
-                        strftime('%Y-%m', datetime(view_at, 'unixepoch')) as month,
+                        substr(view_date, 1, 7) as month,
                         COUNT(*) as count
                     FROM {table}
                     GROUP BY month
@@ -265,7 +262,7 @@ def get_monthly_counts(year=None):
         else:
             cursor.execute(f"""
                 SELECT 
-                    strftime('%Y-%m', datetime(view_at, 'unixepoch')) as month,
+                    substr(view_date, 1, 7) as month,
                     COUNT(*) as count
                 FROM {table_name}
                 GROUP BY month
@@ -286,20 +283,7 @@ def get_available_years():
     """获取可用的年份列表"""
     conn = get_db()
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name LIKE 'bilibili_history_%'
-        """)
-        tables = cursor.fetchall()
-        years = []
-        for (table_name,) in tables:
-            try:
-                year = int(table_name.split('_')[-1])
-                years.append(year)
-            except (ValueError, IndexError):
-                continue
-        return sorted(years, reverse=True)
+        return sorted(history_years(conn), reverse=True)
     except sqlite3.Error as e:
         print(f"数据库错误: {e}")
         return []
@@ -345,10 +329,10 @@ def get_daily_and_monthly_counts(target_year=None):
         for year in years_to_analyze:
             table_name = f"bilibili_history_{year}"
             
-            # 获取每日观看数量，使用localtime进行时区转换
+            # 获取每日观看数量，使用配置时区的本地日期生成列
             cursor.execute(f"""
                 SELECT 
-                    strftime('%Y-%m-%d', datetime(view_at, 'unixepoch', 'localtime')) as date,
+                    view_date as date,
                     COUNT(*) as count
                 FROM {table_name}
                 GROUP BY date
@@ -357,10 +341,10 @@ def get_daily_and_monthly_counts(target_year=None):
             year_daily_count = {row[0]: row[1] for row in cursor.fetchall()}
             daily_count.update(year_daily_count)
 
-            # 获取每日观看总时长（秒），使用localtime进行时区转换
+            # 获取每日观看总时长（秒），使用配置时区的本地日期生成列
             cursor.execute(f"""
                 SELECT
-                    strftime('%Y-%m-%d', datetime(view_at, 'unixepoch', 'localtime')) as date,
+                    view_date as date,
                     SUM(
                         CASE
                             WHEN progress = -1 THEN duration
@@ -377,10 +361,10 @@ def get_daily_and_monthly_counts(target_year=None):
             daily_watch_seconds.update(year_daily_watch)
             total_watch_seconds += sum(year_daily_watch.values())
             
-            # 获取每月观看数量，使用localtime进行时区转换
+            # 获取每月观看数量，使用配置时区的本地日期生成列
             cursor.execute(f"""
                 SELECT 
-                    strftime('%Y-%m', datetime(view_at, 'unixepoch', 'localtime')) as month,
+                    substr(view_date, 1, 7) as month,
                     COUNT(*) as count
                 FROM {table_name}
                 GROUP BY month
@@ -389,10 +373,10 @@ def get_daily_and_monthly_counts(target_year=None):
             year_monthly_count = {row[0]: row[1] for row in cursor.fetchall()}
             monthly_count.update(year_monthly_count)
 
-            # 获取每月观看总时长（秒），使用localtime进行时区转换
+            # 获取每月观看总时长（秒），使用配置时区的本地日期生成列
             cursor.execute(f"""
                 SELECT
-                    strftime('%Y-%m', datetime(view_at, 'unixepoch', 'localtime')) as month,
+                    substr(view_date, 1, 7) as month,
                     SUM(
                         CASE
                             WHEN progress = -1 THEN duration
@@ -9,7 +9,12 @@ import random
 import string
 from datetime import datetime, timedelta
 import requests
-from scripts.utils import load_config, get_base_path, get_output_path
+from loguru import logger
+from scripts.history_fanout import HistoryQueryExecutor
+from scripts.history_partitions import history_years
+from scripts.history_sync_state import HistorySyncCheckpoint, entry_mark, reached_mark
+from scripts.import_sqlite import ingest_history_entries, refresh_derived_tables
+from scripts.utils import load_config, get_config, get_base_path, get_output_path, log_enabled
 
 # 导入获取视频详情的函数
 from routers.download import get_video_info
@@ -19,9 +24,8 @@ config = load_config()
 def load_cookie():
     """从配置文件读取 SESSDATA"""
     print("\n=== 读取 Cookie 配置 ===")
-    # 重新加载配置文件，确保获取最新的SESSDATA
-    current_config = load_config()
-    print(f"配置内容: {current_config}")
+    # 配置服务会在文件变更后自动重新加载，这里拿到的总是最新的SESSDATA
+    current_config = get_config()
     sessdata = current_config.get('SESSDATA', '')
     if not sessdata:
         print("警告: 配置文件中未找到 SESSDATA")
@@ -134,7 +138,7 @@ def save_history(history_data, base_folder='history_by_date'):
             json.dump(daily_data, f, ensure_ascii=False, indent=4)
             
     logging.info(f"历史记录保存完成，共保存了{saved_count}条新记录。")
-    return {"status": "success", "message": f"历史记录获取成功", "data": history_data}
+    return {"status": "success", "message": f"历史记录获取成功", "data": history_data, "saved_count": saved_count}
 
 def save_video_details(video_data):
     """将视频详细信息保存到新数据库"""
@@ -1035,23 +1039,79 @@ def batch_save_video_details(video_details_list):
         "error_stats": error_stats
     }
 
-async def fetch_and_compare_history(cookie, latest_date, skip_exists=False, process_video_details=False):
+# 按日 JSON 归档由单个后台线程按提交顺序写入，同一天的文件不会被并发改写
+_archive_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-archive')
+
+def find_latest_local_entry(base_folder='history_by_date'):
+    """查找本地最新的一条历史记录（用于在没有同步检查点时初始化高水位）"""
+    latest_date = find_latest_local_history(base_folder)
+    if not latest_date:
+        return None
+    file_path = os.path.join(get_output_path(base_folder), latest_date.strftime('%Y'), latest_date.strftime('%m'),
+                             latest_date.strftime('%d') + '.json')
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    return max(data, key=lambda item: item.get('view_at', 0)) if data else None
+
+def _process_video_details_batch(bvids, cookie, skip_exists=False):
+    """多线程获取一批视频的详情并批量保存"""
+    unique_video_ids = list(dict.fromkeys(bvids))
+    if not unique_video_ids:
+        return
+    print(f"本页有 {len(unique_video_ids)} 个不同的视频需要获取详情")
+
+    max_workers = min(30, len(unique_video_ids))  # 最多30个线程
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_to_bvid = {
+            executor.submit(get_video_info_sync, bvid, cookie, skip_exists): bvid
+            for bvid in unique_video_ids
+        }
+        for future in concurrent.futures.as_completed(future_to_bvid):
+            bvid = future_to_bvid[future]
+            try:
+                result = future.result()
+                if result is None:  # 跳过的视频
+                    continue
+                if result.status == "success":
+                    results.append(result)
+                    print(f"成功获取视频 {bvid} 的详情: {result.data.get('title', '')}")
+                else:
+                    print(f"获取视频 {bvid} 的详情失败: {result.message}")
+            except Exception as e:
+                print(f"处理视频 {bvid} 时出错: {e}")
+
+    if results:
+        batch_result = batch_save_video_details(results)
+        print(f"视频详情保存完成: 成功 {batch_result['success']}，失败 {batch_result['fail']}")
+
+async def fetch_and_compare_history(cookie, latest_date=None, skip_exists=False, process_video_details=False,
+                                    base_folder='history_by_date'):
     """
-    获取历史记录并与本地最新记录对比
-    
+    获取历史记录并保存到本地，精确停在上次同步的最新记录
+
+    同步进度保存在数据库的 history_sync_state 表中：
+    - 高水位为上次同步到的最新记录 (view_at, business, oid)，遇到它即停止，不再重复下载最近一天
+    - 每获取一页立即保存，并提交下一页的游标；同步中断后再次调用会从中断的那一页继续
+    - 开启 history_sync.direct_sqlite 时，每页直接写入年份表，与检查点在同一个事务中提交，
+      同步结束即可查询；按日 JSON 文件由后台线程异步写入（history_sync.json_archive）
+
     Args:
         cookie: 用户cookie中的SESSDATA
-        latest_date: 本地最新的记录日期，格式为YYYY-MM-DD
+        latest_date: 已不再使用，保留以兼容旧的调用方式；没有检查点时以本地最新记录初始化高水位
         skip_exists: 是否跳过已存在的记录
         process_video_details: 是否同时获取视频详情，默认为False
-    
+        base_folder: 历史记录 JSON 的保存目录
+
     Returns:
-        dict: 新的历史记录，按日期分组
+        dict: 本次同步的统计信息（new_count 为新保存的记录数，inserted_count 为直接写入数据库的记录数）
     """
-    api_url = "https://api.bilibili.com/x/v2/history"
-    
     print("\n=== API 请求信息 ===")
-    print(f"使用的 Cookie: {cookie}")
+    if log_enabled("DEBUG"):
+        logger.debug(f"使用的 Cookie: {cookie}")
     
     url = 'https://api.bilibili.com/x/web-interface/history/cursor'
     
@@ -1064,217 +1124,198 @@ async def fetch_and_compare_history(cookie, latest_date, skip_exists=False, proc
         'Accept': 'application/json, text/plain, */*',
         'Connection': 'keep-alive'
     }
-    print(f"请求头: {headers}")
-    
-    params = {
-        'ps': 30,
-        'max': '',
-        'view_at': '',
-        'business': '',
-    }
-    
-    # 测试 API 连接
-    response = requests.get(url, headers=headers, params=params)
-    print(f"\n=== API 响应信息 ===")
-    print(f"状态码: {response.status_code}")
+    if log_enabled("DEBUG"):
+        logger.debug(f"请求头: {headers}")
+
+    sync_config = get_config().get('history_sync', {})
+    summary = {"new_count": 0, "inserted_count": 0, "pages": 0, "resumed": False, "high_water_mark": None,
+               "direct_sqlite": bool(sync_config.get('direct_sqlite', True))}
+    json_archive = not summary["direct_sqlite"] or sync_config.get('json_archive', True)
+    archive_jobs = []
+    checkpoint = HistorySyncCheckpoint()
     try:
-        response_data = response.json()
-        if response_data.get('code') == -101:
-            print("Cookie 已失效，请更新 SESSDATA")
-            return []
-    except:
-        print(f"响应内容: {response.text}")
-    
-    all_new_data = []
-    all_video_ids = []  # 存储所有需要获取详情的视频ID
+        if checkpoint.high_water_mark is None and checkpoint.pending_run() is None:
+            latest_entry = find_latest_local_entry(base_folder)
+            if latest_entry:
+                checkpoint.set_high_water_mark(entry_mark(latest_entry))
+            elif summary["direct_sqlite"]:
+                latest_mark = _latest_imported_mark(checkpoint.conn)
+                if latest_mark:
+                    checkpoint.set_high_water_mark(latest_mark)
+
+        # 恢复中断的同步后，再做一次新的同步，补上中断期间新增的记录
+        while True:
+            resumed = await _sync_history_pass(checkpoint, url, headers, cookie, skip_exists,
+                                               process_video_details, base_folder, summary,
+                                               archive_jobs if json_archive else None)
+            if not resumed:
+                break
+        summary["high_water_mark"] = checkpoint.high_water_mark
+
+        if summary["inserted_count"]:
+            # 刷新派生表需要扫描年份表，放到线程中执行，避免阻塞事件循环
+            await asyncio.to_thread(refresh_derived_tables, checkpoint.conn)
+    finally:
+        checkpoint.close()
+        if archive_jobs:
+            results = await asyncio.gather(*archive_jobs, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"写入历史记录 JSON 归档失败: {result}")
+
+    print(f"同步结束：共 {summary['pages']} 页，新保存 {summary['new_count']} 条记录")
+    if summary["new_count"] and not process_video_details:
+        print(f"\n跳过视频详情获取 (process_video_details={process_video_details})")
+        print(f"如需获取视频详情，请使用/fetch/video-details-stats和/fetch/fetch-video-details接口")
+    return summary
+
+def _latest_imported_mark(conn):
+    """没有本地 JSON 文件时，以数据库中最新的一条记录初始化高水位"""
+    for year in reversed(history_years(conn)):
+        row = conn.execute(
+            f"SELECT view_at, business, oid FROM bilibili_history_{year} ORDER BY view_at DESC LIMIT 1").fetchone()
+        if row:
+            return row[0], row[1] or '', row[2] or 0
+    return None
+
+async def _sync_history_pass(checkpoint, url, headers, cookie, skip_exists, process_video_details, base_folder,
+                             summary, archive_jobs=None):
+    """执行一轮同步，返回本轮是否是恢复的中断同步
+
+    archive_jobs 不为 None 时，直接写入数据库的同时把每页提交到后台线程写入 JSON 归档
+    """
+    mark = checkpoint.high_water_mark
+    pending = checkpoint.pending_run()
+    params = {'ps': 30, 'max': '', 'view_at': '', 'business': ''}
+
+    if pending:
+        params.update(pending['cursor'])
+        summary["resumed"] = True
+        print(f"从中断处继续同步：已完成 {pending['pages']} 页 / {pending['records']} 条，"
+              f"游标 max={params['max']}, view_at={params['view_at']}")
+    if mark:
+        print(f"设置停止条件：到达记录 view_at={mark[0]}, business={mark[1]}, oid={mark[2]}")
+    else:
+        print("没有本地数据，抓取所有可用的历史记录。")
+
     page_count = 0
     last_view_at = None  # 记录最后一条数据的时间
     empty_page_count = 0  # 记录连续空页面的次数
     max_empty_pages = 3   # 最大允许的连续空页面次数
-
-    if latest_date:
-        # 直接使用最新日期的时间戳作为停止条件
-        cutoff_timestamp = int(datetime.combine(latest_date, datetime.min.time()).timestamp())
-        print(f"设置停止条件：view_at <= {cutoff_timestamp} ({latest_date})")
-    else:
-        cutoff_timestamp = 0
-        print("没有本地数据，抓取所有可用的历史记录。")
+    run_started = pending is not None
 
     while True:
         page_count += 1
         print(f"发送请求获取数据... (第{page_count}页)")
         response = requests.get(url, headers=headers, params=params)
 
-        if response.status_code == 200:
-            try:
-                data = response.json()
-                if data['code'] != 0:
-                    print(f"API请求失败，错误码: {data['code']}, 错误信息: {data['message']}")
-                    break
-
-                if 'data' in data and 'list' in data['data']:
-                    fetched_list = data['data']['list']
-                    print(f"获取到{len(fetched_list)}条记录，进行对比...")
-
-                    # 如果获取到0条记录，检查是否是因为到达了最后一页
-                    if len(fetched_list) == 0:
-                        empty_page_count += 1
-                        print(f"连续获取到空页面 {empty_page_count}/{max_empty_pages}")
-                        
-                        if empty_page_count >= max_empty_pages:
-                            print(f"连续{max_empty_pages}次获取到空页面，停止请求。")
-                            break
-                            
-                        if 'cursor' in data['data']:
-                            # 检查新的游标时间是否大于最后一条记录的时间
-                            new_view_at = data['data']['cursor']['view_at']
-                            current_max = data['data']['cursor']['max']
-                            
-                            # 如果游标被重置（max变为0或很小的值），说明已经到达末尾
-                            if current_max == 0 or (last_view_at and current_max < 1000000):
-                                print(f"检测到游标重置（max={current_max}），停止请求。")
-                                break
-                                
-                            if last_view_at and new_view_at >= last_view_at:
-                                print(f"检测到重复数据（当前游标时间 {new_view_at} >= 最后记录时间 {last_view_at}），停止请求。")
-                                break
-                                
-                            params['max'] = current_max
-                            params['view_at'] = new_view_at
-                            print(f"获取到空页，尝试继续请求。游标更新：max={params['max']}, view_at={params['view_at']}")
-                            continue
-                        else:
-                            print("没有更多数据，停止请求。")
-                            break
-                    else:
-                        # 重置空页面计数
-                        empty_page_count = 0
-
-                    # 更新最后一条记录的时间
-                    if fetched_list:
-                        last_view_at = fetched_list[-1]['view_at']
-                        print(f"更新最后记录时间: {last_view_at}")
-
-                    # 收集所有视频ID，先不进行API调用
-                    for entry in fetched_list:
-                        print(f"标题: {entry['title']}, 观看时间: {datetime.fromtimestamp(entry['view_at'])}")
-                        
-                        # 从历史记录获取 bvid
-                        bvid = entry['history'].get('bvid', '')
-                        if bvid:
-                            all_video_ids.append(bvid)
-
-                    new_entries = []
-                    should_stop = False
-
-                    for entry in fetched_list:
-                        view_at = entry['view_at']
-                        if view_at > cutoff_timestamp:
-                            new_entries.append(entry)
-                        else:
-                            should_stop = True
-
-                    if new_entries:
-                        all_new_data.extend(new_entries)
-                        print(f"找到{len(new_entries)}条新记录。")
-
-                    if should_stop:
-                        print("达到停止条件，停止请求。")
-                        break
-
-                    if 'cursor' in data['data']:
-                        current_max = data['data']['cursor']['max']
-                        params['max'] = current_max
-                        params['view_at'] = data['data']['cursor']['view_at']
-                        print(f"请求游标更新：max={params['max']}, view_at={params['view_at']}")
-                    else:
-                        print("未能获取游标信息，停止请求。")
-                        break
-
-                    await asyncio.sleep(1)
-                else:
-                    print("没有更多的数据或数据结构错误。")
-                    break
+        if response.status_code != 200:
+            print(f"请求失败，状态码: {response.status_code}")
+            return False
+
+        try:
+            data = response.json()
+        except json.JSONDecodeError:
+            print("JSON Decode Error: 无法解析服务器响应")
+            return False
+
+        if data['code'] != 0:
+            if data['code'] == -101:
+                print("Cookie 已失效，请更新 SESSDATA")
+            else:
+                print(f"API请求失败，错误码: {data['code']}, 错误信息: {data['message']}")
+            return False
+
+        if 'data' not in data or 'list' not in data['data']:
+            print("没有更多的数据或数据结构错误。")
+            break
 
-            except json.JSONDecodeError:
-                print("JSON Decode Error: 无法解析服务器响应")
+        fetched_list = data['data']['list'] or []
+        cursor = data['data'].get('cursor')
+        print(f"获取到{len(fetched_list)}条记录，进行对比...")
+
+        # 如果获取到0条记录，检查是否是因为到达了最后一页
+        if len(fetched_list) == 0:
+            empty_page_count += 1
+            print(f"连续获取到空页面 {empty_page_count}/{max_empty_pages}")
+            if empty_page_count >= max_empty_pages or not cursor:
+                print("没有更多数据，停止请求。")
                 break
-        else:
-            print(f"请求失败，状态码: {response.status_code}")
+
+            # 如果游标被重置（max变为0或很小的值），说明已经到达末尾
+            if cursor['max'] == 0 or (last_view_at and cursor['max'] < 1000000):
+                print(f"检测到游标重置（max={cursor['max']}），停止请求。")
+                break
+            if last_view_at and cursor['view_at'] >= last_view_at:
+                print(f"检测到重复数据（当前游标时间 {cursor['view_at']} >= 最后记录时间 {last_view_at}），停止请求。")
+                break
+
+            params.update({'max': cursor['max'], 'view_at': cursor['view_at'], 'business': cursor.get('business', '')})
+            print(f"获取到空页，尝试继续请求。游标更新：max={params['max']}, view_at={params['view_at']}")
+            continue
+
+        empty_page_count = 0
+        last_view_at = fetched_list[-1]['view_at']
+
+        new_entries = []
+        should_stop = False
+        for entry in fetched_list:
+            if reached_mark(entry, mark):
+                should_stop = True
+                break
+            new_entries.append(entry)
+
+        # 本轮第一页的最新记录在同步完成后成为新的高水位
+        if not run_started:
+            if not new_entries:
+                print("没有新记录。")
+                return False
+            checkpoint.begin_run(entry_mark(new_entries[0]))
+            run_started = True
+
+        if new_entries:
+            # 先写入存储，再提交检查点：中断后最多重新获取这一页，已保存的记录会去重
+            if summary["direct_sqlite"]:
+                # 插入与下面的检查点更新使用同一个连接，一起提交
+                saved = await asyncio.to_thread(ingest_history_entries, checkpoint.conn, new_entries)
+                summary["inserted_count"] += saved
+                if archive_jobs is not None:
+                    archive_jobs.append(asyncio.get_running_loop().run_in_executor(
+                        _archive_executor, save_history, new_entries, base_folder))
+            else:
+                saved = (await asyncio.to_thread(save_history, new_entries, base_folder))["saved_count"]
+            summary["new_count"] += saved
+            print(f"找到{len(new_entries)}条新记录，保存{saved}条。")
+
+            if process_video_details:
+                bvids = [entry['history'].get('bvid', '') for entry in new_entries]
+                await asyncio.to_thread(_process_video_details_batch, [b for b in bvids if b], cookie, skip_exists)
+
+        summary["pages"] += 1
+
+        if should_stop:
+            print("达到停止条件，停止请求。")
             break
 
-    # 完成历史记录获取后，使用多线程获取视频详情
-    if all_video_ids and process_video_details:
-        print(f"\n=== 多线程获取视频详情 ===")
-        print(f"总共有 {len(all_video_ids)} 个视频需要获取详情")
-        
-        # 去重
-        unique_video_ids = list(set(all_video_ids))
-        print(f"去重后有 {len(unique_video_ids)} 个不同的视频")
-        
-        # 使用线程池并行获取视频详情 - 增加最大线程数到30
-        max_workers = min(30, len(unique_video_ids))  # 最多30个线程
-        print(f"使用 {max_workers} 个线程并行获取视频详情")
-        
-        # 分批处理，避免一次性创建太多线程
-        batch_size = 30  # 增加批处理数量
-        results = []
-        
-        for i in range(0, len(unique_video_ids), batch_size):
-            batch = unique_video_ids[i:i+batch_size]
-            print(f"处理第 {i//batch_size + 1} 批，共 {len(batch)} 个视频")
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 将每个视频ID分配给线程池，添加skip_exists参数
-                future_to_bvid = {
-                    executor.submit(get_video_info_sync, bvid, cookie, skip_exists): bvid
-                    for bvid in batch
-                }
-                
-                for future in concurrent.futures.as_completed(future_to_bvid):
-                    bvid = future_to_bvid[future]
-                    try:
-                        result = future.result()
-                        if result is None:  # 跳过的视频
-                            continue
-                        if result.status == "success":
-                            results.append(result)
-                            print(f"成功获取视频 {bvid} 的详情: {result.data.get('title', '')}")
-                        else:
-                            print(f"获取视频 {bvid} 的详情失败: {result.message}")
-                    except Exception as e:
-                        print(f"处理视频 {bvid} 时出错: {e}")
-            
-            # 每批处理完后，批量保存到数据库
-            if results:
-                print(f"开始批量保存第 {i//batch_size + 1} 批视频详情...")
-                batch_result = batch_save_video_details(results)
-                total_success = batch_result["success"]
-                total_fail = batch_result["fail"]
-                
-                # 合并错误统计
-                if "error_stats" in batch_result:
-                    for error_type, count in batch_result["error_stats"].items():
-                        if error_type not in error_stats:
-                            error_stats[error_type] = 0
-                        error_stats[error_type] += count
-                
-                print(f"批次完成: 成功 {batch_result['success']}，失败 {batch_result['fail']}")
-                results = []  # 清空结果列表，准备下一批
-                
-            # 批次之间稍微暂停，减轻服务器压力
-            time.sleep(1)  # 减少暂停时间
-    elif all_video_ids:
-        print(f"\n跳过视频详情获取 (process_video_details={process_video_details})")
-        print(f"如需获取视频详情，请使用/fetch/video-details-stats和/fetch/fetch-video-details接口")
+        if not cursor:
+            print("未能获取游标信息，停止请求。")
+            break
+
+        params.update({'max': cursor['max'], 'view_at': cursor['view_at'], 'business': cursor.get('business', '')})
+        await asyncio.to_thread(checkpoint.save_page, params, len(new_entries))
+        print(f"请求游标更新：max={params['max']}, view_at={params['view_at']}")
 
-    return all_new_data
+        await asyncio.sleep(1)
+
+    if run_started:
+        checkpoint.finish_run()
+    return pending is not None
 
 async def fetch_history(output_dir: str = "history_by_date", skip_exists: bool = False, process_video_details: bool = False) -> dict:
     """主函数：获取B站历史记录并同时获取视频详细信息存入视频库"""
     try:
-        # 重新加载配置文件，确保获取最新的SESSDATA
-        current_config = load_config()
+        # 配置服务会在文件变更后自动重新加载，这里拿到的总是最新的SESSDATA
+        current_config = get_config()
         
         # 修改这里：直接使用 output_dir 而不是拼接 output 路径
         full_output_dir = get_output_path(output_dir)  # 这里 get_output_path 已经会添加 output 前缀
@@ -1287,44 +1328,14 @@ async def fetch_history(output_dir: str = "history_by_date", skip_exists: bool =
         if not cookie:
             return {"status": "error", "message": "未找到SESSDATA配置"}
 
-        latest_date = find_latest_local_history(output_dir)  # 传入相对路径
-        # 由于fetch_and_compare_history现在是异步函数，需要使用await调用
-        new_history = await fetch_and_compare_history(cookie, latest_date, skip_exists, process_video_details)
+        # 每页获取后已直接保存，视频详情也已按页处理
+        summary = await fetch_and_compare_history(cookie, None, skip_exists, process_video_details, output_dir)
 
-        result = {"status": "success", "message": "没有新记录需要更新", "data": {}}
-        if new_history:
-            save_result = save_history(new_history, output_dir)  # 传入相对路径
-            result = save_result
-            
-            # 如果需要处理视频详情
-            if process_video_details and save_result["status"] == "success":
-                print("\n=== 开始处理新记录的视频详情 ===")
-                
-                # 获取所有新记录的bvid
-                new_bvids = []
-                for date, records in new_history.items():
-                    for record in records:
-                        if record.get("bvid"):
-                            new_bvids.append(record["bvid"])
-                
-                print(f"新记录中包含 {len(new_bvids)} 个视频ID")
-                
-                # 调用获取视频详情的函数
-                if new_bvids:
-                    video_details_result = await fetch_video_details_only(specific_videos=new_bvids)
-                    result["video_details_result"] = video_details_result
-                    
-                    if video_details_result.get("status") == "success":
-                        print("成功获取新记录的视频详情")
-                    else:
-                        print(f"获取新记录的视频详情时出错: {video_details_result.get('message', '未知错误')}")
-                else:
-                    print("无新视频需要获取详情")
-                    result["video_details_result"] = {
-                        "status": "success",
-                        "message": "no new videos",
-                        "data": {}
-                    }
+        if summary["new_count"]:
+            result = {"status": "success", "message": f"历史记录获取成功，新增 {summary['new_count']} 条记录",
+                      "data": summary}
+        else:
+            result = {"status": "success", "message": "没有新记录需要更新", "data": summary}
         
         return result
 
@@ -1352,7 +1363,7 @@ async def fetch_video_details_only(max_videos: int = 0, specific_videos: list =
         print("\n=== 开始批量获取视频详情 ===")
         
         # 获取cookie
-        current_config = load_config()
+        current_config = get_config()
         cookie = current_config.get('SESSDATA', '')
         if not cookie:
             return {"status": "error", "message": "未找到SESSDATA配置"}
@@ -1620,38 +1631,31 @@ async def get_video_details_stats() -> dict:
         history_db_path = get_output_path("bilibili_history.db")
         video_db_path = get_output_path("video_library.db")
         
-        # 查询历史记录数据库中的所有bvid
-        conn_history = sqlite3.connect(history_db_path)
-        cursor_history = conn_history.cursor()
+        if not os.path.exists(history_db_path):
+            return {"status": "error", "message": "未找到历史记录表", "data": None}
         
+        # 查询历史记录数据库中的所有bvid
         print("查询历史记录数据库中的视频ID...")
         
-        # 首先获取所有年份的表
-        cursor_history.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name LIKE 'bilibili_history_%'
-        """)
+        # 首先获取所有年份（包括已封存的年份）
+        executor = HistoryQueryExecutor.get_instance()
+        history_years = await asyncio.to_thread(executor.available_years)
         
-        history_tables = cursor_history.fetchall()
-        
-        if not history_tables:
+        if not history_years:
             return {"status": "error", "message": "未找到历史记录表", "data": None}
             
-        print(f"找到以下历史记录表: {[table[0] for table in history_tables]}")
-        
-        # 构建查询所有年份表的UNION查询
-        all_bvids = []
-        for table in history_tables:
-            table_name = table[0]
-            cursor_history.execute(f"""
-                SELECT DISTINCT bvid FROM {table_name} 
-                WHERE bvid IS NOT NULL AND bvid != ''
-            """)
-            bvids = [row[0] for row in cursor_history.fetchall()]
-            all_bvids = list(set(all_bvids + bvids))
-            print(f"从表 {table_name} 中找到 {len(bvids)} 个视频ID")
+        print(f"找到以下年份的历史记录: {history_years}")
         
-        conn_history.close()
+        # 各年份并发查询去重后的bvid
+        bvids_by_year = await asyncio.to_thread(
+            executor.map_years, history_years,
+            "SELECT DISTINCT bvid FROM {table} WHERE bvid IS NOT NULL AND bvid != ''"
+        )
+        all_bvids = set()
+        for year, rows in bvids_by_year.items():
+            all_bvids.update(row[0] for row in rows)
+            print(f"从 {year} 年的历史记录中找到 {len(rows)} 个视频ID")
+        all_bvids = list(all_bvids)
         
         total_history_videos = len(all_bvids)
         print(f"历史记录数据库中总共找到 {total_history_videos} 个不同的视频ID")
@@ -1,9 +1,10 @@
 import json
 import logging
 import os
-import sqlite3
 from datetime import datetime
 
+from scripts.history_partitions import connect_history, history_table_names
+
 # 配置日志
 # 确保输出目录存在
 os.makedirs("output/check", exist_ok=True)
@@ -78,10 +79,12 @@ def count_records_in_json_file(file_path):
 def get_db_tables(db_path):
     """获取数据库中的所有表名"""
     try:
-        conn = sqlite3.connect(db_path)
+        conn = connect_history(db_path)
         cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view');")
         tables = [row[0] for row in cursor.fetchall()]
+        # 加上已封存的年份
+        tables += [name for name in history_table_names(conn) if name not in tables]
         conn.close()
         return tables
     except Exception as e:
@@ -92,7 +95,7 @@ def get_db_tables(db_path):
 def count_records_in_db_table(db_path, table_name):
     """统计数据库表中的记录数量"""
     try:
-        conn = sqlite3.connect(db_path)
+        conn = connect_history(db_path)
         cursor = conn.cursor()
         cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
         count = cursor.fetchone()[0]
@@ -110,7 +113,7 @@ def get_records_by_date(db_path, table_name, year, month, day):
         start_date = datetime(year, month, day).timestamp()
         end_date = datetime(year, month, day, 23, 59, 59).timestamp()
         
-        conn = sqlite3.connect(db_path)
+        conn = connect_history(db_path)
         cursor = conn.cursor()
         cursor.execute(f"SELECT title, view_at FROM {table_name} WHERE view_at >= ? AND view_at <= ?", 
                       (start_date, end_date))
@@ -123,8 +126,12 @@ def get_records_by_date(db_path, table_name, year, month, day):
         return 0, []
 
 
-def check_data_integrity(db_path=None, json_root_path=None):
-    """检查数据完整性"""
+def check_data_integrity(db_path=None, json_root_path=None, progress=None):
+    """检查数据完整性
+
+    Args:
+        progress: 可选的进度回调 (已检查文件数, 文件总数, 说明)
+    """
     # 配置路径
     if db_path is None:
         db_path = os.path.join('output', 'bilibili_history.db')
@@ -164,11 +171,14 @@ def check_data_integrity(db_path=None, json_root_path=None):
     all_json_records = 0
     all_db_records = 0
     
-    for file_info in json_files:
+    for index, file_info in enumerate(json_files, 1):
         file_path = file_info['path']
         year = file_info['year']
         month = file_info['month']
         day = file_info['day']
+
+        if progress:
+            progress(index, len(json_files), f"{year}-{month}-{day}")
         
         # 统计JSON文件中的记录
         json_count, json_titles = count_records_in_json_file(file_path)
@@ -7,6 +7,8 @@ from typing import Dict, List
 
 import requests
 
+from scripts.metrics import sqlite_factory
+
 
 def create_comments_table(connection):
     """创建评论表"""
@@ -151,7 +153,7 @@ def create_connection():
         os.makedirs(db_path, exist_ok=True)
         db_file = os.path.join(db_path, "bilibili_comments.db")
         
-        conn = sqlite3.connect(db_file)
+        conn = sqlite3.connect(db_file, factory=sqlite_factory())
         print(f"成功连接到评论数据库: {db_file}")
         return conn
     except sqlite3.Error as e:
@@ -0,0 +1,327 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import stat
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from config.sql_statements_sqlite import CREATE_TABLE_DEFAULT, CREATE_INDEXES
+from scripts.history_partitions import connect_history, history_years, sealed_stats, sealed_years, table_fingerprint
+from scripts.utils import get_config, get_output_path, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+# 压缩方式 -> 文件后缀
+COMPRESSIONS = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+MEDIA_TYPES = {'none': 'application/x-sqlite3', 'gzip': 'application/gzip', 'zstd': 'application/zstd'}
+
+_COPY_CHUNK = 1024 * 1024
+
+
+def zstd_available() -> bool:
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class Snapshot:
+    """一个快照文件的状态"""
+
+    def __init__(self, scope: str, compression: str, path: str):
+        self.scope = scope
+        self.compression = compression
+        self.path = path
+        self.state = 'missing'  # missing / running / ready / failed
+        self.fingerprint: Optional[str] = None
+        self.created_at: Optional[float] = None
+        self.size = 0
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def snapshot_id(self) -> str:
+        return f"{self.scope}.{self.compression}"
+
+    @property
+    def filename(self) -> str:
+        return os.path.basename(self.path)
+
+    @property
+    def etag(self) -> Optional[str]:
+        if not self.fingerprint:
+            return None
+        return '"' + hashlib.sha1(f"{self.fingerprint}:{self.compression}".encode()).hexdigest() + '"'
+
+    def load_meta(self) -> None:
+        """从旁路元数据文件恢复快照信息（服务重启后仍可复用已有快照）"""
+        try:
+            with open(self.path + '.json', 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if os.path.exists(self.path):
+                self.fingerprint = meta.get('fingerprint')
+                self.created_at = meta.get('created_at')
+                self.size = os.path.getsize(self.path)
+                self.state = 'ready'
+        except (OSError, ValueError):
+            pass
+
+    def save_meta(self) -> None:
+        with open(self.path + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': self.fingerprint, 'created_at': self.created_at}, f)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'snapshot_id': self.snapshot_id,
+            'scope': self.scope,
+            'compression': self.compression,
+            'state': self.state,
+            'filename': self.filename,
+            'size': self.size,
+            'etag': self.etag,
+            'created_at': self.created_at,
+            'error': self.error,
+        }
+
+
+class DatabaseSnapshotManager:
+    """历史记录数据库快照
+
+    使用 SQLite 在线备份 API 生成一致的数据库副本，导入过程中下载也不会拿到
+    写了一半的文件。除完整快照外，每个年份表可以单独生成快照；已结束年份的
+    数据基本不再变化，指纹未变时直接复用上次生成的文件，重复备份几乎没有开销。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'DatabaseSnapshotManager':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._snapshots: Dict[str, Snapshot] = {}
+
+    @staticmethod
+    def source_path() -> str:
+        return get_output_path(get_config()['db_file'])
+
+    @staticmethod
+    def snapshot_dir() -> str:
+        path = get_output_path('snapshots')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _connect_source(self) -> sqlite3.Connection:
+        source = self.source_path()
+        if not os.path.exists(source):
+            raise FileNotFoundError("数据库文件不存在")
+        return connect_history(source, read_only=True)
+
+    def list_years(self) -> List[int]:
+        conn = self._connect_source()
+        try:
+            return history_years(conn)
+        finally:
+            conn.close()
+
+    def get(self, scope: str, compression: str = 'none') -> Snapshot:
+        """获取快照对象，scope 为 full 或年份"""
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        if scope != 'full' and not scope.isdigit():
+            raise ValueError(f"无效的快照范围: {scope}")
+        key = f"{scope}.{compression}"
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            base = get_config()['db_file'].rsplit('.', 1)[0]
+            name = f"{base}.db" if scope == 'full' else f"{base}_{scope}.db"
+            path = os.path.join(self.snapshot_dir(), name + COMPRESSIONS[compression])
+            snapshot = Snapshot(scope, compression, path)
+            snapshot.load_meta()
+            self._snapshots[key] = snapshot
+        return snapshot
+
+    def list_snapshots(self) -> List[Dict[str, Any]]:
+        return [s.to_dict() for s in self._snapshots.values()]
+
+    # ---- 指纹 ----
+
+    def _fingerprint(self, conn: sqlite3.Connection, scope: str) -> str:
+        """计算数据指纹，指纹相同说明数据未变化，可以复用已有快照"""
+        if scope == 'full':
+            parts = []
+            source = self.source_path()
+            for path in [source, source + '-wal'] + list(sealed_years().values()):
+                if os.path.exists(path):
+                    st = os.stat(path)
+                    parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+            return '|'.join(parts)
+        table = f"bilibili_history_{scope}"
+        stats = sealed_stats(int(scope))
+        if stats and not conn.execute("SELECT 1 FROM main.sqlite_master WHERE name = ?", (table,)).fetchone():
+            return stats['fingerprint']
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if not columns:
+            raise FileNotFoundError(f"{scope} 年没有历史记录表")
+        # 新增、删除记录以及修改备注、观看进度都会改变这些聚合值
+        totals = ['view_at'] + [col for col in ('progress', 'remark_time', 'is_fav') if col in columns]
+        fingerprint = table_fingerprint(conn, table, totals)[0]
+        schema = conn.execute(
+            "SELECT group_concat(sql, ';') FROM sqlite_master WHERE tbl_name = ?", (table,)
+        ).fetchone()[0]
+        return f"{fingerprint}|{hashlib.sha1((schema or '').encode()).hexdigest()}"
+
+    # ---- 生成 ----
+
+    def _copy_full(self, src: sqlite3.Connection, target: str) -> None:
+        dst = sqlite3.connect(target)
+        try:
+            # 一次性复制全部页面，备份期间持有读事务，得到的是同一时刻的一致副本
+            src.backup(dst)
+            # backup 只复制主库，封存的年份逐个并入完整快照
+            for year, path in sealed_years().items():
+                table = f"bilibili_history_{year}"
+                if dst.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone():
+                    continue
+                dst.execute("ATTACH DATABASE ? AS sealed", (path,))
+                rows = dst.execute(
+                    "SELECT sql FROM sealed.sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+                    "ORDER BY CASE type WHEN 'table' THEN 0 ELSE 1 END", (table,)
+                ).fetchall()
+                dst.execute(rows[0][0])
+                columns = ', '.join(row[1] for row in dst.execute(f"PRAGMA main.table_info({table})"))
+                dst.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM sealed.{table}")
+                dst.commit()
+                dst.execute("DETACH DATABASE sealed")
+                for (sql,) in rows[1:]:
+                    dst.execute(sql)
+                dst.commit()
+        finally:
+            dst.close()
+
+    def _copy_year(self, src: sqlite3.Connection, scope: str, target: str) -> None:
+        table = f"bilibili_history_{scope}"
+        rows = src.execute(
+            "SELECT type, sql FROM sqlite_master WHERE tbl_name = ? AND sql IS NOT NULL "
+            "AND type IN ('table', 'index') ORDER BY CASE type WHEN 'table' THEN 0 ELSE 1 END",
+            (table,)
+        ).fetchall()
+        if not rows:
+            sealed = sealed_years().get(int(scope))
+            if sealed:
+                # 封存文件本身就是独立的单年数据库
+                shutil.copyfile(sealed, target)
+                os.chmod(target, stat.S_IWRITE | stat.S_IREAD)
+                return
+            if not src.execute("SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?", (table,)).fetchone():
+                raise FileNotFoundError(f"{scope} 年没有历史记录表")
+            # 紧凑存储的年份导出为普通表，快照文件可以单独使用
+            rows = [('table', CREATE_TABLE_DEFAULT.format(table=table))]
+            rows += [('index', sql.format(table=table)) for sql in CREATE_INDEXES]
+
+        dst = sqlite3.connect(target)
+        try:
+            dst.execute(rows[0][1])
+            dst.execute("ATTACH DATABASE ? AS src", (self.source_path(),))
+            # 单条语句在同一个读事务中完成，不会读到导入过程中的中间状态
+            # 生成列不能写入，按普通列复制
+            columns = ', '.join(row[1] for row in dst.execute(f"PRAGMA table_info({table})"))
+            dst.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM src.{table}")
+            dst.commit()
+            dst.execute("DETACH DATABASE src")
+            # 数据写入后再建索引，比逐行维护索引快
+            for _, sql in rows[1:]:
+                dst.execute(sql)
+            dst.commit()
+            dst.execute("VACUUM")
+        finally:
+            dst.close()
+
+    @staticmethod
+    def _compress(source: str, target: str, compression: str) -> None:
+        if compression == 'gzip':
+            with open(source, 'rb') as fin, gzip.open(target, 'wb', compresslevel=6) as fout:
+                shutil.copyfileobj(fin, fout, _COPY_CHUNK)
+        else:
+            import zstandard
+            with open(source, 'rb') as fin, open(target, 'wb') as fout:
+                zstandard.ZstdCompressor(level=6, threads=-1).copy_stream(fin, fout, read_size=_COPY_CHUNK)
+
+    def _build(self, snapshot: Snapshot, force: bool) -> None:
+        """生成快照文件（在线程中执行）"""
+        started = time.time()
+        src = self._connect_source()
+        try:
+            fingerprint = self._fingerprint(src, snapshot.scope)
+            if not force and snapshot.fingerprint == fingerprint and os.path.exists(snapshot.path):
+                logger.info(f"数据未变化，复用快照 {snapshot.filename}")
+                return
+
+            # 先写入临时文件，完成后原子替换，正在下载旧快照的请求不受影响
+            raw_tmp = snapshot.path + '.db.tmp'
+            for leftover in (raw_tmp, snapshot.path + '.tmp'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            if snapshot.scope == 'full':
+                self._copy_full(src, raw_tmp)
+            else:
+                self._copy_year(src, snapshot.scope, raw_tmp)
+        finally:
+            src.close()
+
+        try:
+            if snapshot.compression == 'none':
+                os.replace(raw_tmp, snapshot.path)
+            else:
+                self._compress(raw_tmp, snapshot.path + '.tmp', snapshot.compression)
+                os.replace(snapshot.path + '.tmp', snapshot.path)
+        finally:
+            if os.path.exists(raw_tmp):
+                os.remove(raw_tmp)
+
+        snapshot.fingerprint = fingerprint
+        snapshot.created_at = time.time()
+        snapshot.size = os.path.getsize(snapshot.path)
+        snapshot.save_meta()
+        logger.info(f"已生成数据库快照 {snapshot.filename} ({snapshot.size} 字节)，"
+                    f"耗时 {time.time() - started:.1f} 秒")
+
+    async def _run(self, snapshot: Snapshot, force: bool) -> None:
+        snapshot.state = 'running'
+        snapshot.error = None
+        try:
+            await asyncio.to_thread(self._build, snapshot, force)
+            snapshot.state = 'ready'
+        except Exception as e:
+            snapshot.state = 'failed'
+            snapshot.error = str(e)
+            logger.exception(f"生成数据库快照失败 {snapshot.snapshot_id}: {e}")
+
+    def start(self, scope: str, compression: str = 'none', force: bool = False) -> Snapshot:
+        """在后台生成快照，同一快照正在生成时不会重复启动"""
+        if compression == 'zstd' and not zstd_available():
+            raise ValueError("未安装 zstandard，无法使用 zstd 压缩")
+        snapshot = self.get(scope, compression)
+        if snapshot.task is None or snapshot.task.done():
+            snapshot.task = asyncio.get_running_loop().create_task(self._run(snapshot, force))
+        return snapshot
+
+    async def ensure(self, scope: str, compression: str = 'none') -> Snapshot:
+        """生成（或复用）快照并等待完成"""
+        snapshot = self.start(scope, compression)
+        await asyncio.shield(snapshot.task)
+        return snapshot
@@ -0,0 +1,380 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from loguru import logger
+
+from scripts.dynamic_db import (
+    get_connection,
+    add_watch_host,
+    remove_watch_host,
+    list_watch_hosts,
+    save_crawl_cursor,
+    save_normalized_dynamic_page,
+    existing_dynamic_ids,
+    get_item_id_str,
+    update_media_locals,
+    save_pending_media,
+    load_pending_media,
+    remove_pending_media,
+)
+from scripts.dynamic_media import download_item_media
+from scripts.metrics import WORKER_QUEUE_DEPTH
+from scripts.utils import get_config, setup_logger
+from scripts.wbi_sign import get_wbi_sign
+
+# 确保日志系统已初始化
+setup_logger()
+
+SPACE_API_URL = "https://api.bilibili.com/x/polymer/web-dynamic/v1/feed/space"
+SPACE_FEATURES = "itemOpusStyle,listOnlyfans,opusBigCover,onlyfansVote,forwardListHidden,decorationCard,commentsNewVersion,onlyfansAssetsV2,ugcDelete,onlyfansQaCard"
+
+
+class RateBudget:
+    """全局请求预算：所有UP共享的最小请求间隔（带随机抖动）"""
+
+    def __init__(self, min_interval: float, jitter: float):
+        self.min_interval = max(0.0, float(min_interval))
+        self.jitter = max(0.0, float(jitter))
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._next_slot = time.monotonic() + self.min_interval + random.uniform(0, self.jitter)
+
+
+class DynamicCrawler:
+    """多UP动态后台抓取服务
+
+    - 关注列表与游标保存在 bilibili_dynamic.db 的 dynamic_crawl_cursor 表
+    - 各UP按页轮转交错抓取，共享同一个请求预算
+    - 媒体下载放入独立队列，由若干 worker 异步完成，不阻塞翻页；
+      待下载的动态同时记录在 dynamic_media_pending 表，停止或重启后启动时重新入队
+    - 数据库读写在线程中执行，不阻塞事件循环
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'DynamicCrawler':
+        """获取 DynamicCrawler 的单例实例"""
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        if hasattr(self, '_initialized'):
+            return
+
+        self._load_settings()
+        self.is_running = False
+        self._loop_task: Optional[asyncio.Task] = None
+        self._media_workers: List[asyncio.Task] = []
+        self._media_queue: Optional[asyncio.Queue] = None
+        self._wake_event: Optional[asyncio.Event] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._budget: Optional[RateBudget] = None
+        # host_mid -> 下次允许抓取的时间（monotonic）
+        self._next_due: Dict[str, float] = {}
+        # host_mid -> 增量刷新中的下一页 offset（存在即表示该UP处于刷新中）
+        self._refresh_offsets: Dict[str, Optional[str]] = {}
+        self.stats = {
+            "pages": 0,
+            "items": 0,
+            "errors": 0,
+            "media_done": 0,
+            "media_failed": 0,
+            "started_at": None,
+            "last_host": None,
+        }
+        self._initialized = True
+
+    def _load_settings(self) -> None:
+        """读取 config.yaml 中的 dynamic_crawler 配置"""
+        try:
+            cfg = get_config().get('dynamic_crawler', {}) or {}
+        except Exception:
+            cfg = {}
+        self.enabled_on_startup = bool(cfg.get('enabled', False))
+        self.min_interval = float(cfg.get('min_request_interval', 3.0))
+        self.jitter = float(cfg.get('request_jitter', 2.0))
+        self.refresh_interval = int(cfg.get('refresh_interval', 1800))
+        self.media_workers = max(1, int(cfg.get('media_workers', 2)))
+        self.media_queue_size = max(1, int(cfg.get('media_queue_size', 500)))
+        self.save_media = bool(cfg.get('save_media', True))
+        self.error_backoff = int(cfg.get('error_backoff', 300))
+
+    # ------------------------------------------------------------------
+    # 关注列表管理
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _with_connection(func, *args, **kwargs):
+        conn = get_connection()
+        try:
+            return func(conn, *args, **kwargs)
+        finally:
+            conn.close()
+
+    async def _db(self, func, *args, **kwargs):
+        """在线程中打开连接执行 func(conn, ...)"""
+        return await asyncio.to_thread(self._with_connection, func, *args, **kwargs)
+
+    async def add_host(self, host_mid: int) -> None:
+        await self._db(add_watch_host, host_mid)
+        self._next_due[str(host_mid)] = 0.0
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    async def remove_host(self, host_mid: int) -> bool:
+        removed = await self._db(remove_watch_host, host_mid)
+        self._next_due.pop(str(host_mid), None)
+        self._refresh_offsets.pop(str(host_mid), None)
+        return removed
+
+    async def list_hosts(self) -> List[Dict[str, Any]]:
+        return await self._db(list_watch_hosts, only_enabled=False)
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+    async def start(self) -> bool:
+        """在当前事件循环中启动抓取循环与媒体下载 worker"""
+        if self.is_running:
+            return False
+
+        self._load_settings()
+        self._budget = RateBudget(self.min_interval, self.jitter)
+        self._media_queue = asyncio.Queue(maxsize=self.media_queue_size)
+        self._wake_event = asyncio.Event()
+        self._session = aiohttp.ClientSession()
+        self.is_running = True
+        self.stats["started_at"] = int(time.time())
+
+        # 上次停止时未下载完的媒体，先于本次抓取的新动态入队
+        pending = await self._db(load_pending_media) if self.save_media else []
+
+        self._loop_task = asyncio.create_task(self._crawl_loop())
+        self._media_workers = [
+            asyncio.create_task(self._media_worker(i + 1)) for i in range(self.media_workers)
+        ]
+        if pending:
+            self._media_workers.append(asyncio.create_task(self._requeue_pending(pending)))
+        logger.info(f"动态后台抓取服务已启动，媒体下载worker数: {self.media_workers}，待补齐媒体: {len(pending)}")
+        return True
+
+    async def _requeue_pending(self, pending: List[tuple]) -> None:
+        for entry in pending:
+            await self._media_queue.put(entry)
+
+    async def stop(self) -> bool:
+        """停止抓取循环；未下载完的媒体保留在 dynamic_media_pending 表，下次启动时重新入队"""
+        if not self.is_running:
+            return False
+
+        self.is_running = False
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+        tasks = [t for t in [self._loop_task, *self._media_workers] if t is not None]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+        self._media_workers = []
+
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        logger.info("动态后台抓取服务已停止")
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "is_running": self.is_running,
+            "media_queue_size": self._media_queue.qsize() if self._media_queue is not None else 0,
+            "settings": {
+                "min_request_interval": self.min_interval,
+                "request_jitter": self.jitter,
+                "refresh_interval": self.refresh_interval,
+                "media_workers": self.media_workers,
+                "save_media": self.save_media,
+            },
+            "stats": dict(self.stats),
+        }
+
+    # ------------------------------------------------------------------
+    # 抓取循环
+    # ------------------------------------------------------------------
+    def _pick_host(self, hosts: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """选出最早到期的UP；没有到期的UP时返回 None"""
+        now = time.monotonic()
+        due = [h for h in hosts if self._next_due.get(h["host_mid"], 0.0) <= now]
+        if not due:
+            return None
+        return min(due, key=lambda h: self._next_due.get(h["host_mid"], 0.0))
+
+    async def _crawl_loop(self) -> None:
+        while self.is_running:
+            try:
+                hosts = await self._db(list_watch_hosts)
+
+                host = self._pick_host(hosts)
+                if host is None:
+                    # 无到期UP：等待最近的到期时间或被新增UP唤醒
+                    now = time.monotonic()
+                    pending = [self._next_due.get(h["host_mid"], 0.0) - now for h in hosts]
+                    timeout = min(pending) if pending else 60.0
+                    self._wake_event.clear()
+                    try:
+                        await asyncio.wait_for(self._wake_event.wait(), timeout=max(1.0, timeout))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                await self._budget.acquire()
+                await self._crawl_one_page(host)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"动态后台抓取循环出错: {e}")
+                await asyncio.sleep(5)
+
+    async def _fetch_page(self, host_mid: str, offset: Optional[str]) -> Dict[str, Any]:
+        params = {
+            "host_mid": host_mid,
+            "need_top": 0,
+            "features": SPACE_FEATURES,
+            "timezone_offset": -480,
+            "platform": "web",
+            "web_location": "333.1387",
+        }
+        if offset:
+            params["offset"] = offset
+        signed_params = await asyncio.to_thread(get_wbi_sign, params)
+
+        from routers.dynamic import get_headers
+        async with self._session.get(
+            SPACE_API_URL,
+            headers=get_headers(),
+            params=signed_params,
+            timeout=aiohttp.ClientTimeout(total=30),
+        ) as response:
+            if response.status != 200:
+                raise RuntimeError(f"请求失败，状态码: {response.status}")
+            data = await response.json(content_type=None)
+        if not isinstance(data, dict) or data.get("code") != 0:
+            raise RuntimeError(f"接口返回错误: {data.get('code') if isinstance(data, dict) else data}")
+        return data
+
+    async def _crawl_one_page(self, host: Dict[str, Any]) -> None:
+        host_mid = host["host_mid"]
+        self.stats["last_host"] = host_mid
+
+        # 已完整抓取过的UP进入增量刷新：从头抓取，遇到已存在的动态即停止
+        refreshing = host_mid in self._refresh_offsets
+        if host["fully_fetched"] and not refreshing:
+            self._refresh_offsets[host_mid] = None
+            refreshing = True
+        offset = self._refresh_offsets.get(host_mid) if refreshing else (host["last_offset"] or None)
+
+        try:
+            data = await self._fetch_page(host_mid, offset)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.warning(f"动态后台抓取失败 host_mid={host_mid}: {e}")
+            await self._db(save_crawl_cursor, host_mid, host["last_offset"], host["fully_fetched"], error=str(e))
+            self._next_due[host_mid] = time.monotonic() + self.error_backoff
+            return
+
+        data_section = data.get("data", {}) or {}
+        items = data_section.get("items", []) or []
+        off = data_section.get("offset")
+        next_offset = off.get("offset") if isinstance(off, dict) else off
+        has_more = bool(data_section.get("has_more", bool(next_offset))) and bool(next_offset)
+
+        page_items = [(get_item_id_str(item), item) for item in items]
+        page_items = [(id_str, item) for id_str, item in page_items if id_str]
+
+        new_items, done = await self._db(self._save_page, host_mid, page_items, refreshing,
+                                          host["last_offset"], next_offset, has_more)
+
+        self.stats["pages"] += 1
+        self.stats["items"] += len(new_items)
+
+        if refreshing:
+            if done:
+                self._refresh_offsets.pop(host_mid, None)
+            else:
+                self._refresh_offsets[host_mid] = next_offset
+
+        # 整体完成后等待刷新间隔；否则尽快轮到该UP的下一页
+        self._next_due[host_mid] = time.monotonic() + (self.refresh_interval if done else 0.0)
+
+        if self.save_media:
+            for id_str, item in new_items:
+                await self._media_queue.put((host_mid, id_str, item))
+
+    def _save_page(self, conn, host_mid: str, page_items: List[tuple], refreshing: bool,
+                   last_offset: Optional[str], next_offset: Optional[str], has_more: bool) -> tuple:
+        """（在线程中执行）保存一页动态、游标和待下载媒体，返回（新动态, 是否已抓取完）"""
+        # 一次查询判断本页哪些动态已存在
+        known = existing_dynamic_ids(conn, host_mid, [id_str for id_str, _ in page_items]) if refreshing else set()
+        reached_known = bool(known)
+        new_items = [(id_str, item) for id_str, item in page_items if id_str not in known]
+
+        # 本页数据、游标和待下载媒体在同一事务中提交
+        try:
+            save_normalized_dynamic_page(conn, int(host_mid), [item for _, item in new_items], commit=False)
+            if self.save_media:
+                save_pending_media(conn, host_mid, new_items, commit=False)
+            if refreshing:
+                done = reached_known or not has_more
+                # 刷新过程不覆盖历史游标，只记录本轮刷新进度
+                save_crawl_cursor(conn, host_mid, last_offset, True, items=len(new_items), commit=False)
+            else:
+                done = not has_more
+                save_crawl_cursor(conn, host_mid, next_offset, done, items=len(new_items), commit=False)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        return new_items, done
+
+    # ------------------------------------------------------------------
+    # 媒体下载
+    # ------------------------------------------------------------------
+    async def _media_worker(self, worker_id: int) -> None:
+        while True:
+            host_mid, id_str, item = await self._media_queue.get()
+            try:
+                media_locals, live_media_locals = await download_item_media(host_mid, id_str, item)
+                if media_locals or live_media_locals:
+                    await self._db(update_media_locals, host_mid, id_str, media_locals, live_media_locals)
+                self.stats["media_done"] += 1
+            except asyncio.CancelledError:
+                # 停止服务：保留待下载记录，下次启动时重新入队
+                raise
+            except Exception as e:
+                self.stats["media_failed"] += 1
+                logger.warning(f"媒体下载worker-{worker_id} 处理失败 host_mid={host_mid} id_str={id_str}: {e}")
+            finally:
+                self._media_queue.task_done()
+            # 下载完成或失败（与原先一样不重试）后移除待下载记录
+            try:
+                await self._db(remove_pending_media, host_mid, id_str)
+            except Exception as e:
+                logger.warning(f"移除待下载媒体记录失败 host_mid={host_mid} id_str={id_str}: {e}")
+
+
+WORKER_QUEUE_DEPTH.set_function(('dynamic_media',), lambda: DynamicCrawler._instance._media_queue.qsize())
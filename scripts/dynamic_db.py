@@ -1,12 +1,14 @@
 import os
 import json
 import sqlite3
+import zlib
 from datetime import datetime
-from typing import Iterable, Optional, Tuple, Dict, Any, List
+from typing import Iterable, Optional, Tuple, Dict, Any, List, Set
 from loguru import logger
 
 from scripts.utils import get_database_path
 from scripts.dynamic_media import collect_image_urls
+from scripts.metrics import sqlite_factory
 
 
 def _get_db_path() -> str:
@@ -132,6 +134,44 @@ def _ensure_schema(conn: sqlite3.Connection) -> None:
         """
     )
 
+    # 可选的压缩原始JSON列（旧库自动补列）
+    existing_columns = {row[1] for row in cursor.execute("PRAGMA table_info(dynamic_core)").fetchall()}
+    if "raw_codec" not in existing_columns:
+        cursor.execute("ALTER TABLE dynamic_core ADD COLUMN raw_codec TEXT")
+    if "raw_json" not in existing_columns:
+        cursor.execute("ALTER TABLE dynamic_core ADD COLUMN raw_json BLOB")
+
+    # 后台抓取服务：关注的UP列表及其持久化游标
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS dynamic_crawl_cursor (
+            host_mid TEXT PRIMARY KEY,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            last_offset TEXT,
+            fully_fetched INTEGER NOT NULL DEFAULT 0,
+            last_fetch_time INTEGER,
+            last_error TEXT,
+            pages_fetched INTEGER NOT NULL DEFAULT 0,
+            items_fetched INTEGER NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL
+        )
+        """
+    )
+
+    # 后台抓取服务：已保存但媒体尚未下载的动态，停止服务或重启后从这里补齐
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS dynamic_media_pending (
+            host_mid TEXT NOT NULL,
+            id_str TEXT NOT NULL,
+            codec TEXT NOT NULL,
+            item BLOB NOT NULL,
+            created_at INTEGER NOT NULL,
+            PRIMARY KEY (host_mid, id_str)
+        )
+        """
+    )
+
     conn.commit()
 
 
@@ -139,7 +179,7 @@ def get_connection() -> sqlite3.Connection:
     """获取数据库连接（并自动创建表结构）"""
     db_path = _get_db_path()
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, factory=sqlite_factory())
     _ensure_schema(conn)
     return conn
 
@@ -162,6 +202,173 @@ def dynamic_core_exists(conn: sqlite3.Connection, host_mid: int, id_str: str) ->
     return cursor.fetchone() is not None
 
 
+def add_watch_host(conn: sqlite3.Connection, host_mid: int) -> None:
+    """将UP加入后台抓取关注列表（已存在则重新启用）"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        INSERT INTO dynamic_crawl_cursor (host_mid, enabled, created_at)
+        VALUES (?, 1, ?)
+        ON CONFLICT(host_mid) DO UPDATE SET enabled = 1
+        """,
+        (str(host_mid), int(datetime.now().timestamp())),
+    )
+    conn.commit()
+
+
+def remove_watch_host(conn: sqlite3.Connection, host_mid: int) -> bool:
+    """将UP移出关注列表（保留游标，便于之后重新关注时续抓）"""
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE dynamic_crawl_cursor SET enabled = 0 WHERE host_mid = ?",
+        (str(host_mid),),
+    )
+    conn.commit()
+    return cursor.rowcount > 0
+
+
+def list_watch_hosts(conn: sqlite3.Connection, only_enabled: bool = True) -> List[Dict[str, Any]]:
+    """列出关注列表及各UP的抓取游标"""
+    cursor = conn.cursor()
+    sql = (
+        """
+        SELECT host_mid, enabled, last_offset, fully_fetched, last_fetch_time, last_error,
+               pages_fetched, items_fetched, created_at
+        FROM dynamic_crawl_cursor
+        """
+    )
+    if only_enabled:
+        sql += " WHERE enabled = 1"
+    sql += " ORDER BY created_at ASC"
+    results: List[Dict[str, Any]] = []
+    for r in cursor.execute(sql).fetchall():
+        results.append(
+            {
+                "host_mid": str(r[0]),
+                "enabled": bool(r[1]),
+                "last_offset": r[2] or "",
+                "fully_fetched": bool(r[3]),
+                "last_fetch_time": int(r[4]) if r[4] is not None else None,
+                "last_error": r[5],
+                "pages_fetched": int(r[6] or 0),
+                "items_fetched": int(r[7] or 0),
+                "created_at": int(r[8]) if r[8] is not None else None,
+            }
+        )
+    return results
+
+
+def save_crawl_cursor(
+    conn: sqlite3.Connection,
+    host_mid: int,
+    last_offset: Optional[str],
+    fully_fetched: bool,
+    items: int = 0,
+    error: Optional[str] = None,
+    commit: bool = True,
+) -> None:
+    """更新某个UP的抓取游标
+
+    调用方可传入 commit=False，使游标与本页数据在同一事务中提交。
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE dynamic_crawl_cursor SET
+            last_offset = ?,
+            fully_fetched = ?,
+            last_fetch_time = ?,
+            last_error = ?,
+            pages_fetched = pages_fetched + ?,
+            items_fetched = items_fetched + ?
+        WHERE host_mid = ?
+        """,
+        (
+            last_offset or "",
+            1 if fully_fetched else 0,
+            int(datetime.now().timestamp()),
+            error,
+            0 if error else 1,
+            int(items),
+            str(host_mid),
+        ),
+    )
+    if commit:
+        conn.commit()
+
+
+def update_media_locals(
+    conn: sqlite3.Connection,
+    host_mid: int,
+    id_str: str,
+    media_locals: List[str],
+    live_media_locals: List[str],
+) -> None:
+    """回写某条动态已下载的本地媒体路径（仅在原值为空时写入）"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        UPDATE dynamic_core SET
+            media_locals = CASE
+                WHEN media_locals IS NULL OR media_locals = '' THEN ?
+                ELSE media_locals
+            END,
+            live_media_locals = CASE
+                WHEN live_media_locals IS NULL OR live_media_locals = '' THEN ?
+                ELSE live_media_locals
+            END,
+            live_media_count = ?
+        WHERE host_mid = ? AND id_str = ?
+        """,
+        (
+            ",".join(media_locals) if media_locals else "",
+            ",".join(live_media_locals) if live_media_locals else "",
+            len(live_media_locals),
+            str(host_mid),
+            str(id_str),
+        ),
+    )
+    conn.commit()
+
+
+def save_pending_media(
+    conn: sqlite3.Connection,
+    host_mid: Any,
+    items: List[Tuple[str, Dict[str, Any]]],
+    commit: bool = True,
+) -> None:
+    """记录等待下载媒体的动态（压缩保存原始JSON，下载时需要从中提取媒体地址）"""
+    now = int(datetime.now().timestamp())
+    rows = []
+    for id_str, item in items:
+        codec, blob = compress_raw_json(item, "zlib")
+        if blob is not None:
+            rows.append((str(host_mid), str(id_str), codec, blob, now))
+    conn.executemany(
+        "INSERT OR REPLACE INTO dynamic_media_pending (host_mid, id_str, codec, item, created_at) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    if commit:
+        conn.commit()
+
+
+def load_pending_media(conn: sqlite3.Connection) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """按记录顺序返回全部等待下载媒体的 (host_mid, id_str, item)"""
+    pending = []
+    for host_mid, id_str, codec, blob in conn.execute(
+        "SELECT host_mid, id_str, codec, item FROM dynamic_media_pending ORDER BY created_at, rowid"
+    ):
+        item = decompress_raw_json(codec, blob)
+        if item is not None:
+            pending.append((host_mid, id_str, item))
+    return pending
+
+
+def remove_pending_media(conn: sqlite3.Connection, host_mid: Any, id_str: str) -> None:
+    conn.execute("DELETE FROM dynamic_media_pending WHERE host_mid = ? AND id_str = ?", (str(host_mid), str(id_str)))
+    conn.commit()
+
+
 def _to_int(value: Any) -> Optional[int]:
     try:
         if value is None:
@@ -171,20 +378,139 @@ def _to_int(value: Any) -> Optional[int]:
         return None
 
 
-def save_normalized_dynamic_item(conn: sqlite3.Connection, host_mid: int, item: Dict[str, Any]) -> None:
-    """将动态条目按多表结构保存/更新
-
-    - 核心信息 dynamic_core
-    - 作者 dynamic_author
-    - 统计 dynamic_stat
-    - 正文 dynamic_desc
-    - 话题 dynamic_topic
-    - major 分类型：archive / draw / article / opus
+_UPSERT_CORE_SQL = """
+    INSERT INTO dynamic_core (host_mid, id_str, type, visible, publish_ts, comment_id_str, comment_type, rid_str,
+                              txt, author_name, bvid, title, cover, desc, article_title, article_covers,
+                              opus_title, opus_summary_text, media_locals, media_count, live_media_locals, live_media_count,
+                              fetch_time, raw_codec, raw_json)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(host_mid, id_str) DO UPDATE SET
+        type = excluded.type,
+        visible = excluded.visible,
+        publish_ts = excluded.publish_ts,
+        comment_id_str = excluded.comment_id_str,
+        comment_type = excluded.comment_type,
+        rid_str = excluded.rid_str,
+        txt = excluded.txt,
+        author_name = excluded.author_name,
+        bvid = excluded.bvid,
+        title = excluded.title,
+        cover = excluded.cover,
+        desc = excluded.desc,
+        article_title = excluded.article_title,
+        article_covers = excluded.article_covers,
+        opus_title = excluded.opus_title,
+        opus_summary_text = excluded.opus_summary_text,
+        media_locals = COALESCE(excluded.media_locals, dynamic_core.media_locals),
+        media_count = excluded.media_count,
+        live_media_locals = COALESCE(excluded.live_media_locals, dynamic_core.live_media_locals),
+        live_media_count = COALESCE(dynamic_core.live_media_count, excluded.live_media_count),
+        fetch_time = excluded.fetch_time,
+        raw_codec = COALESCE(excluded.raw_codec, dynamic_core.raw_codec),
+        raw_json = COALESCE(excluded.raw_json, dynamic_core.raw_json)
+"""
+
+_UPSERT_AUTHOR_SQL = """
+    INSERT INTO dynamic_author (host_mid, id_str, author_mid, author_name, face)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(host_mid, id_str) DO UPDATE SET
+        author_mid = excluded.author_mid,
+        author_name = excluded.author_name,
+        face = excluded.face
+"""
+
+_UPSERT_STAT_SQL = """
+    INSERT INTO dynamic_stat (host_mid, id_str, like_count, comment_count, repost_count, view_count)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(host_mid, id_str) DO UPDATE SET
+        like_count = excluded.like_count,
+        comment_count = excluded.comment_count,
+        repost_count = excluded.repost_count,
+        view_count = excluded.view_count
+"""
+
+_UPSERT_TOPIC_SQL = """
+    INSERT INTO dynamic_topic (host_mid, id_str, topic_name, jump_url)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(host_mid, id_str) DO UPDATE SET
+        topic_name = excluded.topic_name,
+        jump_url = excluded.jump_url
+"""
+
+_INSERT_OPUS_PIC_SQL = """
+    INSERT OR REPLACE INTO major_opus_pics (host_mid, id_str, idx, url) VALUES (?, ?, ?, ?)
+"""
+
+_INSERT_JUMP_URL_SQL = """
+    INSERT OR REPLACE INTO major_archive_jump_urls (host_mid, id_str, idx, url) VALUES (?, ?, ?, ?)
+"""
+
+
+def compress_raw_json(item: Dict[str, Any], codec: str) -> Tuple[Optional[str], Optional[bytes]]:
+    """按指定编码压缩原始动态JSON，返回 (实际使用的codec, 压缩数据)
+
+    codec 为 zstd 但未安装 zstandard 时自动回退为 zlib；为 none/空 时不保存。
     """
+    if not codec or codec == "none":
+        return None, None
+    raw = json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if codec == "zstd":
+        try:
+            import zstandard
+            return "zstd", zstandard.ZstdCompressor(level=6).compress(raw)
+        except ImportError:
+            codec = "zlib"
+    return "zlib", zlib.compress(raw, 6)
+
+
+def decompress_raw_json(codec: Optional[str], data: Optional[bytes]) -> Optional[Dict[str, Any]]:
+    """解压 compress_raw_json 保存的原始动态JSON"""
+    if not codec or data is None:
+        return None
+    if codec == "zstd":
+        import zstandard
+        raw = zstandard.ZstdDecompressor().decompress(data)
+    else:
+        raw = zlib.decompress(data)
+    return json.loads(raw.decode("utf-8"))
+
+
+def get_raw_json_codec() -> str:
+    """读取 config.yaml 中 dynamic_raw_json 配置（none / zlib / zstd）"""
+    try:
+        from scripts.utils import get_config
+        return str(get_config().get("dynamic_raw_json", "none") or "none").lower()
+    except Exception:
+        return "none"
+
+
+def get_item_id_str(item: Dict[str, Any]) -> Optional[str]:
+    """提取动态条目的 id_str"""
+    if not isinstance(item, dict):
+        return None
+    id_str = item.get("id_str") or item.get("basic", {}).get("id_str") or item.get("id")
+    return str(id_str) if id_str else None
+
+
+def existing_dynamic_ids(conn: sqlite3.Connection, host_mid: int, id_strs: Iterable[str]) -> Set[str]:
+    """一次查询返回给定ID中已存在于核心表的部分"""
+    ids = [str(i) for i in dict.fromkeys(id_strs) if i]
+    found: Set[str] = set()
     cursor = conn.cursor()
-    fetch_time = int(datetime.now().timestamp())
-    logger.debug(f"normalize.begin host_mid={host_mid}")
+    # 分批避免超过 SQLite 变量数量上限
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        rows = cursor.execute(
+            f"SELECT id_str FROM dynamic_core WHERE host_mid = ? AND id_str IN ({placeholders})",
+            (str(host_mid), *chunk),
+        ).fetchall()
+        found.update(str(r[0]) for r in rows)
+    return found
 
+
+def _normalize_item(host_mid: int, item: Dict[str, Any], fetch_time: int, raw_codec: str = "none") -> Optional[Dict[str, Any]]:
+    """将一条动态拆解为各规范化表的行数据"""
     basic = item.get("basic", {}) if isinstance(item, dict) else {}
     modules_raw = item.get("modules")
     # 兼容 modules 既可能为对象也可能为数组
@@ -208,15 +534,11 @@ def save_normalized_dynamic_item(conn: sqlite3.Connection, host_mid: int, item:
             elif mtype == "MODULE_TYPE_DYNAMIC" and not module_dynamic:
                 module_dynamic = mod.get("module_dynamic", {})
 
-    id_str = (
-        item.get("id_str")
-        or basic.get("id_str")
-        or str(item.get("id"))
-    )
+    id_str = get_item_id_str(item)
     if not id_str:
         logger.warning("normalize.skip: missing id_str")
-        return
-    logger.debug(f"normalize.id id_str={id_str}")
+        return None
+    host_mid_str = str(host_mid)
 
     # 核心信息
     publish_ts = _to_int(module_author.get("pub_ts"))
@@ -224,27 +546,7 @@ def save_normalized_dynamic_item(conn: sqlite3.Connection, host_mid: int, item:
     comment_type = _to_int(basic.get("comment_type"))
     rid_str = basic.get("rid_str")
     visible = item.get("visible")
-
-    # 作者名/头像URL
     author_name = module_author.get("name") or module_author.get("uname")
-    avatar = module_author.get("avatar")
-    if isinstance(avatar, dict):
-        fl = avatar.get("fallback_layers", {})
-        layers = fl.get("layers") if isinstance(fl, dict) else None
-        if isinstance(layers, list):
-            for layer in layers:
-                if not isinstance(layer, dict):
-                    continue
-                res = layer.get("resource", {})
-                if isinstance(res, dict):
-                    res_img = res.get("res_image", {})
-                    if isinstance(res_img, dict):
-                        img_src = res_img.get("image_src", {})
-                        if isinstance(img_src, dict):
-                            remote = img_src.get("remote", {})
-                            if isinstance(remote, dict) and remote.get("url"):
-                                author_face_url = remote.get("url")
-                                break
 
     # 文本
     txt = None
@@ -260,10 +562,6 @@ def save_normalized_dynamic_item(conn: sqlite3.Connection, host_mid: int, item:
                 if txt:
                     break
 
-    # 媒体信息不再从单独表中获取，直接设置为空
-    media_locals_joined = None
-    media_count = 0
-
     # 提取 archive、article 和 opus 信息到核心表
     archive_bvid = None
     archive_title = None
@@ -273,6 +571,8 @@ def save_normalized_dynamic_item(conn: sqlite3.Connection, host_mid: int, item:
     article_covers = None
     opus_title = None
     opus_summary_text = None
+    opus_pics: List[Tuple[str, str, int, str]] = []
+    jump_urls: List[Tuple[str, str, int, str]] = []
     major = module_dynamic.get("major") if isinstance(module_dynamic, dict) else None
     if isinstance(major, dict):
         if isinstance(major.get("archive"), dict):
@@ -281,12 +581,13 @@ def save_normalized_dynamic_item(conn: sqlite3.Connection, host_mid: int, item:
             archive_title = arc.get("title")
             archive_cover = arc.get("cover")
             archive_desc = arc.get("desc")
+            if arc.get("jump_url"):
+                jump_urls.append((host_mid_str, id_str, 0, arc.get("jump_url")))
         if isinstance(major.get("article"), dict):
             ar = major["article"]
             article_title = ar.get("title")
             covers = ar.get("covers") if isinstance(ar, dict) else None
             if isinstance(covers, list) and covers:
-                import json
                 article_covers = json.dumps(covers)
         if isinstance(major.get("opus"), dict):
             opus = major["opus"]
@@ -294,86 +595,56 @@ def save_normalized_dynamic_item(conn: sqlite3.Connection, host_mid: int, item:
             summary = opus.get("summary")
             if isinstance(summary, dict):
                 opus_summary_text = summary.get("text")
+            pics = opus.get("pics")
+            if isinstance(pics, list):
+                for idx, pic in enumerate(pics):
+                    if isinstance(pic, dict) and pic.get("url"):
+                        opus_pics.append((host_mid_str, id_str, idx, pic.get("url")))
 
-    logger.info(f"normalize.core.upsert begin host_mid={host_mid} id_str={id_str} media_count={media_count}")
-    cursor.execute(
-        """
-        INSERT INTO dynamic_core (host_mid, id_str, type, visible, publish_ts, comment_id_str, comment_type, rid_str,
-                                  txt, author_name, bvid, title, cover, desc, article_title, article_covers,
-                                  opus_title, opus_summary_text, media_locals, media_count, live_media_locals, live_media_count,
-                                  fetch_time)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ON CONFLICT(host_mid, id_str) DO UPDATE SET
-            type = excluded.type,
-            visible = excluded.visible,
-            publish_ts = excluded.publish_ts,
-            comment_id_str = excluded.comment_id_str,
-            comment_type = excluded.comment_type,
-            rid_str = excluded.rid_str,
-            txt = excluded.txt,
-            author_name = excluded.author_name,
-            bvid = excluded.bvid,
-            title = excluded.title,
-            cover = excluded.cover,
-            desc = excluded.desc,
-            article_title = excluded.article_title,
-            article_covers = excluded.article_covers,
-            opus_title = excluded.opus_title,
-            opus_summary_text = excluded.opus_summary_text,
-            media_locals = excluded.media_locals,
-            media_count = excluded.media_count,
-            live_media_locals = excluded.live_media_locals,
-            live_media_count = excluded.live_media_count,
-            fetch_time = excluded.fetch_time
-        """,
-        (
-            str(host_mid),
-            str(id_str),
-            item.get("type"),
-            1 if visible else 0 if visible is not None else None,
-            publish_ts,
-            comment_id_str,
-            comment_type,
-            rid_str,
-            txt,
-            author_name,
-            archive_bvid,
-            archive_title,
-            archive_cover,
-            archive_desc if isinstance(archive_desc, str) else None,
-            article_title,
-            article_covers,
-            opus_title,
-            opus_summary_text,
-            media_locals_joined,
-            media_count,
-            None,  # live_media_locals - 暂时设为None，稍后在路由中处理
-            0,     # live_media_count - 暂时设为0
-            fetch_time,
-        ),
+    # 话题
+    topic = None
+    topic_obj = module_dynamic.get("topic") if isinstance(module_dynamic, dict) else None
+    if isinstance(topic_obj, dict) and topic_obj.get("name"):
+        topic = (host_mid_str, id_str, topic_obj.get("name"), topic_obj.get("jump_url"))
+
+    codec, raw_blob = compress_raw_json(item, raw_codec)
+
+    core = (
+        host_mid_str,
+        id_str,
+        item.get("type"),
+        1 if visible else 0 if visible is not None else None,
+        publish_ts,
+        comment_id_str,
+        comment_type,
+        rid_str,
+        txt,
+        author_name,
+        archive_bvid,
+        archive_title,
+        archive_cover,
+        archive_desc if isinstance(archive_desc, str) else None,
+        article_title,
+        article_covers,
+        opus_title,
+        opus_summary_text,
+        None,  # media_locals - 由媒体下载完成后回写
+        0,     # media_count
+        None,  # live_media_locals - 由媒体下载完成后回写
+        0,     # live_media_count
+        fetch_time,
+        codec,
+        raw_blob,
     )
-    logger.info(f"normalize.core.saved host_mid={host_mid} id_str={id_str}")
 
     # 作者
     author_mid = module_author.get("mid") or module_author.get("id")
-    author_name = module_author.get("name") or module_author.get("uname")
-    face = module_author.get("face")
-    cursor.execute(
-        """
-        INSERT INTO dynamic_author (host_mid, id_str, author_mid, author_name, face)
-        VALUES (?, ?, ?, ?, ?)
-        ON CONFLICT(host_mid, id_str) DO UPDATE SET
-            author_mid = excluded.author_mid,
-            author_name = excluded.author_name,
-            face = excluded.face
-        """,
-        (
-            str(host_mid),
-            str(id_str),
-            str(author_mid) if author_mid is not None else None,
-            author_name,
-            face,
-        ),
+    author = (
+        host_mid_str,
+        id_str,
+        str(author_mid) if author_mid is not None else None,
+        author_name,
+        module_author.get("face"),
     )
 
     # 统计
@@ -389,28 +660,108 @@ def save_normalized_dynamic_item(conn: sqlite3.Connection, host_mid: int, item:
     view_count = _to_int(
         module_stat.get("view") if isinstance(module_stat.get("view"), (int, str)) else (module_stat.get("view", {}).get("count") if isinstance(module_stat.get("view"), dict) else None)
     )
-    cursor.execute(
-        """
-        INSERT INTO dynamic_stat (host_mid, id_str, like_count, comment_count, repost_count, view_count)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ON CONFLICT(host_mid, id_str) DO UPDATE SET
-            like_count = excluded.like_count,
-            comment_count = excluded.comment_count,
-            repost_count = excluded.repost_count,
-            view_count = excluded.view_count
-        """,
-        (
-            str(host_mid),
-            str(id_str),
-            like_count,
-            comment_count,
-            repost_count,
-            view_count,
-        ),
-    )
+    stat = (host_mid_str, id_str, like_count, comment_count, repost_count, view_count)
 
+    return {
+        "id_str": id_str,
+        "core": core,
+        "author": author,
+        "stat": stat,
+        "topic": topic,
+        "opus_pics": opus_pics,
+        "jump_urls": jump_urls,
+    }
 
+
+def save_normalized_dynamic_item(conn: sqlite3.Connection, host_mid: int, item: Dict[str, Any]) -> None:
+    """将动态条目按多表结构保存/更新
+
+    - 核心信息 dynamic_core
+    - 作者 dynamic_author
+    - 统计 dynamic_stat
+    - 话题 dynamic_topic
+    - major 图文图片 major_opus_pics / 视频跳转 major_archive_jump_urls
+    """
+    logger.debug(f"normalize.begin host_mid={host_mid}")
+    rows = _normalize_item(host_mid, item, int(datetime.now().timestamp()), get_raw_json_codec())
+    if rows is None:
+        return
+
+    cursor = conn.cursor()
+    cursor.execute(_UPSERT_CORE_SQL, rows["core"])
+    cursor.execute(_UPSERT_AUTHOR_SQL, rows["author"])
+    cursor.execute(_UPSERT_STAT_SQL, rows["stat"])
+    if rows["topic"]:
+        cursor.execute(_UPSERT_TOPIC_SQL, rows["topic"])
+    if rows["opus_pics"]:
+        cursor.executemany(_INSERT_OPUS_PIC_SQL, rows["opus_pics"])
+    if rows["jump_urls"]:
+        cursor.executemany(_INSERT_JUMP_URL_SQL, rows["jump_urls"])
     conn.commit()
+    logger.debug(f"normalize.core.saved host_mid={host_mid} id_str={rows['id_str']}")
+
+
+def save_normalized_dynamic_page(
+    conn: sqlite3.Connection,
+    host_mid: int,
+    items: List[Dict[str, Any]],
+    raw_codec: Optional[str] = None,
+    commit: bool = True,
+) -> List[str]:
+    """整页批量保存动态：各规范化表分别 executemany，整页一个事务
+
+    Args:
+        raw_codec: 原始JSON压缩方式（none / zlib / zstd），默认读取配置
+        commit: 为 False 时由调用方提交，便于与抓取游标放在同一事务
+
+    Returns:
+        本页成功规范化的 id_str 列表
+    """
+    if raw_codec is None:
+        raw_codec = get_raw_json_codec()
+    fetch_time = int(datetime.now().timestamp())
+
+    core_rows, author_rows, stat_rows, topic_rows, pic_rows, jump_rows = [], [], [], [], [], []
+    saved_ids: List[str] = []
+    for item in items:
+        try:
+            rows = _normalize_item(host_mid, item, fetch_time, raw_codec)
+        except Exception as e:
+            logger.warning(f"规范化动态失败（忽略） host_mid={host_mid}: {e}")
+            continue
+        if rows is None:
+            continue
+        saved_ids.append(rows["id_str"])
+        core_rows.append(rows["core"])
+        author_rows.append(rows["author"])
+        stat_rows.append(rows["stat"])
+        if rows["topic"]:
+            topic_rows.append(rows["topic"])
+        pic_rows.extend(rows["opus_pics"])
+        jump_rows.extend(rows["jump_urls"])
+
+    if not core_rows:
+        return saved_ids
+
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(_UPSERT_CORE_SQL, core_rows)
+        cursor.executemany(_UPSERT_AUTHOR_SQL, author_rows)
+        cursor.executemany(_UPSERT_STAT_SQL, stat_rows)
+        if topic_rows:
+            cursor.executemany(_UPSERT_TOPIC_SQL, topic_rows)
+        if pic_rows:
+            cursor.executemany(_INSERT_OPUS_PIC_SQL, pic_rows)
+        if jump_rows:
+            cursor.executemany(_INSERT_JUMP_URL_SQL, jump_rows)
+        if commit:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    logger.debug(f"normalize.page.saved host_mid={host_mid} count={len(saved_ids)}")
+    return saved_ids
 
 
 def list_hosts_with_stats(
@@ -569,6 +920,8 @@ def purge_host(conn: sqlite3.Connection, host_mid: int) -> Dict[str, int]:
     - dynamic_topic
     - major_opus_pics
     - major_archive_jump_urls
+    - dynamic_crawl_cursor
+    - dynamic_media_pending
 
     Returns:
         Dict[str, int]: 各表删除数量与总数统计，如 {"dynamic_core": 10, ..., "total": 42}
@@ -583,6 +936,8 @@ def purge_host(conn: sqlite3.Connection, host_mid: int) -> Dict[str, int]:
         "dynamic_stat",
         "dynamic_author",
         "dynamic_core",
+        "dynamic_crawl_cursor",
+        "dynamic_media_pending",
     ]
 
     stats: Dict[str, int] = {}
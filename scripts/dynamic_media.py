@@ -7,6 +7,8 @@ from urllib.parse import urlparse
 import aiohttp
 import aiofiles
 
+from scripts.utils import get_output_path
+
 
 def _looks_like_image_url(url: str) -> bool:
     if not isinstance(url, str):
@@ -337,3 +339,35 @@ async def download_emojis(emoji_pairs: List[Tuple[str, str]], save_dir: str, con
         return results
 
 
+async def download_item_media(host_mid: Any, id_str: str, item: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+    """下载单条动态的图片/实况/表情，返回 (media_locals, live_media_locals) 相对路径列表"""
+    base_output_dir = os.path.dirname(get_output_path("__base__"))
+    item_dir = os.path.dirname(get_output_path("dynamic", str(host_mid), str(id_str), "media"))
+    media_locals: List[str] = []
+    live_media_locals: List[str] = []
+
+    image_urls = collect_image_urls(item)
+    if image_urls:
+        os.makedirs(item_dir, exist_ok=True)
+        for u in image_urls:
+            media_locals.append(os.path.relpath(predict_image_path(u, item_dir), base_output_dir))
+        await download_images(image_urls, item_dir)
+
+    live_media_pairs = collect_live_media_urls(item)
+    if live_media_pairs:
+        os.makedirs(item_dir, exist_ok=True)
+        for _, _, image_path, video_path, ok in await download_live_media(live_media_pairs, item_dir):
+            if ok:
+                live_media_locals.extend([
+                    os.path.relpath(image_path, base_output_dir),
+                    os.path.relpath(video_path, base_output_dir),
+                ])
+
+    emoji_pairs = collect_emoji_urls(item)
+    if emoji_pairs:
+        os.makedirs(item_dir, exist_ok=True)
+        for _, emoji_path, ok in await download_emojis(emoji_pairs, item_dir):
+            if ok:
+                media_locals.append(os.path.relpath(emoji_path, base_output_dir))
+
+    return media_locals, live_media_locals
@@ -1,13 +1,18 @@
+import csv
+import io
 import json
 import logging
 import os
+import re
 import sqlite3
 import traceback
 from datetime import datetime
+from typing import Iterator, List, Optional, Sequence, Tuple
 
-import pandas as pd
+from openpyxl import Workbook
 from openpyxl.utils import get_column_letter
 
+from scripts.history_partitions import connect_history, history_table_names
 from scripts.utils import load_config, get_output_path
 
 config = load_config()
@@ -24,7 +29,7 @@ def create_connection(db_file):
 
     conn = None
     try:
-        conn = sqlite3.connect(db_file)
+        conn = connect_history(db_file)
         logger.info(f"成功连接到SQLite数据库: {db_file}")
     except sqlite3.Error as e:
         logger.error(f"连接SQLite数据库时出错: {e}")
@@ -45,19 +50,199 @@ def safe_json_loads(value):
         logger.error(f"处理JSON时发生未知错误: {e}, 值为: {value}")
         return []
 
-def export_bilibili_history(year=None, month=None, start_date=None, end_date=None):
-    """导出B站历史记录到Excel文件
+# 每次从数据库读取的行数，导出过程中内存占用与此成正比而不是与总行数成正比
+CHUNK_SIZE = 5000
+# 按前多少行估算 Excel 列宽（流式写入时必须在写数据前确定列宽）
+WIDTH_SAMPLE_ROWS = 1000
+MAX_COLUMN_WIDTH = 60
 
-    Args:
-        year: 要导出的年份，如果不指定则使用当前年份
-        month: 要导出的月份（1-12），如果指定则只导出该月数据
-        start_date: 开始日期，格式为'YYYY-MM-DD'，如果指定则从该日期开始导出
-        end_date: 结束日期，格式为'YYYY-MM-DD'，如果指定则导出到该日期为止
+EXPORT_FORMATS = {
+    'xlsx': ('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('.csv', 'text/csv; charset=utf-8'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def _local_ts(year, month=1, day=1):
+    return int(datetime(year, month, day).timestamp())
+
+
+def _year_range(year, month=None, start_date=None, end_date=None) -> Optional[Tuple[int, int]]:
+    """计算某个年份表需要导出的时间戳范围 [start, end)，范围为空时返回 None
+
+    使用本地时间的时间戳范围代替 date(view_at, 'unixepoch', 'localtime') 比较，
+    这样查询可以直接使用 view_at 索引。
     """
-    full_db_file = get_output_path(config['db_file'])
+    start = _local_ts(year)
+    end = _local_ts(year + 1)
+    if month is not None:
+        start = max(start, _local_ts(year, month))
+        end = min(end, _local_ts(year + 1, 1) if month == 12 else _local_ts(year, month + 1))
+    if start_date:
+        start = max(start, int(datetime.strptime(start_date, '%Y-%m-%d').timestamp()))
+    if end_date:
+        end_day = datetime.strptime(end_date, '%Y-%m-%d')
+        end = min(end, int(end_day.timestamp()) + 86400)
+    return (start, end) if start < end else None
+
+
+def _clean_columns(columns: Sequence[str]) -> List[str]:
+    """清理列名，移除非法字符并确保列名有效"""
+    cleaned = [re.sub(r'[^\w\s]', '', col).strip() for col in columns]
+    return [f"Column_{i}" if not col or not col[0].isalpha() else col for i, col in enumerate(cleaned)]
+
+
+def _tables_to_query(conn, year=None, start_date=None, end_date=None) -> List[Tuple[int, str]]:
     target_year = year if year is not None else get_current_year()
+    years_to_query = [target_year]
+
+    # 如果指定了日期范围，可能需要查询多个年份的表
+    if start_date or end_date:
+        start_year = int(start_date.split('-')[0]) if start_date else target_year
+        end_year = int(end_date.split('-')[0]) if end_date else target_year
+
+        # 确保年份范围有效
+        start_year = max(2000, min(start_year, datetime.now().year))
+        end_year = max(2000, min(end_year, datetime.now().year))
+
+        years_to_query = list(range(start_year, end_year + 1))
+        logger.info(f"将查询以下年份的表: {years_to_query}")
+
+    existing_tables = set(history_table_names(conn))
+    return [(y, f"bilibili_history_{y}") for y in years_to_query if f"bilibili_history_{y}" in existing_tables]
+
 
-    # 构建文件名
+def iter_history_chunks(conn, year=None, month=None, start_date=None, end_date=None,
+                        chunk_size=CHUNK_SIZE) -> Tuple[Optional[List[str]], List[str], Iterator[List[list]]]:
+    """按块读取要导出的历史记录
+
+    Returns:
+        (列名, 列的声明类型, 数据块迭代器)；没有符合条件的表时列名为 None
+    """
+    tables = _tables_to_query(conn, year, start_date, end_date)
+    if not tables:
+        return None, [], iter(())
+    logger.info(f"将查询以下表: {[table for _, table in tables]}")
+
+    table_info = conn.execute(f"PRAGMA table_info({tables[0][1]})").fetchall()
+    columns = [row[1] for row in table_info]
+    types = [(row[2] or '').upper() for row in table_info]
+    covers_idx = columns.index('covers') if 'covers' in columns else None
+    column_list = ', '.join(columns)
+
+    def chunks():
+        for table_year, table in tables:
+            time_range = _year_range(table_year, month, start_date, end_date)
+            if time_range is None:
+                continue
+            query = f"SELECT {column_list} FROM {table} WHERE view_at >= ? AND view_at < ?"
+            logger.info(f"执行SQL查询: {query}, 参数: {time_range}")
+            cursor = conn.execute(query, time_range)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                rows = [list(row) for row in rows]
+                if covers_idx is not None:
+                    # covers 是 JSON 数组，表格中无法直接写入列表，展开为逗号分隔的地址
+                    for row in rows:
+                        row[covers_idx] = ','.join(map(str, safe_json_loads(row[covers_idx])))
+                yield rows
+
+    return _clean_columns(columns), types, chunks()
+
+
+def _peek_chunks(chunks: Iterator[List[list]]) -> Tuple[List[list], Iterator[List[list]]]:
+    """取出第一个数据块用于判断是否为空和估算列宽，并返回完整的迭代器"""
+    first = next(chunks, [])
+
+    def rest():
+        if first:
+            yield first
+        yield from chunks
+
+    return first, rest()
+
+
+def write_xlsx(path: str, columns: List[str], chunks: Iterator[List[list]], sample: List[list]) -> int:
+    """以 openpyxl 只写模式逐块写入 Excel，内存占用不随行数增长"""
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('BilibiliHistory')
+
+    # 调整列宽（按样本行估算）
+    for idx, col in enumerate(columns):
+        sample_len = max((len(str(row[idx])) for row in sample[:WIDTH_SAMPLE_ROWS] if row[idx] is not None), default=0)
+        width = min(max(sample_len, len(col)) + 1, MAX_COLUMN_WIDTH)
+        worksheet.column_dimensions[get_column_letter(idx + 1)].width = width
+
+    worksheet.append(columns)
+    total = 0
+    for rows in chunks:
+        for row in rows:
+            worksheet.append(row)
+        total += len(rows)
+    workbook.save(path)
+    return total
+
+
+def iter_csv(columns: List[str], chunks: Iterator[List[list]]) -> Iterator[bytes]:
+    """逐块生成 CSV 内容（带 BOM，Excel 可直接打开）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def write_csv(path: str, columns: List[str], chunks: Iterator[List[list]]) -> int:
+    total = 0
+
+    def counted():
+        nonlocal total
+        for rows in chunks:
+            total += len(rows)
+            yield rows
+
+    with open(path, 'wb') as f:
+        for data in iter_csv(columns, counted()):
+            f.write(data)
+    return total
+
+
+def write_parquet(path: str, columns: List[str], types: List[str], chunks: Iterator[List[list]]) -> int:
+    """每个数据块写成一个 row group（需要安装 pyarrow）"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("导出 Parquet 需要安装 pyarrow")
+
+    # 按数据库声明的类型确定 schema，避免第一个数据块中全为空的列被推断为 null 类型
+    def arrow_type(declared):
+        if 'INT' in declared:
+            return pa.int64()
+        if 'REAL' in declared or 'FLOA' in declared or 'DOUB' in declared:
+            return pa.float64()
+        return pa.string()
+
+    schema = pa.schema([(col, arrow_type(declared)) for col, declared in zip(columns, types)])
+    total = 0
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for rows in chunks:
+            arrays = [pa.array([row[i] for row in rows], type=field.type) for i, field in enumerate(schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            total += len(rows)
+    return total
+
+
+def build_export_filename(year=None, month=None, start_date=None, end_date=None, fmt='xlsx') -> str:
+    target_year = year if year is not None else get_current_year()
     filename_parts = ['bilibili_history']
     if year is not None:
         filename_parts.append(str(target_year))
@@ -69,118 +254,53 @@ def export_bilibili_history(year=None, month=None, start_date=None, end_date=Non
         filename_parts.append(f"从{start_date}开始")
     elif end_date:
         filename_parts.append(f"至{end_date}")
+    return f'{"_".join(filename_parts)}{EXPORT_FORMATS[fmt][0]}'
 
-    excel_file = get_output_path(f'{"_".join(filename_parts)}.xlsx')
 
-    conn = create_connection(full_db_file)
-    if conn is None:
-        return {"status": "error", "message": f"无法连接到数据库 {full_db_file}。数据库文件可能不存在。"}
-
-    try:
-        # 如果指定了日期范围，需要确定要查询的年份表
-        years_to_query = [target_year]
-
-        # 如果指定了日期范围，可能需要查询多个年份的表
-        if start_date or end_date:
-            # 获取开始和结束年份
-            start_year = int(start_date.split('-')[0]) if start_date else target_year
-            end_year = int(end_date.split('-')[0]) if end_date else target_year
+def export_bilibili_history(year=None, month=None, start_date=None, end_date=None, fmt='xlsx'):
+    """导出B站历史记录到 Excel / CSV / Parquet 文件
 
-            # 确保年份范围有效
-            start_year = max(2000, min(start_year, datetime.now().year))
-            end_year = max(2000, min(end_year, datetime.now().year))
+    数据按块从数据库读取并直接写入文件，不会把整年的数据加载到内存中。
 
-            # 生成要查询的年份列表
-            years_to_query = list(range(start_year, end_year + 1))
-            logger.info(f"将查询以下年份的表: {years_to_query}")
+    Args:
+        year: 要导出的年份，如果不指定则使用当前年份
+        month: 要导出的月份（1-12），如果指定则只导出该月数据
+        start_date: 开始日期，格式为'YYYY-MM-DD'，如果指定则从该日期开始导出
+        end_date: 结束日期，格式为'YYYY-MM-DD'，如果指定则导出到该日期为止
+        fmt: 导出格式，xlsx / csv / parquet
+    """
+    if fmt not in EXPORT_FORMATS:
+        return {"status": "error", "message": f"不支持的导出格式: {fmt}"}
 
-        # 获取所有存在的表
-        cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'bilibili_history_%'")
-        existing_tables = [row[0] for row in cursor.fetchall()]
-        logger.info(f"存在的表: {existing_tables}")
+    full_db_file = get_output_path(config['db_file'])
+    export_file = get_output_path(build_export_filename(year, month, start_date, end_date, fmt))
 
-        # 过滤出实际存在的表
-        tables_to_query = [f"bilibili_history_{year}" for year in years_to_query if f"bilibili_history_{year}" in existing_tables]
+    conn = create_connection(full_db_file)
+    if conn is None:
+        return {"status": "error", "message": f"无法连接到数据库 {full_db_file}。数据库文件可能不存在。"}
 
-        if not tables_to_query:
+    tmp_file = export_file + '.tmp'
+    try:
+        columns, types, chunks = iter_history_chunks(conn, year, month, start_date, end_date)
+        if columns is None:
             return {"status": "error", "message": f"没有找到符合条件的数据表。"}
 
-        logger.info(f"将查询以下表: {tables_to_query}")
-
-        # 准备查询条件
-        conditions = []
-        params = []
-
-        # 如果指定了月份，添加月份筛选条件
-        if month is not None:
-            conditions.append("strftime('%m', datetime(view_at, 'unixepoch', 'localtime')) = ?")
-            params.append(f"{month:02d}")
-
-        # 如果指定了开始日期，添加开始日期筛选条件
-        if start_date:
-            conditions.append("date(view_at, 'unixepoch', 'localtime') >= ?")
-            params.append(start_date)
-
-        # 如果指定了结束日期，添加结束日期筛选条件
-        if end_date:
-            conditions.append("date(view_at, 'unixepoch', 'localtime') <= ?")
-            params.append(end_date)
-
-        # 准备查询条件字符串
-        condition_str = ""
-        if conditions:
-            condition_str = " WHERE " + " AND ".join(conditions)
-
-        # 从所有表中查询数据
-        all_data = []
-        for table in tables_to_query:
-            query = f"SELECT * FROM {table}{condition_str}"
-
-            # 打印调试信息
-            logger.info(f"执行SQL查询: {query}")
-            logger.info(f"参数: {params}")
-
-            # 使用params参数执行查询
-            table_df = pd.read_sql_query(query, conn, params=params)
-            if not table_df.empty:
-                all_data.append(table_df)
-                logger.info(f"从表 {table} 中获取了 {len(table_df)} 条数据")
-
-        # 合并所有表的数据
-        if all_data:
-            df = pd.concat(all_data, ignore_index=True)
-            logger.info(f"合并后共有 {len(df)} 条数据")
-        else:
-            df = pd.DataFrame()
-
-        if df.empty:
+        first, chunks = _peek_chunks(chunks)
+        if not first:
             return {"status": "error", "message": f"没有找到符合条件的数据。"}
 
-        # 将 JSON 字符串转换为列表，处理 null 值
-        if 'covers' in df.columns:
-            df['covers'] = df['covers'].apply(safe_json_loads)
-
-        # 清理列名，移除非法字符并确保列名有效
-        df.columns = df.columns.str.replace(r'[^\w\s]', '', regex=True).str.strip()
-        df.columns = [f"Column_{i}" if not col or not col[0].isalpha() else col for i, col in enumerate(df.columns)]
-
-        # 导出到Excel
-        with pd.ExcelWriter(excel_file, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='BilibiliHistory')
-
-            # 调整列宽
-            worksheet = writer.sheets['BilibiliHistory']
-            for idx, col in enumerate(df.columns):
-                series = df[col]
-                max_len = max((
-                    series.astype(str).map(len).max(),  # 最长的值
-                    len(str(col))  # 列名长度
-                )) + 1  # 为了美观增加一个字符的宽度
-                worksheet.column_dimensions[get_column_letter(idx + 1)].width = max_len
+        # 先写临时文件，避免下载到未写完的文件
+        if fmt == 'xlsx':
+            total = write_xlsx(tmp_file, columns, chunks, first)
+        elif fmt == 'csv':
+            total = write_csv(tmp_file, columns, chunks)
+        else:
+            total = write_parquet(tmp_file, columns, types, chunks)
+        os.replace(tmp_file, export_file)
 
-        logger.info(f"数据已成功导出到 {excel_file}")
-        return {"status": "success", "message": f"数据已成功导出到 {excel_file}"}
+        logger.info(f"共导出 {total} 条数据")
+        logger.info(f"数据已成功导出到 {export_file}")
+        return {"status": "success", "message": f"数据已成功导出到 {export_file}", "rows": total}
 
     except Exception as e:
         logger.error(f"导出数据时发生错误: {e}")
@@ -188,8 +308,23 @@ def export_bilibili_history(year=None, month=None, start_date=None, end_date=Non
         return {"status": "error", "message": f"导出数据时发生错误: {e}"}
 
     finally:
-        if conn:
-            conn.close()
+        conn.close()
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+def stream_history_csv(year=None, month=None, start_date=None, end_date=None) -> Iterator[bytes]:
+    """边查询边生成 CSV 内容，用于流式下载"""
+    full_db_file = get_output_path(config['db_file'])
+    # 流式响应会在线程池的不同线程中迭代，连接需要允许跨线程使用
+    conn = connect_history(full_db_file, read_only=True, check_same_thread=False)
+    try:
+        columns, _, chunks = iter_history_chunks(conn, year, month, start_date, end_date)
+        if columns is None:
+            return
+        yield from iter_csv(columns, chunks)
+    finally:
+        conn.close()
+
 
 # 如果该脚本直接运行，则调用导出函数
 if __name__ == '__main__':
@@ -0,0 +1,334 @@
+import asyncio
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+from loguru import logger
+
+from scripts.utils import get_config, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+FOLDER_LIST_URL = "https://api.bilibili.com/x/v3/fav/folder/created/list-all"
+RESOURCE_LIST_URL = "https://api.bilibili.com/x/v3/fav/resource/list"
+NAV_URL = "https://api.bilibili.com/x/web-interface/nav"
+PAGE_SIZE = 40
+
+
+def save_creator_row(cursor, upper: Dict[str, Any], timestamp: int) -> None:
+    """保存收藏夹创建者/UP主信息"""
+    if not upper or 'mid' not in upper:
+        return
+    cursor.execute("""
+    INSERT OR REPLACE INTO favorites_creator
+    (mid, name, face, followed, vip_type, vip_status, fetch_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (
+        upper.get('mid'),
+        upper.get('name', ''),
+        upper.get('face', ''),
+        1 if upper.get('followed') else 0,
+        upper.get('vip_type', 0),
+        upper.get('vip_statue', 0),  # API返回的字段名可能有误
+        timestamp
+    ))
+
+
+def save_folder_row(cursor, folder: Dict[str, Any], timestamp: int) -> None:
+    """保存单个收藏夹元数据"""
+    save_creator_row(cursor, folder.get('upper', {}), timestamp)
+    cursor.execute("""
+    INSERT OR REPLACE INTO favorites_folder
+    (media_id, fid, mid, title, cover, attr, intro, ctime, mtime, state, media_count, fav_state, like_state, fetch_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        folder.get('id'),
+        folder.get('fid'),
+        folder.get('mid'),
+        folder.get('title', ''),
+        folder.get('cover', ''),
+        folder.get('attr'),
+        folder.get('intro', ''),
+        folder.get('ctime'),
+        folder.get('mtime'),
+        folder.get('state'),
+        folder.get('media_count', 0),
+        folder.get('fav_state', 0),
+        folder.get('like_state', 0),
+        timestamp
+    ))
+
+
+def save_content_rows(cursor, media_id: int, medias: Iterable[Dict[str, Any]], timestamp: int) -> int:
+    """批量保存收藏夹内容及其UP主信息，返回写入条数"""
+    creator_rows = {}
+    content_rows = []
+    for resource in medias:
+        upper = resource.get('upper', {}) or {}
+        if 'mid' in upper:
+            creator_rows[upper.get('mid')] = (
+                upper.get('mid'), upper.get('name', ''), upper.get('face', ''), 0, 0, 0, timestamp
+            )
+        cnt_info = resource.get('cnt_info', {}) or {}
+        content_rows.append((
+            media_id,
+            resource.get('id'),
+            resource.get('type'),
+            resource.get('title', ''),
+            resource.get('cover', ''),
+            resource.get('bvid', ''),
+            resource.get('intro', ''),
+            resource.get('page', 0),
+            resource.get('duration', 0),
+            upper.get('mid') if upper else 0,
+            resource.get('attr', 0),
+            resource.get('ctime', 0),
+            resource.get('pubtime', 0),
+            resource.get('fav_time', 0),
+            resource.get('link', ''),
+            timestamp,
+            upper.get('name', '') if upper else '',
+            upper.get('face', '') if upper else '',
+            resource.get('bv_id', ''),
+            cnt_info.get('collect', 0),
+            cnt_info.get('play', 0),
+            cnt_info.get('danmaku', 0),
+            cnt_info.get('vt', 0),
+            cnt_info.get('play_switch', 0),
+            cnt_info.get('reply', 0),
+            cnt_info.get('view_text_1', ''),
+            resource.get('ugc', {}).get('first_cid', 0) if resource.get('ugc') else 0,
+            resource.get('media_list_link', '')
+        ))
+
+    if creator_rows:
+        cursor.executemany("""
+        INSERT OR REPLACE INTO favorites_creator
+        (mid, name, face, followed, vip_type, vip_status, fetch_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, list(creator_rows.values()))
+    if content_rows:
+        cursor.executemany("""
+        INSERT OR REPLACE INTO favorites_content
+        (media_id, content_id, type, title, cover, bvid, intro, page, duration, upper_mid, attr, ctime, pubtime, fav_time, link, fetch_time,
+        creator_name, creator_face, bv_id, collect, play, danmaku, vt, play_switch, reply, view_text_1, first_cid, media_list_link)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, content_rows)
+    return len(content_rows)
+
+
+def lookup_favorite_folders(conn, oids: List[int], content_type: int = 2) -> Dict[int, List[Dict[str, Any]]]:
+    """一次 IN 查询获取多个视频所在的本地收藏夹，返回 {oid: [{media_id, title}]}"""
+    result: Dict[int, List[Dict[str, Any]]] = {}
+    unique_oids = list(dict.fromkeys(int(o) for o in oids))
+    cursor = conn.cursor()
+    # 分批避免超过 SQLite 变量数量上限
+    for start in range(0, len(unique_oids), 500):
+        chunk = unique_oids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f"""
+        SELECT fc.content_id, fc.media_id, ff.title
+        FROM favorites_content fc
+        JOIN favorites_folder ff ON fc.media_id = ff.media_id
+        WHERE fc.type = ? AND fc.content_id IN ({placeholders})
+        """, (content_type, *chunk))
+        for content_id, media_id, title in cursor.fetchall():
+            result.setdefault(content_id, []).append({"media_id": media_id, "title": title})
+    return result
+
+
+class FavoritesSync:
+    """收藏夹本地镜像同步服务
+
+    - 拉取当前用户创建的全部收藏夹
+    - 每个收藏夹按收藏时间倒序翻页，遇到本地已有的最新 fav_time 即停止
+    - 本地条数多于远端 media_count 时（远端有取消收藏）对该收藏夹做全量重建
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'FavoritesSync':
+        """获取 FavoritesSync 的单例实例"""
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        if hasattr(self, '_initialized'):
+            return
+        self._sync_lock = asyncio.Lock()
+        self._periodic_task: Optional[asyncio.Task] = None
+        self.is_syncing = False
+        self.last_result: Optional[Dict[str, Any]] = None
+        self.last_sync_time: Optional[int] = None
+        self._initialized = True
+
+    @staticmethod
+    def _settings() -> Dict[str, Any]:
+        try:
+            return get_config().get('favorites_sync', {}) or {}
+        except Exception:
+            return {}
+
+    async def _get_json(self, client: httpx.AsyncClient, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        from routers.favorite import get_headers
+        response = await client.get(url, params=params, headers=get_headers())
+        data = response.json()
+        if data.get('code') != 0:
+            raise RuntimeError(f"{data.get('message', '未知错误')} (code={data.get('code')})")
+        return data.get('data') or {}
+
+    async def _resolve_mid(self, client: httpx.AsyncClient) -> int:
+        """优先使用配置中的 DedeUserID，避免每次同步都请求 nav 接口"""
+        mid = get_config().get('DedeUserID')
+        if mid:
+            return int(mid)
+        data = await self._get_json(client, NAV_URL, {})
+        if not data.get('isLogin'):
+            raise RuntimeError("未登录，无法同步收藏夹")
+        return int(data.get('mid'))
+
+    async def sync_all(self, full: bool = False) -> Dict[str, Any]:
+        """同步当前用户的全部收藏夹；full=True 时忽略增量断点重新拉取"""
+        if self._sync_lock.locked():
+            return {"status": "running", "message": "收藏夹同步正在进行中"}
+
+        from routers.favorite import get_db_connection
+
+        async with self._sync_lock:
+            self.is_syncing = True
+            started = time.time()
+            page_interval = float(self._settings().get('page_interval', 0.5))
+            summary = {"folders": 0, "new_items": 0, "rebuilt_folders": 0, "removed_folders": 0}
+            try:
+                async with httpx.AsyncClient(timeout=20) as client:
+                    mid = await self._resolve_mid(client)
+                    folders_data = await self._get_json(client, FOLDER_LIST_URL, {"up_mid": mid, "type": 0})
+                    folders = folders_data.get('list', []) or []
+
+                    conn = get_db_connection()
+                    try:
+                        cursor = conn.cursor()
+                        timestamp = int(time.time())
+                        for folder in folders:
+                            save_folder_row(cursor, folder, timestamp)
+
+                        # 清理远端已删除的收藏夹
+                        remote_ids = [f.get('id') for f in folders]
+                        placeholders = ",".join("?" * len(remote_ids)) or "NULL"
+                        stale = [r[0] for r in cursor.execute(
+                            f"SELECT media_id FROM favorites_folder WHERE mid = ? AND media_id NOT IN ({placeholders})",
+                            (mid, *remote_ids)
+                        ).fetchall()]
+                        for media_id in stale:
+                            cursor.execute("DELETE FROM favorites_content WHERE media_id = ?", (media_id,))
+                            cursor.execute("DELETE FROM favorites_folder WHERE media_id = ?", (media_id,))
+                        summary["removed_folders"] = len(stale)
+                        conn.commit()
+
+                        for folder in folders:
+                            added, rebuilt = await self._sync_folder(client, conn, folder, full, page_interval)
+                            summary["folders"] += 1
+                            summary["new_items"] += added
+                            summary["rebuilt_folders"] += 1 if rebuilt else 0
+                    finally:
+                        conn.close()
+
+                result = {
+                    "status": "success",
+                    "message": "收藏夹同步完成",
+                    "data": {**summary, "duration": round(time.time() - started, 2)}
+                }
+                logger.info(f"收藏夹同步完成: {summary}")
+            except Exception as e:
+                logger.error(f"收藏夹同步失败: {e}")
+                result = {"status": "error", "message": f"收藏夹同步失败: {str(e)}"}
+            finally:
+                self.is_syncing = False
+
+            self.last_result = result
+            self.last_sync_time = int(time.time())
+            return result
+
+    async def _sync_folder(self, client: httpx.AsyncClient, conn, folder: Dict[str, Any],
+                           full: bool, page_interval: float):
+        """增量同步单个收藏夹，返回 (新增条数, 是否全量重建)"""
+        media_id = folder.get('id')
+        remote_count = int(folder.get('media_count', 0) or 0)
+        cursor = conn.cursor()
+
+        row = cursor.execute(
+            "SELECT MAX(fav_time), COUNT(*) FROM favorites_content WHERE media_id = ?", (media_id,)
+        ).fetchone()
+        known_fav_time = row[0] or 0
+        local_count = row[1] or 0
+
+        run_started = int(time.time())
+        added = 0
+        pn = 1
+        while True:
+            data = await self._get_json(client, RESOURCE_LIST_URL, {
+                "media_id": media_id, "pn": pn, "ps": PAGE_SIZE, "order": "mtime",
+                "type": 0, "tid": 0, "platform": "web"
+            })
+            medias = data.get('medias') or []
+            fresh = medias if full else [m for m in medias if (m.get('fav_time') or 0) > known_fav_time]
+            if fresh:
+                added += save_content_rows(cursor, media_id, fresh, run_started)
+                conn.commit()
+
+            # 本页出现已知收藏即说明后续均已同步
+            if not data.get('has_more') or (not full and len(fresh) < len(medias)):
+                break
+            pn += 1
+            await asyncio.sleep(page_interval)
+
+        if full:
+            # 全量拉取后，本轮未再出现的条目即为远端已取消收藏
+            cursor.execute(
+                "DELETE FROM favorites_content WHERE media_id = ? AND fetch_time < ?", (media_id, run_started)
+            )
+            conn.commit()
+            return added, False
+
+        # 本地条数多于远端，说明远端有取消收藏，重建该收藏夹
+        if local_count + added > remote_count:
+            rebuilt_added, _ = await self._sync_folder(client, conn, folder, True, page_interval)
+            return rebuilt_added, True
+        return added, False
+
+    async def run_periodic(self) -> None:
+        """按 favorites_sync.interval 周期同步"""
+        while True:
+            interval = int(self._settings().get('interval', 3600))
+            await self.sync_all()
+            await asyncio.sleep(max(60, interval))
+
+    def start_periodic(self) -> bool:
+        if self._periodic_task is not None and not self._periodic_task.done():
+            return False
+        self._periodic_task = asyncio.create_task(self.run_periodic())
+        return True
+
+    async def stop_periodic(self) -> None:
+        if self._periodic_task is not None:
+            self._periodic_task.cancel()
+            try:
+                await self._periodic_task
+            except asyncio.CancelledError:
+                pass
+            self._periodic_task = None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "is_syncing": self.is_syncing,
+            "periodic_running": self._periodic_task is not None and not self._periodic_task.done(),
+            "last_sync_time": self.last_sync_time,
+            "last_result": self.last_result,
+        }
@@ -0,0 +1,212 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from scripts.history_partitions import connect_history, history_change_token, history_years
+from scripts.utils import get_config, get_output_path, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+
+# 年份表按导入时的本地时间划分，相邻年份的 view_at 区间只可能在跨年附近因时区不同而重叠，
+# 剪枝时留出一天的余量
+_YEAR_MARGIN = 86400
+
+
+def _year_start(year: int) -> int:
+    return int(datetime(year, 1, 1).timestamp())
+
+
+class HistoryQueryExecutor:
+    """跨年份查询执行器
+
+    每个年份的子查询在线程池中并发执行，各自使用独立的只读连接（封存年份以附加文件读取），
+    SQLite 执行语句时释放 GIL，多年份查询可以用上多个核心：
+    - fetch_page：各年份按 view_at 排序并只取前 offset+limit 条，再做 k 路堆合并。
+      先查询排序上最靠前的年份，凑够一页后，时间区间不可能进入这一页的年份直接跳过
+      深翻页时若各年份区间互不重叠，按各年份记录数直接定位到所在年份和年内偏移
+    - count：各年份并发计数后求和，按数据库内容的变化标识（history_change_token）缓存，翻页时不再重复计数
+    - map_years：各年份执行同一条语句，返回每个年份的结果
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'HistoryQueryExecutor':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        settings = get_config().get('history_fanout', {}) or {}
+        workers = int(settings.get('max_workers', 0) or 0) or min(8, os.cpu_count() or 1)
+        self.max_workers = max(1, workers)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='history-fanout')
+        self._count_cache: 'OrderedDict[tuple, Dict[int, int]]' = OrderedDict()
+        self._count_cache_size = int(settings.get('count_cache_size', 128))
+        self._cache_lock = threading.Lock()
+        self.stats = {"queries": 0, "partitions": 0, "pruned": 0, "count_hits": 0}
+
+    @staticmethod
+    def _db_path() -> str:
+        return get_output_path(get_config()['db_file'])
+
+    def available_years(self) -> List[int]:
+        """全部年份（包括已封存的年份），从新到旧"""
+        conn = connect_history(self._db_path(), read_only=True)
+        try:
+            return sorted(history_years(conn), reverse=True)
+        finally:
+            conn.close()
+
+    # ---- 单个年份的子查询（在工作线程中执行，每次使用独立连接） ----
+
+    def _run(self, sql: str, params: Sequence[Any]) -> Tuple[List[str], List[tuple]]:
+        conn = connect_history(self._db_path(), read_only=True)
+        try:
+            cursor = conn.execute(sql, list(params))
+            columns = [d[0] for d in cursor.description] if cursor.description else []
+            return columns, cursor.fetchall()
+        finally:
+            conn.close()
+
+    def _submit_all(self, years: Sequence[int], sql: str, params: Sequence[Any]) -> Dict[int, Tuple[List[str], List[tuple]]]:
+        futures = {year: self._executor.submit(self._run, sql.format(table=f"bilibili_history_{year}"), params)
+                   for year in years}
+        self.stats["partitions"] += len(futures)
+        return {year: future.result() for year, future in futures.items()}
+
+    # ---- 对外接口 ----
+
+    def map_years(self, years: Sequence[int], sql: str, params: Sequence[Any] = ()) -> Dict[int, List[tuple]]:
+        """各年份并发执行同一条语句（{table} 替换为年份表名），返回 年份 -> 结果行"""
+        self.stats["queries"] += 1
+        return {year: rows for year, (_, rows) in self._submit_all(years, sql, params).items()}
+
+    def distinct_bvids(self, years: Optional[Sequence[int]] = None) -> set:
+        """全部年份（或指定年份）历史记录中去重后的 bvid"""
+        years = self.available_years() if years is None else years
+        results = self.map_years(years, "SELECT DISTINCT bvid FROM {table} WHERE bvid IS NOT NULL AND bvid != ''")
+        return {row[0] for rows in results.values() for row in rows}
+
+    def year_counts(self, years: Sequence[int], where: str = '', params: Sequence[Any] = ()) -> Dict[int, int]:
+        """各年份符合条件的记录数，数据库内容没有变化时使用缓存，翻页时不再重复计数"""
+        key = (tuple(years), where, tuple(params), history_change_token(self._db_path()))
+        with self._cache_lock:
+            if key in self._count_cache:
+                self._count_cache.move_to_end(key)
+                self.stats["count_hits"] += 1
+                return dict(self._count_cache[key])
+
+        results = self.map_years(years, f"SELECT COUNT(*) FROM {{table}} {where}", params)
+        counts = {year: rows[0][0] for year, rows in results.items()}
+        with self._cache_lock:
+            self._count_cache[key] = counts
+            while len(self._count_cache) > self._count_cache_size:
+                self._count_cache.popitem(last=False)
+        return dict(counts)
+
+    def count(self, years: Sequence[int], where: str = '', params: Sequence[Any] = ()) -> int:
+        """符合条件的记录总数，where 为空或以 WHERE 开头"""
+        return sum(self.year_counts(years, where, params).values())
+
+    def _disjoint_slices(self, ordered: List[int], where: str, params: Sequence[Any],
+                         descending: bool, offset: int, limit: int) -> Optional[List[Tuple[int, int, int]]]:
+        """各年份 view_at 区间互不重叠时，一页记录就是按年份顺序拼接后的一段
+
+        返回需要查询的（年份, 年内偏移, 条数）；区间有重叠时返回 None。
+        """
+        counts = self.year_counts(ordered, where, params)
+        years = [year for year in ordered if counts.get(year)]
+        bounds = self.map_years(years, "SELECT MIN(view_at), MAX(view_at) FROM {table}")
+        ranges = [bounds[year][0] for year in years]
+        for current, following in zip(ranges, ranges[1:]):
+            if descending and not current[0] > following[1]:
+                return None
+            if not descending and not current[1] < following[0]:
+                return None
+
+        slices = []
+        for year in years:
+            if limit <= 0:
+                break
+            if counts[year] <= offset:
+                offset -= counts[year]
+                continue
+            take = min(limit, counts[year] - offset)
+            slices.append((year, offset, take))
+            offset, limit = 0, limit - take
+        self.stats["pruned"] += len(ordered) - len(slices)
+        return slices
+
+    def fetch_page(self, years: Sequence[int], where: str = '', params: Sequence[Any] = (),
+                   descending: bool = True, limit: int = 10, offset: int = 0) -> Tuple[List[str], List[tuple]]:
+        """按 view_at 排序的一页记录，返回（列名, 记录行）"""
+        self.stats["queries"] += 1
+        started = time.time()
+        offset, limit = max(0, offset), max(0, limit)
+        if limit == 0 or not years:
+            return [], []
+
+        # 排序上靠前的年份先查：降序从新到旧，升序从旧到新
+        pending = sorted(years, reverse=descending)
+        direction = 'DESC' if descending else 'ASC'
+        if offset >= limit and len(pending) > 1:
+            slices = self._disjoint_slices(pending, where, params, descending, offset, limit)
+            if slices is not None:
+                futures = [self._executor.submit(
+                    self._run, f"SELECT * FROM bilibili_history_{year} {where} "
+                               f"ORDER BY view_at {direction} LIMIT {take} OFFSET {skip}", params)
+                    for year, skip, take in slices]
+                self.stats["partitions"] += len(futures)
+                results = [future.result() for future in futures]
+                columns = next((cols for cols, _ in results if cols), [])
+                return columns, [row for _, rows in results for row in rows]
+        need = offset + limit
+        sql = f"SELECT * FROM {{table}} {where} ORDER BY view_at {direction} LIMIT {need}"
+
+        columns: List[str] = []
+        best: List[tuple] = []
+        view_at_index = 0
+        wave = 1  # 第一轮只查一个年份，最新一年通常就能凑够第一页
+        scanned = []
+        while pending:
+            if len(best) >= need:
+                # 已凑够 need 条，区间不可能超过第 need 条的年份（及之后的所有年份）不再查询
+                threshold = best[need - 1][view_at_index]
+                year = pending[0]
+                if descending and _year_start(year + 1) + _YEAR_MARGIN <= threshold:
+                    break
+                if not descending and _year_start(year) - _YEAR_MARGIN >= threshold:
+                    break
+            batch, pending = pending[:wave], pending[wave:]
+            wave = self.max_workers
+            results = self._submit_all(batch, sql, params)
+            scanned.extend(batch)
+
+            lists = [best]
+            for year in batch:
+                cols, rows = results[year]
+                if cols and not columns:
+                    columns = cols
+                    view_at_index = columns.index('view_at')
+                lists.append(rows)
+            # k 路堆合并：每个列表已按 view_at 排好序，只取前 need 条
+            best = list(itertools.islice(
+                heapq.merge(*lists, key=lambda row: row[view_at_index], reverse=descending), need))
+
+        self.stats["pruned"] += len(pending)
+        logger.debug(f"跨年份查询：查询 {scanned}，跳过 {pending}，耗时 {time.time() - started:.3f} 秒")
+        return columns, best[offset:need]
@@ -0,0 +1,161 @@
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from scripts.history_partitions import history_change_token, history_years
+from scripts.utils import setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+
+# 最近一次同步时数据库的变化标识（history_change_token），数据库内容未变化时跳过同步检查
+_synced_state: Dict[str, str] = {}
+_sync_lock = threading.Lock()
+
+
+def create_index_tables(conn: sqlite3.Connection) -> None:
+    """创建跨年份的全局查找表和备注表"""
+    # 每条历史记录一行：按 cid 或 (bvid, view_at) 定位到所在年份表和记录 id
+    # 各年份表的 id 不保证全局唯一，主键使用 (year, id)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_lookup (
+            year INTEGER NOT NULL,
+            id INTEGER NOT NULL,
+            cid INTEGER,
+            bvid TEXT,
+            view_at INTEGER,
+            PRIMARY KEY (year, id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_lookup_cid ON history_lookup (cid, year, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_lookup_bvid ON history_lookup (bvid, view_at)")
+    # 只保存有备注的记录
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_remarks (
+            year INTEGER NOT NULL,
+            id INTEGER NOT NULL,
+            bvid TEXT NOT NULL,
+            view_at INTEGER NOT NULL,
+            remark TEXT NOT NULL,
+            remark_time INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (year, id)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_remarks_time ON history_remarks (remark_time)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_history_remarks_bvid ON history_remarks (bvid, view_at)")
+    # 每个年份表已索引的记录数和最大 id
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_index_sources (
+            year INTEGER PRIMARY KEY,
+            row_count INTEGER NOT NULL,
+            max_id INTEGER NOT NULL
+        )
+    """)
+
+
+def _index_rows(conn: sqlite3.Connection, year: int, after_id: int) -> int:
+    table = f"bilibili_history_{year}"
+    cursor = conn.execute(f"""
+        INSERT OR REPLACE INTO history_lookup (year, id, cid, bvid, view_at)
+        SELECT {year}, id, cid, bvid, view_at FROM {table} WHERE id > ?
+    """, (after_id,))
+    conn.execute(f"""
+        INSERT OR REPLACE INTO history_remarks (year, id, bvid, view_at, remark, remark_time)
+        SELECT {year}, id, bvid, view_at, remark, COALESCE(remark_time, 0) FROM {table}
+        WHERE id > ? AND remark IS NOT NULL AND remark != ''
+    """, (after_id,))
+    return cursor.rowcount
+
+
+def _db_path(conn: sqlite3.Connection) -> str:
+    row = conn.execute("PRAGMA database_list").fetchone()
+    return row[2] if row else ''
+
+
+def sync_history_index(conn: sqlite3.Connection, force: bool = False) -> Dict[str, List[int]]:
+    """把各年份表的变化同步到查找表和备注表
+
+    记录 id 单调递增：新导入的记录只需把 id 大于已索引最大 id 的部分加入索引；
+    记录数对不上（删除过记录等）时重建该年份的索引。数据库内容自上次同步后
+    没有变化时直接返回，不扫描年份表。
+    """
+    summary = {"incremental": [], "rebuilt": [], "removed": []}
+    path = _db_path(conn)
+    # 同步前取变化标识：同步期间其他连接的写入不会被当作已同步；
+    # 本次同步写入后标识会变，下一次调用再检查一遍（不会再写入），之后就走快速路径
+    token = history_change_token(path) if path else None
+    if not force and token and _synced_state.get(path) == token:
+        return summary
+
+    with _sync_lock:
+        create_index_tables(conn)
+        sources = {row[0]: (row[1], row[2]) for row in conn.execute(
+            "SELECT year, row_count, max_id FROM history_index_sources")}
+        # 包括连接上附加的封存年份，未附加时封存年份的索引会被当作已删除的年份移除
+        years = history_years(conn)
+
+        for year in set(sources) - set(years):
+            for table in ('history_lookup', 'history_remarks', 'history_index_sources'):
+                conn.execute(f"DELETE FROM {table} WHERE year = ?", (year,))
+            summary["removed"].append(year)
+
+        for year in years:
+            table = f"bilibili_history_{year}"
+            count, max_id = conn.execute(f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM {table}").fetchone()
+            old = sources.get(year)
+            if old == (count, max_id):
+                continue
+            after_id = 0
+            if old and max_id > old[1]:
+                # 旧记录数未变说明只是追加了新记录
+                old_count = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE id <= ?", (old[1],)).fetchone()[0]
+                if old_count == old[0]:
+                    after_id = old[1]
+            if after_id:
+                summary["incremental"].append(year)
+            else:
+                conn.execute("DELETE FROM history_lookup WHERE year = ?", (year,))
+                conn.execute("DELETE FROM history_remarks WHERE year = ?", (year,))
+                summary["rebuilt"].append(year)
+            _index_rows(conn, year, after_id)
+            conn.execute("INSERT OR REPLACE INTO history_index_sources (year, row_count, max_id) VALUES (?, ?, ?)",
+                         (year, count, max_id))
+        conn.commit()
+
+        if token:
+            _synced_state[path] = token
+
+    if summary["incremental"] or summary["rebuilt"] or summary["removed"]:
+        logger.info(f"历史记录查找索引已同步：增量 {summary['incremental']}，"
+                    f"重建 {summary['rebuilt']}，移除 {summary['removed']}")
+    return summary
+
+
+def locate(conn: sqlite3.Connection, bvid: str, view_at: int) -> Optional[Tuple[int, int]]:
+    """按 (bvid, view_at) 找到记录所在的（年份, id）"""
+    return conn.execute(
+        "SELECT year, id FROM history_lookup WHERE bvid = ? AND view_at = ? ORDER BY year DESC LIMIT 1",
+        (bvid, view_at)
+    ).fetchone()
+
+
+def locate_cid(conn: sqlite3.Connection, cid: int) -> Optional[Tuple[int, int]]:
+    """按 cid 找到记录所在的（年份, id），多条记录时取最新年份表中的第一条"""
+    return conn.execute(
+        "SELECT year, id FROM history_lookup WHERE cid = ? ORDER BY year DESC, id LIMIT 1", (cid,)
+    ).fetchone()
+
+
+def set_remark(conn: sqlite3.Connection, year: int, record_id: int, bvid: str, view_at: int,
+               remark: str, remark_time: int) -> None:
+    """备注修改后同步备注表，备注清空时删除对应行"""
+    if remark:
+        conn.execute("""
+            INSERT OR REPLACE INTO history_remarks (year, id, bvid, view_at, remark, remark_time)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (year, record_id, bvid, view_at, remark, remark_time))
+    else:
+        conn.execute("DELETE FROM history_remarks WHERE year = ? AND id = ?", (year, record_id))
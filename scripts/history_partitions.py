@@ -0,0 +1,437 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import stat
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.request import pathname2url
+
+from loguru import logger
+
+from config.sql_statements_sqlite import CREATE_TABLE_DEFAULT, CREATE_INDEXES
+from scripts.history_time_columns import add_time_columns, create_time_indexes, utc_offset_seconds
+from scripts.metrics import sqlite_factory
+from scripts.utils import get_config, get_output_path, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+# 已经结束的年份封存为独立的只读数据库文件 output/sealed/bilibili_history_{year}.db：
+# - 封存后从主库删除该年份，主库只保留仍在写入的年份，保持小而热
+# - connect_history() 以 mode=ro&immutable=1 附加封存文件（模式名 sealed_{year}）并开启 mmap，
+#   表名不变，不带模式名的查询照常找到 bilibili_history_{year}；immutable 省去文件锁和变更检测
+# - 封存文件内的 sealed_stats 表保存封存时预先计算的统计，不用再扫描整年数据
+# SQLite 默认一个连接最多附加 10 个数据库，封存年份数受 history_partitions.max_sealed_years 限制
+SEALED_FOLDER = 'sealed'
+SCHEMA_PREFIX = 'sealed_'
+
+_SEALED_FILE = re.compile(r'^bilibili_history_(\d{4})\.db$')
+_YEAR_TABLE = re.compile(r'^bilibili_history_(\d{4})$')
+
+
+def _settings() -> Dict[str, Any]:
+    return get_config().get('history_partitions', {}) or {}
+
+
+def sealed_path(year: int) -> str:
+    return os.path.join(get_output_path(SEALED_FOLDER), f"bilibili_history_{year}.db")
+
+
+def sealed_years() -> Dict[int, str]:
+    """已封存的年份 -> 封存文件路径"""
+    folder = get_output_path(SEALED_FOLDER)
+    if not os.path.isdir(folder):
+        return {}
+    years = {}
+    for name in os.listdir(folder):
+        match = _SEALED_FILE.match(name)
+        if match:
+            years[int(match.group(1))] = os.path.join(folder, name)
+    return dict(sorted(years.items()))
+
+
+def _uri(path: str, **params) -> str:
+    query = '&'.join(f"{key}={value}" for key, value in params.items())
+    return f"file:{pathname2url(os.path.abspath(path))}" + (f"?{query}" if query else '')
+
+
+def _attach_sealed_years(conn: sqlite3.Connection) -> List[int]:
+    # 只能用于以 uri=True 打开的连接，否则 ATTACH 不解析 file: URI
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    hot = {name for (name,) in conn.execute(
+        "SELECT name FROM main.sqlite_master WHERE name LIKE 'bilibili_history_%'")}
+    mmap_size = int(_settings().get('mmap_size_mb', 256)) * 1024 * 1024
+    years = []
+    for year, path in sealed_years().items():
+        schema = f"{SCHEMA_PREFIX}{year}"
+        # 主库中仍有同名表时（封存中断、解封后）以主库为准
+        if schema in attached or f"bilibili_history_{year}" in hot:
+            continue
+        conn.execute(f"ATTACH DATABASE ? AS {schema}", (_uri(path, mode='ro', immutable=1),))
+        conn.execute(f"PRAGMA {schema}.mmap_size = {mmap_size}")
+        years.append(year)
+    return years
+
+
+def connect_history(db_path: Optional[str] = None, read_only: bool = False, **kwargs) -> sqlite3.Connection:
+    """连接历史记录数据库，并以只读方式附加所有封存年份"""
+    db_path = db_path or get_output_path(get_config()['db_file'])
+    params = {'mode': 'ro'} if read_only else {}
+    kwargs.setdefault('factory', sqlite_factory())
+    conn = sqlite3.connect(_uri(db_path, **params), uri=True, **kwargs)
+    try:
+        _attach_sealed_years(conn)
+    except sqlite3.Error as e:
+        logger.warning(f"附加封存年份失败: {e}")
+    return conn
+
+
+def history_table_names(conn: sqlite3.Connection) -> List[str]:
+    """主库和已附加的封存年份中所有 bilibili_history_ 开头的表和视图"""
+    names = set()
+    for _, schema, _ in conn.execute("PRAGMA database_list").fetchall():
+        if schema != 'main' and not schema.startswith(SCHEMA_PREFIX):
+            continue
+        names.update(name for (name,) in conn.execute(
+            f"SELECT name FROM {schema}.sqlite_master "
+            f"WHERE type IN ('table', 'view') AND name LIKE 'bilibili_history_%'"))
+    return sorted(names)
+
+
+def history_years(conn: sqlite3.Connection) -> List[int]:
+    """连接上可见的全部年份（包括已附加的封存年份），从旧到新"""
+    return sorted(int(m.group(1)) for m in map(_YEAR_TABLE.match, history_table_names(conn)) if m)
+
+
+def table_fingerprint(conn: sqlite3.Connection, table: str, totals: Sequence[str] = (), where: str = '',
+                      max_id: Optional[int] = None) -> Tuple[str, int, int]:
+    """返回年份表的（指纹, 记录数, 最大 id）
+
+    指纹由 COUNT(*)、MAX(id) 和 totals 中各表达式的 TOTAL() 组成，调用方按自己用到的列选择表达式；
+    where 为额外的筛选条件，指定 max_id 时只统计 id 不超过它的记录。
+    """
+    conditions = [where] if where else []
+    if max_id is not None:
+        conditions.append(f"id <= {int(max_id)}")
+    aggregates = ', '.join(['COUNT(*)', 'MAX(id)'] + [f"TOTAL({expr})" for expr in totals])
+    clause = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    row = conn.execute(f"SELECT {aggregates} FROM {table}{clause}").fetchone()
+    return repr(row), row[0], row[1] or 0
+
+
+def appended_after(conn: sqlite3.Connection, table: str, current: Tuple[str, int, int],
+                   previous: Optional[Tuple[int, str]], totals: Sequence[str] = (), where: str = '') -> Optional[int]:
+    """与上次处理时保存的（最大 id, 指纹）比较，判断年份表需要怎样更新
+
+    current 为 table_fingerprint() 的当前结果。返回 None 表示没有变化；返回上次的最大 id 表示旧记录
+    未被改动，只需处理 id 更大的新记录；返回 0 表示需要全部重建。
+    """
+    if previous is None:
+        return 0
+    fingerprint, _, max_id = current
+    old_max_id, old_fingerprint = previous
+    if fingerprint == old_fingerprint:
+        return None
+    if max_id > old_max_id and table_fingerprint(conn, table, totals, where, old_max_id)[0] == old_fingerprint:
+        return old_max_id
+    return 0
+
+
+# 每个数据库文件一个只读的监视连接：PRAGMA data_version 在其他连接（包括其他进程）提交写入后改变，
+# 只修改文件头、文件时间但数据没变的情况不会误判为变化
+_change_monitors: Dict[str, list] = {}
+_change_lock = threading.Lock()
+
+
+def history_change_token(db_path: Optional[str] = None) -> str:
+    """历史记录库内容的变化标识：库中任何一次提交写入后改变，用作缓存和派生表的失效条件"""
+    db_path = os.path.abspath(db_path or get_output_path(get_config()['db_file']))
+    try:
+        inode = os.stat(db_path).st_ino
+    except OSError:
+        return 'missing'
+    sealed = ','.join(str(year) for year in sealed_years())
+    with _change_lock:
+        monitor = _change_monitors.get(db_path)
+        if monitor is None or monitor[1] != inode:
+            # 文件被替换（恢复快照等）后重新打开监视连接
+            if monitor is not None:
+                monitor[0].close()
+            try:
+                conn = sqlite3.connect(_uri(db_path, mode='ro'), uri=True, check_same_thread=False)
+            except sqlite3.Error:
+                return f"unavailable:{time.time_ns()}"
+            generation = monitor[3] + 1 if monitor is not None else 0
+            monitor = _change_monitors[db_path] = [conn, inode, None, generation]
+        try:
+            version = monitor[0].execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            return f"unavailable:{time.time_ns()}"
+        if version != monitor[2]:
+            if monitor[2] is not None:
+                monitor[3] += 1
+            monitor[2] = version
+        return f"{inode}:{monitor[3]}|{sealed}"
+
+
+def is_sealed(year: int) -> bool:
+    return os.path.exists(sealed_path(year))
+
+
+_stats_cache: Dict[str, tuple] = {}
+
+
+def sealed_stats(year: int) -> Optional[Dict[str, Any]]:
+    """封存时预先计算的统计，没有封存时返回 None"""
+    path = sealed_path(year)
+    if not os.path.exists(path):
+        return None
+    mtime = os.stat(path).st_mtime_ns
+    cached = _stats_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    conn = sqlite3.connect(_uri(path, mode='ro', immutable=1), uri=True)
+    try:
+        stats = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM sealed_stats")}
+    finally:
+        conn.close()
+    _stats_cache[path] = (mtime, stats)
+    return stats
+
+
+def _compute_stats(conn: sqlite3.Connection, table: str, year: int) -> Dict[str, Any]:
+    row = conn.execute(f"""
+        SELECT COUNT(*), COALESCE(MAX(id), 0), MIN(view_at), MAX(view_at), TOTAL(progress), TOTAL(duration),
+               COUNT(DISTINCT bvid), COUNT(DISTINCT author_mid), COUNT(DISTINCT view_date)
+        FROM {table}
+    """).fetchone()
+    stats = {
+        'year': year,
+        'row_count': row[0],
+        'max_id': row[1],
+        'first_view_at': row[2],
+        'last_view_at': row[3],
+        'total_progress': row[4],
+        'total_duration': row[5],
+        'unique_videos': row[6],
+        'unique_authors': row[7],
+        'active_days': row[8],
+        'utc_offset': utc_offset_seconds(),
+        'sealed_at': int(time.time()),
+    }
+    stats['monthly'] = dict(conn.execute(
+        f"SELECT substr(view_date, 1, 7), COUNT(*) FROM {table} GROUP BY 1 ORDER BY 1"))
+    stats['hourly'] = {str(hour): count for hour, count in conn.execute(
+        f"SELECT view_hour, COUNT(*) FROM {table} GROUP BY 1 ORDER BY 1")}
+    stats['categories'] = dict(conn.execute(
+        f"SELECT COALESCE(main_category, ''), COUNT(*) FROM {table} GROUP BY 1 ORDER BY 2 DESC"))
+    stats['business'] = dict(conn.execute(
+        f"SELECT COALESCE(business, ''), COUNT(*) FROM {table} GROUP BY 1 ORDER BY 2 DESC"))
+    # 数据封存后不再变化，统计和分析缓存可以直接用它作为指纹
+    stats['fingerprint'] = f"sealed:{year}:{stats['row_count']}:{stats['max_id']}:{stats['sealed_at']}"
+    return stats
+
+
+def _write_sealed_file(db_path: str, year: int, target: str) -> int:
+    table = f"bilibili_history_{year}"
+    if os.path.exists(target):
+        os.remove(target)
+    dst = sqlite3.connect(target)
+    try:
+        # 紧凑存储的年份也写成普通表，封存文件可以单独使用
+        dst.execute(CREATE_TABLE_DEFAULT.format(table=table))
+        dst.execute("ATTACH DATABASE ? AS src", (_uri(db_path, mode='ro'),))
+        columns = ', '.join(row[1] for row in dst.execute(f"PRAGMA main.table_info({table})"))
+        dst.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM src.{table} ORDER BY id")
+        dst.commit()
+        dst.execute("DETACH DATABASE src")
+
+        add_time_columns(dst, table)
+        for sql in CREATE_INDEXES:
+            dst.execute(sql.format(table=table))
+        create_time_indexes(dst, table)
+        dst.execute("CREATE TABLE sealed_stats (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        stats = _compute_stats(dst, table, year)
+        dst.executemany("INSERT INTO sealed_stats (key, value) VALUES (?, ?)",
+                        [(key, json.dumps(value, ensure_ascii=False)) for key, value in stats.items()])
+        dst.commit()
+        dst.execute("ANALYZE")
+        dst.commit()
+        dst.execute("PRAGMA journal_mode = DELETE")
+        dst.execute("VACUUM")
+        return stats['row_count']
+    finally:
+        dst.close()
+
+
+def _drop_hot_year(conn: sqlite3.Connection, year: int) -> None:
+    table = f"bilibili_history_{year}"
+    conn.execute(f"DROP TABLE IF EXISTS {table}_fts")
+    kind = conn.execute("SELECT type FROM main.sqlite_master WHERE name = ?", (table,)).fetchone()
+    if kind and kind[0] == 'view':
+        conn.execute(f"DROP VIEW {table}")
+        conn.execute(f"DROP TABLE IF EXISTS history_v2_{year}")
+        conn.execute(f"DROP TABLE IF EXISTS history_v2_{year}_extra")
+    elif kind:
+        conn.execute(f"DROP TABLE {table}")
+    conn.execute("DELETE FROM history_time_columns WHERE year = ?", (year,))
+
+
+def seal_year(year: int, db_path: Optional[str] = None) -> Dict[str, Any]:
+    """把已经结束的年份封存为只读数据库文件，并从主库中删除"""
+    db_path = db_path or get_output_path(get_config()['db_file'])
+    if year >= datetime.now().year:
+        raise ValueError(f"{year} 年还没有结束，不能封存")
+    table = f"bilibili_history_{year}"
+    target = sealed_path(year)
+
+    conn = sqlite3.connect(db_path)
+    try:
+        kind = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+        if not kind:
+            raise FileNotFoundError(f"主库中没有 {year} 年的历史记录")
+        expected = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        limit = int(_settings().get('max_sealed_years', 8))
+        if not os.path.exists(target) and len(sealed_years()) >= limit:
+            raise ValueError(f"封存年份已达上限 {limit}（SQLite 单个连接可附加的数据库数量有限）")
+    finally:
+        conn.close()
+
+    started = time.time()
+    if os.path.exists(target):
+        # 上次封存在删除主库数据之前中断，封存文件已完整写入
+        stats = sealed_stats(year) or {}
+        if stats.get('row_count') != expected:
+            raise sqlite3.IntegrityError(f"{year} 年封存文件与主库记录数不一致，请先解封")
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial = target + '.tmp'
+        try:
+            copied = _write_sealed_file(db_path, year, partial)
+            if copied != expected:
+                raise sqlite3.IntegrityError(f"{year} 年封存记录数不一致: {copied} != {expected}")
+            os.chmod(partial, stat.S_IREAD | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(partial, target)
+        except Exception:
+            if os.path.exists(partial):
+                os.chmod(partial, stat.S_IWRITE | stat.S_IREAD)
+                os.remove(partial)
+            raise
+
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("CREATE TABLE IF NOT EXISTS history_time_columns "
+                     "(year INTEGER PRIMARY KEY, utc_offset INTEGER NOT NULL, indexed INTEGER NOT NULL DEFAULT 0)")
+        _drop_hot_year(conn, year)
+        conn.commit()
+        if _settings().get('vacuum_after_seal', True):
+            conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+    logger.info(f"{year} 年历史记录已封存到 {target}：{expected} 条，耗时 {time.time() - started:.2f} 秒")
+    return {'year': year, 'path': target, 'row_count': expected}
+
+
+def unseal_year(year: int, db_path: Optional[str] = None) -> Dict[str, Any]:
+    """把封存的年份复制回主库（恢复可写），然后删除封存文件"""
+    from scripts.import_sqlite import create_table
+
+    db_path = db_path or get_output_path(get_config()['db_file'])
+    source = sealed_path(year)
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"{year} 年没有封存")
+    table = f"bilibili_history_{year}"
+
+    conn = sqlite3.connect(db_path)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone():
+            raise ValueError(f"主库中已经有 {year} 年的历史记录")
+        conn.execute("ATTACH DATABASE ? AS sealed", (_uri(source, mode='ro'),))
+        # 建表和复制在同一个事务中，失败时主库保持不变
+        create_table(conn, table, commit=False)
+        columns = ', '.join(row[1] for row in conn.execute(f"PRAGMA sealed.table_info({table})"))
+        conn.execute(f"INSERT INTO main.{table} ({columns}) SELECT {columns} FROM sealed.{table} ORDER BY id")
+        copied = conn.execute(f"SELECT COUNT(*) FROM main.{table}").fetchone()[0]
+        expected = conn.execute(f"SELECT COUNT(*) FROM sealed.{table}").fetchone()[0]
+        if copied != expected:
+            raise sqlite3.IntegrityError(f"{year} 年解封记录数不一致: {copied} != {expected}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    os.chmod(source, stat.S_IWRITE | stat.S_IREAD)
+    os.remove(source)
+    _stats_cache.pop(source, None)
+    logger.info(f"{year} 年历史记录已解封：{copied} 条")
+    return {'year': year, 'row_count': copied}
+
+
+def auto_seal_years(db_path: Optional[str] = None) -> List[int]:
+    """封存结束超过 grace_days 天的年份（history_partitions.auto_seal 开启时在启动时执行）"""
+    settings = _settings()
+    if not settings.get('auto_seal', False):
+        return []
+    db_path = db_path or get_output_path(get_config()['db_file'])
+    if not os.path.exists(db_path):
+        return []
+    # 年份结束后留出一段时间，跨年时同步到的上一年记录还能写入主库
+    cutoff = (datetime.now() - timedelta(days=int(settings.get('grace_days', 31)))).year
+    conn = sqlite3.connect(db_path)
+    try:
+        hot = sorted(int(name[len('bilibili_history_'):]) for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name GLOB 'bilibili_history_[0-9][0-9][0-9][0-9]'"))
+    finally:
+        conn.close()
+    sealed = []
+    for year in hot:
+        if year < cutoff:
+            seal_year(year, db_path)
+            sealed.append(year)
+    return sealed
+
+
+def list_partitions(db_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """各年份所在位置：热库（可写）或封存文件（只读）"""
+    conn = connect_history(db_path)
+    try:
+        names = history_table_names(conn)
+    finally:
+        conn.close()
+    sealed = sealed_years()
+    partitions = []
+    for name in names:
+        suffix = name[len('bilibili_history_'):]
+        if not (suffix.isdigit() and len(suffix) == 4):
+            continue
+        year = int(suffix)
+        if year in sealed:
+            stats = sealed_stats(year) or {}
+            partitions.append({'year': year, 'sealed': True, 'path': sealed[year],
+                               'size': os.path.getsize(sealed[year]), 'row_count': stats.get('row_count'),
+                               'sealed_at': stats.get('sealed_at')})
+        else:
+            partitions.append({'year': year, 'sealed': False})
+    return partitions
+
+
+# 允许脚本独立运行
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="封存已结束年份的历史记录为只读数据库文件")
+    parser.add_argument('years', nargs='*', type=int, help="要封存的年份")
+    parser.add_argument('--unseal', action='store_true', help="解封，恢复为主库中的可写表")
+    parser.add_argument('--list', action='store_true', help="列出各年份的存储位置")
+    args = parser.parse_args()
+
+    if args.list or not args.years:
+        for item in list_partitions():
+            print(item)
+    for target_year in args.years:
+        print(unseal_year(target_year) if args.unseal else seal_year(target_year))
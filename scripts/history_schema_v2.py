@@ -0,0 +1,368 @@
+import argparse
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from config.sql_statements_sqlite import CREATE_TABLE_DEFAULT, CREATE_INDEXES
+from scripts.history_time_columns import init_year_time_columns
+from scripts.utils import get_config, get_output_path, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+# 紧凑存储（schema v2）：
+# - 作者、标签/分区、业务类型和封面放到全局维度表中，年份表只保存整数键
+# - long_title、uri、badge、current、new_desc 绝大多数为空字符串，不为空字符串时才写入按年份的稀疏附加表
+# - 原来的 bilibili_history_{year} 变成同名视图，列和顺序与 v1 完全一致，
+#   INSTEAD OF 触发器把视图上的 INSERT/UPDATE/DELETE 转到实际存储表，已有查询和写入无需修改
+
+DIMENSION_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS history_authors (
+        id INTEGER PRIMARY KEY,
+        mid INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        face TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_history_authors_mid ON history_authors (mid, name, face)",
+    """
+    CREATE TABLE IF NOT EXISTS history_tags (
+        id INTEGER PRIMARY KEY,
+        tag_name TEXT,
+        main_category TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_history_tags_name ON history_tags (tag_name, main_category)",
+    "CREATE INDEX IF NOT EXISTS idx_history_tags_category ON history_tags (main_category)",
+    """
+    CREATE TABLE IF NOT EXISTS history_business (
+        id INTEGER PRIMARY KEY,
+        name TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_history_business_name ON history_business (name)",
+    """
+    CREATE TABLE IF NOT EXISTS history_covers (
+        id INTEGER PRIMARY KEY,
+        cover TEXT,
+        covers TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_history_covers_cover ON history_covers (cover, covers)",
+]
+
+# 维度表：(表名, 维度列, 记录中对应的列)
+_DIMENSIONS = [
+    ('history_authors', ('mid', 'name', 'face'), ('author_mid', 'author_name', 'author_face')),
+    ('history_tags', ('tag_name', 'main_category'), ('tag_name', 'main_category')),
+    ('history_business', ('name',), ('business',)),
+    ('history_covers', ('cover', 'covers'), ('cover', 'covers')),
+]
+
+CREATE_STORAGE_TABLE = """
+CREATE TABLE IF NOT EXISTS {storage} (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    cover_id INTEGER,
+    oid INTEGER NOT NULL,
+    epid INTEGER DEFAULT 0,
+    bvid TEXT NOT NULL,
+    page INTEGER DEFAULT 1,
+    cid INTEGER,
+    part TEXT,
+    business_id INTEGER,
+    dt INTEGER NOT NULL,
+    videos INTEGER DEFAULT 1,
+    author_id INTEGER NOT NULL,
+    view_at INTEGER NOT NULL,
+    progress INTEGER DEFAULT 0,
+    show_title TEXT,
+    duration INTEGER NOT NULL,
+    total INTEGER DEFAULT 0,
+    is_finish INTEGER DEFAULT 0,
+    is_fav INTEGER DEFAULT 0,
+    kid INTEGER,
+    tag_id INTEGER,
+    live_status INTEGER DEFAULT 0,
+    remark TEXT DEFAULT '',
+    remark_time INTEGER DEFAULT 0
+)
+"""
+
+CREATE_EXTRA_TABLE = """
+CREATE TABLE IF NOT EXISTS {extra} (
+    id INTEGER PRIMARY KEY,
+    long_title TEXT,
+    uri TEXT,
+    badge TEXT,
+    current TEXT,
+    new_desc TEXT
+)
+"""
+
+CREATE_STORAGE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_{storage}_view_at ON {storage} (view_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{storage}_author_id ON {storage} (author_id)",
+    "CREATE INDEX IF NOT EXISTS idx_{storage}_remark_time ON {storage} (remark_time)",
+]
+
+_EXTRA_COLUMNS = ('long_title', 'uri', 'badge', 'current', 'new_desc')
+
+# 视图列，顺序与 CREATE_TABLE_DEFAULT 加上本地时间生成列一致，SELECT * 的结果和 v1 相同
+CREATE_VIEW = """
+CREATE VIEW {view} AS
+SELECT
+    h.id, h.title,
+    CASE WHEN x.id IS NULL THEN '' ELSE x.long_title END AS long_title,
+    c.cover, c.covers,
+    CASE WHEN x.id IS NULL THEN '' ELSE x.uri END AS uri,
+    h.oid, h.epid, h.bvid, h.page, h.cid, h.part, b.name AS business, h.dt, h.videos,
+    a.name AS author_name, a.face AS author_face, a.mid AS author_mid, h.view_at, h.progress,
+    CASE WHEN x.id IS NULL THEN '' ELSE x.badge END AS badge,
+    h.show_title, h.duration,
+    CASE WHEN x.id IS NULL THEN '' ELSE x.current END AS current,
+    h.total,
+    CASE WHEN x.id IS NULL THEN '' ELSE x.new_desc END AS new_desc,
+    h.is_finish, h.is_fav, h.kid, t.tag_name, h.live_status, t.main_category, h.remark, h.remark_time,
+    h.view_date, h.view_hour, h.view_weekday
+FROM {storage} h
+JOIN history_authors a ON a.id = h.author_id
+LEFT JOIN history_covers c ON c.id = h.cover_id
+LEFT JOIN history_business b ON b.id = h.business_id
+LEFT JOIN history_tags t ON t.id = h.tag_id
+LEFT JOIN {extra} x ON x.id = h.id
+"""
+
+
+def _dimension_inserts(prefix: str) -> str:
+    """为记录中的维度值补齐维度表行（NULL 也作为一个维度值，用 IS 比较）"""
+    statements = []
+    for table, columns, fields in _DIMENSIONS:
+        values = ', '.join(f"{prefix}.{field}" for field in fields)
+        match = ' AND '.join(f"{col} IS {prefix}.{field}" for col, field in zip(columns, fields))
+        statements.append(
+            f"INSERT INTO {table} ({', '.join(columns)}) SELECT {values} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {match});"
+        )
+    return '\n'.join(statements)
+
+
+def _dimension_lookup(prefix: str, index: int) -> str:
+    table, columns, fields = _DIMENSIONS[index]
+    match = ' AND '.join(f"{col} IS {prefix}.{field}" for col, field in zip(columns, fields))
+    return f"(SELECT id FROM {table} WHERE {match})"
+
+
+def _storage_values(prefix: str) -> str:
+    return f"""
+        {prefix}.title, {_dimension_lookup(prefix, 3)}, {prefix}.oid, COALESCE({prefix}.epid, 0), {prefix}.bvid,
+        COALESCE({prefix}.page, 1), {prefix}.cid, {prefix}.part, {_dimension_lookup(prefix, 2)}, {prefix}.dt,
+        COALESCE({prefix}.videos, 1), {_dimension_lookup(prefix, 0)}, {prefix}.view_at,
+        COALESCE({prefix}.progress, 0), {prefix}.show_title, {prefix}.duration, COALESCE({prefix}.total, 0),
+        COALESCE({prefix}.is_finish, 0), COALESCE({prefix}.is_fav, 0), {prefix}.kid, {_dimension_lookup(prefix, 1)},
+        COALESCE({prefix}.live_status, 0), COALESCE({prefix}.remark, ''), COALESCE({prefix}.remark_time, 0)"""
+
+
+_STORAGE_COLUMNS = ("title, cover_id, oid, epid, bvid, page, cid, part, business_id, dt, videos, author_id, view_at, "
+                    "progress, show_title, duration, total, is_finish, is_fav, kid, tag_id, live_status, "
+                    "remark, remark_time")
+
+
+def _extra_insert(extra: str, id_expr: str, prefix: str) -> str:
+    values = ', '.join(f"{prefix}.{col}" for col in _EXTRA_COLUMNS)
+    non_empty = ' OR '.join(f"{prefix}.{col} IS NOT ''" for col in _EXTRA_COLUMNS)
+    return f"INSERT INTO {extra} (id, {', '.join(_EXTRA_COLUMNS)}) SELECT {id_expr}, {values} WHERE {non_empty};"
+
+
+def _names(year: int) -> Dict[str, str]:
+    return {'view': f"bilibili_history_{year}", 'storage': f"history_v2_{year}", 'extra': f"history_v2_{year}_extra"}
+
+
+def _create_triggers(conn: sqlite3.Connection, year: int) -> None:
+    names = _names(year)
+    view, storage, extra = names['view'], names['storage'], names['extra']
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {view}_v2_insert INSTEAD OF INSERT ON {view}
+        BEGIN
+            {_dimension_inserts('NEW')}
+            INSERT INTO {storage} (id, {_STORAGE_COLUMNS}) VALUES (NEW.id, {_storage_values('NEW')});
+            {_extra_insert(extra, 'last_insert_rowid()', 'NEW')}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {view}_v2_update INSTEAD OF UPDATE ON {view}
+        BEGIN
+            {_dimension_inserts('NEW')}
+            UPDATE {storage} SET ({', '.join(['id'] + _STORAGE_COLUMNS.split(', '))}) =
+                (NEW.id, {_storage_values('NEW')})
+            WHERE id = OLD.id;
+            DELETE FROM {extra} WHERE id = OLD.id;
+            {_extra_insert(extra, 'NEW.id', 'NEW')}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {view}_v2_delete INSTEAD OF DELETE ON {view}
+        BEGIN
+            DELETE FROM {storage} WHERE id = OLD.id;
+            DELETE FROM {extra} WHERE id = OLD.id;
+        END
+    """)
+
+
+def schema_version(conn: sqlite3.Connection, year: int) -> Optional[int]:
+    """年份表的存储格式：1 为普通表，2 为紧凑存储视图，不存在时返回 None"""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (f"bilibili_history_{year}",)).fetchone()
+    if not row:
+        return None
+    return 2 if row[0] == 'view' else 1
+
+
+def create_year_schema_v2(conn: sqlite3.Connection, year: int) -> None:
+    """创建空的紧凑存储年份（视图、存储表和触发器），不提交事务"""
+    names = _names(year)
+    for sql in DIMENSION_TABLES:
+        conn.execute(sql)
+    conn.execute(CREATE_STORAGE_TABLE.format(**names))
+    conn.execute(CREATE_EXTRA_TABLE.format(**names))
+    for sql in CREATE_STORAGE_INDEXES:
+        conn.execute(sql.format(**names))
+    init_year_time_columns(conn, year, names['storage'])
+    create_view(conn, year)
+
+
+def create_view(conn: sqlite3.Connection, year: int) -> None:
+    """创建兼容视图及其 INSTEAD OF 触发器，不提交事务"""
+    names = _names(year)
+    conn.execute(CREATE_VIEW.format(**names))
+    _create_triggers(conn, year)
+
+
+def _history_years(conn: sqlite3.Connection) -> Dict[int, int]:
+    years = {}
+    for name, obj_type in conn.execute(
+            "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') AND name LIKE 'bilibili_history_%'"):
+        suffix = name[len('bilibili_history_'):]
+        if suffix.isdigit() and len(suffix) == 4:
+            years[int(suffix)] = 2 if obj_type == 'view' else 1
+    return years
+
+
+def _run_in_transaction(conn: sqlite3.Connection, func, *args) -> None:
+    # DDL 和数据复制放在同一个显式事务中，失败时整体回滚，原表保持不变
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            func(conn, *args)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.isolation_level = isolation_level
+
+
+def _migrate_year(conn: sqlite3.Connection, year: int) -> None:
+    names = _names(year)
+    view = names['view']
+    # FTS 外部内容表和触发器指向旧表，迁移后需要重新建立
+    conn.execute(f"DROP TABLE IF EXISTS {view}_fts")
+    conn.execute(f"ALTER TABLE {view} RENAME TO {view}_v1")
+    for sql in DIMENSION_TABLES:
+        conn.execute(sql)
+
+    source = f"{view}_v1"
+    for table, columns, fields in _DIMENSIONS:
+        match = ' AND '.join(f"d.{col} IS s.{field}" for col, field in zip(columns, fields))
+        conn.execute(f"""
+            INSERT INTO {table} ({', '.join(columns)})
+            SELECT DISTINCT {', '.join(f's.{field}' for field in fields)} FROM {source} s
+            WHERE NOT EXISTS (SELECT 1 FROM {table} d WHERE {match})
+        """)
+
+    conn.execute(CREATE_STORAGE_TABLE.format(**names))
+    conn.execute(CREATE_EXTRA_TABLE.format(**names))
+    conn.execute(f"""
+        INSERT INTO {names['storage']} (id, {_STORAGE_COLUMNS})
+        SELECT s.id, {_storage_values('s')} FROM {source} s
+    """)
+    non_empty = ' OR '.join(f"{col} IS NOT ''" for col in _EXTRA_COLUMNS)
+    conn.execute(f"""
+        INSERT INTO {names['extra']} (id, {', '.join(_EXTRA_COLUMNS)})
+        SELECT id, {', '.join(_EXTRA_COLUMNS)} FROM {source} WHERE {non_empty}
+    """)
+    # 数据写入后再建索引
+    for sql in CREATE_STORAGE_INDEXES:
+        conn.execute(sql.format(**names))
+    init_year_time_columns(conn, year, names['storage'])
+
+    copied = conn.execute(f"SELECT COUNT(*) FROM {names['storage']}").fetchone()[0]
+    expected = conn.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+    if copied != expected:
+        raise sqlite3.IntegrityError(f"{year} 年迁移记录数不一致: {copied} != {expected}")
+
+    conn.execute(f"DROP TABLE {source}")
+    create_view(conn, year)
+
+
+def _downgrade_year(conn: sqlite3.Connection, year: int) -> None:
+    names = _names(year)
+    view = names['view']
+    conn.execute(f"DROP TABLE IF EXISTS {view}_fts")
+    table = f"{view}_v1"
+    conn.execute(CREATE_TABLE_DEFAULT.format(table=table))
+    columns = ', '.join(row[1] for row in conn.execute(f"PRAGMA table_info({table})"))
+    conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {view}")
+    conn.execute(f"DROP VIEW {view}")
+    conn.execute(f"DROP TABLE {names['storage']}")
+    conn.execute(f"DROP TABLE {names['extra']}")
+    conn.execute(f"ALTER TABLE {table} RENAME TO {view}")
+    for sql in CREATE_INDEXES:
+        conn.execute(sql.format(table=view))
+    init_year_time_columns(conn, year, view)
+
+
+def migrate(conn: sqlite3.Connection, years: Optional[List[int]] = None, downgrade: bool = False) -> Dict[str, List[int]]:
+    """把年份表迁移到紧凑存储（downgrade=True 时还原为普通表）
+
+    每个年份在单独的事务中迁移，迁移后执行 VACUUM 释放空间。
+    """
+    summary = {"migrated": [], "skipped": []}
+    existing = _history_years(conn)
+    target, func = (1, _downgrade_year) if downgrade else (2, _migrate_year)
+    for year in sorted(years or existing):
+        if existing.get(year) in (None, target):
+            summary["skipped"].append(year)
+            continue
+        started = time.time()
+        _run_in_transaction(conn, func, year)
+        summary["migrated"].append(year)
+        logger.info(f"{year} 年历史记录已{'还原为普通表' if downgrade else '迁移到紧凑存储'}，"
+                    f"耗时 {time.time() - started:.2f} 秒")
+    if summary["migrated"]:
+        conn.execute("VACUUM")
+    return summary
+
+
+def use_schema_v2() -> bool:
+    """新建年份时是否使用紧凑存储"""
+    return int(get_config().get('history_schema', {}).get('version', 1)) == 2
+
+
+# 允许脚本独立运行
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="历史记录年份表紧凑存储（schema v2）迁移")
+    parser.add_argument('years', nargs='*', type=int, help="要迁移的年份，默认全部")
+    parser.add_argument('--downgrade', action='store_true', help="还原为普通表")
+    args = parser.parse_args()
+
+    db_conn = sqlite3.connect(get_output_path(get_config()['db_file']))
+    try:
+        result = migrate(db_conn, args.years or None, args.downgrade)
+    finally:
+        db_conn.close()
+    print(f"完成: {result['migrated']}，跳过: {result['skipped']}")
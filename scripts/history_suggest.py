@@ -0,0 +1,402 @@
+import heapq
+import os
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from scripts.history_partitions import appended_after, connect_history, history_years, table_fingerprint
+from scripts.utils import get_config, get_database_path, get_output_path, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+SUGGEST_DB_FILE = 'bilibili_history_suggest.db'
+
+# 提示类型 -> 历史记录表中的列
+KINDS = {
+    'title': 'title',
+    'author': 'author_name',
+    'tag': 'tag_name',
+}
+
+# 年份表指纹包含的列：标题、UP主、标签有改动时需要重新统计
+_FINGERPRINT_TOTALS = ('length(title)', 'length(author_name)', 'length(tag_name)')
+
+# 匹配范围超过 _HOT_RANGE 个键的短前缀（不超过 _HOT_PREFIX_LEN 个字符）在建立索引时预先计算结果，
+# 输入第一、二个字时也不需要扫描大段区间
+_HOT_PREFIX_LEN = 2
+_HOT_RANGE = 1000
+
+_CJK = re.compile(r'[\u4e00-\u9fff]')
+_KEY_CHARS = re.compile(r'[^0-9a-z]')
+
+# GB2312 一级汉字按拼音排序，各声母第一个汉字的区位码（I、U、V 没有汉字）
+_GB2312_INITIALS = [
+    (0xB0A1, 'a'), (0xB0C5, 'b'), (0xB2C1, 'c'), (0xB4EE, 'd'), (0xB6EA, 'e'), (0xB7A2, 'f'),
+    (0xB8C1, 'g'), (0xB9FE, 'h'), (0xBBF7, 'j'), (0xBFA6, 'k'), (0xC0AC, 'l'), (0xC2E8, 'm'),
+    (0xC4C3, 'n'), (0xC5B6, 'o'), (0xC5BE, 'p'), (0xC6DA, 'q'), (0xC8BB, 'r'), (0xC8F6, 's'),
+    (0xCBFA, 't'), (0xCDDA, 'w'), (0xCEF4, 'x'), (0xD1B9, 'y'), (0xD4D1, 'z'),
+]
+_GB2312_LEVEL1_END = 0xD7F9
+
+try:
+    from pypinyin import Style, lazy_pinyin
+    PINYIN_BACKEND = 'pypinyin'
+except ImportError:
+    Style = lazy_pinyin = None
+    PINYIN_BACKEND = 'gb2312'
+
+
+def _gb2312_initial(char: str) -> str:
+    try:
+        encoded = char.encode('gb2312')
+    except UnicodeEncodeError:
+        return ''
+    if len(encoded) != 2:
+        return ''
+    code = (encoded[0] << 8) | encoded[1]
+    # 二级汉字按部首排序，无法换算声母
+    if code < _GB2312_INITIALS[0][0] or code > _GB2312_LEVEL1_END:
+        return ''
+    initial = ''
+    for start, letter in _GB2312_INITIALS:
+        if code < start:
+            break
+        initial = letter
+    return initial
+
+
+def normalize_key(text: str) -> str:
+    """前缀匹配使用的键：小写，合并连续空白"""
+    return ' '.join(str(text or '').lower().split())
+
+
+def pinyin_initials(text: str) -> str:
+    """拼音首字母键，例如 "原神 4.0" -> "ys40"；不含汉字时返回空字符串
+
+    安装了 pypinyin 时按词组识别多音字；否则只能换算 GB2312 一级汉字（常用字），
+    其余汉字跳过。
+    """
+    if not text or not _CJK.search(text):
+        return ''
+    if lazy_pinyin is not None:
+        letters = ''.join(lazy_pinyin(text, style=Style.FIRST_LETTER))
+    else:
+        letters = ''.join(_gb2312_initial(ch) if _CJK.match(ch) else ch for ch in text)
+    return _KEY_CHARS.sub('', letters.lower())
+
+
+def create_tables(conn: sqlite3.Connection) -> None:
+    # 每个年份表中各标题、UP主和标签出现的次数
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS suggest_terms (
+            source_year INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            text TEXT NOT NULL,
+            initials TEXT NOT NULL,
+            freq INTEGER NOT NULL,
+            PRIMARY KEY (source_year, kind, text)
+        ) WITHOUT ROWID
+    """)
+    # 每个年份表的统计进度，pinyin 记录生成首字母键时使用的方式，变化后重建
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS suggest_sources (
+            source_year INTEGER PRIMARY KEY,
+            pinyin TEXT NOT NULL,
+            max_id INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+    conn.commit()
+
+
+class _PrefixIndex:
+    """内存中的前缀索引：全部键排成有序数组，前缀查询是一次二分查找得到的连续区间"""
+
+    def __init__(self):
+        self.entries: List[list] = []          # [kind, text, freq]
+        self.lookup: Dict[Tuple[str, str], int] = {}
+        # (有序的键, 对应的 (条目下标, 是否拼音首字母))，合并时整体替换，查询不会读到对不上的两个数组
+        self.sorted: Tuple[List[str], List[Tuple[int, bool]]] = ([], [])
+        self.hot: Dict[Tuple[str, Optional[str]], List[Tuple[int, bool]]] = {}
+
+    def add(self, kind: str, text: str, initials: str, freq: int, pending: List[tuple]) -> None:
+        entry_id = self.lookup.get((kind, text))
+        if entry_id is not None:
+            self.entries[entry_id][2] += freq
+            return
+        entry_id = len(self.entries)
+        self.entries.append([kind, text, freq])
+        self.lookup[(kind, text)] = entry_id
+        key = normalize_key(text)
+        pending.append((key, entry_id, False))
+        if initials and initials != key:
+            pending.append((initials, entry_id, True))
+
+    def merge(self, pending: List[tuple], hot_limit: int) -> None:
+        """把新键合并进有序数组（归并，不重新排序整个数组），并重新计算热门短前缀的结果"""
+        if pending:
+            pending.sort()
+            merged = list(heapq.merge(zip(*self.sorted), ((k, (i, p)) for k, i, p in pending)))
+            self.sorted = ([key for key, _ in merged], [ref for _, ref in merged])
+        keys = self.sorted[0]
+        hot = {}
+        for length in range(1, _HOT_PREFIX_LEN + 1):
+            for prefix in {key[:length] for key in keys if len(key) >= length}:
+                lo = bisect_left(keys, prefix)
+                if bisect_left(keys, prefix + '\U0010ffff', lo) - lo < _HOT_RANGE:
+                    continue
+                for kind in (None,) + tuple(KINDS):
+                    hot[(prefix, kind)] = self._scan(prefix, kind, hot_limit)
+        self.hot = hot
+
+    def search(self, key: str, kind: Optional[str], limit: int) -> List[Tuple[int, bool]]:
+        hits = self.hot.get((key, kind))
+        if hits is not None:
+            return hits[:limit]
+        return self._scan(key, kind, limit)
+
+    def _scan(self, key: str, kind: Optional[str], limit: int) -> List[Tuple[int, bool]]:
+        keys, refs = self.sorted
+        lo = bisect_left(keys, key)
+        hi = bisect_left(keys, key + '\U0010ffff', lo)
+        best: Dict[int, bool] = {}
+        for entry_id, via_pinyin in refs[lo:hi]:
+            if kind and self.entries[entry_id][0] != kind:
+                continue
+            # 原文和首字母都匹配时按原文匹配
+            best[entry_id] = best.get(entry_id, True) and via_pinyin
+        top = heapq.nlargest(limit, best, key=lambda i: (self.entries[i][2], -i))
+        return [(entry_id, best[entry_id]) for entry_id in top]
+
+
+class HistorySuggestIndex:
+    """历史记录输入提示
+
+    对去重后的视频标题、UP主名和分区标签按观看次数排序，支持原文前缀和拼音首字母前缀。
+    各年份表的出现次数保存在独立的 bilibili_history_suggest.db 中，导入历史记录后只统计
+    新增的记录（以已统计的最大 id 为界）；启动时直接从该库载入，不需要扫描历史记录表。
+    查询只访问内存中的有序数组，匹配范围很大的短前缀预先计算结果，其余查询缓存最近的结果。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'HistorySuggestIndex':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        settings = get_config().get('history_suggest', {}) or {}
+        self.max_results = int(settings.get('max_results', 50))
+        self._cache_size = int(settings.get('cache_size', 4096))
+        self._refresh_lock = threading.Lock()
+        self._index: Optional[_PrefixIndex] = None
+        self._cache: 'OrderedDict[tuple, List[Tuple[int, bool]]]' = OrderedDict()
+        self.stats = {"queries": 0, "cache_hits": 0, "refreshes": 0, "loaded_at": None,
+                      "load_seconds": None, "last_refresh": None}
+
+    @staticmethod
+    def _history_path() -> str:
+        return get_output_path(get_config()['db_file'])
+
+    @staticmethod
+    def _suggest_path() -> str:
+        return get_database_path(SUGGEST_DB_FILE)
+
+    @staticmethod
+    def _count_terms(conn: sqlite3.Connection, table: str, after_id: int) -> Dict[Tuple[str, str], int]:
+        """统计 id 大于 after_id 的记录中各标题、UP主和标签的出现次数"""
+        counts: Dict[Tuple[str, str], int] = defaultdict(int)
+        for kind, column in KINDS.items():
+            rows = conn.execute(f"""
+                SELECT {column}, COUNT(*) FROM {table}
+                WHERE id > ? AND {column} IS NOT NULL AND {column} != ''
+                GROUP BY {column}
+            """, (after_id,))
+            for text, freq in rows:
+                text = text.strip()
+                if text:
+                    counts[(kind, text)] += freq
+        return counts
+
+    def refresh(self, rebuild: bool = False) -> Dict[str, Any]:
+        """把历史记录库的变化同步到提示库（阻塞调用，接口中应放到线程中执行）"""
+        started = time.time()
+        summary = {"pinyin": PINYIN_BACKEND, "incremental": [], "rebuilt": [], "removed": [], "added_terms": 0}
+        deltas: Dict[Tuple[str, str], int] = defaultdict(int)
+        initials: Dict[Tuple[str, str], str] = {}
+
+        with self._refresh_lock:
+            history_path = self._history_path()
+            history = connect_history(history_path, read_only=True) if os.path.exists(history_path) else None
+            store = sqlite3.connect(self._suggest_path())
+            try:
+                create_tables(store)
+                sources = {
+                    row[0]: row[1:] for row in store.execute(
+                        "SELECT source_year, pinyin, max_id, row_count, fingerprint FROM suggest_sources"
+                    )
+                }
+                years = []
+                if history is not None:
+                    years = history_years(history)
+
+                for source_year in set(sources) - set(years):
+                    store.execute("DELETE FROM suggest_terms WHERE source_year = ?", (source_year,))
+                    store.execute("DELETE FROM suggest_sources WHERE source_year = ?", (source_year,))
+                    summary["removed"].append(source_year)
+
+                for source_year in years:
+                    table = f"bilibili_history_{source_year}"
+                    current = table_fingerprint(history, table, _FINGERPRINT_TOTALS)
+                    fingerprint, count, max_id = current
+                    source = sources.get(source_year)
+                    after_id = 0
+                    if source and not rebuild and source[0] == PINYIN_BACKEND:
+                        # 旧记录未被改动时只统计新增部分
+                        after_id = appended_after(history, table, current, (source[1], source[3]), _FINGERPRINT_TOTALS)
+                        if after_id is None:
+                            continue
+
+                    if after_id:
+                        summary["incremental"].append(source_year)
+                    else:
+                        store.execute("DELETE FROM suggest_terms WHERE source_year = ?", (source_year,))
+                        summary["rebuilt"].append(source_year)
+
+                    terms = self._count_terms(history, table, after_id)
+                    rows = []
+                    for (kind, text), freq in terms.items():
+                        key = (kind, text)
+                        if key not in initials:
+                            initials[key] = pinyin_initials(text)
+                        rows.append((source_year, kind, text, initials[key], freq))
+                        deltas[key] += freq
+                    store.executemany("""
+                        INSERT INTO suggest_terms (source_year, kind, text, initials, freq)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (source_year, kind, text) DO UPDATE SET freq = freq + excluded.freq
+                    """, rows)
+                    summary["added_terms"] += len(rows)
+                    store.execute("""
+                        INSERT OR REPLACE INTO suggest_sources
+                            (source_year, pinyin, max_id, row_count, fingerprint, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (source_year, PINYIN_BACKEND, max_id, count, fingerprint, int(time.time())))
+                    store.commit()
+                store.commit()
+            finally:
+                if history is not None:
+                    history.close()
+                store.close()
+
+            if summary["rebuilt"] or summary["removed"]:
+                # 次数可能减少，重新载入
+                self._index = None
+                self._cache.clear()
+            elif summary["incremental"] and self._index is not None:
+                # 只新增了记录，把增量直接合并进内存索引
+                pending: List[tuple] = []
+                for (kind, text), freq in deltas.items():
+                    self._index.add(kind, text, initials[(kind, text)], freq, pending)
+                self._index.merge(pending, self.max_results)
+                self._cache.clear()
+            self.stats["refreshes"] += 1
+            self.stats["last_refresh"] = int(time.time())
+
+        summary["duration"] = round(time.time() - started, 3)
+        if summary["incremental"] or summary["rebuilt"] or summary["removed"]:
+            logger.info(f"历史记录输入提示已更新：增量 {summary['incremental']}，重建 {summary['rebuilt']}，"
+                        f"移除 {summary['removed']}，更新 {summary['added_terms']} 个词条，"
+                        f"耗时 {summary['duration']} 秒")
+        return summary
+
+    def load(self) -> _PrefixIndex:
+        """从提示库载入内存索引，已载入时直接返回"""
+        index = self._index
+        if index is not None:
+            return index
+        with self._refresh_lock:
+            if self._index is not None:
+                return self._index
+            started = time.time()
+            conn = sqlite3.connect(self._suggest_path())
+            try:
+                create_tables(conn)
+                rows = conn.execute("""
+                    SELECT kind, text, MAX(initials), SUM(freq) FROM suggest_terms GROUP BY kind, text
+                """).fetchall()
+            finally:
+                conn.close()
+            index = _PrefixIndex()
+            pending: List[tuple] = []
+            for kind, text, initials, freq in rows:
+                index.add(kind, text, initials, freq, pending)
+            index.merge(pending, self.max_results)
+            self._cache.clear()
+            self._index = index
+            self.stats["loaded_at"] = int(time.time())
+            self.stats["load_seconds"] = round(time.time() - started, 3)
+        return index
+
+    @property
+    def loaded(self) -> bool:
+        return self._index is not None
+
+    def suggest(self, prefix: str, limit: int = 10, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按观看次数返回以 prefix 开头（原文或拼音首字母）的标题、UP主和标签"""
+        if kind is not None and kind not in KINDS:
+            raise ValueError(f"无效的提示类型: {kind}")
+        self.stats["queries"] += 1
+        key = normalize_key(prefix)
+        if not key:
+            return []
+        index = self.load()
+        limit = max(1, min(limit, self.max_results))
+
+        cache_key = (key, kind)
+        hits = self._cache.get(cache_key)
+        if hits is not None:
+            self.stats["cache_hits"] += 1
+            self._cache.move_to_end(cache_key)
+        else:
+            hits = index.search(key, kind, self.max_results)
+            self._cache[cache_key] = hits
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return [
+            {"text": index.entries[entry_id][1], "type": index.entries[entry_id][0],
+             "count": index.entries[entry_id][2], "match": "pinyin" if via_pinyin else "prefix"}
+            for entry_id, via_pinyin in hits[:limit]
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        index = self._index
+        return {**self.stats, "pinyin": PINYIN_BACKEND,
+                "entries": len(index.entries) if index is not None else 0,
+                "keys": len(index.sorted[0]) if index is not None else 0,
+                "hot_prefixes": len(index.hot) if index is not None else 0,
+                "cached_queries": len(self._cache)}
+
+
+def refresh_history_suggest() -> Optional[Dict[str, Any]]:
+    """导入历史记录后更新输入提示，失败时只记录日志，不影响导入结果"""
+    try:
+        return HistorySuggestIndex.get_instance().refresh()
+    except Exception as e:
+        logger.warning(f"更新历史记录输入提示失败: {e}")
+        return None
@@ -0,0 +1,142 @@
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from scripts.history_partitions import connect_history
+
+# (view_at, business, oid)：唯一确定一条历史记录在时间线上的位置
+Mark = Tuple[int, str, int]
+
+
+def entry_mark(entry: Dict[str, Any]) -> Mark:
+    history = entry.get('history') or {}
+    return int(entry.get('view_at') or 0), str(history.get('business') or ''), int(history.get('oid') or 0)
+
+
+def reached_mark(entry: Dict[str, Any], mark: Optional[Mark]) -> bool:
+    """接口按观看时间倒序返回，遇到高水位记录本身或更早的记录即说明已同步到本地"""
+    if not mark:
+        return False
+    current = entry_mark(entry)
+    return current == mark or current[0] < mark[0]
+
+
+class HistorySyncCheckpoint:
+    """历史记录同步检查点
+
+    保存在历史记录数据库的 history_sync_state 表中：
+    - 高水位 hw_*：上次完整同步时最新一条记录，下次同步精确停在这条记录
+    - 进行中的同步 run_*：本次同步最新一条记录和下一页的游标，每写完一页提交一次，
+      中断后再次同步时从游标继续，而不是从头开始
+    """
+
+    def __init__(self, name: str = 'default', db_path: Optional[str] = None):
+        self.name = name
+        # 附加封存年份：同步后刷新查找索引时需要看到全部年份
+        # 同步过程中的写入通过 asyncio.to_thread 在线程池中执行，各步骤依次进行，不会并发使用连接
+        self.conn = connect_history(db_path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS history_sync_state (
+                name TEXT PRIMARY KEY,
+                hw_view_at INTEGER,
+                hw_business TEXT,
+                hw_oid INTEGER,
+                run_view_at INTEGER,
+                run_business TEXT,
+                run_oid INTEGER,
+                cursor_max INTEGER,
+                cursor_view_at INTEGER,
+                cursor_business TEXT,
+                run_pages INTEGER DEFAULT 0,
+                run_records INTEGER DEFAULT 0,
+                run_started_at INTEGER,
+                updated_at INTEGER
+            )
+        """)
+        self.conn.execute("INSERT OR IGNORE INTO history_sync_state (name) VALUES (?)", (name,))
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _row(self) -> Dict[str, Any]:
+        cursor = self.conn.execute("SELECT * FROM history_sync_state WHERE name = ?", (self.name,))
+        columns = [d[0] for d in cursor.description]
+        return dict(zip(columns, cursor.fetchone()))
+
+    @property
+    def high_water_mark(self) -> Optional[Mark]:
+        row = self._row()
+        if row['hw_view_at'] is None:
+            return None
+        return row['hw_view_at'], row['hw_business'] or '', row['hw_oid'] or 0
+
+    @classmethod
+    def stored_high_water_mark(cls, name: str = 'default') -> Optional[Mark]:
+        checkpoint = cls(name)
+        try:
+            return checkpoint.high_water_mark
+        finally:
+            checkpoint.close()
+
+    def pending_run(self) -> Optional[Dict[str, Any]]:
+        """返回中断的同步（含下一页游标），没有时返回 None"""
+        row = self._row()
+        if row['run_view_at'] is None or row['cursor_max'] is None:
+            return None
+        return {
+            'top': (row['run_view_at'], row['run_business'] or '', row['run_oid'] or 0),
+            'cursor': {'max': row['cursor_max'], 'view_at': row['cursor_view_at'],
+                       'business': row['cursor_business'] or ''},
+            'pages': row['run_pages'] or 0,
+            'records': row['run_records'] or 0,
+            'started_at': row['run_started_at'],
+        }
+
+    def set_high_water_mark(self, mark: Mark) -> None:
+        """没有检查点时用本地已有的最新记录初始化高水位"""
+        self.conn.execute(
+            "UPDATE history_sync_state SET hw_view_at = ?, hw_business = ?, hw_oid = ?, updated_at = ? "
+            "WHERE name = ?", (*mark, int(time.time()), self.name)
+        )
+        self.conn.commit()
+
+    def begin_run(self, top: Mark) -> None:
+        """记录本次同步拿到的最新一条记录，同步完成后它成为新的高水位"""
+        now = int(time.time())
+        self.conn.execute("""
+            UPDATE history_sync_state
+            SET run_view_at = ?, run_business = ?, run_oid = ?,
+                cursor_max = NULL, cursor_view_at = NULL, cursor_business = NULL,
+                run_pages = 0, run_records = 0, run_started_at = ?, updated_at = ?
+            WHERE name = ?
+        """, (*top, now, now, self.name))
+        self.conn.commit()
+
+    def save_page(self, cursor: Dict[str, Any], records: int, commit: bool = True) -> None:
+        """一页数据写入存储后记录下一页的游标；commit=False 时由调用方在同一事务中提交"""
+        self.conn.execute("""
+            UPDATE history_sync_state
+            SET cursor_max = ?, cursor_view_at = ?, cursor_business = ?,
+                run_pages = run_pages + 1, run_records = run_records + ?, updated_at = ?
+            WHERE name = ?
+        """, (cursor.get('max'), cursor.get('view_at'), cursor.get('business') or '',
+              records, int(time.time()), self.name))
+        if commit:
+            self.conn.commit()
+
+    def finish_run(self) -> None:
+        """同步到达高水位或历史记录末尾，本次的最新记录成为新的高水位"""
+        self.conn.execute("""
+            UPDATE history_sync_state
+            SET hw_view_at = COALESCE(run_view_at, hw_view_at),
+                hw_business = CASE WHEN run_view_at IS NULL THEN hw_business ELSE run_business END,
+                hw_oid = CASE WHEN run_view_at IS NULL THEN hw_oid ELSE run_oid END,
+                run_view_at = NULL, run_business = NULL, run_oid = NULL,
+                cursor_max = NULL, cursor_view_at = NULL, cursor_business = NULL,
+                updated_at = ?
+            WHERE name = ?
+        """, (int(time.time()), self.name))
+        self.conn.commit()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'high_water_mark': self.high_water_mark, 'pending_run': self.pending_run()}
@@ -0,0 +1,196 @@
+import re
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from scripts.utils import get_config, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+# 年份表上的本地时间生成列：
+# - view_date    'YYYY-MM-DD'
+# - view_hour    0-23
+# - view_weekday 0-6（0 为星期日，与 strftime('%w') 一致）
+# SQLite 的生成列不能使用 'localtime'，时区用 viewing_cube.timezone 的标准 UTC 偏移（不含夏令时）。
+# ALTER TABLE 只能添加 VIRTUAL 生成列，计算结果保存在索引中，按这些列筛选和分组时直接走索引。
+TIME_COLUMNS = {
+    'view_date': "TEXT GENERATED ALWAYS AS (date(view_at + {offset}, 'unixepoch')) VIRTUAL",
+    'view_hour': "INTEGER GENERATED ALWAYS AS (CAST(strftime('%H', view_at + {offset}, 'unixepoch') AS INTEGER)) VIRTUAL",
+    'view_weekday': "INTEGER GENERATED ALWAYS AS (CAST(strftime('%w', view_at + {offset}, 'unixepoch') AS INTEGER)) VIRTUAL",
+}
+
+# 依赖时区的索引（索引名后缀 -> 列），时区变化时随生成列一起重建
+TIME_INDEXES = {
+    'view_date': 'view_date',
+    'view_hour': 'view_hour',
+    'view_weekday_hour': 'view_weekday, view_hour',
+}
+
+# /history/all 等按条件筛选后再按 view_at 排序的组合索引
+FILTER_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_{table}_main_category_view_at ON {table} (main_category, view_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_tag_name_view_at ON {table} (tag_name, view_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_business_view_at ON {table} (business, view_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_bvid_view_at ON {table} (bvid, view_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_cid ON {table} (cid)",
+]
+
+# 紧凑存储（schema v2）的存储表用维度键代替字符串列
+FILTER_INDEXES_V2 = [
+    "CREATE INDEX IF NOT EXISTS idx_{table}_tag_id_view_at ON {table} (tag_id, view_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_business_id_view_at ON {table} (business_id, view_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_bvid_view_at ON {table} (bvid, view_at)",
+    "CREATE INDEX IF NOT EXISTS idx_{table}_cid ON {table} (cid)",
+]
+
+DEFAULT_TIMEZONE = 'Asia/Shanghai'
+
+_OFFSET = re.compile(r'^(?:UTC|GMT)?([+-])(\d{1,2})(?::?(\d{2}))?$')
+
+
+def resolve_timezone(name: Optional[str]) -> Tuple[str, tzinfo]:
+    """解析时区配置，支持 IANA 名称（如 Asia/Shanghai）或固定偏移（如 +08:00）"""
+    name = (name or DEFAULT_TIMEZONE).strip()
+    match = _OFFSET.match(name)
+    if match:
+        sign, hours, minutes = match.groups()
+        delta = timedelta(hours=int(hours), minutes=int(minutes or 0))
+        return name, timezone(-delta if sign == '-' else delta)
+    try:
+        from zoneinfo import ZoneInfo
+        return name, ZoneInfo(name)
+    except Exception as e:
+        # Windows 上未安装 tzdata 时无法加载 IANA 时区
+        logger.warning(f"无法加载时区 {name}（{e}），使用 UTC+8")
+        return '+08:00', timezone(timedelta(hours=8))
+
+
+def local_timezone() -> Tuple[str, tzinfo]:
+    """统计使用的时区（viewing_cube.timezone），返回（配置名称, tzinfo）"""
+    return resolve_timezone(get_config().get('viewing_cube', {}).get('timezone'))
+
+
+def utc_offset_seconds() -> int:
+    """查询和生成列使用的时区偏移（秒）：当前时区的标准偏移，不随夏令时变化"""
+    now = datetime.now(local_timezone()[1])
+    return int((now.utcoffset() - (now.dst() or timedelta(0))).total_seconds())
+
+
+def _create_meta_table(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS history_time_columns (
+            year INTEGER PRIMARY KEY,
+            utc_offset INTEGER NOT NULL,
+            indexed INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+
+def _year_storage(conn: sqlite3.Connection) -> Dict[int, str]:
+    """年份 -> 实际存储表（紧凑存储的年份是 history_v2_{year}）"""
+    storage = {}
+    for name, obj_type in conn.execute(
+            "SELECT name, type FROM sqlite_master WHERE type IN ('table', 'view') AND name LIKE 'bilibili_history_%'"):
+        suffix = name[len('bilibili_history_'):]
+        if suffix.isdigit() and len(suffix) == 4:
+            storage[int(suffix)] = f"history_v2_{suffix}" if obj_type == 'view' else name
+    return storage
+
+
+def _existing_time_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})") if row[1] in TIME_COLUMNS]
+
+
+def add_time_columns(conn: sqlite3.Connection, table: str, offset: Optional[int] = None) -> None:
+    """给存储表添加生成列（不提交事务，不建索引）"""
+    offset = utc_offset_seconds() if offset is None else offset
+    existing = _existing_time_columns(conn, table)
+    for column, definition in TIME_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition.format(offset=offset)}")
+
+
+def _drop_time_columns(conn: sqlite3.Connection, table: str) -> None:
+    for suffix in TIME_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS idx_{table}_{suffix}")
+    for column in _existing_time_columns(conn, table):
+        conn.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+
+
+def create_time_indexes(conn: sqlite3.Connection, table: str) -> None:
+    for suffix, columns in TIME_INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{suffix} ON {table} ({columns})")
+    for sql in FILTER_INDEXES_V2 if table.startswith('history_v2_') else FILTER_INDEXES:
+        conn.execute(sql.format(table=table))
+
+
+def init_year_time_columns(conn: sqlite3.Connection, year: int, table: str) -> None:
+    """新建年份表时添加生成列和索引（空表建索引没有开销），不提交事务"""
+    offset = utc_offset_seconds()
+    _create_meta_table(conn)
+    add_time_columns(conn, table, offset)
+    create_time_indexes(conn, table)
+    conn.execute("INSERT OR REPLACE INTO history_time_columns (year, utc_offset, indexed) VALUES (?, ?, 1)",
+                 (year, offset))
+
+
+def _sync_year(conn: sqlite3.Connection, year: int, table: str, offset: int, build_indexes: bool) -> None:
+    is_v2 = table.startswith('history_v2_')
+    columns = _existing_time_columns(conn, table)
+    recorded = conn.execute("SELECT utc_offset FROM history_time_columns WHERE year = ?", (year,)).fetchone()
+    rebuild = bool(columns) and (recorded is None or recorded[0] != offset)
+    if rebuild or len(columns) < len(TIME_COLUMNS):
+        if is_v2:
+            # 视图引用了生成列，先删除视图，添加列后重建视图和触发器
+            conn.execute(f"DROP TABLE IF EXISTS bilibili_history_{year}_fts")
+            conn.execute(f"DROP VIEW IF EXISTS bilibili_history_{year}")
+        if rebuild:
+            _drop_time_columns(conn, table)
+        add_time_columns(conn, table, offset)
+        if is_v2:
+            from scripts.history_schema_v2 import create_view
+            create_view(conn, year)
+        conn.execute("INSERT OR REPLACE INTO history_time_columns (year, utc_offset, indexed) VALUES (?, ?, 0)",
+                     (year, offset))
+    elif recorded is None:
+        conn.execute("INSERT INTO history_time_columns (year, utc_offset, indexed) VALUES (?, ?, 0)", (year, offset))
+
+    if build_indexes:
+        indexed = conn.execute("SELECT indexed FROM history_time_columns WHERE year = ?", (year,)).fetchone()[0]
+        if not indexed:
+            started = time.time()
+            create_time_indexes(conn, table)
+            conn.execute("UPDATE history_time_columns SET indexed = 1 WHERE year = ?", (year,))
+            logger.info(f"{year} 年本地时间列和组合索引已建立，耗时 {time.time() - started:.2f} 秒")
+
+
+def ensure_time_columns(conn: sqlite3.Connection, build_indexes: bool = True) -> List[int]:
+    """确保所有年份表都有当前时区的本地时间生成列
+
+    添加生成列只修改表结构，很快；build_indexes=True 时再为未建索引的年份建立索引。
+    时区偏移修改后删除旧的生成列和索引，按新偏移重建。返回有变化的年份。
+    """
+    offset = utc_offset_seconds()
+    _create_meta_table(conn)
+    conn.commit()
+    pending = []
+    states = {row[0]: row[1:] for row in conn.execute(
+        "SELECT year, utc_offset, indexed FROM history_time_columns")}
+    for year, table in sorted(_year_storage(conn).items()):
+        state = states.get(year)
+        if state and state[0] == offset and (state[1] or not build_indexes):
+            continue
+        pending.append((year, table))
+
+    for year, table in pending:
+        try:
+            _sync_year(conn, year, table, offset, build_indexes)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+    return [year for year, _ in pending]
@@ -20,6 +20,8 @@ import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+from scripts.history_partitions import connect_history, history_table_names
+from scripts.metrics import WORKER_QUEUE_DEPTH
 from scripts.utils import get_output_path, load_config
 
 config = load_config()
@@ -303,6 +305,59 @@ class DownloadStatusDB:
             finally:
                 conn.close()
 
+    def reconcile_missing_files(self, progress=None) -> Dict:
+        """核对下载记录与磁盘文件，已标记下载但文件缺失的记录改为未下载
+
+        Args:
+            progress: 可选的进度回调 (当前表序号, 表总数, 说明)
+
+        Returns:
+            Dict: 检查的记录数和修正的记录数
+        """
+        with self.lock:
+            conn = sqlite3.connect(self.db_path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT name FROM sqlite_master
+                    WHERE type='table' AND name LIKE 'images_%'
+                """)
+                tables = [row[0] for row in cursor.fetchall()]
+            finally:
+                conn.close()
+
+        checked = 0
+        fixed = 0
+        for index, table_name in enumerate(tables, 1):
+            conn = sqlite3.connect(self.db_path)
+            try:
+                rows = conn.execute(f"SELECT hash, path FROM {table_name} WHERE downloaded = 1").fetchall()
+            finally:
+                conn.close()
+
+            # 文件检查不占用锁，避免阻塞下载线程
+            missing = [(hash_value,) for hash_value, path in rows if not os.path.exists(path)]
+            checked += len(rows)
+
+            if missing:
+                with self.lock:
+                    conn = sqlite3.connect(self.db_path)
+                    try:
+                        conn.executemany(f"""
+                            UPDATE {table_name} SET downloaded = 0, error = '文件缺失'
+                            WHERE hash = ?
+                        """, missing)
+                        conn.commit()
+                    finally:
+                        conn.close()
+                fixed += len(missing)
+
+            if progress:
+                progress(index, len(tables), f"{table_name}: 缺失 {len(missing)} 个文件")
+
+        return {'checked': checked, 'fixed': fixed}
+
+
 class ImageDownloader:
     _instance = None
     _lock = threading.Lock()
@@ -1051,23 +1106,21 @@ class ImageDownloader:
             "stats": self.get_download_stats()
         }
 
+# 只读取已创建的下载器，导出指标时不会创建实例
+WORKER_QUEUE_DEPTH.set_function(('image_download',), lambda: ImageDownloader._instance.download_queue.qsize())
+
+
 def get_db():
     """获取数据库连接"""
     db_path = get_output_path(config['db_file'])
-    return sqlite3.connect(db_path)
+    return connect_history(db_path)
 
 def get_available_years() -> List[int]:
     """获取可用的年份列表"""
     conn = get_db()
     try:
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT name FROM sqlite_master
-            WHERE type='table' AND name LIKE 'bilibili_history_%'
-        """)
-        tables = cursor.fetchall()
         years = []
-        for (table_name,) in tables:
+        for table_name in history_table_names(conn):
             try:
                 year = int(table_name.split('_')[-1])
                 years.append(year)
@@ -6,7 +6,10 @@ import threading
 import time
 from datetime import datetime
 
-from config.sql_statements_sqlite import CREATE_TABLE_DEFAULT, CREATE_INDEXES, INSERT_DATA
+from config.sql_statements_sqlite import CREATE_TABLE_DEFAULT, CREATE_INDEXES, INSERT_DATA, CREATE_TABLE_DELETED_HISTORY
+from scripts.history_partitions import connect_history, sealed_years
+from scripts.history_schema_v2 import create_year_schema_v2, use_schema_v2
+from scripts.history_time_columns import init_year_time_columns
 from scripts.utils import load_config, get_base_path, get_output_path
 
 config = load_config()
@@ -83,7 +86,8 @@ def create_connection(db_file):
     """创建数据库连接"""
     try:
         os.makedirs(os.path.dirname(db_file), exist_ok=True)
-        conn = sqlite3.connect(db_file)
+        # 附加封存年份：导入后刷新查找索引时需要看到全部年份
+        conn = connect_history(db_file)
         logger.info(f"成功连接到SQLite数据库: {db_file}")
         return conn
     except sqlite3.Error as e:
@@ -95,12 +99,20 @@ def table_exists(conn, table_name):
     cursor = conn.cursor()
     cursor.execute("""
         SELECT count(name) FROM sqlite_master
-        WHERE type='table' AND name=?
+        WHERE type IN ('table', 'view') AND name=?
     """, (table_name,))
     return cursor.fetchone()[0] > 0
 
-def create_table(conn, table_name):
-    """创建数据表"""
+def create_table(conn, table_name, commit=True):
+    """创建数据表，commit=False 时由调用方在同一事务中提交"""
+    if use_schema_v2():
+        # 紧凑存储：同名视图 + 实际存储表
+        create_year_schema_v2(conn, int(table_name.rsplit('_', 1)[1]))
+        if commit:
+            conn.commit()
+        logger.info(f"成功创建紧凑存储的 {table_name}")
+        return
+
     cursor = conn.cursor()
 
     # 使用 sql_statements_sqlite.py 中的建表语句
@@ -109,8 +121,10 @@ def create_table(conn, table_name):
     # 创建索引
     for index_sql in CREATE_INDEXES:
         cursor.execute(index_sql.format(table=table_name))
+    init_year_time_columns(conn, int(table_name.rsplit('_', 1)[1]), table_name)
 
-    conn.commit()
+    if commit:
+        conn.commit()
     logger.info(f"成功创建表 {table_name} 及其索引")
 
 def batch_insert_data(conn, table_name, data_batch):
@@ -130,6 +144,126 @@ def batch_insert_data(conn, table_name, data_batch):
         conn.rollback()
         return 0
 
+def history_entry_to_record(item):
+    """把接口返回的一条历史记录转换为年份表的一行（分类映射、生成雪花ID）"""
+    history = item.get('history', {})
+    main_category = None
+    business = history.get('business', '')
+    tag_name = item.get('tag_name', '').strip()
+
+    if business == 'archive':
+        if tag_name in unique_tag_to_main:
+            main_category = unique_tag_to_main[tag_name]
+        elif tag_name in duplicated_tags:
+            main_category = '待定'
+        else:
+            main_category = '待定'
+
+    # 从正确的位置获取duration和progress
+    duration = item.get('duration', 0)  # 从item对象获取视频总时长
+    progress = item.get('progress', 0)  # 从item对象获取观看进度
+
+    return (
+        id_generator.get_id(),
+        item.get('title', ''),
+        item.get('long_title', ''),
+        item.get('cover', ''),
+        json.dumps(item.get('covers', [])),
+        item.get('uri', ''),
+        history.get('oid', 0),
+        history.get('epid', 0),
+        history.get('bvid', ''),
+        history.get('page', 1),
+        history.get('cid', 0),
+        history.get('part', ''),
+        business,
+        history.get('dt', 0),
+        history.get('videos', 0),
+        item.get('author_name', ''),
+        item.get('author_face', ''),
+        item.get('author_mid', 0),
+        item.get('view_at', 0),
+        progress,  # 使用从item对象获取的观看进度
+        item.get('badge', ''),
+        item.get('show_title', ''),
+        duration,  # 使用从item对象获取的视频总时长
+        item.get('current', ''),
+        item.get('total', 0),
+        item.get('new_desc', ''),
+        item.get('is_finish', 0),
+        item.get('is_fav', 0),
+        history.get('kid', 0),
+        tag_name,
+        item.get('live_status', 0),
+        main_category,
+        '',  # 默认的空备注
+        0   # 默认的备注时间为0
+    )
+
+def ingest_history_entries(conn, entries, sync_deleted=False):
+    """把同步获取的一页历史记录直接写入年份表
+
+    不提交事务：调用方把这一页和同步检查点放在同一个事务中提交。
+    只查询这一页涉及的 view_at 来去重，不需要加载整年的记录。
+    """
+    entries_by_year = {}
+    for item in entries:
+        view_at = item.get('view_at', 0)
+        if view_at:
+            entries_by_year.setdefault(datetime.fromtimestamp(view_at).year, []).append(item)
+    # 封存的年份是只读的
+    for year in set(entries_by_year) & set(sealed_years()):
+        logger.warning(f"{year} 年已封存，跳过 {len(entries_by_year.pop(year))} 条记录")
+    if not entries_by_year:
+        return 0
+
+    cursor = conn.cursor()
+    deleted_records = set()
+    if not sync_deleted:
+        cursor.execute(CREATE_TABLE_DELETED_HISTORY)
+        view_ats = [item['view_at'] for items in entries_by_year.values() for item in items]
+        cursor.execute(f"SELECT bvid, view_at FROM deleted_history WHERE view_at IN ({','.join('?' * len(view_ats))})",
+                       view_ats)
+        deleted_records = set(cursor.fetchall())
+
+    total_inserted = 0
+    placeholders = ','.join(['?' for _ in range(34)])  # 34个字段
+    for year, items in entries_by_year.items():
+        year_table = f"bilibili_history_{year}"
+        if not table_exists(conn, year_table):
+            create_table(conn, year_table, commit=False)
+
+        view_ats = [item['view_at'] for item in items]
+        cursor.execute(f"SELECT bvid, view_at FROM {year_table} WHERE view_at IN ({','.join('?' * len(view_ats))})",
+                       view_ats)
+        existing_records = set(cursor.fetchall())
+
+        records = []
+        for item in items:
+            key = (item.get('history', {}).get('bvid', ''), item['view_at'])
+            if key in existing_records or key in deleted_records:
+                continue
+            existing_records.add(key)
+            records.append(history_entry_to_record(item))
+        if records:
+            cursor.executemany(INSERT_DATA.format(table=year_table, placeholders=placeholders), records)
+            total_inserted += len(records)
+    return total_inserted
+
+def refresh_derived_tables(conn):
+    """新增历史记录后更新全局查找表、备注表、观看习惯立方体和输入提示"""
+    # 新增记录加入全局 cid/bvid 查找表和备注表
+    from scripts.history_index import sync_history_index
+    sync_history_index(conn)
+
+    # 把新增记录聚合进观看习惯立方体
+    from scripts.viewing_cube import refresh_viewing_cube
+    refresh_viewing_cube()
+
+    # 新增的标题、UP主和标签加入输入提示
+    from scripts.history_suggest import refresh_history_suggest
+    refresh_history_suggest()
+
 def get_last_import_time():
     """获取上次导入时间"""
     try:
@@ -165,6 +299,7 @@ def import_data_from_json(conn, table_name, file_path, last_import_time=0, batch
         # 按年份分组数据
         data_by_year = {}
         has_new_records = False
+        sealed = set(sealed_years())
 
         # 获取现有记录的bvid和view_at组合
         cursor = conn.cursor()
@@ -218,64 +353,17 @@ def import_data_from_json(conn, table_name, file_path, last_import_time=0, batch
                 logger.debug(f"跳过已删除的记录: {item.get('title')} - {datetime.fromtimestamp(view_at)}")
                 continue
 
-            has_new_records = True
             year = datetime.fromtimestamp(view_at).year
+            # 封存的年份是只读的
+            if year in sealed:
+                logger.debug(f"跳过已封存年份的记录: {item.get('title')} - {datetime.fromtimestamp(view_at)}")
+                continue
+
+            has_new_records = True
             if year not in data_by_year:
                 data_by_year[year] = []
 
-            main_category = None
-            business = history.get('business', '')
-            tag_name = item.get('tag_name', '').strip()
-
-            if business == 'archive':
-                if tag_name in unique_tag_to_main:
-                    main_category = unique_tag_to_main[tag_name]
-                elif tag_name in duplicated_tags:
-                    main_category = '待定'
-                else:
-                    main_category = '待定'
-
-            # 从正确的位置获取duration和progress
-            duration = item.get('duration', 0)  # 从item对象获取视频总时长
-            progress = item.get('progress', 0)  # 从item对象获取观看进度
-
-            record = (
-                id_generator.get_id(),
-                item.get('title', ''),
-                item.get('long_title', ''),
-                item.get('cover', ''),
-                json.dumps(item.get('covers', [])),
-                item.get('uri', ''),
-                history.get('oid', 0),
-                history.get('epid', 0),
-                bvid,
-                history.get('page', 1),
-                history.get('cid', 0),
-                history.get('part', ''),
-                business,
-                history.get('dt', 0),
-                history.get('videos', 0),
-                item.get('author_name', ''),
-                item.get('author_face', ''),
-                item.get('author_mid', 0),
-                view_at,
-                progress,  # 使用从item对象获取的观看进度
-                item.get('badge', ''),
-                item.get('show_title', ''),
-                duration,  # 使用从item对象获取的视频总时长
-                item.get('current', ''),
-                item.get('total', 0),
-                item.get('new_desc', ''),
-                item.get('is_finish', 0),
-                item.get('is_fav', 0),
-                history.get('kid', 0),
-                tag_name,
-                item.get('live_status', 0),
-                main_category,
-                '',  # 默认的空备注
-                0   # 默认的备注时间为0
-            )
-
+            record = history_entry_to_record(item)
             data_by_year[year].append(record)
             existing_records.add((bvid, view_at))  # 添加到已存在记录集合中
 
@@ -433,6 +521,9 @@ def import_all_history_files(sync_deleted=False):
             logger.info("\n没有新记录需要插入")
         logger.info("================\n")
 
+        if total_records > 0:
+            refresh_derived_tables(conn)
+
         message = f"数据导入完成，共插入 {total_records} 条记录。"
         return {"status": "success", "message": message, "inserted_count": total_records}
 
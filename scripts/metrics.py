@@ -0,0 +1,551 @@
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+from loguru import logger
+
+from scripts.utils import get_config, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+# 延迟分桶（秒），覆盖从毫秒级的 SQLite 语句到分钟级的计划任务
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# 超出上限的标签组合合并到这个标签值，避免 SQL 或 URL 过多时指标无限增长
+OVERFLOW_LABEL = '__other__'
+
+
+def _settings() -> Dict[str, Any]:
+    try:
+        return get_config().get('metrics', {}) or {}
+    except Exception:
+        return {}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), max_series: int = 500):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _key(self, labels: Sequence[Any]) -> Tuple[str, ...]:
+        key = tuple(str(v) for v in labels)
+        if key not in self._values and len(self._values) >= self.max_series:
+            return (OVERFLOW_LABEL,) * len(self.labelnames)
+        return key
+
+    def _samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def inc(self, labels: Sequence[Any] = (), amount: float = 1) -> None:
+        with self._lock:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """可以直接设置，也可以注册回调在导出时读取（如队列长度）"""
+    metric_type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, labels: Sequence[Any], value: float) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, labels: Sequence[Any] = (), amount: float = 1) -> None:
+        with self._lock:
+            key = self._key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, labels: Sequence[Any] = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+    def set_function(self, labels: Sequence[Any], func: Callable[[], float]) -> None:
+        with self._lock:
+            self._functions[tuple(str(v) for v in labels)] = func
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for labels, func in functions:
+            try:
+                values[labels] = float(func())
+            except Exception:
+                # 回调依赖的对象还未创建或已关闭，这次导出跳过
+                continue
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels: Sequence[Any], value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(labels)
+            state = self._values.get(key)
+            if state is None:
+                # [各分桶计数（非累计）..., 超出最大分桶的计数, 总和]
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def _samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(labels, list(state)) for labels, state in self._values.items()]
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {repr(float(state[-1]))}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class MetricsRegistry:
+    """进程内的指标注册表，/metrics 以 Prometheus 文本格式导出"""
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'MetricsRegistry':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        settings = _settings()
+        self.enabled = bool(settings.get('enabled', True))
+        self.max_series = int(settings.get('max_series', 500))
+        self._metrics: Dict[str, _Metric] = {}
+        self._register_lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> Any:
+        with self._register_lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames,
+                                                   max_series=self.max_series, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._register_lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry.get_instance()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    'bili_http_request_duration_seconds', '接口处理耗时（按路由模板）', ('method', 'route'))
+HTTP_REQUESTS = registry.counter(
+    'bili_http_requests_total', '接口请求数（按路由模板和状态码）', ('method', 'route', 'status'))
+HTTP_IN_PROGRESS = registry.gauge('bili_http_requests_in_progress', '正在处理的接口请求数')
+
+SQLITE_STATEMENT_DURATION = registry.histogram(
+    'bili_sqlite_statement_duration_seconds', 'SQLite 语句执行耗时（按归一化 SQL）', ('statement',))
+SQLITE_FETCH_DURATION = registry.histogram(
+    'bili_sqlite_fetch_duration_seconds', 'SQLite 结果读取（fetchall/fetchmany）耗时（按归一化 SQL）', ('statement',))
+
+UPSTREAM_DURATION = registry.histogram(
+    'bili_upstream_request_duration_seconds', '外部 HTTP 请求耗时（按主机和接口路径）', ('client', 'host', 'endpoint'))
+UPSTREAM_REQUESTS = registry.counter(
+    'bili_upstream_requests_total', '外部 HTTP 请求数（按主机、接口路径和状态码）', ('host', 'endpoint', 'status'))
+
+WORKER_QUEUE_DEPTH = registry.gauge('bili_worker_queue_depth', '后台任务队列中等待处理的数量', ('queue',))
+DOWNLOADS_IN_PROGRESS = registry.gauge('bili_downloads_in_progress', '正在执行的 yutto 下载数')
+DOWNLOAD_DURATION = registry.histogram('bili_download_duration_seconds', 'yutto 下载耗时')
+
+SCHEDULER_JOB_DURATION = registry.histogram(
+    'bili_scheduler_job_duration_seconds', '计划任务执行耗时', ('task_id', 'kind', 'result'))
+
+
+# ---- 接口请求 ----
+
+_PATH_PARAM = re.compile(r'{(\w+)(?::[^}]*)?}')
+
+
+def route_template(scope) -> str:
+    """请求对应的路由模板，如 /history/by_cid/{cid}
+
+    include_router 的前缀在不同 FastAPI 版本中有的并入 route.path，有的不并入；
+    用路径参数还原出路由匹配的那段实际路径，实际路径中它前面的部分就是前缀。
+    """
+    route = scope.get('route')
+    template = getattr(route, 'path', None)
+    path = scope.get('path', '')
+    if template is None:
+        return '/static' if path.startswith('/static/') else 'unmatched'
+    params = scope.get('path_params') or {}
+    concrete = _PATH_PARAM.sub(lambda m: str(params.get(m.group(1), '')), template)
+    if concrete and path.endswith(concrete):
+        return path[:len(path) - len(concrete)] + template
+    return template
+
+
+class MetricsMiddleware:
+    """统计每个路由的处理耗时和状态码（纯 ASGI 中间件，不缓冲响应体，流式响应同样适用）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        HTTP_IN_PROGRESS.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_PROGRESS.dec()
+            # 路由匹配后 FastAPI 把路由对象写入 scope，使用路由模板而不是实际路径
+            route = route_template(scope)
+            method = scope.get('method', '')
+            HTTP_REQUEST_DURATION.observe((method, route), time.perf_counter() - started)
+            HTTP_REQUESTS.inc((method, route, status[0]))
+
+
+# ---- SQLite 语句 ----
+
+_SQL_YEAR_NAMES = re.compile(r'\b(bilibili_history|history_v2|sealed)_(\d{4})')
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SQL_MAX_LENGTH = 240
+_normalized_sql: Dict[str, str] = {}
+
+
+def normalize_sql(sql: str) -> str:
+    """把 SQL 归一化为统计标签：年份表名换成 {year}，字面量和 IN 列表换成占位符，合并空白"""
+    normalized = _normalized_sql.get(sql)
+    if normalized is not None:
+        return normalized
+    text = _SQL_YEAR_NAMES.sub(r'\1_{year}', sql)
+    text = _SQL_LITERALS.sub('?', text)
+    text = _SQL_IN_LIST.sub('(?, ...)', text)
+    normalized = ' '.join(text.split())[:_SQL_MAX_LENGTH]
+    if len(_normalized_sql) >= 4096:
+        _normalized_sql.clear()
+    _normalized_sql[sql] = normalized
+    return normalized
+
+
+def _slow_threshold() -> Optional[float]:
+    from scripts.slow_query_log import threshold_seconds
+    return threshold_seconds()
+
+
+# 统计开关和慢查询阈值在导入时读取，每条语句只做一次比较
+_OBSERVE_SQLITE = registry.enabled and bool(_settings().get('sqlite', True))
+_SLOW_THRESHOLD = _slow_threshold()
+
+
+def _trace_slow(cursor: sqlite3.Cursor, sql: str, parameters: Any, elapsed: float) -> None:
+    try:
+        from scripts.slow_query_log import SlowQueryLog
+        SlowQueryLog.get_instance().record(cursor.connection, sql, parameters, elapsed, normalize_sql(sql))
+    except Exception as e:
+        logger.debug(f"记录慢查询失败: {e}")
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """记录每条语句执行耗时的游标，超过慢查询阈值的语句交给 SlowQueryLog 分析
+
+    SQLite 的 SELECT 在 execute 时只执行到第一行，之后的工作发生在 fetchone/fetchall/fetchmany
+    或逐行迭代中，慢查询按两者之和判断。逐行迭代的耗时累加后一起记录：迭代结束、游标再次执行
+    或关闭时记录；提前中断迭代后直接丢弃的游标不记录这部分耗时。
+    """
+
+    _statement = ''
+    _parameters: Any = ()
+    _elapsed = 0.0
+    _iter_elapsed = 0.0
+
+    def _finish(self, sql: str, parameters: Any, elapsed: float) -> None:
+        self._statement, self._parameters, self._elapsed = sql, parameters, elapsed
+        if _OBSERVE_SQLITE:
+            SQLITE_STATEMENT_DURATION.observe((normalize_sql(sql),), elapsed)
+        if _SLOW_THRESHOLD is not None and elapsed >= _SLOW_THRESHOLD:
+            _trace_slow(self, sql, parameters, elapsed)
+
+    def _flush_iteration(self) -> None:
+        if self._iter_elapsed:
+            elapsed, self._iter_elapsed = self._iter_elapsed, 0.0
+            self._finish_fetch(elapsed)
+
+    def _finish_fetch(self, elapsed: float) -> None:
+        if _OBSERVE_SQLITE:
+            SQLITE_FETCH_DURATION.observe((normalize_sql(self._statement),), elapsed)
+        total = self._elapsed + elapsed
+        # execute 阶段已经超过阈值的语句在那时记录过
+        if _SLOW_THRESHOLD is not None and total >= _SLOW_THRESHOLD > self._elapsed:
+            _trace_slow(self, self._statement, self._parameters, total)
+
+    def execute(self, sql, parameters=()):
+        self._flush_iteration()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._finish(sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._flush_iteration()
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            # 参数序列已被消耗，慢查询分析时不带参数（只分析不需要参数的语句）
+            self._finish(sql, None, time.perf_counter() - started)
+
+    def executescript(self, sql_script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            if _OBSERVE_SQLITE:
+                SQLITE_STATEMENT_DURATION.observe(('executescript',), time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._finish_fetch(time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._finish_fetch(time.perf_counter() - started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(size) if size is not None else super().fetchmany()
+        finally:
+            self._finish_fetch(time.perf_counter() - started)
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._iter_elapsed += time.perf_counter() - started
+            self._flush_iteration()
+            raise
+        self._iter_elapsed += time.perf_counter() - started
+        return row
+
+    def close(self):
+        self._flush_iteration()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """conn.execute 和 conn.cursor() 都返回 InstrumentedCursor"""
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    # 内置的 Connection.execute 不经过 cursor() 方法，这里显式使用计时游标
+    def execute(self, sql, parameters=()):
+        cursor = self.cursor()
+        cursor.execute(sql, parameters)
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        cursor = self.cursor()
+        cursor.executemany(sql, seq_of_parameters)
+        return cursor
+
+    def executescript(self, sql_script):
+        cursor = self.cursor()
+        cursor.executescript(sql_script)
+        return cursor
+
+
+def sqlite_factory() -> type:
+    """sqlite3.connect 的 factory 参数：开启 SQLite 统计或慢查询日志时返回带计时的连接类"""
+    if _OBSERVE_SQLITE or _SLOW_THRESHOLD is not None:
+        return InstrumentedConnection
+    return sqlite3.Connection
+
+
+# ---- 外部 HTTP 请求 ----
+
+_PATH_IDS = re.compile(r'/(?:\d+|BV[0-9A-Za-z]{10}|av\d+|[0-9a-f]{32,})(?=/|$)')
+# 图片和视频 CDN 的路径是文件名，只按主机统计
+_CDN_SUFFIXES = ('hdslb.com', 'bilivideo.com', 'bilivideo.cn', 'akamaized.net', 'biliimg.com')
+
+
+def upstream_labels(url: Any) -> Tuple[str, str]:
+    """URL -> (主机, 接口路径)，路径中的数字 id、BV 号等换成 :id"""
+    parts = urlsplit(str(url))
+    host = (parts.hostname or '').lower()
+    if host.endswith(_CDN_SUFFIXES):
+        return host, '*'
+    return host, _PATH_IDS.sub('/:id', parts.path or '/')
+
+
+def _observe_upstream(client: str, url: Any, status: Any, elapsed: float) -> None:
+    host, endpoint = upstream_labels(url)
+    UPSTREAM_DURATION.observe((client, host, endpoint), elapsed)
+    UPSTREAM_REQUESTS.inc((host, endpoint, status))
+
+
+_hooks_installed = False
+
+
+def install_http_hooks() -> None:
+    """在 requests、httpx、aiohttp 的传输层统计外部请求耗时和状态码
+
+    项目中各模块直接使用这三个库发请求，在传输层挂钩子不需要修改每个调用点。
+    """
+    global _hooks_installed
+    if _hooks_installed or not registry.enabled or not _settings().get('upstream', True):
+        return
+    _hooks_installed = True
+
+    try:
+        from requests.adapters import HTTPAdapter
+        original_send = HTTPAdapter.send
+
+        def send(self, request, *args, **kwargs):
+            started, status = time.perf_counter(), 'error'
+            try:
+                response = original_send(self, request, *args, **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                _observe_upstream('requests', request.url, status, time.perf_counter() - started)
+
+        HTTPAdapter.send = send
+    except ImportError:
+        pass
+
+    try:
+        import httpx
+        original_async = httpx.AsyncHTTPTransport.handle_async_request
+        original_sync = httpx.HTTPTransport.handle_request
+
+        async def handle_async_request(self, request):
+            started, status = time.perf_counter(), 'error'
+            try:
+                response = await original_async(self, request)
+                status = response.status_code
+                return response
+            finally:
+                _observe_upstream('httpx', request.url, status, time.perf_counter() - started)
+
+        def handle_request(self, request):
+            started, status = time.perf_counter(), 'error'
+            try:
+                response = original_sync(self, request)
+                status = response.status_code
+                return response
+            finally:
+                _observe_upstream('httpx', request.url, status, time.perf_counter() - started)
+
+        httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+        httpx.HTTPTransport.handle_request = handle_request
+    except ImportError:
+        pass
+
+    try:
+        import aiohttp
+        original_request = aiohttp.ClientSession._request
+
+        async def _request(self, method, str_or_url, *args, **kwargs):
+            started, status = time.perf_counter(), 'error'
+            try:
+                response = await original_request(self, method, str_or_url, *args, **kwargs)
+                status = response.status
+                return response
+            finally:
+                _observe_upstream('aiohttp', str_or_url, status, time.perf_counter() - started)
+
+        aiohttp.ClientSession._request = _request
+    except ImportError:
+        pass
+
+    logger.info("已开启外部 HTTP 请求统计")
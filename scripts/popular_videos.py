@@ -17,6 +17,7 @@ from typing import Dict, Any, List, Optional, Tuple
 
 import requests
 
+from scripts.metrics import sqlite_factory
 from scripts.wbi_sign import get_wbi_sign
 from scripts.utils import get_output_path, get_database_path
 
@@ -40,7 +41,7 @@ def get_db_connection(year=None):
     # 构建基于年份的数据库路径
     db_filename = f"bilibili_popular_{year}.db"
     db_path = get_database_path(db_filename)
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, factory=sqlite_factory())
 
     # 创建表
     create_tables(conn)
@@ -0,0 +1,200 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, Union
+
+from loguru import logger
+
+from scripts.utils import get_config, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+# TTL 可以是固定秒数，也可以是根据结果计算秒数的函数（返回 0 表示不缓存）
+TTL = Union[float, Callable[[Any], float]]
+Loader = Callable[[], Awaitable[Any]]
+
+
+class CacheEntry:
+    """缓存条目"""
+
+    __slots__ = ('value', 'stored_at', 'expires_at', 'stale_until')
+
+    def __init__(self, value: Any, ttl: float, stale_ttl: float):
+        now = time.monotonic()
+        self.value = value
+        self.stored_at = now
+        self.expires_at = now + ttl
+        self.stale_until = self.expires_at + stale_ttl
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def is_usable(self, now: float) -> bool:
+        return now < self.stale_until
+
+
+class ResponseCache:
+    """上游接口响应缓存
+
+    - 按命名空间区分不同接口，每次调用可指定独立的 TTL
+    - 同一个键同时只会有一个上游请求在进行，其余请求等待同一个结果
+    - 过期但仍在 stale 窗口内的条目会被立即返回，同时在后台刷新
+    - 上游失败时回退到任意年龄的旧条目
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'ResponseCache':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        settings = self._settings()
+        self.max_entries = int(settings.get('max_entries', 2000))
+        self._entries: 'OrderedDict[Tuple[str, Hashable], CacheEntry]' = OrderedDict()
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def _settings() -> Dict[str, Any]:
+        try:
+            return get_config().get('response_cache', {}) or {}
+        except Exception:
+            return {}
+
+    @classmethod
+    def setting(cls, name: str, default: Any) -> Any:
+        """读取 response_cache 配置项"""
+        return cls._settings().get(name, default)
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return bool(cls.setting('enabled', True))
+
+    def _count(self, namespace: str, field: str) -> None:
+        stats = self._stats.setdefault(namespace, {
+            'hits': 0, 'stale_hits': 0, 'misses': 0, 'coalesced': 0, 'fallbacks': 0, 'errors': 0
+        })
+        stats[field] += 1
+
+    def peek(self, namespace: str, key: Hashable) -> Optional[CacheEntry]:
+        """获取条目（不检查是否过期）"""
+        return self._entries.get((namespace, key))
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: float, stale_ttl: float = 0) -> None:
+        if ttl <= 0:
+            return
+        full_key = (namespace, key)
+        self._entries[full_key] = CacheEntry(value, ttl, stale_ttl)
+        self._entries.move_to_end(full_key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str, key: Optional[Hashable] = None) -> int:
+        """删除指定键，未指定键时清空整个命名空间"""
+        if key is not None:
+            return 1 if self._entries.pop((namespace, key), None) is not None else 0
+        targets = [k for k in self._entries if k[0] == namespace]
+        for k in targets:
+            del self._entries[k]
+        return len(targets)
+
+    async def _load(self, namespace: str, key: Hashable, loader: Loader, ttl: TTL, stale_ttl: float) -> Any:
+        """执行上游请求，同一个键的并发调用共享同一个结果"""
+        full_key = (namespace, key)
+        future = self._inflight.get(full_key)
+        if future is not None:
+            self._count(namespace, 'coalesced')
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await loader()
+            seconds = ttl(value) if callable(ttl) else ttl
+            self.set(namespace, key, value, seconds, stale_ttl)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时取出异常，避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(full_key, None)
+
+    def schedule_refresh(self, namespace: str, key: Hashable, loader: Loader, ttl: TTL, stale_ttl: float = 0) -> None:
+        """在后台刷新条目，已有请求在进行时不会重复发起"""
+        if (namespace, key) in self._inflight:
+            return
+
+        async def _refresh():
+            try:
+                await self._load(namespace, key, loader, ttl, stale_ttl)
+            except Exception as e:
+                self._count(namespace, 'errors')
+                logger.warning(f"后台刷新缓存失败 {namespace}:{key}: {e}")
+
+        asyncio.get_running_loop().create_task(_refresh())
+
+    async def get_or_load(
+        self,
+        namespace: str,
+        key: Hashable,
+        loader: Loader,
+        ttl: TTL,
+        stale_ttl: float = 0,
+        force_refresh: bool = False,
+        fallback: Optional[Callable[[], Any]] = None,
+    ) -> Tuple[Any, str]:
+        """获取缓存结果，必要时调用 loader
+
+        Returns:
+            (结果, 来源)，来源为 fresh / stale / upstream / fallback
+        """
+        now = time.monotonic()
+        entry = self._entries.get((namespace, key))
+        if entry is not None and not force_refresh:
+            if entry.is_fresh(now):
+                self._entries.move_to_end((namespace, key))
+                self._count(namespace, 'hits')
+                return entry.value, 'fresh'
+            if entry.is_usable(now):
+                self._count(namespace, 'stale_hits')
+                self.schedule_refresh(namespace, key, loader, ttl, stale_ttl)
+                return entry.value, 'stale'
+
+        self._count(namespace, 'misses')
+        try:
+            return await self._load(namespace, key, loader, ttl, stale_ttl), 'upstream'
+        except Exception as e:
+            self._count(namespace, 'errors')
+            if entry is not None:
+                self._count(namespace, 'fallbacks')
+                logger.warning(f"上游请求失败，使用过期缓存 {namespace}:{key}: {e}")
+                return entry.value, 'fallback'
+            if fallback is not None:
+                value = await asyncio.to_thread(fallback)
+                if value is not None:
+                    self._count(namespace, 'fallbacks')
+                    logger.warning(f"上游请求失败，使用本地数据 {namespace}:{key}: {e}")
+                    return value, 'fallback'
+            raise
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'inflight': len(self._inflight),
+            'namespaces': {name: dict(stats) for name, stats in self._stats.items()},
+        }
@@ -2,6 +2,7 @@ import asyncio
 import calendar
 import os
 import threading
+import time
 import traceback
 from datetime import datetime, timedelta
 from typing import Optional, List
@@ -11,8 +12,10 @@ import schedule
 import yaml
 from loguru import logger
 
+from scripts.metrics import SCHEDULER_JOB_DURATION
 from scripts.scheduler_db_enhanced import EnhancedSchedulerDB  # 修改为导入增强版数据库
-from scripts.utils import get_base_path, load_config, get_config_path, setup_logger
+from scripts.scheduler_tasks import TaskRegistry
+from scripts.utils import get_base_path, get_config, load_config, get_config_path, setup_logger
 
 # 确保日志系统已初始化
 setup_logger()
@@ -48,6 +51,10 @@ class SchedulerManager:
         self.is_running = False
         self.log_capture = None
         self.current_log_file = None
+        # 任务链统一在主事件循环上执行，调度线程通过它提交任务
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._running_chains = set()
+        self.registry = TaskRegistry.get_instance()
 
         # 从config.yaml读取服务器配置
         config = load_config()
@@ -320,19 +327,9 @@ class SchedulerManager:
         # 创建一个同步的执行函数
         def sync_execute_task(task_name):
             try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-
-            try:
-                task = loop.create_task(self.execute_task_chain(task_name))
-                loop.run_until_complete(asyncio.gather(task))
+                self._submit_task_chain(task_name)
             except Exception as e:
                 print(f"执行任务时发生错误: {str(e)}")
-            finally:
-                if loop and not loop.is_running():
-                    loop.close()
 
         for task_name, task in self.tasks.items():
             if task.get('schedule_type') == 'daily':
@@ -550,24 +547,11 @@ class SchedulerManager:
             print(f"当前时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             print(f"任务名称: {task_name}")
 
-            # 获取或创建事件循环
+            # schedule 在主事件循环中回调，不能阻塞等待，提交后立即返回
             try:
-                loop = asyncio.get_event_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-
-            # 在事件循环中执行异步任务
-            try:
-                # 创建任务并等待其完成
-                task = loop.create_task(self.execute_task_chain(task_name))
-                loop.run_until_complete(asyncio.gather(task))
+                self._submit_task_chain(task_name)
             except Exception as e:
                 print(f"执行任务时发生错误: {str(e)}")
-            finally:
-                # 如果我们创建了新的事件循环，需要关闭它
-                if loop and not loop.is_running():
-                    loop.close()
 
         for task_name, task in self.tasks.items():
             print(f"\n--- 处理任务: {task_name} ---")
@@ -750,6 +734,7 @@ class SchedulerManager:
     async def run_scheduler(self):
         """运行调度器"""
         print(f"\n=== 开始运行调度器 [{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] ===")
+        self._loop = asyncio.get_running_loop()
 
         # 重新加载配置并设置任务
         self.load_scheduler_config()
@@ -797,10 +782,42 @@ class SchedulerManager:
         """停止调度器"""
         self.is_running = False
 
+        # 取消正在执行的任务链
+        if self._loop is not None and not self._loop.is_closed():
+            for task in list(self._running_chains):
+                self._loop.call_soon_threadsafe(task.cancel)
+        self.registry.shutdown()
+
         # 关闭数据库连接
         if hasattr(self, 'db'):
             self.db.close()
 
+    async def _run_tracked_chain(self, task_name: str) -> bool:
+        """执行任务链并登记，以便停止调度器时取消"""
+        task = asyncio.current_task()
+        self._running_chains.add(task)
+        try:
+            return await self.execute_task_chain(task_name)
+        finally:
+            self._running_chains.discard(task)
+
+    def _submit_task_chain(self, task_name: str):
+        """把任务链提交到主事件循环执行，可以在任意线程中调用
+
+        在事件循环线程中调用时返回 asyncio.Task，在其他线程中调用时返回
+        concurrent.futures.Future，可通过 result() 等待结果。
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            raise RuntimeError("调度器事件循环未运行")
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            return loop.create_task(self._run_tracked_chain(task_name))
+        return asyncio.run_coroutine_threadsafe(self._run_tracked_chain(task_name), loop)
+
     def reload_scheduler(self):
         """重新加载调度配置"""
         print("\n=== 重新加载调度配置 ===")
@@ -944,61 +961,38 @@ class SchedulerManager:
         print(f"当前时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
         try:
-            # 获取当前事件循环，如果没有则创建新的
-            try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                should_close_loop = True
-            else:
-                should_close_loop = False
-
-            # 在事件循环中执行任务
-            try:
-                # 创建任务并等待其完成
-                if loop.is_running():
-                    try:
-                        # 如果循环已经在运行，使用asyncio.run_coroutine_threadsafe
-                        future = asyncio.run_coroutine_threadsafe(
-                            self.execute_task_chain(task_name),
-                            loop
-                        )
-                        result = future.result()
-                    except RuntimeError as re:
-                        # 处理"This event loop is already running"错误
-                        if "This event loop is already running" in str(re):
-                            print(f"执行任务时发生事件循环错误: {str(re)}，任务将被跳过")
-                            # 记录错误
-                            self._record_task_failure(
-                                task_name,
-                                datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                f"事件循环错误: {str(re)}",
-                                "scheduler"
-                            )
-                            return False
-                        else:
-                            raise  # 重新引发其他RuntimeError
-                else:
-                    # 如果循环未运行，正常执行
-                    task = asyncio.ensure_future(self.execute_task_chain(task_name), loop=loop)
-                    result = loop.run_until_complete(task)
-                return result
-            finally:
-                # 只关闭我们创建的事件循环
-                if should_close_loop and not loop.is_running():
-                    loop.close()
+            future = self._submit_task_chain(task_name)
+            if isinstance(future, asyncio.Task):
+                # 在事件循环线程中不能阻塞等待，任务已在后台执行
+                return True
+            return future.result()
         except Exception as e:
             print(f"执行任务时发生错误: {str(e)}")
             return False
 
     async def _execute_single_task(self, task_id: str, is_sub_task: bool = False) -> bool:
-        """执行单个任务（主任务或子任务）"""
+        """执行单个任务并记录耗时指标"""
+        started = time.perf_counter()
+        success = False
+        try:
+            success = await self._run_single_task(task_id, is_sub_task)
+            return success
+        finally:
+            SCHEDULER_JOB_DURATION.observe(
+                (task_id, 'sub' if is_sub_task else 'main', 'success' if success else 'failure'),
+                time.perf_counter() - started)
+
+    async def _run_single_task(self, task_id: str, is_sub_task: bool = False) -> bool:
+        """执行单个任务（主任务或子任务）
+
+        已在 TaskRegistry 中注册的接口直接在进程内调用，其余接口通过 HTTP 请求本服务。
+        """
         print(f"\n=== 执行{'子' if is_sub_task else ''}任务: {task_id} ===")
 
         start_time = datetime.now()
         start_time_str = start_time.strftime('%Y-%m-%d %H:%M:%S')
         triggered_by = "manual" if not hasattr(self, 'current_chain') else f"chain:{self.current_chain}"
+        timeout = 300
 
         try:
             task = None
@@ -1012,105 +1006,136 @@ class SchedulerManager:
                 self._record_task_failure(task_id, start_time_str, "任务不存在", triggered_by)
                 return False
 
-            # 确保base_url有协议前缀
-            base_url = self.base_url
-            if not base_url.startswith(('http://', 'https://')):
-                base_url = f"http://{base_url}"
-                print(f"警告: base_url未包含协议前缀，已自动添加http://前缀")
-
-            # 构建完整URL
             endpoint = task['endpoint']
-            if endpoint.startswith('/'):
-                url = f"{base_url}{endpoint}"
-            else:
-                url = f"{base_url}/{endpoint}"
-
-            print(f"请求URL: {url}")
             method = task.get('method', 'GET').upper()
             params = task.get('params', {})
             timeout = task.get('timeout', 300)
 
-            # 强制将所有调度任务设置为内部API调用类型
-            task['task_type'] = 'internal_api'
+            registered = None
+            if get_config().get('scheduler', {}).get('in_process', True):
+                registered = self.registry.resolve(endpoint, method)
 
-            # 从配置中获取API密钥
-            try:
-                config = load_config()
-                api_security = config.get('server', {}).get('api_security', {})
-                api_enabled = api_security.get('enabled', False)
-                api_key = api_security.get('api_key', '')
-
-                logger.info(f"API安全状态: enabled={api_enabled}, API密钥长度: {len(api_key) if api_key else 0}")
-                print(f"API安全状态: enabled={api_enabled}, API密钥长度: {len(api_key) if api_key else 0}")
-
-                # 检查任务类型是否是内部API调用
-                task_type = task.get('task_type', '')
-                logger.info(f"任务 {task_id} 类型: {task_type}")
-                print(f"任务 {task_id} 类型: {task_type}")
-
-                if task_type == 'internal_api':
-                    # 内部API调用不需要验证API密钥
-                    logger.info(f"任务 {task_id} 是内部API调用，跳过API密钥验证")
-                    print(f"任务 {task_id} 是内部API调用，跳过API密钥验证")
-                    headers = {'X-Internal-Call': 'true'}
-                elif api_security.get('enabled', False):
-                    # 普通任务，添加API密钥
-                    api_key = api_security.get('api_key', '')
-                    headers = {'X-API-Key': api_key}
-                    logger.info(f"任务 {task_id} 已添加API密钥到请求头，密钥长度: {len(api_key)}")
-                    print(f"任务 {task_id} 已添加API密钥到请求头，密钥长度: {len(api_key)}")
-                else:
-                    # API安全验证未启用
-                    headers = {}
-                    logger.info(f"API安全验证未启用，不添加API密钥")
-                    print(f"API安全验证未启用，不添加API密钥")
-            except Exception as e:
-                logger.error(f"获取API密钥失败: {str(e)}")
-                print(f"获取API密钥失败: {str(e)}")
-                headers = {}
+            if registered is not None:
+                print(f"进程内执行: {method} {registered.endpoint}")
+                result = await self.registry.run(registered, params, timeout)
+            else:
+                result = await self._request_task_endpoint(task_id, task, endpoint, method, params, timeout)
+                if result is None:
+                    return False
 
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                if method == 'GET':
-                    response = await client.get(url, params=params, headers=headers)
-                else:
-                    response = await client.post(url, json=params, headers=headers)
+            end_time = datetime.now()
+            end_time_str = end_time.strftime('%Y-%m-%d %H:%M:%S')
+            duration = (end_time - start_time).total_seconds()
 
-                end_time = datetime.now()
-                end_time_str = end_time.strftime('%Y-%m-%d %H:%M:%S')
-                duration = (end_time - start_time).total_seconds()
-
-                if response.status_code == 200:
-                    result = response.json()
-                    if result.get("status") == "success":
-                        print(f"任务 {task_id} 执行成功")
-                        self.task_status[task_id] = True
-                        self.db.record_task_execution_enhanced(
-                            task_id=task_id,
-                            start_time=start_time_str,
-                            end_time=end_time_str,
-                            duration=duration,
-                            status="success",
-                            triggered_by=triggered_by,
-                            output=str(result)
-                        )
-                        return True
-                    else:
-                        error_msg = result.get('message', '未知错误')
-                        print(f"任务 {task_id} 执行失败: {error_msg}")
-                        self._record_task_failure(task_id, start_time_str, error_msg, triggered_by)
-                        return False
-                else:
-                    error_msg = f"请求失败: {response.status_code}"
-                    print(f"任务 {task_id} 请求失败: {response.status_code}")
-                    self._record_task_failure(task_id, start_time_str, error_msg, triggered_by)
-                    return False
+            if result.get("status") == "success":
+                print(f"任务 {task_id} 执行成功")
+                self.task_status[task_id] = True
+                self.db.record_task_execution_enhanced(
+                    task_id=task_id,
+                    start_time=start_time_str,
+                    end_time=end_time_str,
+                    duration=duration,
+                    status="success",
+                    triggered_by=triggered_by,
+                    output=str(result)
+                )
+                return True
+            else:
+                error_msg = result.get('message', '未知错误')
+                print(f"任务 {task_id} 执行失败: {error_msg}")
+                self._record_task_failure(task_id, start_time_str, error_msg, triggered_by)
+                return False
 
+        except asyncio.CancelledError:
+            print(f"任务 {task_id} 已取消")
+            try:
+                self._record_task_failure(task_id, start_time_str, "任务已取消", triggered_by)
+            except Exception:
+                # 停止调度器时数据库可能已关闭
+                pass
+            raise
+        except asyncio.TimeoutError:
+            error_msg = f"任务执行超时（{timeout} 秒）"
+            print(f"任务 {task_id} {error_msg}")
+            self._record_task_failure(task_id, start_time_str, error_msg, triggered_by)
+            return False
         except Exception as e:
             error_msg = str(e)
             print(f"执行任务时发生错误: {error_msg}")
             self._record_task_failure(task_id, start_time_str, error_msg, triggered_by)
             return False
 
+    async def _request_task_endpoint(self, task_id, task, endpoint, method, params, timeout) -> Optional[dict]:
+        """通过 HTTP 请求本服务执行任务，请求失败时记录失败并返回 None"""
+        start_time_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        triggered_by = "manual" if not hasattr(self, 'current_chain') else f"chain:{self.current_chain}"
+
+        # 确保base_url有协议前缀
+        base_url = self.base_url
+        if not base_url.startswith(('http://', 'https://')):
+            base_url = f"http://{base_url}"
+            print(f"警告: base_url未包含协议前缀，已自动添加http://前缀")
+
+        # 构建完整URL
+        if endpoint.startswith('/'):
+            url = f"{base_url}{endpoint}"
+        else:
+            url = f"{base_url}/{endpoint}"
+
+        print(f"请求URL: {url}")
+
+        # 强制将所有调度任务设置为内部API调用类型
+        task['task_type'] = 'internal_api'
+
+        # 从配置中获取API密钥
+        try:
+            config = load_config()
+            api_security = config.get('server', {}).get('api_security', {})
+            api_enabled = api_security.get('enabled', False)
+            api_key = api_security.get('api_key', '')
+
+            logger.info(f"API安全状态: enabled={api_enabled}, API密钥长度: {len(api_key) if api_key else 0}")
+            print(f"API安全状态: enabled={api_enabled}, API密钥长度: {len(api_key) if api_key else 0}")
+
+            # 检查任务类型是否是内部API调用
+            task_type = task.get('task_type', '')
+            logger.info(f"任务 {task_id} 类型: {task_type}")
+            print(f"任务 {task_id} 类型: {task_type}")
+
+            if task_type == 'internal_api':
+                # 内部API调用不需要验证API密钥
+                logger.info(f"任务 {task_id} 是内部API调用，跳过API密钥验证")
+                print(f"任务 {task_id} 是内部API调用，跳过API密钥验证")
+                headers = {'X-Internal-Call': 'true'}
+            elif api_security.get('enabled', False):
+                # 普通任务，添加API密钥
+                api_key = api_security.get('api_key', '')
+                headers = {'X-API-Key': api_key}
+                logger.info(f"任务 {task_id} 已添加API密钥到请求头，密钥长度: {len(api_key)}")
+                print(f"任务 {task_id} 已添加API密钥到请求头，密钥长度: {len(api_key)}")
+            else:
+                # API安全验证未启用
+                headers = {}
+                logger.info(f"API安全验证未启用，不添加API密钥")
+                print(f"API安全验证未启用，不添加API密钥")
+        except Exception as e:
+            logger.error(f"获取API密钥失败: {str(e)}")
+            print(f"获取API密钥失败: {str(e)}")
+            headers = {}
+
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            if method == 'GET':
+                response = await client.get(url, params=params, headers=headers)
+            else:
+                response = await client.post(url, json=params, headers=headers)
+
+        if response.status_code != 200:
+            error_msg = f"请求失败: {response.status_code}"
+            print(f"任务 {task_id} 请求失败: {response.status_code}")
+            self._record_task_failure(task_id, start_time_str, error_msg, triggered_by)
+            return None
+        return response.json()
+
     def _record_task_failure(self, task_id, start_time_str, error_msg, triggered_by):
         """记录任务失败信息"""
         end_time = datetime.now()
@@ -1398,12 +1423,8 @@ class SchedulerManager:
 
             # 执行任务
             try:
-                # 使用异步方式执行任务
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                task = loop.create_task(self.execute_task_chain(task_id))
-                result = loop.run_until_complete(asyncio.gather(task))[0]
-                loop.close()
+                # 提交到主事件循环执行并等待结果
+                result = self._submit_task_chain(task_id).result()
 
                 # 记录执行结果
                 end_time = datetime.now()
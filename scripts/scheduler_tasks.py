@@ -0,0 +1,192 @@
+import asyncio
+import functools
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from scripts.utils import get_config, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+
+class RegisteredTask:
+    """可在进程内直接执行的计划任务"""
+
+    __slots__ = ('endpoint', 'method', 'func', 'cpu_bound', 'description')
+
+    def __init__(self, endpoint: str, method: str, func: Callable, cpu_bound: bool, description: str):
+        self.endpoint = endpoint
+        self.method = method
+        self.func = func
+        self.cpu_bound = cpu_bound
+        self.description = description
+
+
+class TaskRegistry:
+    """计划任务注册表
+
+    把调度配置中的接口地址映射到进程内的函数，调度器据此直接调用而不是
+    通过 HTTP 请求本服务。协程任务在主事件循环上执行，耗时的同步任务
+    （导入数据库、生成热力图等）放到独立的线程池中执行，不占用默认线程池。
+    未注册的接口仍然走 HTTP 调用。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'TaskRegistry':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._tasks: Dict[tuple, RegisteredTask] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @staticmethod
+    def _key(endpoint: str, method: str) -> tuple:
+        return '/' + endpoint.strip('/'), method.upper()
+
+    def register(self, endpoint: str, method: str = 'GET', cpu_bound: bool = False, description: str = ''):
+        """注册任务的装饰器
+
+        被注册的函数接收调度配置中的 params 字典，返回与接口响应相同结构的字典。
+        cpu_bound 为 True 时函数应为同步函数，会在工作线程池中执行。
+        """
+        def decorator(func: Callable) -> Callable:
+            key = self._key(endpoint, method)
+            self._tasks[key] = RegisteredTask(key[0], key[1], func, cpu_bound, description)
+            return func
+        return decorator
+
+    def resolve(self, endpoint: str, method: str = 'GET') -> Optional[RegisteredTask]:
+        return self._tasks.get(self._key(endpoint, method))
+
+    def list_tasks(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            f"{task.method} {task.endpoint}": {'cpu_bound': task.cpu_bound, 'description': task.description}
+            for task in self._tasks.values()
+        }
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            workers = int(get_config().get('scheduler', {}).get('worker_threads', 2) or 2)
+            self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='scheduler-job')
+        return self._executor
+
+    async def run(self, task: RegisteredTask, params: Optional[Dict[str, Any]], timeout: Optional[float]) -> Dict[str, Any]:
+        """执行任务，超时或调度器停止时取消
+
+        线程池中的同步任务无法被强制中断，超时后只是不再等待其结果。
+        """
+        params = dict(params or {})
+        if task.cpu_bound or not inspect.iscoroutinefunction(task.func):
+            loop = asyncio.get_running_loop()
+            awaitable = loop.run_in_executor(self._get_executor(), functools.partial(task.func, params))
+        else:
+            awaitable = task.func(params)
+
+        try:
+            result = await asyncio.wait_for(awaitable, timeout=timeout if timeout and timeout > 0 else None)
+        except HTTPException as e:
+            # 与 HTTP 调用时的非 200 响应一致，视为任务失败
+            return {'status': 'error', 'message': f"请求失败: {e.status_code} {e.detail}"}
+        return _to_dict(result)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _to_dict(result: Any) -> Dict[str, Any]:
+    """把接口返回值（字典或 pydantic 模型）转换为字典"""
+    if isinstance(result, dict):
+        return result
+    if hasattr(result, 'model_dump'):
+        return result.model_dump()
+    if hasattr(result, 'dict'):
+        return result.dict()
+    return {'status': 'success', 'data': result}
+
+
+registry = TaskRegistry.get_instance()
+
+
+# ---- 默认计划任务 ----
+# 接口函数在任务执行时才导入，避免与路由模块循环导入
+
+@registry.register('/bilibili/popular/all', 'GET', description='获取热门视频')
+async def fetch_popular_videos(params: Dict[str, Any]) -> Dict[str, Any]:
+    from fastapi import BackgroundTasks
+    from routers.popular_videos import get_all_popular_videos_api, task_status
+
+    background_tasks = BackgroundTasks()
+    response = await get_all_popular_videos_api(
+        background_tasks,
+        size=int(params.get('size', 20)),
+        max_pages=int(params.get('max_pages', 100)),
+        save_to_db=bool(params.get('save_to_db', True)),
+        include_videos=False,
+    )
+    # 接口本身只受理任务并在响应发出后执行，这里直接等待后台处理完成
+    await background_tasks()
+    info = task_status.get(response.task_id) or {}
+    return info.get('result') or {'status': 'error', 'message': info.get('message', '获取热门视频失败')}
+
+
+@registry.register('/login/check-and-notify', 'GET', description='检查登录状态')
+async def check_login(params: Dict[str, Any]) -> Dict[str, Any]:
+    from routers.login import check_and_notify
+
+    return await check_and_notify()
+
+
+@registry.register('/fetch/bili-history', 'GET', description='获取历史记录')
+async def fetch_bili_history(params: Dict[str, Any]) -> Dict[str, Any]:
+    from routers.fetch_bili_history import get_bili_history
+
+    return await get_bili_history(
+        output_dir=params.get('output_dir', 'history_by_date'),
+        skip_exists=bool(params.get('skip_exists', True)),
+        process_video_details=bool(params.get('process_video_details', False)),
+    )
+
+
+@registry.register('/importSqlite/import_data_sqlite', 'POST', cpu_bound=True, description='导入历史记录到数据库')
+def import_sqlite(params: Dict[str, Any]) -> Dict[str, Any]:
+    from routers.import_data_sqlite import import_history
+
+    return import_history()
+
+
+@registry.register('/analysis/analyze', 'POST', description='分析历史数据')
+async def analyze(params: Dict[str, Any]) -> Dict[str, Any]:
+    from routers.analysis import analyze_history
+
+    return await analyze_history(year=params.get('year'))
+
+
+@registry.register('/heatmap/generate_heatmap', 'POST', cpu_bound=True, description='生成热力图')
+def generate_heatmap(params: Dict[str, Any]) -> Dict[str, Any]:
+    from routers.heatmap import api_generate_heatmap
+
+    return api_generate_heatmap()
+
+
+@registry.register('/log/send-email', 'POST', description='发送日志邮件')
+async def send_email(params: Dict[str, Any]) -> Dict[str, Any]:
+    from routers.send_log import send_log_email
+
+    return await send_log_email(
+        subject=params.get('subject', '任务执行日志'),
+        content=params.get('content'),
+        to_email=params.get('to_email'),
+    )
@@ -0,0 +1,285 @@
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from scripts.utils import get_config, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+_PLANNABLE = ('SELECT', 'WITH', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?(?: USING (COVERING )?INDEX (\w+))?')
+_SQL_KEYWORDS = {
+    'WHERE', 'ON', 'USING', 'JOIN', 'LEFT', 'RIGHT', 'INNER', 'OUTER', 'CROSS', 'NATURAL', 'GROUP', 'ORDER',
+    'LIMIT', 'HAVING', 'UNION', 'EXCEPT', 'INTERSECT', 'WINDOW', 'SET', 'VALUES', 'AS', 'INDEXED', 'NOT',
+}
+_FROM_TABLE = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+([\w.]+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_WHERE_CLAUSE = re.compile(r'\bWHERE\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\bUNION\b|$)',
+                           re.IGNORECASE | re.DOTALL)
+_PREDICATE = re.compile(
+    r'(?:\b\w+\.)?\b(\w+)\s*(=|==|>=|<=|<>|!=|>|<|\bIN\b|\bBETWEEN\b|\bLIKE\b|\bGLOB\b|\bIS\b)\s*(\'[^\']*\'|\S+)?',
+    re.IGNORECASE)
+_ORDER_BY = re.compile(r'\bORDER\s+BY\s+(?:\w+\.)?(\w+)', re.IGNORECASE)
+_YEAR_TABLE = re.compile(r'^(bilibili_history|history_v2)_\d{4}$')
+
+
+def _settings() -> Dict[str, Any]:
+    try:
+        return get_config().get('slow_query_log', {}) or {}
+    except Exception:
+        return {}
+
+
+def threshold_seconds() -> Optional[float]:
+    """超过这个耗时的语句记入慢查询日志，未开启时返回 None"""
+    settings = _settings()
+    if not settings.get('enabled', True):
+        return None
+    return float(settings.get('threshold_ms', 200)) / 1000
+
+
+def _plain_execute(conn: sqlite3.Connection, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+    # 使用 sqlite3.Connection 自身的 execute，分析语句不计入统计，也不会再次触发慢查询记录
+    return sqlite3.Connection.execute(conn, sql, params).fetchall()
+
+
+def _table_aliases(sql: str) -> Dict[str, str]:
+    """FROM / JOIN 中的 别名 -> 表名（表名也映射到自身）"""
+    aliases = {}
+    for table, alias in _FROM_TABLE.findall(sql):
+        table = table.split('.')[-1]
+        aliases[table] = table
+        if alias and alias.upper() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def _predicate_columns(sql: str) -> Tuple[List[str], List[str], List[str]]:
+    """返回（等值条件列, 范围条件列, 无法走索引的 LIKE 列），只做启发式提取"""
+    equality, ranges, unindexable = [], [], []
+    for clause in _WHERE_CLAUSE.findall(sql):
+        for column, operator, operand in _PREDICATE.findall(clause):
+            operator = operator.upper()
+            if operator in ('=', '==', 'IN', 'IS'):
+                equality.append(column)
+            elif operator in ('>', '<', '>=', '<=', 'BETWEEN'):
+                ranges.append(column)
+            elif operator in ('LIKE', 'GLOB'):
+                # 以通配符开头的模式用不上索引，其余视为前缀范围查询
+                if operand.startswith(("'%", "'*")) or operand.startswith('?'):
+                    unindexable.append(column)
+                else:
+                    ranges.append(column)
+    return equality, ranges, unindexable
+
+
+class SlowQueryLog:
+    """慢查询日志
+
+    经过带计时连接（scripts.metrics.InstrumentedConnection）执行、耗时超过阈值的语句按归一化 SQL
+    汇总，首次记录时（以及每隔 explain_interval 秒）在同一连接上执行 EXPLAIN QUERY PLAN，
+    找出对大表的全表扫描和临时 B 树排序，并根据 WHERE / ORDER BY 中的列给出索引建议。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'SlowQueryLog':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        settings = _settings()
+        self.large_table_rows = int(settings.get('large_table_rows', 10000))
+        self.max_statements = int(settings.get('max_statements', 200))
+        self.explain_interval = int(settings.get('explain_interval', 600))
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._entries_lock = threading.Lock()
+        self._row_counts: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self.started_at = int(time.time())
+
+    # ---- 记录 ----
+
+    def record(self, conn: sqlite3.Connection, sql: str, params: Any, elapsed: float, statement: str) -> None:
+        """记录一条慢语句（在执行语句的线程中调用），分析失败不影响原查询"""
+        now = time.time()
+        with self._entries_lock:
+            entry = self._entries.get(statement)
+            if entry is None:
+                if len(self._entries) >= self.max_statements:
+                    # 淘汰累计耗时最少的语句
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k]['total_seconds'])]
+                entry = self._entries[statement] = {
+                    'statement': statement, 'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0,
+                    'first_seen': int(now), 'last_seen': int(now), 'sample_sql': '', 'database': '',
+                    'plan': None, 'explained_at': 0, 'full_scans': [], 'temp_btree': [], 'suggestions': [],
+                }
+            entry['count'] += 1
+            entry['total_seconds'] += elapsed
+            entry['last_seen'] = int(now)
+            if elapsed >= entry['max_seconds']:
+                entry['max_seconds'] = elapsed
+                entry['sample_sql'] = sql[:4000]
+            explain = now - entry['explained_at'] >= self.explain_interval
+            if explain:
+                entry['explained_at'] = now
+
+        if not explain:
+            return
+        try:
+            analysis = self._analyze(conn, sql, params)
+        except Exception as e:
+            analysis = {'plan': [f'无法获取执行计划: {e}'], 'full_scans': [], 'temp_btree': [], 'suggestions': []}
+        with self._entries_lock:
+            entry.update(analysis)
+
+        scans = '，'.join(f"{s['table']}（{s['rows']} 行）" for s in analysis['full_scans'])
+        logger.warning(
+            f"慢查询 {elapsed * 1000:.0f}ms: {statement}"
+            + (f"\n  全表扫描: {scans}" if scans else '')
+            + ''.join(f"\n  {line}" for line in analysis['plan'])
+            + ''.join(f"\n  建议: {s['sql']}" for s in analysis['suggestions'])
+        )
+
+    # ---- 分析 ----
+
+    def _row_count(self, conn: sqlite3.Connection, database: str, table: str) -> int:
+        key = (database, table)
+        cached = self._row_counts.get(key)
+        if cached and time.time() - cached[0] < self.explain_interval:
+            return cached[1]
+        try:
+            count = _plain_execute(conn, f'SELECT COUNT(*) FROM "{table}"')[0][0]
+        except sqlite3.Error:
+            count = -1
+        self._row_counts[key] = (time.time(), count)
+        return count
+
+    def _indexed_prefixes(self, conn: sqlite3.Connection, table: str) -> List[Tuple[str, ...]]:
+        prefixes = []
+        for row in _plain_execute(conn, f'PRAGMA index_list("{table}")'):
+            columns = tuple(info[2] for info in _plain_execute(conn, f'PRAGMA index_info("{row[1]}")'))
+            prefixes.append(columns)
+        return prefixes
+
+    def _suggest(self, conn: sqlite3.Connection, sql: str, table: str, order_btree: bool) -> List[Dict[str, str]]:
+        """根据语句的 WHERE / ORDER BY 为被扫描的表建议索引"""
+        columns = {row[1] for row in _plain_execute(conn, f'PRAGMA table_xinfo("{table}")')}
+        if not columns:
+            return []
+        equality, ranges, unindexable = _predicate_columns(sql)
+        equality = list(dict.fromkeys(c for c in equality if c in columns))[:3]
+        tail = next((c for c in ranges if c in columns and c not in equality), None)
+        if tail is None and order_btree:
+            tail = next((c for c in _ORDER_BY.findall(sql) if c in columns and c not in equality), None)
+        index_columns = equality + ([tail] if tail else [])
+
+        suggestions = []
+        if index_columns:
+            existing = self._indexed_prefixes(conn, table)
+            if not any(prefix[:len(index_columns)] == tuple(index_columns) for prefix in existing):
+                name = f"idx_{table}_{'_'.join(index_columns)}"
+                generic = _YEAR_TABLE.match(table)
+                suggestions.append({
+                    'table': table,
+                    'sql': f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(index_columns)})",
+                    'reason': '按条件列' + ('和排序列' if tail else '') + '建立组合索引，避免全表扫描'
+                              + ('（各年份表结构相同，其他年份表同样适用）' if generic else ''),
+                })
+        like_columns = [c for c in dict.fromkeys(unindexable) if c in columns]
+        if like_columns:
+            suggestions.append({
+                'table': table,
+                'sql': '',
+                'reason': f"{'、'.join(like_columns)} 使用以通配符开头的 LIKE，索引无效，"
+                          f"可改用 FTS 全文索引（如 /history/search 使用的 {table}_fts）",
+            })
+        return suggestions
+
+    def _analyze(self, conn: sqlite3.Connection, sql: str, params: Any) -> Dict[str, Any]:
+        if sql.lstrip().split(None, 1)[0].upper() not in _PLANNABLE:
+            return {'plan': [], 'full_scans': [], 'temp_btree': [], 'suggestions': []}
+        if params is None and '?' in sql:
+            return {'plan': ['批量执行（executemany）的语句，未分析执行计划'], 'full_scans': [], 'temp_btree': [],
+                    'suggestions': []}
+        database = next((row[2] for row in _plain_execute(conn, 'PRAGMA database_list') if row[1] == 'main'), '')
+        rows = _plain_execute(conn, f'EXPLAIN QUERY PLAN {sql}', params if params is not None else ())
+
+        depth: Dict[int, int] = {}
+        plan = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, -1) + 1
+            plan.append('  ' * depth[node_id] + detail)
+
+        aliases = _table_aliases(sql)
+        details = [row[3] for row in rows]
+        temp_btree = [d[len('USE TEMP B-TREE FOR '):] for d in details if d.startswith('USE TEMP B-TREE FOR ')]
+        full_scans, suggestions = [], []
+        for detail in details:
+            match = _SCAN.match(detail)
+            if not match or match.group(1) in ('CONSTANT', 'SUBQUERY'):
+                continue
+            table = aliases.get(match.group(1), match.group(1))
+            count = self._row_count(conn, database, table)
+            if count < self.large_table_rows:
+                continue
+            full_scans.append({
+                'table': table,
+                'rows': count,
+                'via': ('covering_index' if match.group(2) else 'index') if match.group(3) else 'table',
+                'index': match.group(3) or '',
+            })
+            for suggestion in self._suggest(conn, sql, table, 'ORDER BY' in temp_btree):
+                if suggestion not in suggestions:
+                    suggestions.append(suggestion)
+        return {'plan': plan, 'full_scans': full_scans, 'temp_btree': temp_btree,
+                'suggestions': suggestions, 'database': database}
+
+    # ---- 报告 ----
+
+    def report(self, limit: int = 50, sort: str = 'total') -> Dict[str, Any]:
+        """按累计耗时（total）、单次最大耗时（max）或次数（count）排序的慢查询汇总"""
+        key = {'total': 'total_seconds', 'max': 'max_seconds', 'count': 'count'}.get(sort, 'total_seconds')
+        with self._entries_lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        entries.sort(key=lambda e: e[key], reverse=True)
+
+        # 相同的索引建议合并，按受益语句的累计耗时排序
+        suggestions: Dict[str, Dict[str, Any]] = {}
+        for entry in entries:
+            for suggestion in entry['suggestions']:
+                merged = suggestions.setdefault(suggestion['sql'] or suggestion['reason'], {
+                    **suggestion, 'statements': 0, 'total_seconds': 0.0})
+                merged['statements'] += 1
+                merged['total_seconds'] += entry['total_seconds']
+
+        for entry in entries:
+            entry['avg_ms'] = round(entry['total_seconds'] / entry['count'] * 1000, 1)
+            entry['max_ms'] = round(entry.pop('max_seconds') * 1000, 1)
+            entry['total_ms'] = round(entry.pop('total_seconds') * 1000, 1)
+            entry['explained_at'] = int(entry['explained_at'])
+        for suggestion in suggestions.values():
+            suggestion['total_ms'] = round(suggestion.pop('total_seconds') * 1000, 1)
+
+        threshold = threshold_seconds()
+        return {
+            'threshold_ms': round(threshold * 1000) if threshold is not None else None,
+            'since': self.started_at,
+            'statements': len(entries),
+            'queries': entries[:limit],
+            'index_suggestions': sorted(suggestions.values(), key=lambda s: s['total_ms'], reverse=True),
+        }
+
+    def reset(self) -> None:
+        with self._entries_lock:
+            self._entries.clear()
+        self._row_counts.clear()
+        self.started_at = int(time.time())
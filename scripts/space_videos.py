@@ -0,0 +1,302 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from loguru import logger
+
+from scripts.dynamic_crawler import RateBudget
+from scripts.utils import get_config, get_database_path, setup_logger
+from scripts.wbi_sign import enc_wbi, fetch_wbi_keys, reset_wbi_keys
+
+# 确保日志系统已初始化
+setup_logger()
+
+SPACE_ARC_URL = "https://api.bilibili.com/x/space/wbi/arc/search"
+
+# 风控或签名失效时返回的错误码，重新获取 WBI 密钥后重试一次
+_WBI_RETRY_CODES = {-352, -403}
+
+VIDEO_COLUMNS = [
+    "mid", "bvid", "aid", "title", "pic", "description", "length", "created",
+    "play", "comment", "typeid", "author", "fetched_at"
+]
+
+
+class SpaceApiError(RuntimeError):
+    """投稿列表接口返回非 0 错误码"""
+
+    def __init__(self, code: Any, message: str, payload: Optional[Dict[str, Any]] = None):
+        super().__init__(f"{message} (code={code})")
+        self.code = code
+        self.payload = payload or {}
+
+
+def _video_row(mid: int, item: Dict[str, Any], timestamp: int) -> tuple:
+    return (
+        mid,
+        item.get("bvid"),
+        item.get("aid"),
+        item.get("title"),
+        item.get("pic"),
+        item.get("description"),
+        item.get("length"),
+        item.get("created", 0),
+        item.get("play") if isinstance(item.get("play"), int) else 0,
+        item.get("comment", 0),
+        item.get("typeid"),
+        item.get("author"),
+        timestamp,
+    )
+
+
+class SpaceVideoLister:
+    """UP主投稿列表抓取服务
+
+    - 首页请求得到投稿总数后，其余页面在共享的请求预算下并发请求
+    - WBI 密钥每次列举只获取一次，各页只在本地计算签名
+    - 结果按 mid 缓存在 bilibili_space_videos.db，之后按发布时间倒序翻页，
+      遇到已缓存的视频即停止，通常只需请求一页
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'SpaceVideoLister':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._budget: Optional[RateBudget] = None
+        self._mid_locks: Dict[int, asyncio.Lock] = {}
+        self.stats = {"requests": 0, "errors": 0, "full_syncs": 0, "incremental_syncs": 0, "cache_hits": 0}
+
+    @staticmethod
+    def _settings() -> Dict[str, Any]:
+        try:
+            return get_config().get('space_videos', {}) or {}
+        except Exception:
+            return {}
+
+    def _get_budget(self) -> RateBudget:
+        if self._budget is None:
+            settings = self._settings()
+            self._budget = RateBudget(settings.get('min_request_interval', 0.3), settings.get('request_jitter', 0.2))
+        return self._budget
+
+    # ---- 本地缓存 ----
+
+    @staticmethod
+    def _connect() -> sqlite3.Connection:
+        conn = sqlite3.connect(get_database_path('bilibili_space_videos.db'))
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS space_videos (
+            mid INTEGER NOT NULL,
+            bvid TEXT NOT NULL,
+            aid INTEGER,
+            title TEXT,
+            pic TEXT,
+            description TEXT,
+            length TEXT,
+            created INTEGER,
+            play INTEGER,
+            comment INTEGER,
+            typeid INTEGER,
+            author TEXT,
+            fetched_at INTEGER,
+            PRIMARY KEY (mid, bvid)
+        )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_space_videos_mid_created ON space_videos (mid, created DESC)")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS space_video_sync (
+            mid INTEGER PRIMARY KEY,
+            remote_count INTEGER,
+            last_created INTEGER,
+            synced_at INTEGER
+        )
+        """)
+        return conn
+
+    def _load_state(self, mid: int) -> Tuple[Optional[Dict[str, Any]], set]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT remote_count, last_created, synced_at FROM space_video_sync WHERE mid = ?", (mid,)
+            ).fetchone()
+            known = {r[0] for r in conn.execute("SELECT bvid FROM space_videos WHERE mid = ?", (mid,))}
+        finally:
+            conn.close()
+        if not row:
+            return None, known
+        return {"remote_count": row[0], "last_created": row[1], "synced_at": row[2]}, known
+
+    def _save(self, mid: int, items: List[Dict[str, Any]], remote_count: int, replace: bool) -> None:
+        timestamp = int(time.time())
+        conn = self._connect()
+        try:
+            if replace:
+                conn.execute("DELETE FROM space_videos WHERE mid = ?", (mid,))
+            conn.executemany(
+                f"INSERT OR REPLACE INTO space_videos ({', '.join(VIDEO_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(VIDEO_COLUMNS))})",
+                [_video_row(mid, item, timestamp) for item in items if item.get("bvid")]
+            )
+            last_created = conn.execute(
+                "SELECT COALESCE(MAX(created), 0) FROM space_videos WHERE mid = ?", (mid,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO space_video_sync (mid, remote_count, last_created, synced_at) VALUES (?, ?, ?, ?)",
+                (mid, remote_count, last_created, timestamp)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def cached_videos(self, mid: int) -> List[Dict[str, Any]]:
+        """按发布时间倒序返回缓存的投稿"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(
+                "SELECT * FROM space_videos WHERE mid = ? ORDER BY created DESC, aid DESC", (mid,)
+            ).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    # ---- 请求 ----
+
+    @staticmethod
+    def build_headers(mid: int, sessdata: Optional[str] = None, use_sessdata: bool = True) -> Dict[str, str]:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept': 'application/json',
+            'Referer': f'https://space.bilibili.com/{mid}/video',
+            'Origin': 'https://space.bilibili.com'
+        }
+        sessdata = sessdata or get_config().get('SESSDATA')
+        if sessdata and use_sessdata:
+            headers['Cookie'] = f'SESSDATA={sessdata}'
+        return headers
+
+    async def request_page(self, client: httpx.AsyncClient, headers: Dict[str, str], keys: Dict[str, str],
+                           params: Dict[str, Any]) -> Dict[str, Any]:
+        """请求一页投稿列表，返回完整的响应 JSON（不检查错误码）"""
+        await self._get_budget().acquire()
+        signed = enc_wbi(params, keys["img_key"], keys["sub_key"]) if keys.get("img_key") else params
+        self.stats["requests"] += 1
+        response = await client.get(SPACE_ARC_URL, params=signed, headers=headers)
+        return response.json()
+
+    async def fetch_page(self, client: httpx.AsyncClient, headers: Dict[str, str], keys: Dict[str, str],
+                         mid: int, pn: int, ps: int, **filters: Any) -> Dict[str, Any]:
+        """请求一页投稿列表并返回 data，失败时按配置重试"""
+        params = {'mid': mid, 'pn': pn, 'ps': ps, 'tid': 0, 'keyword': '', 'order': 'pubdate', 'platform': 'web'}
+        params.update(filters)
+        retries = int(self._settings().get('retries', 2))
+        for attempt in range(retries + 1):
+            try:
+                payload = await self.request_page(client, headers, keys, params)
+                if payload.get('code') == 0:
+                    return payload.get('data') or {}
+                if payload.get('code') in _WBI_RETRY_CODES and attempt == 0:
+                    # 密钥可能已轮换，刷新后重试
+                    reset_wbi_keys()
+                    keys.update(await asyncio.to_thread(fetch_wbi_keys))
+                    continue
+                raise SpaceApiError(payload.get('code'), payload.get('message', '未知错误'), payload)
+            except SpaceApiError:
+                self.stats["errors"] += 1
+                raise
+            except (httpx.HTTPError, ValueError) as e:
+                self.stats["errors"] += 1
+                if attempt >= retries:
+                    raise
+                logger.warning(f"获取 {mid} 投稿列表第 {pn} 页失败，准备重试: {e}")
+        raise SpaceApiError(-1, f"获取 {mid} 投稿列表第 {pn} 页失败")
+
+    async def _list_all(self, client, headers, keys, mid: int, ps: int) -> Tuple[List[Dict[str, Any]], int]:
+        first = await self.fetch_page(client, headers, keys, mid, 1, ps)
+        total = int((first.get('page') or {}).get('count', 0))
+        items = list((first.get('list') or {}).get('vlist') or [])
+        pages = (total + ps - 1) // ps
+        if pages > 1:
+            semaphore = asyncio.Semaphore(max(1, int(self._settings().get('concurrency', 4))))
+
+            async def fetch(pn: int) -> List[Dict[str, Any]]:
+                async with semaphore:
+                    data = await self.fetch_page(client, headers, keys, mid, pn, ps)
+                return (data.get('list') or {}).get('vlist') or []
+
+            for page_items in await asyncio.gather(*(fetch(pn) for pn in range(2, pages + 1))):
+                items.extend(page_items)
+        return items, total
+
+    async def _list_newer(self, client, headers, keys, mid: int, ps: int,
+                          known: set) -> Tuple[List[Dict[str, Any]], int]:
+        """从最新一页开始翻页，遇到已缓存的视频即停止"""
+        items: List[Dict[str, Any]] = []
+        pn, total = 1, 0
+        while True:
+            data = await self.fetch_page(client, headers, keys, mid, pn, ps)
+            total = int((data.get('page') or {}).get('count', 0))
+            vlist = (data.get('list') or {}).get('vlist') or []
+            fresh = [item for item in vlist if item.get('bvid') not in known]
+            items.extend(fresh)
+            if len(fresh) < len(vlist) or pn * ps >= total or not vlist:
+                return items, total
+            pn += 1
+
+    async def list_videos(self, mid: int, refresh: bool = True, full: bool = False,
+                          sessdata: Optional[str] = None, use_sessdata: bool = True) -> Dict[str, Any]:
+        """获取 UP 主的全部投稿
+
+        Args:
+            refresh: 为 False 且缓存未过期时直接返回缓存
+            full: 忽略缓存重新列举全部投稿（可清理已删除的视频）
+
+        Returns:
+            包含 videos（按发布时间倒序）与 new_bvids（本次新发现的视频）的字典
+        """
+        lock = self._mid_locks.setdefault(mid, asyncio.Lock())
+        async with lock:
+            started = time.time()
+            settings = self._settings()
+            state, known = await asyncio.to_thread(self._load_state, mid)
+            cache_ttl = int(settings.get('cache_ttl', 600))
+            if state and not full and not refresh and time.time() - (state['synced_at'] or 0) < cache_ttl:
+                self.stats["cache_hits"] += 1
+                videos = await asyncio.to_thread(self.cached_videos, mid)
+                return {"mid": mid, "source": "cache", "total": len(videos), "remote_count": state['remote_count'],
+                        "new_bvids": [], "videos": videos, "duration": round(time.time() - started, 3)}
+
+            ps = int(settings.get('page_size', 50))
+            headers = self.build_headers(mid, sessdata, use_sessdata)
+            keys = dict(await asyncio.to_thread(fetch_wbi_keys))
+            async with httpx.AsyncClient(timeout=int(settings.get('timeout', 10))) as client:
+                if state and not full:
+                    items, remote_count = await self._list_newer(client, headers, keys, mid, ps, known)
+                    source = "incremental"
+                    self.stats["incremental_syncs"] += 1
+                else:
+                    items, remote_count = await self._list_all(client, headers, keys, mid, ps)
+                    source = "full"
+                    self.stats["full_syncs"] += 1
+
+            await asyncio.to_thread(self._save, mid, items, remote_count, source == "full")
+            videos = await asyncio.to_thread(self.cached_videos, mid)
+            new_bvids = [item['bvid'] for item in items if item.get('bvid') and item['bvid'] not in known]
+            duration = round(time.time() - started, 3)
+            logger.info(f"获取 {mid} 的投稿列表完成 ({source})：共 {len(videos)} 个，新增 {len(new_bvids)} 个，耗时 {duration} 秒")
+            return {"mid": mid, "source": source, "total": len(videos), "remote_count": remote_count,
+                    "new_bvids": new_bvids, "videos": videos, "duration": duration}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
@@ -0,0 +1,195 @@
+import asyncio
+import inspect
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from scripts.utils import setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+# 进度回调：(当前数量, 总数, 说明)
+ProgressCallback = Callable[[int, int, str], None]
+
+
+class StartupJob:
+    """启动后在后台执行的维护任务"""
+
+    def __init__(self, name: str, func: Callable, priority: int, description: str,
+                 subsystem: Optional[str]):
+        self.name = name
+        self.func = func
+        self.priority = priority
+        self.description = description
+        self.subsystem = subsystem
+        self.state = 'pending'  # pending / running / done / failed / cancelled
+        self.current = 0
+        self.total = 0
+        self.message = ''
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def report(self, current: int, total: int, message: str = '') -> None:
+        self.current = current
+        self.total = total
+        if message:
+            self.message = message
+
+    def to_dict(self) -> Dict[str, Any]:
+        duration = None
+        if self.started_at is not None:
+            duration = round((self.finished_at or time.time()) - self.started_at, 3)
+        return {
+            'name': self.name,
+            'description': self.description,
+            'priority': self.priority,
+            'subsystem': self.subsystem,
+            'state': self.state,
+            'current': self.current,
+            'total': self.total,
+            'percent': round(self.current * 100 / self.total, 1) if self.total else None,
+            'message': self.message,
+            'error': self.error,
+            'duration': duration,
+        }
+
+
+class StartupManager:
+    """启动阶段管理器
+
+    应用启动时只做必要的轻量初始化并立即开始处理请求，耗时的维护工作
+    （数据完整性校验、图片索引核对等）按优先级注册为后台任务依次执行。
+    每个子系统有独立的就绪标记，接口可以据此返回 503 而不是阻塞等待。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'StartupManager':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.serving_at: Optional[float] = None
+        self._subsystems: Dict[str, Dict[str, Any]] = {}
+        self._jobs: List[StartupJob] = []
+        self._task: Optional[asyncio.Task] = None
+
+    # ---- 子系统就绪状态 ----
+
+    def register_subsystem(self, name: str, message: str = '') -> None:
+        """登记一个需要初始化的子系统（初始为未就绪）"""
+        self._subsystems.setdefault(name, {
+            'ready': False, 'state': 'pending', 'message': message, 'since': time.time()
+        })
+
+    def set_ready(self, name: str, message: str = '') -> None:
+        self._subsystems[name] = {'ready': True, 'state': 'ready', 'message': message, 'since': time.time()}
+
+    def set_failed(self, name: str, message: str) -> None:
+        self._subsystems[name] = {'ready': False, 'state': 'failed', 'message': message, 'since': time.time()}
+
+    def set_skipped(self, name: str, message: str = '') -> None:
+        """子系统按配置未启用，视为就绪"""
+        self._subsystems[name] = {'ready': True, 'state': 'skipped', 'message': message, 'since': time.time()}
+
+    def is_ready(self, name: str) -> bool:
+        info = self._subsystems.get(name)
+        return bool(info and info['ready'])
+
+    def mark_serving(self) -> None:
+        """应用已开始处理请求"""
+        self.serving_at = time.time()
+
+    # ---- 后台维护任务 ----
+
+    def register_job(self, name: str, func: Callable, priority: int = 100, description: str = '',
+                     subsystem: Optional[str] = None) -> None:
+        """注册后台任务，priority 越小越先执行
+
+        func 可以是同步函数（在线程中执行）或协程函数；如果参数中有 progress，
+        会传入一个 (current, total, message) 回调用于上报进度。
+        指定 subsystem 时，该子系统在任务成功后标记为就绪。
+        """
+        self._jobs.append(StartupJob(name, func, priority, description, subsystem))
+        if subsystem:
+            self.register_subsystem(subsystem, '等待后台任务执行')
+
+    def start(self) -> None:
+        """按优先级在后台依次执行已注册的任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run_jobs())
+
+    async def stop(self) -> None:
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run_jobs(self) -> None:
+        for job in sorted(self._jobs, key=lambda j: j.priority):
+            if job.state != 'pending':
+                continue
+            try:
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                for pending in self._jobs:
+                    if pending.state in ('pending', 'running'):
+                        pending.state = 'cancelled'
+                raise
+        logger.info(f"启动后台任务全部结束，耗时 {time.time() - self.started_at:.1f} 秒")
+
+    async def _run_job(self, job: StartupJob) -> None:
+        job.state = 'running'
+        job.started_at = time.time()
+        logger.info(f"开始执行启动后台任务: {job.name}")
+        if job.subsystem:
+            self._subsystems[job.subsystem].update(state='running', message=job.description)
+
+        kwargs = {}
+        if 'progress' in inspect.signature(job.func).parameters:
+            kwargs['progress'] = job.report
+        try:
+            if inspect.iscoroutinefunction(job.func):
+                job.result = await job.func(**kwargs)
+            else:
+                job.result = await asyncio.to_thread(job.func, **kwargs)
+            job.state = 'done'
+            if job.subsystem:
+                self.set_ready(job.subsystem, job.message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.state = 'failed'
+            job.error = str(e)
+            logger.exception(f"启动后台任务失败: {job.name}: {e}")
+            if job.subsystem:
+                self.set_failed(job.subsystem, str(e))
+        finally:
+            job.finished_at = time.time()
+            logger.info(f"启动后台任务 {job.name} 结束 ({job.state})，耗时 {job.finished_at - job.started_at:.1f} 秒")
+
+    def get_status(self) -> Dict[str, Any]:
+        jobs = sorted(self._jobs, key=lambda j: j.priority)
+        finished = sum(1 for j in jobs if j.state in ('done', 'failed', 'cancelled'))
+        return {
+            'ready': all(info['ready'] for info in self._subsystems.values()),
+            'serving': self.serving_at is not None,
+            'time_to_serve': round(self.serving_at - self.started_at, 3) if self.serving_at else None,
+            'subsystems': {name: dict(info) for name, info in self._subsystems.items()},
+            'jobs': [job.to_dict() for job in jobs],
+            'jobs_finished': finished,
+            'jobs_total': len(jobs),
+        }
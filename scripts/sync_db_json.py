@@ -5,6 +5,9 @@ import shutil
 import sqlite3
 from datetime import datetime
 
+from scripts.history_partitions import connect_history, history_table_names
+from scripts.history_time_columns import ensure_time_columns
+
 # 配置日志
 # 确保输出目录存在
 os.makedirs("output/check", exist_ok=True)
@@ -67,10 +70,12 @@ def get_json_files(json_root_path):
 def get_db_tables(db_path):
     """获取数据库中的所有表名"""
     try:
-        conn = sqlite3.connect(db_path)
+        conn = connect_history(db_path)
         cursor = conn.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view');")
         tables = [row[0] for row in cursor.fetchall()]
+        # 加上已封存的年份
+        tables += [name for name in history_table_names(conn) if name not in tables]
         conn.close()
         return tables
     except Exception as e:
@@ -121,7 +126,7 @@ def get_records_from_db(db_path, year, month, day):
         start_date = datetime(year, month, day).timestamp()
         end_date = datetime(year, month, day, 23, 59, 59).timestamp()
         
-        conn = sqlite3.connect(db_path)
+        conn = connect_history(db_path)
         conn.row_factory = sqlite3.Row  # 将结果转换为字典格式
         cursor = conn.cursor()
         
@@ -195,7 +200,7 @@ def import_records_to_db(db_path, records, year):
         
         # 检查表是否存在
         table_name = f"bilibili_history_{year}"
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view') AND name=?", (table_name,))
         if not cursor.fetchone():
             logger.error(f"数据库表 {table_name} 不存在")
             conn.close()
@@ -328,17 +333,17 @@ def sync_db_to_json(db_path, json_root_path):
         year = int(table.split('_')[-1])
         
         try:
-            conn = sqlite3.connect(db_path)
+            conn = connect_history(db_path)
+            ensure_time_columns(conn, build_indexes=False)
             cursor = conn.cursor()
             
             # 获取表中的不同日期的记录
             cursor.execute(f"""
-                SELECT strftime('%Y-%m-%d', datetime(view_at, 'unixepoch')) as date_str,
-                       strftime('%Y', datetime(view_at, 'unixepoch')) as year,
-                       strftime('%m', datetime(view_at, 'unixepoch')) as month,
-                       strftime('%d', datetime(view_at, 'unixepoch')) as day
+                SELECT DISTINCT view_date as date_str,
+                       substr(view_date, 1, 4) as year,
+                       substr(view_date, 6, 2) as month,
+                       substr(view_date, 9, 2) as day
                 FROM {table}
-                GROUP BY date_str
                 ORDER BY date_str
             """)
             dates = cursor.fetchall()
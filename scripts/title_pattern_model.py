@@ -0,0 +1,458 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from scripts.history_partitions import appended_after, connect_history, table_fingerprint
+from scripts.utils import get_config, get_output_path, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+MODEL_FOLDER = 'title_models'
+
+_DEFAULTS = {
+    'n_clusters': 5,
+    'max_features': 1000,
+    'refit_ratio': 0.3,   # 增量更新的记录数超过拟合时记录数的该比例后，后台重新拟合
+}
+
+_EMPTY_METRICS = {'coverage': 0, 'distinctiveness': 0, 'unique_matches': 0, 'shared_matches': 0}
+
+# 只有标题参与聚类：指纹只统计有标题的记录，包含标题长度和 id 的校验和
+_TITLE_WHERE = "title IS NOT NULL AND title != ''"
+_FINGERPRINT_TOTALS = ('length(title)', 'id % 1000003')
+
+
+def get_stop_words() -> set:
+    """获取停用词列表"""
+    return {
+        '的', '了', '是', '在', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很',
+        '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这', '那', '啊', '呢', '吧',
+        '吗', '啦', '呀', '哦', '哈', '嘿', '哎', '哟', '唉', '嗯', '嘛', '哼', '哇', '咦', '诶', '喂',
+        '么', '什么', '这个', '那个', '这样', '那样', '怎么', '为什么', '如何', '哪里', '谁', '什么时候',
+        '多少', '几', '怎样', '为何', '哪个', '哪些', '几个', '多久', '多长时间', '什么样'
+    }
+
+
+def tokenize_titles(titles: List[str]) -> List[str]:
+    """分词并过滤停用词和单字词，返回以空格连接的词序列"""
+    import jieba
+    stop_words = get_stop_words()
+    return [' '.join(w for w in jieba.cut(title) if w not in stop_words and len(w) > 1) for title in titles]
+
+
+def title_sentiments(processed_titles: List[str]) -> np.ndarray:
+    from snownlp import SnowNLP
+    values = np.full(len(processed_titles), 0.5)
+    for i, title in enumerate(processed_titles):
+        if title:
+            try:
+                values[i] = SnowNLP(title).sentiments
+            except Exception:
+                pass
+    return values
+
+
+def model_settings() -> Dict[str, Any]:
+    return {**_DEFAULTS, **(get_config().get('title_patterns') or {})}
+
+
+def title_fingerprint(conn: sqlite3.Connection, table: str) -> Tuple[str, int, int]:
+    """返回（指纹, 标题数, 最大 id），只统计有标题的记录"""
+    return table_fingerprint(conn, table, _FINGERPRINT_TOTALS, _TITLE_WHERE)
+
+
+def _read_titles(conn: sqlite3.Connection, table: str, after_id: int = 0) -> Tuple[np.ndarray, List[str]]:
+    rows = conn.execute(
+        f"SELECT id, title FROM {table} WHERE {_TITLE_WHERE} AND id > ? ORDER BY id",
+        (after_id,)
+    ).fetchall()
+    return np.array([r[0] for r in rows], dtype=np.int64), [r[1] for r in rows]
+
+
+# ---- 模式提取 ----
+
+def build_patterns(terms: np.ndarray, matrix, labels: np.ndarray, sentiments: np.ndarray) -> Dict[str, Any]:
+    """由持久化的 TF-IDF 矩阵和聚类结果生成标题模式
+
+    每个聚类取簇内 TF-IDF 权重之和最高的 10 个词作为关键词，之后按关键词出现情况
+    计算覆盖率和区分度；覆盖率或区分度过低的模式改用匹配标题中最常见的 5 个词。
+    全部计算都在稀疏矩阵上完成，不需要重新拟合向量器或逐条扫描标题。
+    """
+    total = matrix.shape[0]
+    if total == 0 or len(terms) == 0:
+        return {'default': {'keywords': [], 'sentiment': 0.5, 'sample_size': 0, 'metrics': dict(_EMPTY_METRICS)}}
+
+    presence = matrix.copy().tocsc()
+    presence.data[:] = 1
+
+    patterns: Dict[str, Dict[str, Any]] = {}
+    columns: Dict[str, np.ndarray] = {}
+    for cluster in range(int(labels.max()) + 1 if len(labels) else 0):
+        members = labels == cluster
+        if not members.any():
+            continue
+        weights = np.asarray(matrix[members].sum(axis=0)).ravel()
+        top = np.argsort(-weights, kind='stable')[:10]
+        top = top[weights[top] > 0]
+        sentiment = float(sentiments[members].mean())
+        pattern_type = '积极' if sentiment > 0.6 else '消极' if sentiment < 0.4 else '中性'
+        name = f'模式{cluster + 1}_{pattern_type}'
+        patterns[name] = {
+            'keywords': [str(t) for t in terms[top]],
+            'sentiment': sentiment,
+            'sample_size': int(members.sum()),
+        }
+        columns[name] = top
+
+    if not patterns:
+        return {'default': {'keywords': [], 'sentiment': 0.5, 'sample_size': 0, 'metrics': dict(_EMPTY_METRICS)}}
+
+    # 每个模式命中的标题（含任一关键词）
+    names = list(patterns)
+    hits = np.column_stack([
+        presence[:, columns[name]].getnnz(axis=1) > 0 if len(columns[name]) else np.zeros(total, dtype=bool)
+        for name in names
+    ])
+    hit_counts = hits.sum(axis=1)
+
+    optimized = {}
+    for p, name in enumerate(names):
+        matched = hits[:, p]
+        unique = int((matched & (hit_counts == 1)).sum())
+        shared = int(matched.sum()) - unique
+        metrics = {
+            'coverage': float(matched.sum()) / total,
+            'distinctiveness': unique / (unique + shared) if unique + shared else 0,
+            'unique_matches': unique,
+            'shared_matches': shared,
+        }
+        info = patterns[name]
+        if (metrics['coverage'] < 0.05 or metrics['distinctiveness'] < 0.3) and matched.any():
+            doc_freq = np.asarray(presence[matched].sum(axis=0)).ravel()
+            top = np.argsort(-doc_freq, kind='stable')[:5]
+            top = top[doc_freq[top] > 0]
+            info = {'keywords': [str(t) for t in terms[top]], 'sentiment': info['sentiment'],
+                    'sample_size': int(matched.sum())}
+        optimized[name] = {**info, 'metrics': metrics}
+    return optimized
+
+
+# ---- 持久化 ----
+
+def _model_dir(base_dir: str, year: int) -> str:
+    path = os.path.join(base_dir, str(year))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def save_model(base_dir: str, year: int, state: Dict[str, Any]) -> Dict[str, Any]:
+    """保存模型文件；数据文件带版本号，最后原子替换 meta.json，读取方不会读到写了一半的模型"""
+    import joblib
+    import scipy.sparse as sp
+
+    path = _model_dir(base_dir, year)
+    version = uuid.uuid4().hex[:12]
+    files = {
+        'vectorizer': f'vectorizer-{version}.joblib',
+        'kmeans': f'kmeans-{version}.joblib',
+        'tfidf': f'tfidf-{version}.npz',
+        'rows': f'rows-{version}.npz',
+    }
+    joblib.dump(state['vectorizer'], os.path.join(path, files['vectorizer']))
+    joblib.dump(state['kmeans'], os.path.join(path, files['kmeans']))
+    sp.save_npz(os.path.join(path, files['tfidf']), state['matrix'].tocsr())
+    np.savez(os.path.join(path, files['rows']), ids=state['ids'], labels=state['labels'],
+             sentiments=state['sentiments'])
+
+    meta = {**state['meta'], 'files': files}
+    tmp = os.path.join(path, f'meta.json.{version}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, os.path.join(path, 'meta.json'))
+
+    for name in os.listdir(path):
+        if name != 'meta.json' and name not in files.values():
+            try:
+                os.remove(os.path.join(path, name))
+            except OSError:
+                pass
+    return meta
+
+
+def load_model(base_dir: str, year: int) -> Optional[Dict[str, Any]]:
+    import joblib
+    import scipy.sparse as sp
+
+    path = os.path.join(base_dir, str(year))
+    try:
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        files = meta['files']
+        rows = np.load(os.path.join(path, files['rows']))
+        return {
+            'meta': meta,
+            'vectorizer': joblib.load(os.path.join(path, files['vectorizer'])),
+            'kmeans': joblib.load(os.path.join(path, files['kmeans'])),
+            'matrix': sp.load_npz(os.path.join(path, files['tfidf'])).tocsr(),
+            'ids': rows['ids'],
+            'labels': rows['labels'],
+            'sentiments': rows['sentiments'],
+        }
+    except (OSError, ValueError, KeyError) as e:
+        if os.path.exists(os.path.join(path, 'meta.json')):
+            logger.warning(f"读取 {year} 年标题模式模型失败: {e}")
+        return None
+
+
+# ---- 拟合（在后台进程中执行） ----
+
+def fit_year_model(db_path: str, base_dir: str, year: int, n_clusters: int, max_features: int) -> Dict[str, Any]:
+    """从头拟合某年的标题模型并保存，返回模型元数据"""
+    import sklearn
+    from sklearn.cluster import MiniBatchKMeans
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    started = time.time()
+    table = f"bilibili_history_{year}"
+    conn = connect_history(db_path, read_only=True)
+    try:
+        fingerprint, count, max_id = title_fingerprint(conn, table)
+        ids, titles = _read_titles(conn, table)
+    finally:
+        conn.close()
+
+    processed = tokenize_titles(titles)
+    vectorizer = TfidfVectorizer(max_features=max_features)
+    try:
+        matrix = vectorizer.fit_transform(processed)
+    except ValueError:
+        # 全部标题分词后为空，得到空词表
+        vectorizer = TfidfVectorizer(max_features=max_features, token_pattern=r'(?u)\S+')
+        matrix = vectorizer.fit_transform(processed + ['_'])[:len(processed)]
+
+    k = max(1, min(n_clusters, matrix.shape[0]))
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3, batch_size=1024)
+    labels = kmeans.fit_predict(matrix) if matrix.shape[0] else np.zeros(0, dtype=np.int32)
+    sentiments = title_sentiments(processed)
+    patterns = build_patterns(vectorizer.get_feature_names_out(), matrix, labels, sentiments)
+
+    now = int(time.time())
+    meta = {
+        'year': year,
+        'fingerprint': fingerprint,
+        'row_count': count,
+        'max_id': int(max_id),
+        'fit_rows': count,
+        'incremental_rows': 0,
+        'n_clusters': n_clusters,
+        'max_features': max_features,
+        'sklearn_version': sklearn.__version__,
+        'fitted_at': now,
+        'updated_at': now,
+        'fit_seconds': round(time.time() - started, 2),
+        'patterns': patterns,
+    }
+    return save_model(base_dir, year, {
+        'meta': meta, 'vectorizer': vectorizer, 'kmeans': kmeans, 'matrix': matrix,
+        'ids': ids, 'labels': labels.astype(np.int32), 'sentiments': sentiments,
+    })
+
+
+class TitlePatternModelStore:
+    """标题模式模型存储
+
+    每个年份的 TF-IDF 词表、稀疏特征矩阵和聚类中心保存在 output/title_models/{year}/。
+    新增标题只做 transform 并用 MiniBatchKMeans.partial_fit 更新聚类中心；
+    首次拟合、旧记录被修改或增量过多时，在独立的后台进程中重新拟合，
+    API 进程中不再执行耗时的 sklearn 拟合。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'TitlePatternModelStore':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._models: Dict[int, Dict[str, Any]] = {}
+        self._year_locks: Dict[int, threading.Lock] = {}
+        self._fits: Dict[int, Future] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.stats = {"fits_scheduled": 0, "fits_completed": 0, "fits_failed": 0,
+                      "incremental_updates": 0, "hits": 0}
+
+    @staticmethod
+    def base_dir() -> str:
+        path = get_output_path(MODEL_FOLDER)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _db_path() -> str:
+        return get_output_path(get_config()['db_file'])
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn 启动的子进程不继承 API 进程的线程和连接，避免 fork 后死锁
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+
+    def schedule_fit(self, year: int) -> Future:
+        """在后台进程中重新拟合某年的模型，同一年份正在拟合时直接返回已有任务"""
+        with self._lock:
+            future = self._fits.get(year)
+            if future is not None and not future.done():
+                return future
+            settings = model_settings()
+            args = (self._db_path(), self.base_dir(), year,
+                    int(settings['n_clusters']), int(settings['max_features']))
+            try:
+                future = self._get_executor().submit(fit_year_model, *args)
+            except Exception as e:
+                # 进程池不可用（如进程池已损坏）时退回后台线程
+                logger.warning(f"无法启动标题模型拟合进程，改用线程: {e}")
+                self._executor = None
+                future = Future()
+                threading.Thread(target=self._run_in_thread, args=(future, args), daemon=True).start()
+            self._fits[year] = future
+            self.stats["fits_scheduled"] += 1
+            future.add_done_callback(lambda f, y=year: self._on_fit_done(y, f))
+            logger.info(f"已安排后台拟合 {year} 年标题模式模型")
+            return future
+
+    @staticmethod
+    def _run_in_thread(future: Future, args: tuple) -> None:
+        try:
+            future.set_result(fit_year_model(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _on_fit_done(self, year: int, future: Future) -> None:
+        error = future.exception()
+        if error is not None:
+            self.stats["fits_failed"] += 1
+            logger.error(f"拟合 {year} 年标题模式模型失败: {error}")
+            return
+        self.stats["fits_completed"] += 1
+        # 下次访问时从磁盘重新加载
+        self._models.pop(year, None)
+        meta = future.result()
+        logger.info(f"{year} 年标题模式模型拟合完成：{meta['fit_rows']} 条标题，耗时 {meta['fit_seconds']} 秒")
+
+    def _needs_refit(self, meta: Dict[str, Any], settings: Dict[str, Any]) -> Optional[str]:
+        import sklearn
+        if meta.get('sklearn_version') != sklearn.__version__:
+            return 'sklearn 版本变化'
+        if meta.get('n_clusters') != int(settings['n_clusters']) or \
+                meta.get('max_features') != int(settings['max_features']):
+            return '模型参数变化'
+        if meta.get('incremental_rows', 0) > float(settings['refit_ratio']) * max(meta.get('fit_rows', 0), 1):
+            return '增量记录过多'
+        return None
+
+    def _update_incremental(self, state: Dict[str, Any], conn: sqlite3.Connection, table: str,
+                            fingerprint: str, count: int, max_id: int) -> None:
+        """只对新增标题做 transform，并用 partial_fit 更新聚类中心"""
+        import scipy.sparse as sp
+
+        ids, titles = _read_titles(conn, table, state['meta']['max_id'])
+        processed = tokenize_titles(titles)
+        new_matrix = state['vectorizer'].transform(processed)
+        kmeans = state['kmeans']
+        non_empty = new_matrix.getnnz(axis=1) > 0
+        if non_empty.any():
+            kmeans.partial_fit(new_matrix[non_empty])
+
+        matrix = sp.vstack([state['matrix'], new_matrix]).tocsr()
+        # 聚类中心移动后重新分配全部标题，稀疏矩阵上的预测开销很小
+        labels = kmeans.predict(matrix).astype(np.int32)
+        sentiments = np.concatenate([state['sentiments'], title_sentiments(processed)])
+
+        meta = dict(state['meta'])
+        meta.update({
+            'fingerprint': fingerprint,
+            'row_count': count,
+            'max_id': int(max_id),
+            'incremental_rows': meta.get('incremental_rows', 0) + len(ids),
+            'updated_at': int(time.time()),
+            'patterns': build_patterns(state['vectorizer'].get_feature_names_out(), matrix, labels, sentiments),
+        })
+        state.update({
+            'matrix': matrix,
+            'ids': np.concatenate([state['ids'], ids]),
+            'labels': labels,
+            'sentiments': sentiments,
+        })
+        state['meta'] = save_model(self.base_dir(), state['meta']['year'], {**state, 'meta': meta})
+        self.stats["incremental_updates"] += 1
+        logger.info(f"{meta['year']} 年标题模式模型增量更新 {len(ids)} 条标题")
+
+    def get_patterns(self, year: int) -> Tuple[Optional[Dict[str, Any]], Optional[Future]]:
+        """获取某年的标题模式（阻塞调用，接口中应放到线程中执行）
+
+        Returns:
+            (模型元数据, 后台拟合任务)：没有可用模型时元数据为 None，需要等待拟合任务完成
+        """
+        lock = self._year_locks.setdefault(year, threading.Lock())
+        with lock:
+            state = self._models.get(year)
+            if state is None:
+                state = load_model(self.base_dir(), year)
+                if state is None:
+                    return None, self.schedule_fit(year)
+                self._models[year] = state
+
+            meta = state['meta']
+            table = f"bilibili_history_{year}"
+            conn = connect_history(self._db_path(), read_only=True)
+            try:
+                current = title_fingerprint(conn, table)
+                after_id = appended_after(conn, table, current, (meta['max_id'], meta['fingerprint']),
+                                          _FINGERPRINT_TOTALS, _TITLE_WHERE)
+                if after_id is None:
+                    self.stats["hits"] += 1
+                elif after_id and hasattr(state['kmeans'], 'cluster_centers_'):
+                    self._update_incremental(state, conn, table, *current)
+                else:
+                    # 旧记录被删除或修改，继续使用当前模型，同时后台重新拟合
+                    return state['meta'], self.schedule_fit(year)
+            finally:
+                conn.close()
+
+            reason = self._needs_refit(state['meta'], model_settings())
+            if reason:
+                logger.info(f"{year} 年标题模式模型需要重新拟合：{reason}")
+                return state['meta'], self.schedule_fit(year)
+            pending = self._fits.get(year)
+            return state['meta'], pending if pending is not None and not pending.done() else None
+
+    async def patterns(self, year: int, wait: bool = True) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """异步获取标题模式，返回（模型元数据, 是否正在后台重新拟合）"""
+        meta, future = await asyncio.to_thread(self.get_patterns, year)
+        if meta is None and future is not None and wait:
+            meta = await asyncio.wrap_future(future)
+            future = None
+        return meta, future is not None and not future.done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "loaded_years": sorted(self._models),
+            "fitting_years": sorted(y for y, f in self._fits.items() if not f.done()),
+        }
@@ -1,8 +1,13 @@
+import atexit
+import copy
 import os
+import queue
 import sqlite3
 import sys
+import threading
 from datetime import datetime
-from typing import Dict, Any
+from types import MappingProxyType
+from typing import Dict, Any, Callable, Iterable, List, Mapping, Optional
 
 import yaml
 from loguru import logger
@@ -10,17 +15,135 @@ from loguru import logger
 # 全局变量，用于标记日志系统是否已初始化
 _logger_initialized = False
 
-def setup_logger(log_level: str = "INFO") -> Dict:
+# 标准日志级别对应的数值，避免每次检查都查询loguru
+_LEVEL_NO = {"TRACE": 5, "DEBUG": 10, "INFO": 20, "SUCCESS": 25, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+
+# 默认日志级别（setup_logger 显式传入时覆盖配置）与按模块名缓存的最低级别
+_default_log_level: Optional[str] = None
+_module_level_cache: Dict[str, int] = {}
+
+
+def _level_no(level: Any) -> int:
+    if isinstance(level, int):
+        return level
+    name = str(level).upper()
+    no = _LEVEL_NO.get(name)
+    if no is None:
+        no = logger.level(name).no
+    return no
+
+
+def _module_level_no(name: str) -> int:
+    """获取模块的最低日志级别，按 logging.modules 中最长的前缀匹配"""
+    cached = _module_level_cache.get(name)
+    if cached is not None:
+        return cached
+
+    try:
+        settings = get_config().get('logging', {}) or {}
+        cacheable = True
+    except Exception:
+        # 配置尚未可用时使用默认级别，但不缓存
+        settings, cacheable = {}, False
+
+    level = _default_log_level or settings.get('level', 'INFO')
+    best = ''
+    for prefix, module_level in (settings.get('modules') or {}).items():
+        if (name == prefix or name.startswith(prefix + '.')) and len(prefix) > len(best):
+            best, level = prefix, module_level
+
+    no = _level_no(level)
+    if cacheable:
+        _module_level_cache[name] = no
+    return no
+
+
+def log_enabled(level: str, name: Optional[str] = None) -> bool:
+    """判断某个级别的日志在指定模块中是否会被记录
+
+    用于在热路径上跳过调试日志的字符串格式化，name 为空时使用调用方的模块名。
+    """
+    if name is None:
+        name = sys._getframe(1).f_globals.get('__name__', '')
+    return _level_no(level) >= _module_level_no(name)
+
+
+def _record_allowed(record) -> bool:
+    return record["level"].no >= _module_level_no(record["name"] or '')
+
+
+def _reset_log_levels(old_config=None, new_config=None) -> None:
+    _module_level_cache.clear()
+
+
+class _AsyncLogWriter:
+    """在后台线程写日志文件
+
+    loguru 的 enqueue=True 会在调用线程 pickle 每条记录再经过进程间管道，开销比写文件本身还大。
+    这里调用线程只做格式化并放入内存队列，后台线程再交给一个独立的 loguru 实例写文件，
+    按天轮转、保留期和压缩仍由 loguru 处理。
+    """
+
+    def __init__(self):
+        # 需在主 logger 移除所有处理器之后复制，得到一个互不影响的实例
+        self._file_logger = copy.deepcopy(logger)
+        self._file_logger.remove()
+        self._targets: Dict[str, Any] = {}
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add_file(self, path: str, level: str, format: str, filter=None, **file_options) -> None:
+        """添加一个文件处理器，file_options 与 logger.add 的文件参数一致"""
+        self._file_logger.add(
+            path,
+            level=0,
+            format="{message}",
+            filter=lambda record, target=path: record["extra"].get("target") == target,
+            encoding="utf-8",
+            enqueue=False,
+            diagnose=False,
+            backtrace=False,
+            **file_options
+        )
+        self._targets[path] = self._file_logger.bind(target=path).opt(raw=True)
+
+        def sink(message, target=path):
+            self._queue.put((target, message.record["level"].name, str(message)))
+
+        logger.add(sink, level=level, format=format, filter=filter, enqueue=False, diagnose=False, backtrace=False)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            target, level, text = item
+            try:
+                self._targets[target].log(level, text)
+            except Exception as e:
+                sys.__stderr__.write(f"写入日志文件失败: {e}\n{text}")
+
+    def close(self) -> None:
+        """写完队列中剩余的日志后停止后台线程"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+def setup_logger(log_level: Optional[str] = None) -> Dict:
     """
     统一的日志系统初始化函数
 
     Args:
-        log_level: 日志级别，默认为INFO
+        log_level: 默认日志级别，为空时使用配置中的 logging.level（默认INFO），
+            可通过 logging.modules 为单个模块单独设置级别
 
     Returns:
         包含日志路径信息的字典
     """
-    global _logger_initialized
+    global _logger_initialized, _default_log_level
 
     # 获取当前日志文件路径
     current_date = datetime.now().strftime("%Y/%m/%d")
@@ -42,9 +165,16 @@ def setup_logger(log_level: str = "INFO") -> Dict:
             "error_log_file": error_log_file
         }
 
+    if log_level:
+        _default_log_level = log_level
+        _reset_log_levels()
+
     # 移除默认处理器
     logger.remove()
 
+    # 文件日志交给后台线程写入，调用线程只负责格式化（需在添加其他处理器之前创建）
+    writer = _AsyncLogWriter()
+
     # 配置全局上下文信息
     logger.configure(extra={"app_name": "BilibiliHistoryFetcher", "version": "1.0.0"})
 
@@ -56,7 +186,8 @@ def setup_logger(log_level: str = "INFO") -> Dict:
         filter=lambda record: (
             # 只有以特定字符开头的信息才输出到控制台
             isinstance(record["message"], str) and
-            record["message"].startswith(("===", "正在", "已", "成功", "错误:", "警告:"))
+            record["message"].startswith(("===", "正在", "已", "成功", "错误:", "警告:")) and
+            _record_allowed(record)
         ),
         enqueue=True,  # 确保控制台输出也是进程安全的
         diagnose=False  # 禁用诊断以避免日志循环
@@ -69,14 +200,11 @@ def setup_logger(log_level: str = "INFO") -> Dict:
     dynamic_log_path = "output/logs/{time:YYYY}/{time:MM}/{time:DD}/{time:DD}.log"
     
     # 添加文件处理器（完整日志信息）
-    logger.add(
+    writer.add_file(
         dynamic_log_path,  # 使用动态路径
-        level=log_level,
+        level="TRACE",  # 实际级别由 _record_allowed 按模块判断
+        filter=_record_allowed,
         format="[{time:YYYY-MM-DD HH:mm:ss}] [{level}] [{extra[app_name]}] [v{extra[version]}] [进程:{process}] [线程:{thread}] [{name}] [{file.name}:{line}] [{function}] {message}\n{exception}",
-        encoding="utf-8",
-        enqueue=True,  # 启用进程安全的队列
-        diagnose=False,  # 禁用诊断信息，避免不必要的栈跟踪导致的死锁
-        backtrace=False,  # 禁用异常回溯，避免不必要的栈跟踪
         rotation="00:00",  # 每天午夜轮转
         retention="30 days",  # 保留30天的日志
         compression="zip"  # 压缩旧日志
@@ -86,14 +214,10 @@ def setup_logger(log_level: str = "INFO") -> Dict:
     dynamic_error_log_path = "output/logs/{time:YYYY}/{time:MM}/{time:DD}/error_{time:DD}.log"
     
     # 专门用于记录错误级别日志的处理器
-    logger.add(
+    writer.add_file(
         dynamic_error_log_path,  # 使用动态路径
         level="ERROR",  # 只记录ERROR及以上级别
         format="[{time:YYYY-MM-DD HH:mm:ss}] [{level}] [{extra[app_name]}] [{name}] [{file.name}:{line}] [{function}] {message}\n{exception}",
-        encoding="utf-8",
-        enqueue=True,
-        diagnose=False,  # 禁用诊断信息
-        backtrace=False,  # 禁用异常回溯
         rotation="00:00",  # 每天午夜轮转
         retention="30 days",
         compression="zip"
@@ -114,9 +238,6 @@ def setup_logger(log_level: str = "INFO") -> Dict:
         "error_log_file": error_log_file
     }
 
-# 初始化日志系统
-setup_logger()
-
 
 def get_base_path() -> str:
     """获取项目基础路径"""
@@ -144,11 +265,76 @@ def get_config_path(config_file: str) -> str:
         base_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         return os.path.join(base_path, 'config', config_file)
 
-def load_config() -> Dict[str, Any]:
-    """加载配置文件并验证"""
-    try:
+def _freeze(value: Any) -> Any:
+    """将解析后的配置递归转换为只读结构（dict -> MappingProxyType，list -> tuple）"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    """将只读配置快照还原为可修改的 dict/list 副本"""
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+class ConfigService:
+    """config.yaml 的进程内配置服务
+
+    - 只在文件 mtime/大小变化时重新解析 YAML，其余调用直接返回缓存的快照
+    - 快照为只读结构，可在线程间安全共享
+    - 支持按顶层键注册变更回调（例如 SESSDATA 变化时重建 HTTP 会话）
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'ConfigService':
+        """获取 ConfigService 的单例实例"""
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._snapshot: Optional[Mapping[str, Any]] = None
+        self._signature: Optional[tuple] = None
+        self._reload_lock = threading.Lock()
+        self._callbacks: List[tuple] = []
+
+    @staticmethod
+    def _validate(config: Dict[str, Any]) -> None:
+        """验证配置内容"""
+        if not isinstance(config, dict):
+            raise ValueError("配置文件格式错误：顶层必须是映射")
+
+        # 验证邮件配置
+        email_config = config.get('email', {})
+        required_fields = ['smtp_server', 'smtp_port', 'sender', 'password', 'receiver']
+        missing_fields = [field for field in required_fields if not email_config.get(field)]
+
+        if missing_fields:
+            raise ValueError(f"邮件配置缺少必要字段: {', '.join(missing_fields)}")
+
+    def _stat_signature(self, config_path: str) -> tuple:
+        st = os.stat(config_path)
+        return (config_path, st.st_mtime_ns, st.st_size)
+
+    def get(self) -> Mapping[str, Any]:
+        """返回当前配置快照；文件有变化时先重新加载"""
         config_path = get_config_path('config.yaml')
-        if not os.path.exists(config_path):
+        try:
+            signature = self._stat_signature(config_path)
+        except FileNotFoundError:
+            if self._snapshot is not None:
+                return self._snapshot
             # 打印更多调试信息
             base_path = get_base_path()
             logger.debug(f"\n=== 配置文件信息 ===")
@@ -160,18 +346,73 @@ def load_config() -> Dict[str, Any]:
             logger.debug("=====================\n")
             raise FileNotFoundError(f"配置文件不存在: {config_path}")
 
-        with open(config_path, 'r', encoding='utf-8') as f:
-            config = yaml.safe_load(f)
+        if signature != self._signature:
+            self._reload(config_path, signature)
+        return self._snapshot
+
+    def _reload(self, config_path: str, signature: tuple) -> None:
+        with self._reload_lock:
+            if signature == self._signature:
+                return
+            try:
+                with open(config_path, 'r', encoding='utf-8') as f:
+                    config = yaml.safe_load(f)
+                self._validate(config)
+            except Exception:
+                # 已有可用快照时保留旧配置，避免编辑过程中的半成品文件影响运行
+                if self._snapshot is not None:
+                    logger.exception("重新加载配置文件失败，继续使用上一次的有效配置")
+                    self._signature = signature
+                    return
+                raise
+
+            old = self._snapshot
+            self._snapshot = _freeze(config)
+            self._signature = signature
+
+        if old is not None:
+            self._notify(old, self._snapshot)
+
+    def invalidate(self) -> None:
+        """强制下一次读取时重新解析（用于程序自身写回配置文件后）"""
+        self._signature = None
+
+    def on_change(self, callback: Callable[[Mapping[str, Any], Mapping[str, Any]], None],
+                  keys: Optional[Iterable[str]] = None) -> None:
+        """注册配置变更回调
+
+        Args:
+            callback: 回调函数，参数为 (旧快照, 新快照)
+            keys: 关注的顶层键，为空时任意变化都会触发
+        """
+        self._callbacks.append((callback, tuple(keys) if keys else None))
+
+    def _notify(self, old: Mapping[str, Any], new: Mapping[str, Any]) -> None:
+        changed = {k for k in set(old) | set(new) if old.get(k) != new.get(k)}
+        if not changed:
+            return
+        logger.info(f"配置文件已更新，变更项: {', '.join(sorted(changed))}")
+        for callback, keys in list(self._callbacks):
+            if keys is not None and not changed.intersection(keys):
+                continue
+            try:
+                callback(old, new)
+            except Exception as e:
+                logger.error(f"执行配置变更回调失败: {e}")
+
+
+def get_config() -> Mapping[str, Any]:
+    """获取只读配置快照（热路径使用，不会重复解析YAML）"""
+    return ConfigService.get_instance().get()
 
-        # 验证邮件配置
-        email_config = config.get('email', {})
-        required_fields = ['smtp_server', 'smtp_port', 'sender', 'password', 'receiver']
-        missing_fields = [field for field in required_fields if not email_config.get(field)]
 
-        if missing_fields:
-            raise ValueError(f"邮件配置缺少必要字段: {', '.join(missing_fields)}")
+def load_config() -> Dict[str, Any]:
+    """加载配置文件并验证
 
-        return config
+    返回当前快照的可修改副本；只读场景请使用 get_config()。
+    """
+    try:
+        return _thaw(get_config())
     except Exception as e:
         logger.error(f"加载配置文件失败: {str(e)}")
         raise
@@ -257,3 +498,8 @@ def get_db():
     """获取数据库连接"""
     db_path = get_database_path('bilibili_history.db')
     return sqlite3.connect(db_path)
+
+
+# 初始化日志系统（放在配置服务之后，以便读取 logging 配置）
+setup_logger()
+ConfigService.get_instance().on_change(_reset_log_levels, keys=('logging',))
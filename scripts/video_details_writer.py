@@ -0,0 +1,850 @@
+import concurrent.futures
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from scripts.dynamic_db import compress_raw_json, decompress_raw_json
+from scripts.metrics import WORKER_QUEUE_DEPTH, sqlite_factory
+from scripts.utils import get_config, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+# 数据库路径
+DB_PATH = os.path.join("output", "database", "bilibili_video_details.db")
+
+# 确保数据库目录存在
+os.makedirs(os.path.join("output", "database"), exist_ok=True)
+
+
+def create_tables(conn: sqlite3.Connection) -> None:
+    """创建视频详情相关的表和索引"""
+    cursor = conn.cursor()
+
+    # 视频基本信息表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS video_base_info (
+        id INTEGER PRIMARY KEY,
+        bvid TEXT NOT NULL UNIQUE,
+        aid INTEGER NOT NULL,
+        videos INTEGER DEFAULT 1,
+        tid INTEGER,
+        tid_v2 INTEGER,
+        tname TEXT,
+        tname_v2 TEXT,
+        copyright INTEGER,
+        pic TEXT,
+        title TEXT NOT NULL,
+        pubdate INTEGER,
+        ctime INTEGER,
+        desc TEXT,
+        desc_v2 TEXT,
+        state INTEGER DEFAULT 0,
+        duration INTEGER,
+        mission_id INTEGER,
+        dynamic TEXT,
+        cid INTEGER,
+        season_id INTEGER,
+        premiere INTEGER,
+        teenage_mode INTEGER DEFAULT 0,
+        is_chargeable_season INTEGER DEFAULT 0,
+        is_story INTEGER DEFAULT 0,
+        is_upower_exclusive INTEGER DEFAULT 0,
+        is_upower_play INTEGER DEFAULT 0,
+        is_upower_preview INTEGER DEFAULT 0,
+        enable_vt INTEGER DEFAULT 0,
+        vt_display TEXT,
+        is_upower_exclusive_with_qa INTEGER DEFAULT 0,
+        no_cache INTEGER DEFAULT 0,
+        is_season_display INTEGER DEFAULT 0,
+        like_icon TEXT,
+        need_jump_bv INTEGER DEFAULT 0,
+        disable_show_up_info INTEGER DEFAULT 0,
+        is_story_play INTEGER DEFAULT 0,
+        owner_mid INTEGER,
+        owner_name TEXT,
+        owner_face TEXT,
+        stat_view INTEGER DEFAULT 0,
+        stat_danmaku INTEGER DEFAULT 0,
+        stat_reply INTEGER DEFAULT 0,
+        stat_favorite INTEGER DEFAULT 0,
+        stat_coin INTEGER DEFAULT 0,
+        stat_share INTEGER DEFAULT 0,
+        stat_like INTEGER DEFAULT 0,
+        stat_dislike INTEGER DEFAULT 0,
+        stat_his_rank INTEGER DEFAULT 0,
+        stat_now_rank INTEGER DEFAULT 0,
+        stat_evaluation TEXT,
+        stat_vt INTEGER DEFAULT 0,
+        dimension_width INTEGER,
+        dimension_height INTEGER,
+        dimension_rotate INTEGER DEFAULT 0,
+        rights_bp INTEGER DEFAULT 0,
+        rights_elec INTEGER DEFAULT 0,
+        rights_download INTEGER DEFAULT 0,
+        rights_movie INTEGER DEFAULT 0,
+        rights_pay INTEGER DEFAULT 0,
+        rights_hd5 INTEGER DEFAULT 0,
+        rights_no_reprint INTEGER DEFAULT 0,
+        rights_autoplay INTEGER DEFAULT 0,
+        rights_ugc_pay INTEGER DEFAULT 0,
+        rights_is_cooperation INTEGER DEFAULT 0,
+        rights_ugc_pay_preview INTEGER DEFAULT 0,
+        rights_no_background INTEGER DEFAULT 0,
+        rights_clean_mode INTEGER DEFAULT 0,
+        rights_is_stein_gate INTEGER DEFAULT 0,
+        rights_is_360 INTEGER DEFAULT 0,
+        rights_no_share INTEGER DEFAULT 0,
+        rights_arc_pay INTEGER DEFAULT 0,
+        rights_free_watch INTEGER DEFAULT 0,
+        argue_msg TEXT,
+        argue_type INTEGER DEFAULT 0,
+        argue_link TEXT,
+        fetch_time INTEGER NOT NULL,
+        update_time INTEGER DEFAULT 0
+    )
+    """)
+
+    # 视频分P信息表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS video_pages (
+        id INTEGER PRIMARY KEY,
+        bvid TEXT NOT NULL,
+        cid INTEGER NOT NULL,
+        page INTEGER NOT NULL,
+        part TEXT,
+        duration INTEGER,
+        from_source TEXT,
+        vid TEXT,
+        weblink TEXT,
+        dimension_width INTEGER,
+        dimension_height INTEGER,
+        dimension_rotate INTEGER DEFAULT 0,
+        first_frame TEXT,
+        ctime INTEGER DEFAULT 0,
+        UNIQUE(bvid, cid)
+    )
+    """)
+
+    # 视频标签信息表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS video_tags (
+        id INTEGER PRIMARY KEY,
+        bvid TEXT NOT NULL,
+        tag_id INTEGER NOT NULL,
+        tag_name TEXT NOT NULL,
+        music_id TEXT,
+        tag_type TEXT,
+        jump_url TEXT,
+        cover TEXT,
+        content TEXT,
+        short_content TEXT,
+        type INTEGER,
+        state INTEGER,
+        UNIQUE(bvid, tag_id)
+    )
+    """)
+
+    # UP主详细信息表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS uploader_info (
+        mid INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        sex TEXT,
+        face TEXT,
+        face_nft INTEGER DEFAULT 0,
+        face_nft_type INTEGER DEFAULT 0,
+        sign TEXT,
+        rank TEXT,
+        level INTEGER DEFAULT 0,
+        regtime INTEGER DEFAULT 0,
+        spacesta INTEGER DEFAULT 0,
+        birthday TEXT,
+        place TEXT,
+        description TEXT,
+        article INTEGER DEFAULT 0,
+        fans INTEGER DEFAULT 0,
+        friend INTEGER DEFAULT 0,
+        attention INTEGER DEFAULT 0,
+        official_role INTEGER DEFAULT 0,
+        official_title TEXT,
+        official_desc TEXT,
+        official_type INTEGER DEFAULT 0,
+        vip_type INTEGER DEFAULT 0,
+        vip_status INTEGER DEFAULT 0,
+        vip_due_date INTEGER DEFAULT 0,
+        vip_pay_type INTEGER DEFAULT 0,
+        vip_theme_type INTEGER DEFAULT 0,
+        vip_avatar_subscript INTEGER DEFAULT 0,
+        vip_nickname_color TEXT,
+        vip_role INTEGER DEFAULT 0,
+        vip_avatar_subscript_url TEXT,
+        pendant_pid INTEGER DEFAULT 0,
+        pendant_name TEXT,
+        pendant_image TEXT,
+        pendant_expire INTEGER DEFAULT 0,
+        nameplate_nid INTEGER DEFAULT 0,
+        nameplate_name TEXT,
+        nameplate_image TEXT,
+        nameplate_image_small TEXT,
+        nameplate_level TEXT,
+        nameplate_condition TEXT,
+        is_senior_member INTEGER DEFAULT 0,
+        following INTEGER DEFAULT 0,
+        archive_count INTEGER DEFAULT 0,
+        article_count INTEGER DEFAULT 0,
+        like_num INTEGER DEFAULT 0,
+        fetch_time INTEGER NOT NULL,
+        update_time INTEGER DEFAULT 0
+    )
+    """)
+
+    # 视频荣誉信息表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS video_honors (
+        id INTEGER PRIMARY KEY,
+        bvid TEXT NOT NULL,
+        aid INTEGER NOT NULL,
+        type INTEGER NOT NULL,
+        desc TEXT,
+        weekly_recommend_num INTEGER DEFAULT 0,
+        UNIQUE(bvid, type)
+    )
+    """)
+
+    # 视频字幕信息表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS video_subtitles (
+        id INTEGER PRIMARY KEY,
+        bvid TEXT NOT NULL,
+        allow_submit INTEGER DEFAULT 0,
+        subtitle_id INTEGER,
+        lan TEXT,
+        lan_doc TEXT,
+        is_lock INTEGER DEFAULT 0,
+        subtitle_url TEXT,
+        UNIQUE(bvid, subtitle_id)
+    )
+    """)
+
+    # 相关视频信息表
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS related_videos (
+        id INTEGER PRIMARY KEY,
+        bvid TEXT NOT NULL,
+        related_bvid TEXT NOT NULL,
+        related_aid INTEGER NOT NULL,
+        related_title TEXT,
+        related_pic TEXT,
+        related_owner_mid INTEGER,
+        related_owner_name TEXT,
+        related_owner_face TEXT,
+        UNIQUE(bvid, related_bvid)
+    )
+    """)
+
+    # 原始API响应归档表（压缩存储，按 video_details.raw_archive 配置启用）
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS video_raw_responses (
+        bvid TEXT PRIMARY KEY,
+        fetch_time INTEGER NOT NULL,
+        codec TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        data BLOB NOT NULL
+    )
+    """)
+
+    # 创建索引
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_raw_responses_fetch_time ON video_raw_responses (fetch_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_base_info_owner_mid ON video_base_info (owner_mid)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_base_info_fetch_time ON video_base_info (fetch_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_pages_bvid ON video_pages (bvid)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_tags_bvid ON video_tags (bvid)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_honors_bvid ON video_honors (bvid)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_subtitles_bvid ON video_subtitles (bvid)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_related_videos_bvid ON related_videos (bvid)")
+
+    # 提交更改
+    conn.commit()
+
+
+def init_db() -> None:
+    """初始化数据库"""
+    with sqlite3.connect(DB_PATH, factory=sqlite_factory()) as conn:
+        create_tables(conn)
+
+
+# ---- 行数据构造 ----
+
+BASE_INFO_COLUMNS = [
+    "bvid", "aid", "videos", "tid", "tid_v2", "tname", "tname_v2", "copyright", "pic", "title",
+    "pubdate", "ctime", "desc", "desc_v2", "state", "duration", "mission_id", "dynamic", "cid",
+    "season_id", "premiere", "teenage_mode", "is_chargeable_season", "is_story",
+    "is_upower_exclusive", "is_upower_play", "is_upower_preview", "enable_vt", "vt_display",
+    "is_upower_exclusive_with_qa", "no_cache", "is_season_display", "like_icon",
+    "need_jump_bv", "disable_show_up_info", "is_story_play", "owner_mid", "owner_name",
+    "owner_face", "stat_view", "stat_danmaku", "stat_reply", "stat_favorite", "stat_coin",
+    "stat_share", "stat_like", "stat_dislike", "stat_his_rank", "stat_now_rank",
+    "stat_evaluation", "stat_vt", "dimension_width", "dimension_height", "dimension_rotate",
+    "rights_bp", "rights_elec", "rights_download", "rights_movie", "rights_pay", "rights_hd5",
+    "rights_no_reprint", "rights_autoplay", "rights_ugc_pay", "rights_is_cooperation",
+    "rights_ugc_pay_preview", "rights_no_background", "rights_clean_mode",
+    "rights_is_stein_gate", "rights_is_360", "rights_no_share", "rights_arc_pay",
+    "rights_free_watch", "argue_msg", "argue_type", "argue_link", "fetch_time", "update_time"
+]
+
+UPLOADER_COLUMNS = [
+    "mid", "name", "sex", "face", "face_nft", "face_nft_type",
+    "sign", "rank", "level", "regtime", "spacesta",
+    "birthday", "place", "description", "article",
+    "fans", "friend", "attention",
+    "official_role", "official_title", "official_desc", "official_type",
+    "vip_type", "vip_status", "vip_due_date", "vip_pay_type",
+    "vip_theme_type", "vip_avatar_subscript",
+    "vip_nickname_color", "vip_role", "vip_avatar_subscript_url",
+    "pendant_pid", "pendant_name", "pendant_image", "pendant_expire",
+    "nameplate_nid", "nameplate_name", "nameplate_image",
+    "nameplate_image_small", "nameplate_level", "nameplate_condition",
+    "is_senior_member",
+    "following", "archive_count", "article_count", "like_num",
+    "fetch_time", "update_time"
+]
+
+PAGE_COLUMNS = [
+    "bvid", "cid", "page", "part", "duration", "from_source", "vid", "weblink",
+    "dimension_width", "dimension_height", "dimension_rotate", "first_frame", "ctime"
+]
+TAG_COLUMNS = [
+    "bvid", "tag_id", "tag_name", "music_id", "tag_type", "jump_url",
+    "cover", "content", "short_content", "type", "state"
+]
+HONOR_COLUMNS = ["bvid", "aid", "type", "desc", "weekly_recommend_num"]
+SUBTITLE_COLUMNS = ["bvid", "allow_submit", "subtitle_id", "lan", "lan_doc", "is_lock", "subtitle_url"]
+RELATED_COLUMNS = [
+    "bvid", "related_bvid", "related_aid", "related_title", "related_pic",
+    "related_owner_mid", "related_owner_name", "related_owner_face"
+]
+
+# 子表：先按 bvid 删除旧数据再插入。replace_always 为 False 的表只在响应中有数据时才替换
+CHILD_TABLES = [
+    ("video_pages", PAGE_COLUMNS, True),
+    ("video_tags", TAG_COLUMNS, True),
+    ("video_honors", HONOR_COLUMNS, False),
+    ("video_subtitles", SUBTITLE_COLUMNS, False),
+    ("related_videos", RELATED_COLUMNS, False),
+]
+
+
+def _sqlite_value(value: Any) -> Any:
+    """列表、字典等 SQLite 不支持的类型转换为 JSON 字符串"""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+def _upsert_sql(table: str, columns: List[str], key: str, keep: Tuple[str, ...]) -> str:
+    """INSERT ... ON CONFLICT DO UPDATE，keep 中的列在更新时保留原值"""
+    updates = ", ".join(f"{col} = excluded.{col}" for col in columns if col != key and col not in keep)
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+        f"ON CONFLICT({key}) DO UPDATE SET {updates}"
+    )
+
+
+BASE_INFO_UPSERT = _upsert_sql("video_base_info", BASE_INFO_COLUMNS, "bvid", ("aid", "fetch_time"))
+UPLOADER_UPSERT = _upsert_sql("uploader_info", UPLOADER_COLUMNS, "mid", ("fetch_time",))
+
+
+class VideoRows:
+    """一个视频详情响应拆分后的各表数据"""
+
+    __slots__ = ("bvid", "base", "uploader", "children", "raw")
+
+    def __init__(self, bvid: str, base: tuple, uploader: Optional[tuple],
+                 children: Dict[str, Optional[List[tuple]]], raw: Dict[str, Any]):
+        self.bvid = bvid
+        self.base = base
+        self.uploader = uploader
+        # None 表示响应中没有该部分数据，保留数据库中已有的记录
+        self.children = children
+        self.raw = raw
+
+
+def build_video_rows(data: Dict[str, Any], now_timestamp: Optional[int] = None) -> Optional[VideoRows]:
+    """把视频详情 API 响应转换为各表的行数据，数据不完整时返回 None"""
+    now_timestamp = now_timestamp or int(time.time())
+    payload = data.get("data", {}) or {}
+    view_data = payload.get("View", {}) or {}
+    if not view_data:
+        logger.error("视频数据为空")
+        return None
+    bvid = view_data.get("bvid")
+    if not bvid:
+        logger.error("视频BV号为空")
+        return None
+
+    card_data = payload.get("Card", {}) or {}
+    tags_data = payload.get("Tags", []) or []
+    related_data = payload.get("Related", []) or []
+    honor_reply_data = view_data.get("honor_reply", {}).get("honor", []) if view_data.get("honor_reply") else []
+    subtitle_data = view_data.get("subtitle", {}) if view_data.get("subtitle") else {}
+
+    owner = view_data.get("owner", {})
+    stat = view_data.get("stat", {})
+    dimension = view_data.get("dimension", {})
+    rights = view_data.get("rights", {})
+    argue_info = view_data.get("argue_info", {})
+    desc_v2 = view_data.get("desc_v2")
+
+    base = (
+        bvid,
+        view_data.get("aid"),
+        view_data.get("videos", 1),
+        view_data.get("tid"),
+        view_data.get("tid_v2"),
+        view_data.get("tname"),
+        view_data.get("tname_v2"),
+        view_data.get("copyright"),
+        view_data.get("pic"),
+        view_data.get("title"),
+        view_data.get("pubdate"),
+        view_data.get("ctime"),
+        view_data.get("desc"),
+        # 对于desc_v2字段，如果是列表且有内容，只取第一项的raw_text值
+        desc_v2[0].get("raw_text") if isinstance(desc_v2, list) and desc_v2 else "",
+        view_data.get("state", 0),
+        view_data.get("duration"),
+        view_data.get("mission_id"),
+        view_data.get("dynamic"),
+        view_data.get("cid"),
+        view_data.get("season_id"),
+        1 if view_data.get("premiere") else 0,
+        view_data.get("teenage_mode", 0),
+        1 if view_data.get("is_chargeable_season") else 0,
+        1 if view_data.get("is_story") else 0,
+        1 if view_data.get("is_upower_exclusive") else 0,
+        1 if view_data.get("is_upower_play") else 0,
+        1 if view_data.get("is_upower_preview") else 0,
+        view_data.get("enable_vt", 0),
+        view_data.get("vt_display", ""),
+        1 if view_data.get("is_upower_exclusive_with_qa") else 0,
+        1 if view_data.get("no_cache") else 0,
+        1 if view_data.get("is_season_display") else 0,
+        view_data.get("like_icon", ""),
+        1 if view_data.get("need_jump_bv") else 0,
+        1 if view_data.get("disable_show_up_info") else 0,
+        view_data.get("is_story_play", 0),
+        owner.get("mid"),
+        owner.get("name"),
+        owner.get("face"),
+        stat.get("view", 0),
+        stat.get("danmaku", 0),
+        stat.get("reply", 0),
+        stat.get("favorite", 0),
+        stat.get("coin", 0),
+        stat.get("share", 0),
+        stat.get("like", 0),
+        stat.get("dislike", 0),
+        stat.get("his_rank", 0),
+        stat.get("now_rank", 0),
+        stat.get("evaluation", ""),
+        stat.get("vt", 0),
+        dimension.get("width"),
+        dimension.get("height"),
+        dimension.get("rotate", 0),
+        rights.get("bp", 0),
+        rights.get("elec", 0),
+        rights.get("download", 0),
+        rights.get("movie", 0),
+        rights.get("pay", 0),
+        rights.get("hd5", 0),
+        rights.get("no_reprint", 0),
+        rights.get("autoplay", 0),
+        rights.get("ugc_pay", 0),
+        rights.get("is_cooperation", 0),
+        rights.get("ugc_pay_preview", 0),
+        rights.get("no_background", 0),
+        rights.get("clean_mode", 0),
+        rights.get("is_stein_gate", 0),
+        rights.get("is_360", 0),
+        rights.get("no_share", 0),
+        rights.get("arc_pay", 0),
+        rights.get("free_watch", 0),
+        argue_info.get("argue_msg", ""),
+        argue_info.get("argue_type", 0),
+        argue_info.get("argue_link", ""),
+        now_timestamp,
+        now_timestamp,
+    )
+
+    uploader = None
+    up_info = card_data.get("card") if card_data else None
+    if up_info and up_info.get("mid"):
+        official = up_info.get("Official", {})
+        level_info = up_info.get("level_info", {})
+        vip = up_info.get("vip", {})
+        pendant = up_info.get("pendant", {})
+        nameplate = up_info.get("nameplate", {})
+        uploader = (
+            up_info.get("mid"),
+            up_info.get("name"),
+            up_info.get("sex"),
+            up_info.get("face"),
+            up_info.get("face_nft", 0),
+            up_info.get("face_nft_type", 0),
+            up_info.get("sign"),
+            up_info.get("rank"),
+            level_info.get("current_level", 0),
+            up_info.get("regtime", 0),
+            up_info.get("spacesta", 0),
+            up_info.get("birthday", ""),
+            up_info.get("place", ""),
+            up_info.get("description", ""),
+            up_info.get("article", 0),
+            up_info.get("fans", 0),
+            up_info.get("friend", 0),
+            up_info.get("attention", 0),
+            official.get("role", 0),
+            official.get("title", ""),
+            official.get("desc", ""),
+            official.get("type", 0),
+            vip.get("type", 0),
+            vip.get("status", 0),
+            vip.get("due_date", 0),
+            vip.get("vip_pay_type", 0),
+            vip.get("theme_type", 0),
+            vip.get("avatar_subscript", 0),
+            vip.get("nickname_color", ""),
+            vip.get("role", 0),
+            vip.get("avatar_subscript_url", ""),
+            pendant.get("pid", 0),
+            pendant.get("name", ""),
+            pendant.get("image", ""),
+            pendant.get("expire", 0),
+            nameplate.get("nid", 0),
+            nameplate.get("name", ""),
+            nameplate.get("image", ""),
+            nameplate.get("image_small", ""),
+            nameplate.get("level", ""),
+            nameplate.get("condition", ""),
+            up_info.get("is_senior_member", 0),
+            card_data.get("following", 0),
+            card_data.get("archive_count", 0),
+            card_data.get("article_count", 0),
+            card_data.get("like_num", 0),
+            now_timestamp,
+            now_timestamp,
+        )
+
+    pages = []
+    for page in view_data.get("pages", []) or []:
+        page_dimension = page.get("dimension", {})
+        pages.append((
+            bvid,
+            page.get("cid"),
+            page.get("page"),
+            page.get("part"),
+            page.get("duration"),
+            page.get("from"),
+            page.get("vid", ""),
+            page.get("weblink", ""),
+            page_dimension.get("width"),
+            page_dimension.get("height"),
+            page_dimension.get("rotate", 0),
+            page.get("first_frame"),
+            page.get("ctime", 0),
+        ))
+
+    tags = [(
+        bvid,
+        tag.get("tag_id"),
+        tag.get("tag_name"),
+        tag.get("music_id", ""),
+        tag.get("tag_type", ""),
+        tag.get("jump_url", ""),
+        tag.get("cover"),
+        tag.get("content"),
+        tag.get("short_content"),
+        tag.get("type"),
+        tag.get("state"),
+    ) for tag in tags_data]
+
+    honors = None
+    if honor_reply_data:
+        honors = [(
+            bvid,
+            honor.get("aid", view_data.get("aid")),
+            honor.get("type", 0),
+            honor.get("desc", ""),
+            honor.get("weekly_recommend_num", 0),
+        ) for honor in honor_reply_data]
+
+    subtitles = None
+    if subtitle_data:
+        allow_submit = 1 if subtitle_data.get("allow_submit") else 0
+        subtitle_list = subtitle_data.get("list", [])
+        if subtitle_list:
+            subtitles = [(
+                bvid,
+                allow_submit,
+                subtitle.get("id", 0),
+                subtitle.get("lan", ""),
+                subtitle.get("lan_doc", ""),
+                1 if subtitle.get("is_lock") else 0,
+                subtitle.get("subtitle_url", ""),
+            ) for subtitle in subtitle_list]
+        else:
+            # 如果没有字幕，但有allow_submit信息，也插入一条记录
+            subtitles = [(bvid, allow_submit, 0, "", "", 0, "")]
+
+    related = None
+    if related_data:
+        related = []
+        for item in related_data:
+            related_owner = item.get("owner", {})
+            related.append((
+                bvid,
+                item.get("bvid", ""),
+                item.get("aid", 0),
+                item.get("title", ""),
+                item.get("pic", ""),
+                related_owner.get("mid", 0),
+                related_owner.get("name", ""),
+                related_owner.get("face", ""),
+            ))
+
+    children = {
+        "video_pages": pages,
+        "video_tags": tags,
+        "video_honors": honors,
+        "video_subtitles": subtitles,
+        "related_videos": related,
+    }
+    return VideoRows(
+        bvid,
+        tuple(_sqlite_value(v) for v in base),
+        tuple(_sqlite_value(v) for v in uploader) if uploader else None,
+        {table: [tuple(_sqlite_value(v) for v in row) for row in rows] if rows is not None else None
+         for table, rows in children.items()},
+        data,
+    )
+
+
+# ---- 写入服务 ----
+
+class VideoDetailsWriter:
+    """视频详情单线程写入服务
+
+    所有视频详情由同一个后台线程、同一个数据库连接写入：表结构只在启动时
+    创建一次，队列中积压的多个视频合并到一个事务中批量写入各表，批量抓取时
+    不再有多线程争抢写锁。原始 API 响应可以按配置压缩后存入归档表，
+    并按总大小上限淘汰最旧的记录。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'VideoDetailsWriter':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self._queue: "queue.Queue[Tuple[Optional[VideoRows], concurrent.futures.Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._archive_bytes: Optional[int] = None
+        self.stats = {"videos": 0, "batches": 0, "errors": 0, "archived": 0, "pruned": 0}
+
+    @staticmethod
+    def _settings() -> Dict[str, Any]:
+        try:
+            return get_config().get("video_details", {}) or {}
+        except Exception:
+            return {}
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="video-details-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, data: Dict[str, Any]) -> concurrent.futures.Future:
+        """提交视频详情，立即返回；写入完成后 Future 结果为 bvid，数据不完整时为 None"""
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        rows = build_video_rows(data)
+        if rows is None:
+            future.set_result(None)
+            return future
+        self._ensure_thread()
+        self._queue.put((rows, future))
+        return future
+
+    def save(self, data: Dict[str, Any], timeout: Optional[float] = None) -> Optional[str]:
+        """提交并等待写入完成，写入失败时抛出异常"""
+        return self.submit(data).result(timeout)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """等待此前提交的数据全部写入"""
+        if self._thread is None:
+            return
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._queue.put((None, future))
+        future.result(timeout)
+
+    def _run(self) -> None:
+        conn = sqlite3.connect(self.db_path, factory=sqlite_factory())
+        try:
+            create_tables(conn)
+        except Exception as e:
+            logger.error(f"初始化视频详情数据库失败: {e}")
+        while True:
+            batch = [self._queue.get()]
+            batch_size = int(self._settings().get("write_batch_size", 100) or 100)
+            # 只合并已经在队列中的数据，不为凑批次额外等待
+            while len(batch) < batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            # 等待方已取消（如 asyncio.wrap_future 包装后请求被取消）的提交直接丢弃；
+            # 标记为运行中之后 Future 不能再被取消，之后设置结果不会抛出 InvalidStateError
+            batch = [(rows, future) for rows, future in batch if future.set_running_or_notify_cancel()]
+            items = [(rows, future) for rows, future in batch if rows is not None]
+            try:
+                if items:
+                    self._write(conn, items)
+            except Exception as e:
+                # 写入线程不能退出，否则之后提交的数据都不会被处理
+                logger.error(f"视频详情写入线程出错: {e}")
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+            for rows, future in batch:
+                if rows is None:
+                    future.set_result(None)
+
+    def _write(self, conn: sqlite3.Connection, items: List[Tuple[VideoRows, concurrent.futures.Future]]) -> None:
+        try:
+            self._write_batch(conn, [rows for rows, _ in items])
+        except Exception as e:
+            conn.rollback()
+            if len(items) == 1:
+                self.stats["errors"] += 1
+                logger.error(f"保存视频详情到数据库时出错 {items[0][0].bvid}: {e}")
+                items[0][1].set_exception(e)
+                return
+            # 批量写入失败时逐个重试，只让出错的视频失败
+            logger.warning(f"批量写入 {len(items)} 个视频详情失败，改为逐个写入: {e}")
+            for item in items:
+                self._write(conn, [item])
+            return
+        for rows, future in items:
+            future.set_result(rows.bvid)
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[VideoRows]) -> None:
+        # 同一批次中重复的视频只保留最新的一份
+        latest: Dict[str, VideoRows] = {}
+        for rows in batch:
+            latest[rows.bvid] = rows
+        videos = list(latest.values())
+
+        cursor = conn.cursor()
+        cursor.executemany(BASE_INFO_UPSERT, [rows.base for rows in videos])
+        uploaders = [rows.uploader for rows in videos if rows.uploader]
+        if uploaders:
+            cursor.executemany(UPLOADER_UPSERT, uploaders)
+
+        for table, columns, replace_always in CHILD_TABLES:
+            targets = [rows for rows in videos if replace_always or rows.children[table] is not None]
+            if not targets:
+                continue
+            cursor.executemany(f"DELETE FROM {table} WHERE bvid = ?", [(rows.bvid,) for rows in targets])
+            values = [row for rows in targets for row in rows.children[table] or []]
+            if values:
+                cursor.executemany(
+                    f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})",
+                    values
+                )
+
+        archive = self._archive(cursor, videos)
+        conn.commit()
+
+        # 归档大小和计数在提交成功后才更新，回滚的批次不计入
+        if archive is not None:
+            self._archive_bytes, archived, pruned = archive
+            self.stats["archived"] += archived
+            self.stats["pruned"] += pruned
+        self.stats["videos"] += len(videos)
+        self.stats["batches"] += 1
+        logger.info(f"已保存 {len(videos)} 个视频的超详细信息到数据库")
+
+    def _archive(self, cursor: sqlite3.Cursor, videos: List[VideoRows]) -> Optional[Tuple[int, int, int]]:
+        """按配置压缩保存原始响应，总大小超过上限时删除最旧的记录
+
+        返回（写入后的归档总大小, 归档数, 淘汰数），未开启归档时返回 None；由调用方在提交成功后更新统计。
+        """
+        settings = self._settings()
+        codec = str(settings.get("raw_archive", "none") or "none").lower()
+        if codec == "none":
+            return None
+
+        total = self._archive_bytes
+        if total is None:
+            total = cursor.execute("SELECT COALESCE(SUM(size), 0) FROM video_raw_responses").fetchone()[0]
+
+        now = int(time.time())
+        archived = 0
+        for rows in videos:
+            used_codec, blob = compress_raw_json(rows.raw, codec)
+            if blob is None:
+                continue
+            old = cursor.execute("SELECT size FROM video_raw_responses WHERE bvid = ?", (rows.bvid,)).fetchone()
+            cursor.execute(
+                "INSERT OR REPLACE INTO video_raw_responses (bvid, fetch_time, codec, size, data) VALUES (?, ?, ?, ?, ?)",
+                (rows.bvid, now, used_codec, len(blob), blob)
+            )
+            total += len(blob) - (old[0] if old else 0)
+            archived += 1
+
+        max_bytes = int(float(settings.get("raw_archive_max_mb", 256)) * 1024 * 1024)
+        if total <= max_bytes:
+            return total, archived, 0
+        excess = total - max_bytes
+        victims = []
+        for bvid, size in cursor.execute("SELECT bvid, size FROM video_raw_responses ORDER BY fetch_time"):
+            victims.append((bvid,))
+            excess -= size
+            total -= size
+            if excess <= 0:
+                break
+        cursor.executemany("DELETE FROM video_raw_responses WHERE bvid = ?", victims)
+        return total, archived, len(victims)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "queued": self._queue.qsize(), "archive_bytes": self._archive_bytes}
+
+
+WORKER_QUEUE_DEPTH.set_function(('video_details_writer',), lambda: VideoDetailsWriter._instance._queue.qsize())
+
+
+def load_raw_response(bvid: str) -> Optional[Dict[str, Any]]:
+    """读取归档的原始 API 响应"""
+    with sqlite3.connect(DB_PATH, factory=sqlite_factory()) as conn:
+        row = conn.execute("SELECT codec, data FROM video_raw_responses WHERE bvid = ?", (bvid,)).fetchone()
+    if not row:
+        return None
+    return decompress_raw_json(row[0], row[1])
@@ -0,0 +1,323 @@
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, tzinfo
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from scripts.history_partitions import appended_after, connect_history, history_years, table_fingerprint
+from scripts.history_time_columns import local_timezone
+from scripts.utils import get_config, get_database_path, get_output_path, setup_logger
+
+# 确保日志系统已初始化
+setup_logger()
+
+CUBE_DB_FILE = 'bilibili_viewing_cube.db'
+
+# 原始记录先按 15 分钟分桶再换算为本地时间，所有现行时区的偏移量都是 15 分钟的整数倍
+BUCKET_SECONDS = 900
+
+WEEKDAY_LABELS = ["周日", "周一", "周二", "周三", "周四", "周五", "周六"]
+
+# 年份表指纹包含的列：这些列有改动时需要重新聚合
+_FINGERPRINT_TOTALS = ('view_at', 'duration', 'progress', 'length(main_category)', 'length(tag_name)')
+
+
+def create_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS viewing_cube (
+            source_year INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            weekday INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            main_category TEXT NOT NULL,
+            tag_name TEXT NOT NULL,
+            view_count INTEGER NOT NULL,
+            total_duration REAL NOT NULL,
+            watch_seconds REAL NOT NULL,
+            PRIMARY KEY (source_year, year, weekday, hour, main_category, tag_name)
+        ) WITHOUT ROWID
+    """)
+    # 每个历史记录年份表的聚合进度，source_year 对应 bilibili_history_{source_year}
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS viewing_cube_sources (
+            source_year INTEGER PRIMARY KEY,
+            timezone TEXT NOT NULL,
+            max_id INTEGER NOT NULL,
+            row_count INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+    conn.commit()
+
+
+class ViewingCube:
+    """观看习惯数据立方体
+
+    按（年份, 星期, 小时, 主分区, 分区标签）预先聚合观看次数、视频时长和实际观看时长，
+    保存在独立的 bilibili_viewing_cube.db 中。年份、星期和小时按配置的时区计算。
+
+    导入历史记录后只聚合新增的记录（记录 id 单调递增，以已聚合的最大 id 为界）；
+    发现删除或修改了旧记录时只重建对应年份表的部分。多年份对比直接在内存中的
+    立方体上做分组求和，不需要再扫描历史记录表。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'ViewingCube':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        self._refresh_lock = threading.Lock()
+        self._frame: Optional[Dict[str, np.ndarray]] = None
+        self.stats = {"refreshes": 0, "incremental": 0, "rebuilt": 0, "unchanged": 0, "last_refresh": None}
+
+    @staticmethod
+    def _history_path() -> str:
+        return get_output_path(get_config()['db_file'])
+
+    @staticmethod
+    def _cube_path() -> str:
+        return get_database_path(CUBE_DB_FILE)
+
+    @staticmethod
+    def timezone_setting() -> Tuple[str, tzinfo]:
+        return local_timezone()
+
+    @staticmethod
+    def _aggregate(conn: sqlite3.Connection, table: str, tz: tzinfo, after_id: int) -> Dict[tuple, List[float]]:
+        """聚合 id 大于 after_id 的记录，返回 (year, weekday, hour, main_category, tag_name) -> [次数, 时长, 观看时长]"""
+        rows = conn.execute(f"""
+            SELECT view_at / {BUCKET_SECONDS}, COALESCE(main_category, ''), COALESCE(tag_name, ''),
+                   COUNT(*), TOTAL(duration),
+                   TOTAL(CASE WHEN progress = -1 THEN duration ELSE MAX(COALESCE(progress, 0), 0) END)
+            FROM {table}
+            WHERE id > ? AND view_at > 0
+            GROUP BY 1, 2, 3
+        """, (after_id,)).fetchall()
+
+        local_slots: Dict[int, Tuple[int, int, int]] = {}
+        cells: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+        for bucket, main_category, tag_name, count, duration, watched in rows:
+            slot = local_slots.get(bucket)
+            if slot is None:
+                local = datetime.fromtimestamp(bucket * BUCKET_SECONDS, tz)
+                # 与 strftime('%w') 一致，0 表示周日
+                slot = local_slots[bucket] = (local.year, (local.weekday() + 1) % 7, local.hour)
+            cell = cells[slot + (main_category.strip(), tag_name.strip())]
+            cell[0] += count
+            cell[1] += duration
+            cell[2] += watched
+        return cells
+
+    @staticmethod
+    def _write_cells(cube: sqlite3.Connection, source_year: int, cells: Dict[tuple, List[float]]) -> None:
+        cube.executemany("""
+            INSERT INTO viewing_cube (source_year, year, weekday, hour, main_category, tag_name,
+                                      view_count, total_duration, watch_seconds)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (source_year, year, weekday, hour, main_category, tag_name) DO UPDATE SET
+                view_count = view_count + excluded.view_count,
+                total_duration = total_duration + excluded.total_duration,
+                watch_seconds = watch_seconds + excluded.watch_seconds
+        """, [(source_year,) + key + tuple(values) for key, values in cells.items()])
+
+    def refresh(self, rebuild: bool = False) -> Dict[str, Any]:
+        """把历史记录库的变化同步到立方体（阻塞调用，接口中应放到线程中执行）"""
+        tz_name, tz = self.timezone_setting()
+        started = time.time()
+        summary = {"timezone": tz_name, "incremental": [], "rebuilt": [], "removed": [], "added_records": 0}
+
+        with self._refresh_lock:
+            history = connect_history(self._history_path(), read_only=True)
+            cube = sqlite3.connect(self._cube_path())
+            try:
+                create_tables(cube)
+                sources = {
+                    row[0]: row[1:] for row in cube.execute(
+                        "SELECT source_year, timezone, max_id, row_count, fingerprint FROM viewing_cube_sources"
+                    )
+                }
+                years = history_years(history)
+
+                for source_year in set(sources) - set(years):
+                    cube.execute("DELETE FROM viewing_cube WHERE source_year = ?", (source_year,))
+                    cube.execute("DELETE FROM viewing_cube_sources WHERE source_year = ?", (source_year,))
+                    summary["removed"].append(source_year)
+
+                for source_year in years:
+                    table = f"bilibili_history_{source_year}"
+                    current = table_fingerprint(history, table, _FINGERPRINT_TOTALS)
+                    fingerprint, count, max_id = current
+                    source = sources.get(source_year)
+                    after_id = 0
+                    if source and not rebuild and source[0] == tz_name:
+                        # 旧记录未被改动时只聚合新增部分
+                        after_id = appended_after(history, table, current, (source[1], source[3]), _FINGERPRINT_TOTALS)
+                        if after_id is None:
+                            self.stats["unchanged"] += 1
+                            continue
+
+                    if after_id:
+                        summary["incremental"].append(source_year)
+                        self.stats["incremental"] += 1
+                    else:
+                        cube.execute("DELETE FROM viewing_cube WHERE source_year = ?", (source_year,))
+                        summary["rebuilt"].append(source_year)
+                        self.stats["rebuilt"] += 1
+
+                    cells = self._aggregate(history, table, tz, after_id)
+                    summary["added_records"] += sum(int(v[0]) for v in cells.values())
+                    self._write_cells(cube, source_year, cells)
+                    cube.execute("""
+                        INSERT OR REPLACE INTO viewing_cube_sources
+                            (source_year, timezone, max_id, row_count, fingerprint, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (source_year, tz_name, max_id, count, fingerprint, int(time.time())))
+                    cube.commit()
+                cube.commit()
+            finally:
+                history.close()
+                cube.close()
+
+            if summary["incremental"] or summary["rebuilt"] or summary["removed"]:
+                self._frame = None
+            self.stats["refreshes"] += 1
+            self.stats["last_refresh"] = int(time.time())
+
+        summary["duration"] = round(time.time() - started, 3)
+        if summary["incremental"] or summary["rebuilt"] or summary["removed"]:
+            logger.info(f"观看习惯立方体已更新：增量 {summary['incremental']}，重建 {summary['rebuilt']}，"
+                        f"移除 {summary['removed']}，聚合 {summary['added_records']} 条记录，"
+                        f"耗时 {summary['duration']} 秒")
+        return summary
+
+    def _load_frame(self) -> Dict[str, np.ndarray]:
+        """把立方体读入内存，按（年份, 星期, 小时, 主分区, 标签）合并各来源表"""
+        frame = self._frame
+        if frame is not None:
+            return frame
+        conn = sqlite3.connect(self._cube_path())
+        try:
+            create_tables(conn)
+            rows = conn.execute("""
+                SELECT year, weekday, hour, main_category, tag_name,
+                       SUM(view_count), SUM(total_duration), SUM(watch_seconds)
+                FROM viewing_cube
+                GROUP BY year, weekday, hour, main_category, tag_name
+            """).fetchall()
+        finally:
+            conn.close()
+        columns = list(zip(*rows)) if rows else [()] * 8
+        frame = {
+            "year": np.array(columns[0], dtype=np.int64),
+            "weekday": np.array(columns[1], dtype=np.int64),
+            "hour": np.array(columns[2], dtype=np.int64),
+            "main_category": np.array(columns[3], dtype=object),
+            "tag_name": np.array(columns[4], dtype=object),
+            "count": np.array(columns[5], dtype=np.float64),
+            "duration": np.array(columns[6], dtype=np.float64),
+            "watch": np.array(columns[7], dtype=np.float64),
+        }
+        self._frame = frame
+        return frame
+
+    def years(self) -> List[int]:
+        return sorted({int(y) for y in self._load_frame()["year"]})
+
+    def summarize(self, start: int, end: int, main_category: Optional[str] = None,
+                  tag_name: Optional[str] = None, top: int = 10) -> Dict[str, Any]:
+        """汇总 [start, end] 年份范围内的观看习惯"""
+        frame = self._load_frame()
+        mask = (frame["year"] >= start) & (frame["year"] <= end)
+        if main_category:
+            mask &= frame["main_category"] == main_category
+        if tag_name:
+            mask &= frame["tag_name"] == tag_name
+
+        slot = frame["weekday"][mask] * 24 + frame["hour"][mask]
+        counts = np.bincount(slot, weights=frame["count"][mask], minlength=168).reshape(7, 24)
+        watch = np.bincount(slot, weights=frame["watch"][mask], minlength=168).reshape(7, 24)
+        total = float(counts.sum())
+        years_present = sorted({int(y) for y in frame["year"][mask]})
+
+        hourly = counts.sum(axis=0)
+        weekly = counts.sum(axis=1)
+
+        def share(values: np.ndarray) -> List[float]:
+            return [round(float(v) / total * 100, 2) if total else 0 for v in values]
+
+        categories = {}
+        for column, key in (("main_category", "top_main_categories"), ("tag_name", "top_tags")):
+            names, inverse = np.unique(frame[column][mask], return_inverse=True)
+            sums = np.bincount(inverse, weights=frame["count"][mask], minlength=len(names))
+            order = np.argsort(-sums, kind='stable')
+            categories[key] = [
+                {"name": str(names[i]), "view_count": int(sums[i]),
+                 "percentage": round(float(sums[i]) / total * 100, 2) if total else 0}
+                for i in order if names[i] != ''
+            ][:top]
+
+        peak = np.unravel_index(int(np.argmax(counts)), counts.shape) if total else None
+        workday = float(weekly[1:6].sum()) / 5
+        weekend = float(weekly[0] + weekly[6]) / 2
+        return {
+            "range": f"{start}" if start == end else f"{start}-{end}",
+            "years": years_present,
+            "total_videos": int(total),
+            "total_watch_seconds": float(watch.sum()),
+            "avg_videos_per_year": round(total / len(years_present), 1) if years_present else 0,
+            "hour_weekday_matrix": counts.astype(np.int64).tolist(),
+            "hourly_distribution": {f"{h}时": int(hourly[h]) for h in range(24)},
+            "hourly_share": share(hourly),
+            "weekly_distribution": {WEEKDAY_LABELS[d]: int(weekly[d]) for d in range(7)},
+            "weekly_share": share(weekly),
+            "peak_slot": {"weekday": WEEKDAY_LABELS[peak[0]], "hour": f"{peak[1]}时",
+                          "view_count": int(counts[peak])} if peak else None,
+            "peak_hour": f"{int(np.argmax(hourly))}时" if total else None,
+            "night_owl_rate": round(float(hourly[[23, 0, 1, 2, 3, 4]].sum()) / total * 100, 2) if total else 0,
+            "weekend_ratio": round(weekend / workday, 2) if workday else None,
+            **categories,
+        }
+
+    def compare(self, ranges: List[Tuple[int, int]], main_category: Optional[str] = None,
+                tag_name: Optional[str] = None, top: int = 10) -> Dict[str, Any]:
+        """多个年份范围并排对比，各范围的小时分布差异用占比之差衡量"""
+        summaries = [self.summarize(start, end, main_category, tag_name, top) for start, end in ranges]
+        baseline = summaries[0]
+        for item in summaries[1:]:
+            item["hourly_share_change"] = [
+                round(a - b, 2) for a, b in zip(item["hourly_share"], baseline["hourly_share"])
+            ]
+            item["weekly_share_change"] = [
+                round(a - b, 2) for a, b in zip(item["weekly_share"], baseline["weekly_share"])
+            ]
+        return {
+            "timezone": self.timezone_setting()[0],
+            "available_years": self.years(),
+            "ranges": summaries,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        frame = self._frame
+        return {**self.stats, "cells_in_memory": len(frame["year"]) if frame is not None else 0,
+                "timezone": self.timezone_setting()[0]}
+
+
+def refresh_viewing_cube() -> Optional[Dict[str, Any]]:
+    """导入历史记录后更新观看习惯立方体，失败时只记录日志，不影响导入结果"""
+    try:
+        return ViewingCube.get_instance().refresh()
+    except Exception as e:
+        logger.warning(f"更新观看习惯立方体失败: {e}")
+        return None
@@ -0,0 +1,354 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone, tzinfo
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from scripts.history_partitions import connect_history, sealed_stats, table_fingerprint
+from scripts.utils import get_config, get_output_path, setup_logger
+from scripts.viewing_cube import BUCKET_SECONDS, ViewingCube
+
+# 确保日志系统已初始化
+setup_logger()
+
+# 时长分类边界（秒）：≤5分钟、5-20分钟、>20分钟
+DURATION_BOUNDS = np.array([300, 1200])
+DURATION_LABELS = ["短视频(≤5分钟)", "中等视频(5-20分钟)", "长视频(>20分钟)"]
+
+# 完成率分布区间上界（含）
+COMPLETION_BOUNDS = np.array([10, 30, 50, 70, 90])
+COMPLETION_LABELS = ["0-10%", "10-30%", "30-50%", "50-70%", "70-90%", "90-100%"]
+
+SEASON_LABELS = ["春季", "夏季", "秋季", "冬季"]
+WEEKDAY_LABELS = ["周日", "周一", "周二", "周三", "周四", "周五", "周六"]
+PERIOD_LABELS = ["凌晨", "上午", "下午", "晚上"]
+PERIOD_DURATION_LABELS = ["短视频", "中等视频", "长视频"]
+
+_FRAME_COLUMNS = [
+    ("view_at", "0"), ("duration", "NULL"), ("progress", "NULL"), ("bvid", "''"), ("title", "''"),
+    ("tag_name", "''"), ("author_name", "''"), ("author_mid", "0"),
+]
+
+
+class YearFrame:
+    """一个年份表的列式数据，只包含统计需要的列"""
+
+    def __init__(self, year: int, version: str, rows: List[tuple]):
+        self.year = year
+        self.version = version
+        self.loaded_at = time.time()
+        columns = list(zip(*rows)) if rows else [()] * len(_FRAME_COLUMNS)
+        self.view_at = np.array(columns[0], dtype=np.int64)
+        # NULL 读取为 NaN，与 SQL 聚合忽略 NULL 的行为保持一致
+        self.duration = np.array(columns[1], dtype=np.float64)
+        self.progress = np.array(columns[2], dtype=np.float64)
+        self.bvid = np.array(columns[3], dtype=object)
+        self.title = np.array(columns[4], dtype=object)
+        self.tag_name = np.array(columns[5], dtype=object)
+        self.author_name = np.array(columns[6], dtype=object)
+        self.author_mid = np.array(columns[7], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.view_at)
+
+
+def _group_sums(codes: np.ndarray, size: int, *weights: np.ndarray) -> List[np.ndarray]:
+    return [np.bincount(codes, weights=w, minlength=size) for w in weights]
+
+
+def _rate_stats(count: int, total: float, fully: float) -> Dict[str, Any]:
+    return {
+        "video_count": int(count),
+        "total_completion": float(total),
+        "fully_watched": int(fully),
+        "average_completion_rate": round(float(total) / count, 2) if count else 0,
+        "fully_watched_rate": round(float(fully) / count * 100, 2) if count else 0,
+    }
+
+
+def local_seconds(view_at: np.ndarray, tz: tzinfo) -> np.ndarray:
+    """UTC 时间戳 -> 本地时间秒数，与观看习惯立方体一样按 15 分钟分桶查询时区偏移"""
+    if isinstance(tz, timezone):
+        return view_at + int(tz.utcoffset(None).total_seconds())
+    buckets, inverse = np.unique(view_at // BUCKET_SECONDS, return_inverse=True)
+    offsets = np.array([datetime.fromtimestamp(int(b) * BUCKET_SECONDS, tz).utcoffset().total_seconds()
+                        for b in buckets], dtype=np.int64)
+    return view_at + offsets[inverse]
+
+
+def compute_metrics(frame: YearFrame, tz: tzinfo) -> Dict[str, Any]:
+    """一次性计算所有观看统计指标，日期和小时按 viewing_cube.timezone 配置的时区计算"""
+    n = len(frame)
+    local = local_seconds(frame.view_at, tz)
+    day = local // 86400
+    hour = (local % 86400) // 3600
+    weekday = (day + 4) % 7  # 1970-01-01 是周四，0 表示周日
+    months = day.astype('datetime64[D]').astype('datetime64[M]')
+    month_no = months.astype(np.int64) % 12 + 1
+
+    duration0 = np.nan_to_num(frame.duration)
+    progress0 = np.nan_to_num(frame.progress)
+    # progress 为 -1 表示已看完，实际观看时长记为视频时长
+    watch_seconds = np.where(frame.progress == -1, frame.duration, frame.progress)
+    completion = np.where(
+        progress0 == -1, 100.0,
+        np.divide(progress0 * 100, duration0, out=np.zeros(n), where=duration0 > 0)
+    )
+    fully = completion >= 90
+
+    metrics: Dict[str, Any] = {"total_videos": n}
+
+    # ---- 按日 ----
+    days, day_inv, day_counts = np.unique(day, return_inverse=True, return_counts=True)
+    day_labels = [str(d) for d in days.astype('datetime64[D]')]
+    daily_watch = np.bincount(day_inv, weights=np.nan_to_num(watch_seconds), minlength=len(days))
+    metrics["active_days"] = len(days)
+    metrics["view_dates"] = day_labels
+    if len(days):
+        top_watch = int(np.argmax(daily_watch))
+        top_count = int(np.argmax(day_counts))
+        metrics["time_investment"] = {
+            "max_duration_day": {
+                "date": day_labels[top_watch],
+                "video_count": int(day_counts[top_watch]),
+                "total_duration": float(daily_watch[top_watch]),
+            },
+            "avg_daily_duration": float(daily_watch.mean()),
+        }
+        metrics["max_daily_record"] = {"date": day_labels[top_count], "video_count": int(day_counts[top_count])}
+    else:
+        metrics["time_investment"] = {
+            "max_duration_day": {"date": None, "video_count": None, "total_duration": None},
+            "avg_daily_duration": None,
+        }
+        metrics["max_daily_record"] = None
+
+    # ---- 按月 / 周 / 季节 / 小时 ----
+    month_keys, month_counts = np.unique(months, return_counts=True)
+    metrics["monthly_stats"] = {str(m): int(c) for m, c in zip(month_keys, month_counts)}
+
+    week_counts = np.bincount(weekday, minlength=7) if n else np.zeros(7, dtype=np.int64)
+    metrics["weekly_stats"] = {WEEKDAY_LABELS[i]: int(week_counts[i]) for i in (0, 1, 2, 3, 4, 5, 6)}
+
+    season = (month_no - 1) // 3
+    valid_watch = ~np.isnan(watch_seconds)
+    season_counts = np.bincount(season, minlength=4)
+    season_valid, season_sum = _group_sums(season, 4, valid_watch.astype(np.float64), np.nan_to_num(watch_seconds))
+    metrics["seasonal_patterns"] = {
+        SEASON_LABELS[i]: {
+            "view_count": int(season_counts[i]),
+            "avg_duration": float(season_sum[i] / season_valid[i]) if season_valid[i] else None,
+        }
+        for i in range(4) if season_counts[i]
+    }
+
+    hour_counts = np.bincount(hour, minlength=24) if n else np.zeros(24, dtype=np.int64)
+    metrics["hourly_counts"] = {int(h): int(hour_counts[h]) for h in range(24) if hour_counts[h]}
+
+    # ---- 完成率 ----
+    duration_cat = np.searchsorted(DURATION_BOUNDS, duration0, side='left')
+    cat_counts, cat_total, cat_fully = _group_sums(duration_cat, 3, None, completion, fully.astype(np.float64))
+    duration_stats = {
+        label: _rate_stats(cat_counts[i], cat_total[i], cat_fully[i]) for i, label in enumerate(DURATION_LABELS)
+    }
+    distribution = np.bincount(np.searchsorted(COMPLETION_BOUNDS, completion, side='left'), minlength=6)
+    fully_count = int(fully.sum())
+    not_started = int((completion == 0).sum())
+    metrics["completion"] = {
+        "overall_stats": {
+            "total_videos": n,
+            "average_completion_rate": round(float(completion.sum()) / n, 2) if n else 0,
+            "fully_watched_count": fully_count,
+            "not_started_count": not_started,
+            "fully_watched_rate": round(fully_count / n * 100, 2) if n else 0,
+            "not_started_rate": round(not_started / n * 100, 2) if n else 0,
+        },
+        "duration_based_stats": duration_stats,
+        "completion_distribution": {label: int(distribution[i]) for i, label in enumerate(COMPLETION_LABELS)},
+    }
+
+    # ---- UP主 ----
+    author_mask = (frame.author_name != '') & (frame.author_mid != 0)
+    names, first_idx, author_inv = np.unique(frame.author_name[author_mask], return_index=True, return_inverse=True)
+    author_counts, author_total, author_fully = _group_sums(
+        author_inv, len(names), None, completion[author_mask], fully[author_mask].astype(np.float64)
+    )
+    author_mids = frame.author_mid[author_mask][first_idx]
+    metrics["authors"] = {
+        str(names[i]): {"author_mid": int(author_mids[i]),
+                        **_rate_stats(author_counts[i], author_total[i], author_fully[i])}
+        for i in range(len(names)) if author_counts[i] >= 5
+    }
+
+    # ---- 分区 ----
+    tag_mask = frame.tag_name != ''
+    tags, tag_inv = np.unique(frame.tag_name[tag_mask], return_inverse=True)
+    tag_counts, tag_total, tag_fully = _group_sums(
+        tag_inv, len(tags), None, completion[tag_mask], fully[tag_mask].astype(np.float64)
+    )
+    metrics["tag_counts"] = {str(tags[i]): int(tag_counts[i]) for i in range(len(tags))}
+    metrics["tags"] = {
+        str(tags[i]): _rate_stats(tag_counts[i], tag_total[i], tag_fully[i])
+        for i in range(len(tags)) if tag_counts[i] >= 5
+    }
+
+    # ---- 重复观看 ----
+    bvid_rows = np.flatnonzero(frame.bvid != '')
+    bvids, bvid_inv, bvid_counts = np.unique(frame.bvid[bvid_rows], return_inverse=True, return_counts=True)
+    order = bvid_rows[np.lexsort((frame.view_at[bvid_rows], bvid_inv))]
+    starts = np.concatenate(([0], np.cumsum(bvid_counts)[:-1])).astype(np.int64)
+    first_rows = order[starts] if len(bvids) else order
+    last_rows = order[starts + bvid_counts - 1] if len(bvids) else order
+    rewatched = np.flatnonzero(bvid_counts > 1)
+    rewatched = rewatched[np.argsort(-bvid_counts[rewatched], kind='stable')]
+    rewatched_duration = duration0[last_rows[rewatched]]
+    rewatched_cat = np.bincount(np.searchsorted(DURATION_BOUNDS, rewatched_duration, side='left'), minlength=3)
+    most_watched = []
+    for i in rewatched[:10]:
+        row, count = last_rows[i], int(bvid_counts[i])
+        first_view, last_view = int(frame.view_at[first_rows[i]]), int(frame.view_at[row])
+        most_watched.append({
+            "title": frame.title[row],
+            "bvid": str(bvids[i]),
+            "duration": float(duration0[row]),
+            "tag_name": frame.tag_name[row],
+            "author_name": frame.author_name[row],
+            "watch_count": count,
+            "first_view": first_view,
+            "last_view": last_view,
+            "avg_interval": (last_view - first_view) / (count - 1),
+        })
+    metrics["watch_counts"] = {
+        "rewatch_stats": {
+            "total_rewatched_videos": len(rewatched),
+            "total_unique_videos": len(bvids),
+            "rewatch_rate": round(len(rewatched) / len(bvids) * 100, 2) if len(bvids) else 0,
+            "total_rewatch_count": int((bvid_counts[rewatched] - 1).sum()),
+        },
+        "most_watched_videos": most_watched,
+        "duration_distribution": {label: int(rewatched_cat[i]) for i, label in enumerate(DURATION_LABELS)},
+        "tag_distribution": {},
+    }
+
+    # ---- 时段 × 时长 ----
+    period_mask = (frame.view_at != 0) & (duration0 > 0)
+    period = hour[period_mask] // 6
+    period_type = np.searchsorted(DURATION_BOUNDS, duration0[period_mask], side='right')
+    cell = period * 3 + period_type
+    cell_counts, cell_total = _group_sums(cell, 12, None, duration0[period_mask])
+    correlation = {}
+    for p, period_label in enumerate(PERIOD_LABELS):
+        correlation[period_label] = {}
+        for t, type_label in enumerate(PERIOD_DURATION_LABELS):
+            count, total = int(cell_counts[p * 3 + t]), float(cell_total[p * 3 + t])
+            correlation[period_label][type_label] = {
+                "video_count": count,
+                "total_duration": total,
+                "avg_duration": total / count if count else 0,
+            }
+    metrics["duration_correlation"] = correlation
+
+    return metrics
+
+
+class ViewingAnalyticsEngine:
+    """观看统计引擎
+
+    每个年份表只读取一次统计所需的列，转换为 NumPy 列式数据后用分组聚合
+    一次算出全部指标，各 /viewing 接口只从结果中取自己需要的部分。数据库
+    文件未变化时直接复用；文件变化后先比较该年份的数据指纹，只有该年数据
+    确实变化时才重新读取。
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> 'ViewingAnalyticsEngine':
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def __init__(self):
+        # year -> (文件状态, 数据指纹, 指标)
+        self._cache: Dict[int, Tuple[str, str, Dict[str, Any]]] = {}
+        self._year_locks: Dict[int, threading.Lock] = {}
+        self.stats = {"scans": 0, "hits": 0, "revalidated": 0}
+
+    @staticmethod
+    def _db_path() -> str:
+        return get_output_path(get_config()['db_file'])
+
+    def _file_state(self) -> str:
+        parts = []
+        path = self._db_path()
+        for p in (path, path + '-wal'):
+            if os.path.exists(p):
+                st = os.stat(p)
+                parts.append(f"{st.st_size}:{st.st_mtime_ns}")
+        return '|'.join(parts)
+
+    @staticmethod
+    def _load_frame(conn: sqlite3.Connection, table: str, year: int, version: str) -> YearFrame:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        # 缺少的列用默认值代替；时长和进度保留 NULL
+        select = ", ".join(
+            default if col not in existing else col if default == "NULL" else f"COALESCE({col}, {default})"
+            for col, default in _FRAME_COLUMNS
+        )
+        rows = conn.execute(f"SELECT {select} FROM {table}").fetchall()
+        return YearFrame(year, version, rows)
+
+    def get_metrics(self, year: int) -> Dict[str, Any]:
+        """获取某年的全部统计指标（阻塞调用，接口中应放到线程中执行）"""
+        lock = self._year_locks.setdefault(year, threading.Lock())
+        with lock:
+            # 时区配置也是缓存状态的一部分，修改后重新计算
+            tz_name, tz = ViewingCube.timezone_setting()
+            file_state = f"{self._file_state()}|{tz_name}"
+            cached = self._cache.get(year)
+            if cached and cached[0] == file_state:
+                self.stats["hits"] += 1
+                return cached[2]
+
+            table = f"bilibili_history_{year}"
+            conn = connect_history(self._db_path())
+            try:
+                # 封存的年份不再变化，直接使用封存时计算的指纹，不用扫描整年数据
+                stats = sealed_stats(year)
+                if stats:
+                    fingerprint = stats['fingerprint']
+                else:
+                    fingerprint = table_fingerprint(conn, table, ('view_at', 'progress', 'duration'))[0]
+                fingerprint = f"{fingerprint}|{tz_name}"
+                if cached and cached[1] == fingerprint:
+                    # 数据库有写入，但不是这一年的数据
+                    self.stats["revalidated"] += 1
+                    self._cache[year] = (file_state, fingerprint, cached[2])
+                    return cached[2]
+
+                started = time.time()
+                frame = self._load_frame(conn, table, year, fingerprint)
+            finally:
+                conn.close()
+
+            metrics = compute_metrics(frame, tz)
+            self.stats["scans"] += 1
+            self._cache[year] = (file_state, fingerprint, metrics)
+            logger.info(f"已计算 {year} 年观看统计：{len(frame)} 条记录，耗时 {time.time() - started:.2f} 秒")
+            return metrics
+
+    def invalidate(self, year: Optional[int] = None) -> None:
+        if year is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(year, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "cached_years": sorted(self._cache)}
@@ -21,6 +21,24 @@ _cached_wbi_keys = {
     "time": 0
 }
 
+
+def reset_wbi_keys() -> None:
+    """清空缓存的 WBI 密钥，下次签名时重新获取（密钥轮换、登录状态变化后使用）"""
+    _cached_wbi_keys.update(img_key="", sub_key="", time=0)
+
+
+def _reset_wbi_keys(old_config, new_config) -> None:
+    """SESSDATA 变化后旧的 WBI 密钥可能失效，清空缓存以便下次重新获取"""
+    reset_wbi_keys()
+
+
+def _register_config_watch() -> None:
+    from scripts.utils import ConfigService
+    ConfigService.get_instance().on_change(_reset_wbi_keys, keys=('SESSDATA',))
+
+
+_register_config_watch()
+
 def get_mixin_key(orig: str) -> str:
     """
     对 imgKey 和 subKey 进行字符顺序打乱编码
@@ -48,8 +66,8 @@ def fetch_wbi_keys() -> Dict[str, str]:
     
     try:
         # 从配置中读取SESSDATA
-        from scripts.utils import load_config
-        config = load_config()
+        from scripts.utils import get_config
+        config = get_config()
         sessdata = config.get('SESSDATA', '')
         
         # 设置请求头，解决412错误，添加Cookie认证
@@ -1,10 +1,13 @@
 import asyncio
 import io
 import sys
+import time
 from typing import AsyncGenerator
 
 from yutto.__main__ import main as _YUTTO_MAIN
 
+from scripts.metrics import DOWNLOAD_DURATION, DOWNLOADS_IN_PROGRESS
+
 class _AsyncWriter(io.StringIO):
     """自定义的 StringIO：每次 write 时立即通过 Queue 推送到事件循环"""
     def __init__(self, queue: asyncio.Queue[str | None], loop: asyncio.AbstractEventLoop):
@@ -34,12 +37,16 @@ async def run_yutto(argv: list[str]) -> AsyncGenerator[str, None]:
         # 伪装 sys.argv
         argv_backup = sys.argv
         sys.argv = ["yutto", *argv, '--no-color']
+        started = time.perf_counter()
+        DOWNLOADS_IN_PROGRESS.inc()
         try:
             _YUTTO_MAIN()                   # 进入 yutto 的主函数
         except SystemExit:                  # yutto 内部可能调用 sys.exit()
             pass
         finally:
             sys.argv = argv_backup
+            DOWNLOADS_IN_PROGRESS.dec()
+            DOWNLOAD_DURATION.observe((), time.perf_counter() - started)
             # 通知协程：任务结束
             loop.call_soon_threadsafe(queue.put_nowait, None)
 
@@ -0,0 +1,77 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import scripts.history_partitions as history_partitions
+from scripts.history_fanout import HistoryQueryExecutor
+from scripts.history_partitions import history_change_token
+
+
+@pytest.fixture
+def history_db(tmp_path, monkeypatch):
+    """两个年份表的历史记录库，不附加封存年份"""
+    monkeypatch.setattr(history_partitions, 'sealed_years', lambda: {})
+    path = str(tmp_path / 'bilibili_history.db')
+    conn = sqlite3.connect(path)
+    for year in (2023, 2024):
+        conn.execute(f"CREATE TABLE bilibili_history_{year} (id INTEGER PRIMARY KEY, title TEXT, view_at INTEGER)")
+        start = int(datetime(year, 3, 1).timestamp())
+        conn.executemany(f"INSERT INTO bilibili_history_{year} (title, view_at) VALUES (?, ?)",
+                         [(f"video {i}", start + i * 60) for i in range(30)])
+    conn.commit()
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def executor(history_db, monkeypatch):
+    executor = HistoryQueryExecutor()
+    monkeypatch.setattr(executor, '_db_path', lambda: history_db)
+    return executor
+
+
+def test_change_token_ignores_unchanged_header_pragmas(history_db):
+    token = history_change_token(history_db)
+    conn = sqlite3.connect(history_db)
+    conn.execute("PRAGMA user_version=317")
+    conn.commit()
+    assert history_change_token(history_db) != token
+
+    # 与当前值相同时不再写文件头（routers/history.py get_db 的做法），变化标识不变
+    token = history_change_token(history_db)
+    if conn.execute("PRAGMA user_version").fetchone()[0] != 317:
+        conn.execute("PRAGMA user_version=317")
+    conn.commit()
+    conn.close()
+    assert history_change_token(history_db) == token
+
+
+def test_count_cache_hit_on_second_page(executor, history_db):
+    years = [2024, 2023]
+    where, params = "WHERE title LIKE ?", ['video%']
+
+    assert executor.count(years, where, params) == 60
+    executor.fetch_page(years, where, params, limit=10, offset=0)
+    hits = executor.stats["count_hits"]
+
+    # 第二页：计数和深翻页定位都走缓存
+    assert executor.count(years, where, params) == 60
+    columns, rows = executor.fetch_page(years, where, params, limit=10, offset=10)
+    assert executor.stats["count_hits"] > hits
+    assert [row[columns.index('title')] for row in rows] == [f"video {i}" for i in range(19, 9, -1)]
+
+
+def test_count_cache_invalidated_by_write(executor, history_db):
+    years = [2024, 2023]
+    assert executor.count(years) == 60
+
+    conn = sqlite3.connect(history_db)
+    conn.execute("INSERT INTO bilibili_history_2024 (title, view_at) VALUES ('new', ?)",
+                 (int(datetime(2024, 6, 1).timestamp()),))
+    conn.commit()
+    conn.close()
+
+    hits = executor.stats["count_hits"]
+    assert executor.count(years) == 61
+    assert executor.stats["count_hits"] == hits
@@ -0,0 +1,41 @@
+import sqlite3
+
+import pytest
+
+from scripts.history_partitions import appended_after, history_years, table_fingerprint
+
+TOTALS = ('view_at', 'length(title)')
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    for year in (2024, 2023):
+        conn.execute(f"CREATE TABLE bilibili_history_{year} (id INTEGER PRIMARY KEY, title TEXT, view_at INTEGER)")
+    conn.execute("CREATE TABLE bilibili_history_2024_fts (title TEXT)")
+    conn.executemany("INSERT INTO bilibili_history_2024 (title, view_at) VALUES (?, ?)",
+                     [(f"video {i}", 1704067200 + i) for i in range(5)])
+    yield conn
+    conn.close()
+
+
+def test_history_years_ignores_other_tables(conn):
+    assert history_years(conn) == [2023, 2024]
+
+
+def test_appended_after(conn):
+    table = 'bilibili_history_2024'
+    current = table_fingerprint(conn, table, TOTALS)
+    assert current[1:] == (5, 5)
+    previous = (current[2], current[0])
+
+    assert appended_after(conn, table, current, None, TOTALS) == 0
+    assert appended_after(conn, table, current, previous, TOTALS) is None
+
+    # 只追加新记录：只需处理上次最大 id 之后的部分
+    conn.execute("INSERT INTO bilibili_history_2024 (title, view_at) VALUES ('new', 1704067300)")
+    assert appended_after(conn, table, table_fingerprint(conn, table, TOTALS), previous, TOTALS) == 5
+
+    # 旧记录被修改：需要全部重建
+    conn.execute("UPDATE bilibili_history_2024 SET title = 'changed title' WHERE id = 1")
+    assert appended_after(conn, table, table_fingerprint(conn, table, TOTALS), previous, TOTALS) == 0
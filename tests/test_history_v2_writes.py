@@ -0,0 +1,80 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import scripts.history_partitions as history_partitions
+from config.sql_statements_sqlite import INSERT_DATA
+from routers import delete_history, history
+from scripts.history_schema_v2 import create_year_schema_v2, schema_version
+
+YEAR = 2024
+VIEW_AT = int(datetime(YEAR, 5, 1, 12).timestamp())
+
+
+def _record(record_id: int, bvid: str, view_at: int) -> tuple:
+    return (
+        record_id, f"title {bvid}", '', 'https://i0.hdslb.com/cover.jpg', '[]', '', record_id, 0, bvid, 1,
+        record_id, '', 'archive', 1, 1, 'author', '', 42, view_at, 10,
+        '', '', 100, '', 0, '', 0, 0, 0,
+        'tag', 0, 'main', '', 0,
+    )
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """紧凑存储（v2）年份的历史记录库，挂上历史记录和删除记录两个路由"""
+    monkeypatch.setattr(history_partitions, 'sealed_years', lambda: {})
+    path = str(tmp_path / 'bilibili_history.db')
+    conn = sqlite3.connect(path)
+    create_year_schema_v2(conn, YEAR)
+    placeholders = ','.join('?' * 34)
+    conn.executemany(INSERT_DATA.format(table=f"bilibili_history_{YEAR}", placeholders=placeholders),
+                     [_record(1, 'BV1aa', VIEW_AT), _record(2, 'BV1bb', VIEW_AT + 60)])
+    conn.commit()
+    assert schema_version(conn, YEAR) == 2
+    conn.close()
+
+    monkeypatch.setitem(history.config, 'db_file', path)
+    monkeypatch.setitem(delete_history.config, 'db_file', path)
+    monkeypatch.setattr(delete_history, 'update_last_import_time', lambda timestamp: None)
+
+    app = FastAPI()
+    app.include_router(history.router, prefix="/history")
+    app.include_router(delete_history.router, prefix="/delete")
+    client = TestClient(app)
+    client.db_path = path
+    return client
+
+
+def test_update_remark_on_v2_year(client):
+    response = client.post('/history/update-remark',
+                           json={'bvid': 'BV1aa', 'view_at': VIEW_AT, 'remark': 'note'})
+    assert response.status_code == 200
+
+    conn = sqlite3.connect(client.db_path)
+    try:
+        assert conn.execute(f"SELECT remark FROM bilibili_history_{YEAR} WHERE bvid = 'BV1aa'").fetchone() == ('note',)
+        assert conn.execute("SELECT remark FROM history_remarks WHERE bvid = 'BV1aa'").fetchone() == ('note',)
+    finally:
+        conn.close()
+
+    missing = client.post('/history/update-remark',
+                          json={'bvid': 'BV1zz', 'view_at': VIEW_AT, 'remark': 'note'})
+    assert missing.status_code == 404
+
+
+def test_batch_delete_on_v2_year(client):
+    response = client.request('DELETE', '/delete/batch-delete',
+                              json=[{'bvid': 'BV1aa', 'view_at': VIEW_AT}, {'bvid': 'BV1zz', 'view_at': VIEW_AT}])
+    assert response.status_code == 200
+    assert response.json()['data']['deleted_count'] == 1
+
+    conn = sqlite3.connect(client.db_path)
+    try:
+        assert conn.execute(f"SELECT COUNT(*) FROM bilibili_history_{YEAR} WHERE bvid = 'BV1aa'").fetchone() == (0,)
+        assert conn.execute("SELECT bvid FROM deleted_history").fetchall() == [('BV1aa',)]
+    finally:
+        conn.close()